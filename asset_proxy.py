@@ -0,0 +1,486 @@
+# asset_proxy.py
+"""Mandataire local (127.0.0.1) entre la fenêtre kiosque et le serveur, avec
+cache disque des ressources statiques.
+
+À chaque chargement de /patient (et à chaque rechargement), le moteur web
+redemandait la page et tous ses scripts, feuilles de style et images au
+serveur : sur une liaison faible, le changement de page est lent.
+:class:`AssetProxy` écoute sur la boucle locale ; la fenêtre pointe sur lui
+au lieu du serveur :
+
+- ressources statiques (CSS, JS, images, polices) : conservées sur disque
+  avec leurs validateurs (``ETag``, ``Last-Modified``). Fraîches
+  (``max-age``, ``DEFAULT_MAX_AGE`` à défaut) : servies sans appel réseau ;
+  périmées : servies aussitôt et revalidées en arrière-plan (requête
+  conditionnelle, stale-while-revalidate) ; ``no-cache`` : revalidées avant
+  d'être servies ; ``no-store`` : jamais conservées ;
+- page d'accueil (``SHELL_PATHS``) : toujours demandée au serveur, la
+  dernière version valide étant conservée ; si le serveur est brièvement
+  injoignable (erreur réseau, 5xx, disjoncteur ouvert), elle est servie à sa
+  place ;
+- tout le reste (API, formulaires, POST) est relayé tel quel, sans cache.
+
+Les cookies de session transitent entre le moteur web et le serveur sans
+être conservés par le mandataire ; les redirections et cookies sont
+réécrits pour l'origine locale. Les connexions WebSocket et les flux SSE de
+la page ne sont pas relayés.
+
+L'occupation disque est bornée : au-delà de ``max_bytes``, les entrées les
+moins récemment servies sont supprimées.
+"""
+import hashlib
+import http.cookiejar
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from requests.exceptions import RequestException
+
+from http_client import HttpClient
+
+logger = logging.getLogger("borne.proxy")
+
+# Répertoire du cache, sous le dossier de configuration de la borne.
+ASSET_CACHE_DIRNAME = "asset_cache"
+
+# Pages servies en dernier recours depuis le cache si le serveur ne répond pas.
+SHELL_PATHS = ('/patient',)
+# Durée de fraîcheur d'une ressource sans max-age (secondes).
+DEFAULT_MAX_AGE = 300
+# Taille max du cache disque (octets, cf. Settings.asset_cache_mb).
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+# Délais (connexion, lecture) des requêtes relayées : la lecture est plus
+# longue que NETWORK_TIMEOUT pour les requêtes longues de la page.
+PROXY_TIMEOUT = (5, 60)
+
+_STATIC_EXTENSIONS = frozenset({
+    '.css', '.js', '.mjs', '.map', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp',
+    '.ico', '.woff', '.woff2', '.ttf', '.otf',
+})
+_STATIC_TYPES = ('text/css', 'application/javascript', 'text/javascript', 'image/',
+                 'font/', 'application/font')
+# En-têtes propres à une connexion (RFC 7230 § 6.1), jamais relayés, plus ceux
+# recalculés par le mandataire (corps décodé par requests).
+_HOP_HEADERS = frozenset({
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te',
+    'trailer', 'transfer-encoding', 'upgrade', 'host', 'content-length',
+    'content-encoding', 'accept-encoding',
+})
+# En-têtes de réponse conservés avec une ressource en cache.
+_STORED_HEADERS = ('content-type', 'etag', 'last-modified', 'cache-control')
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def _cache_directives(value):
+    return {part.strip().split('=', 1)[0].lower() for part in (value or '').split(',')}
+
+
+def _is_static(path, content_type):
+    if os.path.splitext(path)[1].lower() in _STATIC_EXTENSIONS:
+        return True
+    return (content_type or '').lower().startswith(_STATIC_TYPES)
+
+
+class AssetCache:
+    """Cache disque : par ressource, un fichier de métadonnées (JSON) et un
+    fichier de corps versionné qu'il désigne (sûr entre threads).
+
+    Un corps n'est jamais réécrit en place : :meth:`put` écrit un NOUVEAU
+    fichier de corps, puis remplace atomiquement les métadonnées qui le
+    désignent, et seulement ensuite supprime l'ancien. Un lecteur concurrent
+    ou un arrêt brutal voit donc toujours une paire cohérente (au pire une
+    absence). :meth:`touch` ne réécrit que les métadonnées."""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, clock=time.time):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sizes = {}
+        for tmp in self.directory.glob('*.tmp'):
+            _unlink(tmp)
+        for meta_path in self.directory.glob('*.meta'):
+            name = meta_path.stem
+            meta = self._read_meta(name)
+            body = self.directory / meta['body'] if meta and meta.get('body') else None
+            if body is None or not body.exists():
+                self._remove(name)
+                continue
+            self._sizes[name] = body.stat().st_size
+            for orphan in self.directory.glob(f'{name}.*.body'):
+                if orphan != body:
+                    _unlink(orphan)
+        self.evicted = 0
+
+    @staticmethod
+    def _name(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _read_meta(self, name):
+        try:
+            return json.loads((self.directory / f'{name}.meta').read_text('utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        """``(métadonnées, corps)`` de ``key``, ou None."""
+        name = self._name(key)
+        meta = self._read_meta(name)
+        if not meta or not meta.get('body'):
+            return None
+        try:
+            body = (self.directory / meta['body']).read_bytes()
+        except OSError:
+            return None  # remplacé entre-temps : absence
+        # Date d'accès pour l'éviction (moins récemment servies d'abord).
+        try:
+            os.utime(self.directory / f'{name}.meta')
+        except OSError:
+            pass
+        return meta, body
+
+    def put(self, key, status, headers, body, max_age):
+        name = self._name(key)
+        body_name = f'{name}.{uuid.uuid4().hex[:12]}.body'
+        meta = {'key': key, 'status': status, 'stored_at': self._clock(),
+                'max_age': max_age, 'body': body_name,
+                'headers': {h: headers[h] for h in _STORED_HEADERS if h in headers}}
+        with self._lock:
+            previous = self._read_meta(name)
+            # Corps d'abord, puis les métadonnées qui le désignent.
+            self._write(self.directory / body_name, body)
+            self._write(self.directory / f'{name}.meta', json.dumps(meta).encode('utf-8'))
+            if previous and previous.get('body') and previous['body'] != body_name:
+                _unlink(self.directory / previous['body'])
+            self._sizes[name] = len(body)
+            self._evict()
+
+    def touch(self, key, headers, max_age):
+        """Ressource revalidée (304) : fraîche à nouveau, validateurs mis à
+        jour ; le corps n'est pas réécrit."""
+        name = self._name(key)
+        with self._lock:
+            meta = self._read_meta(name)
+            if not meta or name not in self._sizes:
+                return
+            meta['headers'].update({h: headers[h] for h in _STORED_HEADERS if h in headers})
+            meta['stored_at'] = self._clock()
+            meta['max_age'] = max_age
+            self._write(self.directory / f'{name}.meta', json.dumps(meta).encode('utf-8'))
+
+    def _remove(self, name):
+        _unlink(self.directory / f'{name}.meta')
+        for body in self.directory.glob(f'{name}.*.body'):
+            _unlink(body)
+
+    def is_fresh(self, meta):
+        return self._clock() - meta['stored_at'] < meta['max_age']
+
+    def size(self):
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        if total <= self._max_bytes:
+            return
+        entries = []
+        for name in self._sizes:
+            try:
+                entries.append(((self.directory / f'{name}.meta').stat().st_mtime, name))
+            except OSError:
+                entries.append((0, name))
+        for _, name in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            total -= self._sizes.pop(name)
+            self.evicted += 1
+            self._remove(name)
+
+
+def _unlink(path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+class AssetProxy:
+    """Mandataire HTTP local vers ``upstream`` (URL du serveur).
+
+    ``client`` : client HTTP (cf. http_client) dédié au mandataire ; ses
+    cookies ne sont jamais conservés (ceux du moteur web sont relayés)."""
+
+    def __init__(self, upstream, cache_dir, client=None, max_bytes=DEFAULT_MAX_BYTES,
+                 port=0, clock=time.time):
+        self.upstream = upstream.rstrip('/')
+        parts = urlsplit(self.upstream)
+        self._upstream_origin = f'{parts.scheme}://{parts.netloc}'
+        self.cache = AssetCache(cache_dir, max_bytes, clock)
+        self._client = client or HttpClient()
+        self.session = self._client.session
+        self.session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        self._port = port
+        self._server = None
+        self._thread = None
+        self._revalidating = set()
+        self._revalidating_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale': 0, 'misses': 0, 'revalidated': 0,
+                       'shell_fallbacks': 0, 'relayed': 0}
+        self.url = None
+
+    def start(self):
+        proxy = self
+
+        class _Handler(_ProxyHandler):
+            owner = proxy
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self._port), _Handler)
+        self._server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="borne-proxy", daemon=True)
+        self._thread.start()
+        logger.info("Mandataire local démarré sur %s (serveur %s).", self.url, self.upstream)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._client.close()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['cache_bytes'] = self.cache.size()
+        stats['evicted'] = self.cache.evicted
+        return stats
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    # ------------------------------------------------------------------
+    # Réécritures entre l'origine locale et le serveur
+    # ------------------------------------------------------------------
+    def upstream_headers(self, headers):
+        forwarded = {}
+        for name, value in headers.items():
+            if name.lower() in _HOP_HEADERS:
+                continue
+            if name.lower() in ('origin', 'referer') and value.startswith(self.url):
+                value = self._upstream_origin + value[len(self.url):]
+            forwarded[name] = value
+        return forwarded
+
+    def local_headers(self, response):
+        """En-têtes de réponse relayés au moteur web (liste de paires)."""
+        headers = []
+        for name, value in response.headers.items():
+            lower = name.lower()
+            if lower in _HOP_HEADERS or lower == 'set-cookie':
+                continue
+            if lower == 'location' and value.startswith(self._upstream_origin):
+                value = self.url + value[len(self._upstream_origin):]
+            headers.append((name, value))
+        for cookie in _set_cookie_values(response):
+            headers.append(('Set-Cookie', _localize_cookie(cookie)))
+        return headers
+
+    # ------------------------------------------------------------------
+    # Traitement d'une requête (thread du serveur local)
+    # ------------------------------------------------------------------
+    def handle(self, method, path, headers, body):
+        """Renvoie ``(statut, en-têtes [(nom, valeur)], corps)``."""
+        route = urlsplit(path).path
+        if method == 'GET' and route in SHELL_PATHS:
+            return self._shell(path, headers)
+        if method == 'GET':
+            cached = self.cache.get(path)
+            if cached is not None:
+                return self._from_cache(path, headers, *cached)
+        return self._relay(method, path, headers, body, cacheable=(method == 'GET'))
+
+    def _fetch(self, method, path, headers, body=None):
+        return self.session.request(method, self.upstream_origin_url(path),
+                                    headers=self.upstream_headers(headers), data=body,
+                                    timeout=PROXY_TIMEOUT, allow_redirects=False)
+
+    def upstream_origin_url(self, path):
+        return self._upstream_origin + path
+
+    def _relay(self, method, path, headers, body, cacheable):
+        try:
+            response = self._fetch(method, path, headers, body)
+        except RequestException as e:
+            logger.warning("Serveur injoignable pour %s : %s", urlsplit(path).path, e)
+            return 502, [('Content-Type', 'text/plain; charset=utf-8')], \
+                "Serveur injoignable.".encode('utf-8')
+        self._count('misses' if cacheable else 'relayed')
+        if cacheable:
+            self._store(path, response)
+        return response.status_code, self.local_headers(response), response.content
+
+    def _store(self, path, response):
+        content_type = response.headers.get('Content-Type')
+        directives = _cache_directives(response.headers.get('Cache-Control'))
+        if (response.status_code != 200 or 'no-store' in directives
+                or not _is_static(urlsplit(path).path, content_type)):
+            return
+        self.cache.put(path, 200, _lower(response.headers), response.content,
+                       _max_age(response.headers))
+
+    def _from_cache(self, path, headers, meta, body):
+        directives = _cache_directives(meta['headers'].get('cache-control'))
+        if self.cache.is_fresh(meta) and 'no-cache' not in directives:
+            self._count('hits')
+        elif 'no-cache' in directives or 'must-revalidate' in directives:
+            # Revalidation obligatoire avant de servir (copie périmée en
+            # dernier recours si le serveur ne répond pas).
+            if self._revalidate(path, meta):
+                cached = self.cache.get(path)
+                if cached is not None:
+                    meta, body = cached
+            self._count('stale')
+        else:
+            # Servie aussitôt, revalidée en arrière-plan.
+            self._count('stale')
+            self._revalidate_in_background(path, meta)
+        etag = meta['headers'].get('etag')
+        if etag and headers.get('If-None-Match') == etag:
+            return 304, [('ETag', etag)], b''
+        local = [(name.title(), value) for name, value in meta['headers'].items()
+                 if name != 'cache-control']
+        return meta['status'], local, body
+
+    def _revalidate_in_background(self, path, meta):
+        with self._revalidating_lock:
+            if path in self._revalidating:
+                return
+            self._revalidating.add(path)
+
+        def _run():
+            try:
+                self._revalidate(path, meta)
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(path)
+        threading.Thread(target=_run, name="borne-proxy-revalidate", daemon=True).start()
+
+    def _revalidate(self, path, meta):
+        """Requête conditionnelle ; True si le cache est à jour."""
+        conditional = {}
+        if meta['headers'].get('etag'):
+            conditional['If-None-Match'] = meta['headers']['etag']
+        if meta['headers'].get('last-modified'):
+            conditional['If-Modified-Since'] = meta['headers']['last-modified']
+        try:
+            response = self._fetch('GET', path, conditional)
+        except RequestException as e:
+            logger.debug("Revalidation de %s impossible : %s", path, e)
+            return False
+        self._count('revalidated')
+        if response.status_code == 304:
+            self.cache.touch(path, _lower(response.headers), _max_age(response.headers))
+            return True
+        if response.status_code == 200:
+            self._store(path, response)
+            return True
+        return False
+
+    def _shell(self, path, headers):
+        key = urlsplit(path).path
+        try:
+            response = self._fetch('GET', path, headers)
+            if response.status_code < 500:
+                self._count('relayed')
+                if (response.status_code == 200 and 'text/html' in
+                        response.headers.get('Content-Type', '')):
+                    self.cache.put(key, 200, _lower(response.headers), response.content, 0)
+                return response.status_code, self.local_headers(response), response.content
+            reason = f"HTTP {response.status_code}"
+        except RequestException as e:
+            reason = str(e)
+        cached = self.cache.get(key)
+        if cached is None:
+            logger.warning("Serveur injoignable pour %s (%s), aucune copie locale.",
+                           key, reason)
+            return 502, [('Content-Type', 'text/plain; charset=utf-8')], \
+                "Serveur injoignable.".encode('utf-8')
+        self._count('shell_fallbacks')
+        logger.warning("Serveur injoignable pour %s (%s) : dernière version servie.",
+                       key, reason)
+        meta, body = cached
+        return 200, [('Content-Type', meta['headers'].get('content-type', 'text/html')),
+                     ('Cache-Control', 'no-store')], body
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    owner = None
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        status, headers, payload = self.owner.handle(self.command, self.path,
+                                                     dict(self.headers.items()), body)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _handle
+
+    def log_message(self, format, *args):
+        logger.debug("Mandataire : " + format, *args)
+
+
+def _lower(headers):
+    return {name.lower(): value for name, value in headers.items()}
+
+
+def _max_age(headers):
+    match = _MAX_AGE_RE.search(headers.get('Cache-Control') or '')
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+def _set_cookie_values(response):
+    raw = getattr(response, 'raw', None)
+    raw_headers = getattr(raw, 'headers', None)
+    if raw_headers is not None and hasattr(raw_headers, 'getlist'):
+        return raw_headers.getlist('Set-Cookie')
+    value = response.headers.get('Set-Cookie')
+    return [value] if value else []
+
+
+def _localize_cookie(cookie):
+    """Cookie du serveur valable pour l'origine locale : sans ``Domain`` ni
+    ``Secure`` (le mandataire est en HTTP sur la boucle locale)."""
+    parts = [part.strip() for part in cookie.split(';')]
+    kept = [parts[0]]
+    for part in parts[1:]:
+        name = part.split('=', 1)[0].strip().lower()
+        if name in ('domain', 'secure'):
+            continue
+        if name == 'samesite' and part.split('=', 1)[-1].strip().lower() == 'none':
+            part = 'SameSite=Lax'
+        kept.append(part)
+    return '; '.join(kept)
@@ -0,0 +1,269 @@
+# circuit_breaker.py
+"""Disjoncteurs par route et budget global de réessais pour les appels au
+serveur.
+
+Chaque appelant (token, envoi des statuts, supervision de l'initialisation,
+renouvellement) a sa propre politique de réessai. Quand le serveur peine, une
+flotte de bornes qui réessaient chacune de son côté aggrave la situation.
+:class:`ServerGuard` ajoute, au niveau du client HTTP partagé (cf.
+http_client), donc pour tous les appelants :
+
+- un disjoncteur par route (hôte + chemin) : fermé, ouvert après
+  ``FAILURE_THRESHOLD`` échecs consécutifs (erreur réseau, 429, 5xx) pendant
+  ``RESET_TIMEOUT`` secondes, puis semi-ouvert (une seule requête d'essai,
+  dont le résultat referme ou rouvre le disjoncteur). Un disjoncteur ouvert
+  fait échouer la requête immédiatement (:class:`CircuitOpenError`, une
+  ``requests.ConnectionError`` : les appelants la traitent comme une erreur
+  réseau) ;
+- le respect de ``Retry-After`` (429/503) : le disjoncteur s'ouvre aussitôt
+  pour la durée demandée (plafonnée à ``MAX_RETRY_AFTER``) ;
+- un budget de réessais commun (:class:`RetryBudget`) : les appelants le
+  consultent avant chaque réessai (:meth:`ServerGuard.allow_retry`) et
+  attendent :meth:`ServerGuard.retry_in` avant de rappeler une route ouverte.
+
+Les sondages de joignabilité (HEAD) ne sont pas soumis aux disjoncteurs :
+ce sont eux qui détectent le retour du serveur.
+"""
+import collections
+import email.utils
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+logger = logging.getLogger("borne.network")
+
+# Échecs consécutifs ouvrant le disjoncteur d'une route.
+FAILURE_THRESHOLD = 5
+# Durée d'ouverture avant une requête d'essai (secondes).
+RESET_TIMEOUT = 30
+# Plafond d'un Retry-After annoncé par le serveur (secondes).
+MAX_RETRY_AFTER = 600
+# Budget de réessais : 20 % des requêtes de la fenêtre, plus un minimum.
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN = 10
+RETRY_BUDGET_WINDOW = 60
+# Disjoncteurs conservés (les moins récemment utilisés sont oubliés) : une
+# route par chemin appelé, la table resterait sinon sans limite sur une borne
+# allumée en continu.
+MAX_BREAKERS = 64
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RequestsConnectionError):
+    """Requête refusée localement : disjoncteur de la route ouvert."""
+
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"Disjoncteur ouvert pour {endpoint} "
+                         f"(nouvel essai dans {retry_in:.0f}s)")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value, now=time.time):
+    """Délai (secondes) d'un en-tête ``Retry-After`` (secondes ou date HTTP),
+    ou None s'il est absent ou illisible."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - now())
+
+
+class CircuitBreaker:
+    """Disjoncteur d'une route (sûr entre threads)."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self._threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._open_until = 0.0
+        self._trial = False
+
+    def allow(self):
+        """True si une requête peut partir (en semi-ouvert : une seule)."""
+        with self._lock:
+            if self.state == OPEN and self._clock() >= self._open_until:
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def retry_in(self):
+        """Secondes avant qu'une requête soit de nouveau autorisée."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self._open_until - self._clock())
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Disjoncteur refermé.")
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def release(self):
+        """Requête abandonnée sans verdict sur le serveur (erreur locale) :
+        en semi-ouvert, une autre requête peut servir d'essai."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self, retry_after=None):
+        """Échec d'une requête ; ``retry_after`` (Retry-After) ouvre aussitôt."""
+        with self._lock:
+            self.failures += 1
+            if (retry_after is None and self.state == CLOSED
+                    and self.failures < self._threshold):
+                return
+            duration = self._reset_timeout
+            if retry_after is not None:
+                duration = min(retry_after, MAX_RETRY_AFTER)
+            self._open_until = max(self._open_until, self._clock() + duration)
+            if self.state != OPEN:
+                self.opened += 1
+            self.state = OPEN
+            self._trial = False
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = max(0.0, self._open_until - self._clock()) if self.state == OPEN else 0.0
+            return {'state': self.state, 'failures': self.failures,
+                    'opened': self.opened, 'retry_in': round(retry_in, 1)}
+
+
+class RetryBudget:
+    """Budget de réessais sur une fenêtre glissante : au plus
+    ``minimum + ratio × requêtes`` réessais par ``window`` secondes."""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN,
+                 window=RETRY_BUDGET_WINDOW, clock=time.monotonic):
+        self._ratio = ratio
+        self._minimum = minimum
+        self._window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._requests = collections.deque()
+        self._retries = collections.deque()
+        self.denied = 0
+
+    def _trim(self, now):
+        for stamps in (self._requests, self._retries):
+            while stamps and stamps[0] <= now - self._window:
+                stamps.popleft()
+
+    def note_request(self):
+        with self._lock:
+            now = self._clock()
+            self._trim(now)
+            self._requests.append(now)
+
+    def allow_retry(self):
+        """Consomme un réessai du budget ; False si le budget est épuisé."""
+        with self._lock:
+            now = self._clock()
+            self._trim(now)
+            if len(self._retries) >= self._minimum + self._ratio * len(self._requests):
+                self.denied += 1
+                return False
+            self._retries.append(now)
+            return True
+
+    def snapshot(self):
+        with self._lock:
+            self._trim(self._clock())
+            return {'requests': len(self._requests), 'retries': len(self._retries),
+                    'denied': self.denied}
+
+
+def _endpoint(url):
+    parts = urlsplit(url)
+    return f'{parts.hostname}{parts.path.rstrip("/") or "/"}'
+
+
+class ServerGuard:
+    """Disjoncteurs par route et budget de réessais communs à la borne."""
+
+    def __init__(self, clock=time.monotonic, failure_threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT, budget=None):
+        self._clock = clock
+        self._threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._breakers = collections.OrderedDict()
+        self.budget = budget or RetryBudget(clock=clock)
+
+    def breaker(self, url):
+        endpoint = _endpoint(url)
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(
+                    self._threshold, self._reset_timeout, self._clock)
+                if len(self._breakers) > MAX_BREAKERS:
+                    self._breakers.popitem(last=False)
+            else:
+                self._breakers.move_to_end(endpoint)
+            return breaker
+
+    def before_request(self, url):
+        """Vérifie le disjoncteur avant l'envoi ; lève CircuitOpenError."""
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            raise CircuitOpenError(_endpoint(url), breaker.retry_in())
+        self.budget.note_request()
+
+    def after_response(self, url, status_code, retry_after=None):
+        breaker = self.breaker(url)
+        if status_code == 429 or status_code >= 500:
+            delay = parse_retry_after(retry_after) if status_code in (429, 503) else None
+            breaker.record_failure(delay)
+            if delay is not None:
+                logger.warning("Serveur surchargé (HTTP %s) : %s suspendu %.0fs.",
+                               status_code, _endpoint(url), delay)
+        else:
+            breaker.record_success()
+
+    def after_error(self, url):
+        self.breaker(url).record_failure()
+
+    def after_abort(self, url):
+        """Requête interrompue par une erreur qui ne met pas le serveur en
+        cause (URL ou en-tête invalide, bogue local) : ni succès ni échec,
+        mais l'essai semi-ouvert éventuel est libéré."""
+        self.breaker(url).release()
+
+    def allow_retry(self):
+        return self.budget.allow_retry()
+
+    def retry_in(self, url):
+        """Attente imposée avant de rappeler ``url`` (disjoncteur ouvert)."""
+        return self.breaker(url).retry_in()
+
+    def snapshot(self):
+        """État des disjoncteurs (par route) et du budget de réessais."""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {'breakers': {endpoint: breaker.snapshot()
+                             for endpoint, breaker in breakers.items()},
+                'retry_budget': self.budget.snapshot()}
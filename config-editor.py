@@ -90,6 +90,12 @@ class ConfigEditor(tk.Tk):
                 ("printer_id_product", "ID Produit:", str),
                 ("printer_model", "Modèle:", str),
                 ("check_paper", "Vérifier le papier avant les impressions:", bool),
+                ("printer_process_isolation", "Imprimante dans un processus séparé:", bool),
+                ("status_outbox", "Conserver les statuts hors ligne (envoi par lots):", bool),
+            ]),
+            ("Bornes voisines", [
+                ("peer_forwarding", "Renvoyer vers une borne voisine si l'imprimante est indisponible:", bool),
+                ("peer_discovery", "Découverte automatique sur le réseau local:", bool),
             ]),
         ]
 
@@ -5,12 +5,14 @@ import os
 import re
 import shutil
 import tempfile
-from dataclasses import dataclass, asdict, fields
+from dataclasses import dataclass, asdict, field, fields, replace
 from pathlib import Path
 from urllib.parse import urlparse, urlunparse
 import platform
 
 import secret_store
+from renderer_watch import parse_quiet_window
+from webengine_profile import profile_errors
 
 logger = logging.getLogger("borne.config")
 
@@ -55,9 +57,80 @@ class Settings:
     printer_model: str = "TM-T88II"
     app_secret: str = DEFAULT_APP_SECRET
     check_paper: bool = True
+    # Exécute l'imprimante (USB, statuts, santé) dans un processus enfant
+    # supervisé : isole la borne d'un plantage libusb (cf. printer_worker.py).
+    printer_process_isolation: bool = False
+    # Conserve TOUS les statuts imprimante sur disque jusqu'à acquittement par
+    # le serveur et les envoie par lots compressés (cf. status_outbox.py).
+    status_outbox: bool = True
     # Identifiant de la borne joint aux statuts imprimante. Vide => le hostname
     # de la machine est utilisé par défaut (voir Printer.__init__).
     borne_id: str = ""
+    # Renvoi des tickets vers une borne voisine quand l'imprimante locale ne
+    # peut pas imprimer (cf. peer_link.py). ``peers`` : adresses « hôte[:port] »
+    # des voisines connues ; ``peer_discovery`` : annonces UDP sur le réseau local.
+    peer_forwarding: bool = False
+    peer_port: int = 47800
+    peers: list = field(default_factory=list)
+    peer_discovery: bool = True
+    # Renouvellement du token à ce pourcentage de sa durée de vie (annoncée par
+    # le serveur), avancé d'un décalage aléatoire par borne (cf. token_manager).
+    token_refresh_percent: int = 80
+    # Client HTTP partagé (cf. http_client) : connexions conservées vers le
+    # serveur, réessais d'une connexion impossible, keep-alive TCP (secondes
+    # d'inactivité avant sondage, 0 = désactivé).
+    http_pool_size: int = 4
+    http_retries: int = 2
+    http_keepalive: int = 60
+    # Conservation des résolutions DNS (secondes) ; une réponse expirée reste
+    # servie si le DNS échoue (cf. dns_cache). 0 = résolution à chaque connexion.
+    dns_cache_ttl: int = 300
+    # Sondage léger (HEAD) du serveur toutes les N secondes pour garder la
+    # connexion du pool ouverte (0 = désactivé, cf. network_core).
+    http_warm_interval: int = 45
+    # Conserve le token d'application dans le magasin de secrets (jamais en
+    # clair) pour redémarrer sans attendre le serveur (cf. network_core).
+    persist_app_token: bool = True
+    # Délivrance locale des numéros de ticket depuis des blocs loués au
+    # serveur (cf. ticket_lease). ``ticket_lease_services`` : services dont un
+    # bloc est loué dès le démarrage ; ``ticket_lease_block_size`` : numéros
+    # par bloc.
+    ticket_leasing: bool = False
+    ticket_lease_services: list = field(default_factory=list)
+    ticket_lease_block_size: int = 20
+    # Canal de commandes WebSocket persistant avec le serveur (cf.
+    # push_channel) : commandes poussées par le serveur et statuts imprimante.
+    # ``push_ping_interval`` : pulsation en secondes.
+    push_channel: bool = False
+    push_ping_interval: int = 25
+    # Mandataire local avec cache disque des ressources de /patient (cf.
+    # asset_proxy) ; ``asset_cache_mb`` : taille max du cache en Mo.
+    asset_proxy: bool = False
+    asset_cache_mb: int = 100
+    # /patient préchargée dans une fenêtre cachée puis affichée d'un coup à
+    # la place de l'écran hors ligne (cf. page_preload).
+    preload_patient_page: bool = True
+    # Surveillance du moteur de rendu (cf. renderer_watch) : /patient est
+    # rechargée si la mémoire de rendu dépasse ``renderer_memory_limit_mb``
+    # (0 = pas de limite), si la pulsation reste sans réponse
+    # ``renderer_heartbeat_timeout`` secondes, et une fois par jour dans
+    # ``renderer_recycle_window`` (« HH:MM-HH:MM », vide = jamais).
+    renderer_watch: bool = True
+    renderer_memory_limit_mb: int = 1024
+    renderer_heartbeat_interval: int = 60
+    renderer_heartbeat_timeout: int = 20
+    renderer_recycle_window: str = ""
+    # Profil de performance du moteur web (cf. webengine_profile) :
+    # préréglage (« default », « raspberry_pi », « x86 ») et surcharges de
+    # ses options (gpu, raster_threads, disk_cache_mb, cache_dir,
+    # process_model, touch). ``disk_cache_mb`` > 0 rend la session web non
+    # privée (cookies et stockage local conservés entre redémarrages).
+    webengine_profile: str = "default"
+    webengine_overrides: dict = field(default_factory=dict)
+    # Veille après N minutes sans contact (0 = jamais, cf. idle_mode) :
+    # animations suspendues ; ``idle_screen`` : écran noir statique en plus.
+    idle_after_minutes: int = 5
+    idle_screen: bool = False
 
     @property
     def url(self) -> str:
@@ -153,6 +226,24 @@ class Settings:
             ]
         return []
 
+    def peer_errors(self) -> list:
+        """Erreurs des réglages de renvoi vers les bornes voisines."""
+        errors = []
+        if (not isinstance(self.peer_port, int) or isinstance(self.peer_port, bool)
+                or not (1 <= self.peer_port <= 65535)):
+            errors.append("Le champ « peer_port » doit être un port entre 1 et 65535.")
+        if not isinstance(self.peers, list):
+            errors.append("Le champ « peers » doit être une liste d'adresses « hôte[:port] ».")
+            return errors
+        for address in self.peers:
+            host, sep, port = (address.strip().rpartition(":")
+                               if isinstance(address, str) else ("", "", ""))
+            if not sep:
+                host, port = (address.strip() if isinstance(address, str) else ""), "1"
+            if not host or not port.isdigit() or not (1 <= int(port) <= 65535):
+                errors.append(f"Adresse de borne voisine invalide : {address!r}.")
+        return errors
+
     def validate(self) -> list:
         """Valide la configuration AVANT démarrage. Renvoie la liste des
         problèmes (vide = configuration valide). Vérifie les types, l'URL
@@ -161,7 +252,11 @@ class Settings:
         errors = []
 
         # Types : une valeur JSON du mauvais type ne doit pas passer en douce.
-        for name in ("fullscreen", "debug", "hide_cursor", "check_paper"):
+        for name in ("fullscreen", "debug", "hide_cursor", "check_paper",
+                     "printer_process_isolation", "status_outbox", "peer_forwarding",
+                     "peer_discovery", "persist_app_token", "ticket_leasing",
+                     "push_channel", "asset_proxy", "preload_patient_page",
+                     "renderer_watch", "idle_screen"):
             if not isinstance(getattr(self, name), bool):
                 errors.append(f"Le champ « {name} » doit être un booléen (vrai/faux).")
         for name in (
@@ -176,6 +271,49 @@ class Settings:
         # URL du serveur.
         errors.extend(self.base_url_errors())
 
+        # Bornes voisines.
+        errors.extend(self.peer_errors())
+
+        # Renouvellement du token et client HTTP.
+        for name, low, high in (("token_refresh_percent", 10, 95),
+                                ("http_pool_size", 1, 32),
+                                ("http_retries", 0, 10),
+                                ("http_keepalive", 0, 3600),
+                                ("http_warm_interval", 0, 3600),
+                                ("dns_cache_ttl", 0, 86400),
+                                ("ticket_lease_block_size", 1, 1000),
+                                ("push_ping_interval", 5, 300),
+                                ("asset_cache_mb", 10, 2000),
+                                ("renderer_memory_limit_mb", 0, 16384),
+                                ("renderer_heartbeat_interval", 10, 3600),
+                                ("renderer_heartbeat_timeout", 5, 300),
+                                ("idle_after_minutes", 0, 1440)):
+            value = getattr(self, name)
+            if (not isinstance(value, int) or isinstance(value, bool)
+                    or not (low <= value <= high)):
+                errors.append(f"Le champ « {name} » doit être un entier "
+                              f"entre {low} et {high}.")
+
+        # Délivrance locale des tickets : identifiants de service.
+        if (not isinstance(self.ticket_lease_services, list)
+                or any(not isinstance(s, (str, int)) or isinstance(s, bool)
+                       for s in self.ticket_lease_services)):
+            errors.append("Le champ « ticket_lease_services » doit être une liste "
+                          "d'identifiants de service.")
+
+        # Fenêtre de recyclage de la page.
+        if not isinstance(self.renderer_recycle_window, str):
+            errors.append("Le champ « renderer_recycle_window » doit être une chaîne "
+                          "de caractères.")
+        else:
+            try:
+                parse_quiet_window(self.renderer_recycle_window)
+            except ValueError as e:
+                errors.append(f"Le champ « renderer_recycle_window » est invalide ({e}).")
+
+        # Profil du moteur web.
+        errors.extend(profile_errors(self.webengine_profile, self.webengine_overrides))
+
         # Authentification borne.
         if isinstance(self.username, str) and not self.username.strip():
             errors.append("Le nom d'utilisateur ne peut pas être vide.")
@@ -193,6 +331,24 @@ class Settings:
         return errors
 
 
+# Seuls réglages qu'un changement poussé par le serveur (canal de commandes,
+# cf. push_channel) peut modifier : intervalles, tailles et fonctions de la
+# borne. Tout le reste est réservé à l'éditeur local : serveur, identifiants
+# et secrets, ``debug`` (qui lève les protections de production), imprimante
+# et identité de la borne, renvoi entre voisines (écoute réseau), token
+# conservé, canal de commandes lui-même et profil du moteur web.
+REMOTE_TUNABLE_FIELDS = frozenset({
+    "fullscreen", "hide_cursor", "check_paper", "printer_process_isolation",
+    "status_outbox", "token_refresh_percent", "http_pool_size", "http_retries",
+    "http_keepalive", "dns_cache_ttl", "http_warm_interval", "ticket_leasing",
+    "ticket_lease_services", "ticket_lease_block_size", "push_ping_interval",
+    "asset_proxy", "asset_cache_mb", "preload_patient_page", "renderer_watch",
+    "renderer_memory_limit_mb", "renderer_heartbeat_interval",
+    "renderer_heartbeat_timeout", "renderer_recycle_window",
+    "idle_after_minutes", "idle_screen",
+})
+
+
 class Config:
     """Gestionnaire de configuration"""
     _instance = None
@@ -320,6 +476,29 @@ class Config:
                 setattr(self.settings, name, legacy)
         return migrated
 
+    def apply_remote_changes(self, changes) -> list:
+        """Applique des réglages poussés par le serveur (dict champ -> valeur)
+        et les enregistre. Renvoie la liste des problèmes (vide = appliqué) :
+        champ inconnu ou hors de REMOTE_TUNABLE_FIELDS, configuration
+        résultante invalide. Comme pour l'éditeur, les changements prennent
+        effet au prochain démarrage de la borne."""
+        if not isinstance(changes, dict) or not changes:
+            return ["Aucun réglage à appliquer."]
+        known = {f.name for f in fields(Settings)}
+        errors = [f"Réglage inconnu : {name}." for name in changes if name not in known]
+        errors.extend(f"Réglage non modifiable à distance : {name}."
+                      for name in changes
+                      if name in known and name not in REMOTE_TUNABLE_FIELDS)
+        if errors:
+            return errors
+        new_settings = replace(self.settings, **changes)
+        errors = new_settings.validate()
+        if errors:
+            return errors
+        self.save_settings(new_settings)
+        logger.info("Réglages modifiés par le serveur : %s.", ", ".join(sorted(changes)))
+        return []
+
     def save_settings(self, new_settings=None):
         """Sauvegarde les paramètres dans le fichier JSON, de façon **atomique**.
 
@@ -0,0 +1,227 @@
+# dns_cache.py
+"""Résolution DNS mise en cache et connexion « happy eyeballs » pour le
+client HTTP de la borne.
+
+Beaucoup d'officines ont un DNS lent ou capricieux (box opérateur) : sans
+cache, chaque reconnexion de ``requests`` repasse par le résolveur système et
+peut coûter plusieurs secondes. :class:`DnsCache` :
+
+- conserve les réponses pendant leur TTL (celui du résolveur s'il l'indique,
+  sinon ``Settings.dns_cache_ttl`` : ``getaddrinfo`` n'expose pas de TTL) ;
+- une fois le TTL échu, relance la résolution mais ne l'attend que
+  ``STALE_GRACE`` secondes : si le résolveur échoue ou traîne, l'ancienne
+  réponse est servie (la résolution en cours met le cache à jour si elle
+  aboutit). Une seule résolution à la fois par nom ;
+- :meth:`DnsCache.connect` met en concurrence les adresses IPv6 et IPv4
+  (RFC 8305) : une tentative par adresse, familles alternées, la suivante
+  démarrant ``HAPPY_EYEBALLS_DELAY`` secondes plus tard (ou dès l'échec de la
+  précédente) ; la première connexion établie l'emporte.
+
+Le tout respecte le délai de connexion de la requête (premier élément de
+``NETWORK_TIMEOUT``) : résolution et connexion partagent la même échéance, et
+un dépassement lève ``socket.timeout`` comme une connexion ordinaire.
+"""
+import errno
+import logging
+import os
+import selectors
+import socket
+import threading
+import time
+
+logger = logging.getLogger("borne.network")
+
+# Durée de conservation d'une réponse quand le résolveur n'indique pas de TTL
+# (cf. Settings.dns_cache_ttl).
+DEFAULT_DNS_TTL = 300
+# Attente maximale d'une nouvelle résolution quand une réponse expirée est
+# disponible (secondes).
+STALE_GRACE = 1.0
+# Décalage entre deux tentatives de connexion concurrentes (RFC 8305 : 250 ms).
+HAPPY_EYEBALLS_DELAY = 0.25
+
+_IN_PROGRESS = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN,
+                getattr(errno, 'WSAEWOULDBLOCK', 10035)}
+
+
+def system_resolver(host, port):
+    """Résolveur par défaut : ``getaddrinfo`` (sans TTL)."""
+    return socket.getaddrinfo(host, port, type=socket.SOCK_STREAM), None
+
+
+def _interleave(addrinfos):
+    """Adresses dans l'ordre des tentatives : familles alternées, en
+    commençant par celle que préfère le résolveur."""
+    by_family = {}
+    for info in addrinfos:
+        by_family.setdefault(info[0], []).append(info)
+    groups = list(by_family.values())
+    ordered = []
+    while groups:
+        for group in groups:
+            ordered.append(group.pop(0))
+        groups = [g for g in groups if g]
+    return ordered
+
+
+class _Entry:
+    __slots__ = ('addrinfos', 'expires')
+
+    def __init__(self, addrinfos, expires):
+        self.addrinfos = addrinfos
+        self.expires = expires
+
+
+class _Lookup:
+    """Résolution en cours, partagée par les demandes simultanées."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class DnsCache:
+    """Cache des résolutions et connexion concurrente (sûr entre threads).
+
+    ``resolver(host, port)`` renvoie ``(addrinfos, ttl)`` (``ttl`` None : TTL
+    par défaut) ou lève ``OSError``."""
+
+    def __init__(self, resolver=system_resolver, ttl=DEFAULT_DNS_TTL,
+                 clock=time.monotonic, attempt_delay=HAPPY_EYEBALLS_DELAY):
+        self._resolver = resolver
+        self._ttl = ttl
+        self._clock = clock
+        self._attempt_delay = attempt_delay
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._lookups = {}
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'failures': 0}
+        self._won_by = {}
+
+    def stats(self):
+        """Compteurs du cache (``hits``, ``misses``, ``stale`` : réponses
+        expirées servies, ``failures`` : échecs du résolveur) et familles
+        gagnantes des connexions (``won_by``)."""
+        with self._lock:
+            return dict(self._stats, won_by=dict(self._won_by))
+
+    def resolve(self, host, port, timeout=None):
+        """Adresses de ``host`` (``getaddrinfo``), depuis le cache si possible."""
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() < entry.expires:
+                self._stats['hits'] += 1
+                return entry.addrinfos
+            self._stats['misses'] += 1
+            lookup = self._lookups.get(key)
+            if lookup is None:
+                lookup = self._lookups[key] = _Lookup()
+                threading.Thread(target=self._run_lookup, args=(key, lookup),
+                                 name="borne-dns", daemon=True).start()
+        wait = timeout
+        if entry is not None:
+            wait = STALE_GRACE if timeout is None else min(STALE_GRACE, timeout)
+        if lookup.done.wait(wait) and lookup.error is None:
+            return lookup.result
+        if entry is not None:
+            with self._lock:
+                self._stats['stale'] += 1
+            logger.warning("Résolution DNS de %s %s : réponse expirée utilisée.", host,
+                           "en échec" if lookup.done.is_set() else "trop lente")
+            return entry.addrinfos
+        if lookup.done.is_set():
+            raise lookup.error
+        raise socket.timeout(f"Résolution DNS de {host} : délai dépassé ({timeout}s)")
+
+    def _run_lookup(self, key, lookup):
+        try:
+            addrinfos, ttl = self._resolver(*key)
+            if not addrinfos:
+                raise socket.gaierror(socket.EAI_NONAME, f"Aucune adresse pour {key[0]}")
+            lookup.result = addrinfos
+        except OSError as e:
+            lookup.error = e
+        with self._lock:
+            if lookup.error is None:
+                ttl = self._ttl if ttl is None else ttl
+                self._entries[key] = _Entry(addrinfos, self._clock() + ttl)
+            else:
+                self._stats['failures'] += 1
+            del self._lookups[key]
+        lookup.done.set()
+
+    def connect(self, host, port, timeout=None, source_address=None, socket_options=None):
+        """Socket connecté à ``host:port`` (mêmes paramètres que
+        ``urllib3.util.connection.create_connection``)."""
+        deadline = None if timeout is None else self._clock() + timeout
+        addrinfos = self.resolve(host, port, timeout)
+        if deadline is not None and self._clock() >= deadline:
+            raise socket.timeout(f"Connexion à {host} : délai dépassé ({timeout}s)")
+        sock = self._race(_interleave(addrinfos), deadline, source_address, socket_options)
+        family = 'ipv6' if sock.family == socket.AF_INET6 else 'ipv4'
+        with self._lock:
+            self._won_by[family] = self._won_by.get(family, 0) + 1
+        sock.settimeout(timeout)
+        return sock
+
+    def _start_attempt(self, info, source_address, socket_options):
+        family, type_, proto, _, sockaddr = info
+        sock = socket.socket(family, type_, proto)
+        try:
+            for option in socket_options or ():
+                sock.setsockopt(*option)
+            if source_address:
+                sock.bind(source_address)
+            sock.setblocking(False)
+            err = sock.connect_ex(sockaddr)
+            if err not in _IN_PROGRESS:
+                raise OSError(err, os.strerror(err))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _race(self, candidates, deadline, source_address, socket_options):
+        selector = selectors.DefaultSelector()
+        pending = set()
+        last_error = None
+        next_start = self._clock()
+        try:
+            while True:
+                now = self._clock()
+                if candidates and (not pending or now >= next_start):
+                    try:
+                        sock = self._start_attempt(candidates.pop(0), source_address,
+                                                   socket_options)
+                    except OSError as e:
+                        last_error = e
+                        continue
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    pending.add(sock)
+                    next_start = now + self._attempt_delay
+                    continue
+                if not pending:
+                    raise last_error or OSError("Aucune adresse joignable")
+                if deadline is not None and now >= deadline:
+                    raise socket.timeout("Connexion : délai dépassé")
+                wait = None if deadline is None else deadline - now
+                if candidates:
+                    wait = next_start - now if wait is None else min(wait, next_start - now)
+                for key, _ in selector.select(max(0, wait) if wait is not None else None):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    pending.discard(sock)
+                    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err == 0:
+                        sock.setblocking(True)
+                        return sock
+                    last_error = OSError(err, os.strerror(err))
+                    sock.close()
+                    # Échec : la tentative suivante démarre sans attendre.
+                    next_start = self._clock()
+        finally:
+            for sock in pending:
+                sock.close()
+            selector.close()
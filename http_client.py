@@ -0,0 +1,230 @@
+# http_client.py
+"""Client HTTP unique de la borne : une session ``requests`` partagée, avec
+un pool de connexions, un keep-alive et une politique de réessai réglables.
+
+Tous les échanges avec le serveur (token, statuts imprimante, sondage de
+joignabilité) passent par la même session, reçue par injection : une seule
+connexion TCP/TLS réutilisée vers le serveur au lieu d'une par composant.
+:meth:`HttpClient.stats` expose le nombre de connexions réellement ouvertes
+(un chiffre qui grimpe signale des connexions non réutilisées) et la durée
+de la dernière poignée de main (résolution + TCP, puis TLS).
+
+Les connexions sont établies par :class:`dns_cache.DnsCache` : résolutions
+mises en cache (réponse expirée servie si le DNS échoue) et adresses IPv6 /
+IPv4 mises en concurrence. Chaque requête passe par les disjoncteurs et le
+budget de réessais communs (:class:`circuit_breaker.ServerGuard`,
+:attr:`HttpClient.guard`).
+
+Réessais : seules les ERREURS DE CONNEXION (requête jamais partie) sont
+réessayées par le pool, quel que soit le verbe ; les réponses d'erreur et les
+coupures en cours de lecture remontent à l'appelant, qui applique son propre
+backoff (cf. envoi des statuts) : un POST n'est jamais rejoué à l'aveugle.
+
+HTTP/2 n'est pas disponible avec ``requests`` ; avec un seul serveur et un
+trafic faible, une connexion HTTP/1.1 persistante suffit.
+"""
+import logging
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.retry import Retry
+
+from circuit_breaker import ServerGuard
+from dns_cache import DnsCache
+
+logger = logging.getLogger("borne.network")
+
+# Connexions conservées par hôte (cf. Settings.http_pool_size).
+DEFAULT_POOL_SIZE = 4
+# Réessais d'une connexion impossible à établir (cf. Settings.http_retries).
+DEFAULT_RETRIES = 2
+# Keep-alive TCP : premier sondage après N secondes d'inactivité ; 0 = désactivé
+# (cf. Settings.http_keepalive). Détecte une connexion morte (box redémarrée,
+# NAT expiré) avant qu'une requête ne reste bloquée dessus.
+DEFAULT_KEEPALIVE = 60
+# Backoff entre deux réessais de connexion (secondes, exponentiel).
+RETRY_BACKOFF_FACTOR = 0.5
+
+
+def _keepalive_options(idle):
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # Options fines disponibles sous Linux (absentes sous Windows/macOS).
+    for name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', max(1, idle // 4)),
+                        ('TCP_KEEPCNT', 4)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+def _timed(connection_class, on_connected, dns):
+    """Sous-classe de connexion urllib3 établie via ``dns`` (DnsCache) et
+    chronométrée : ``_new_conn`` = résolution DNS + TCP, le reste de
+    ``connect`` = TLS."""
+    class _Connection(connection_class):
+        def _new_conn(self):
+            started = time.perf_counter()
+            # Délai de connexion de la requête (None : pas de délai).
+            timeout = self.timeout if isinstance(self.timeout, (int, float)) else None
+            # Mêmes exceptions que HTTPConnection._new_conn (réessais urllib3).
+            try:
+                sock = dns.connect(self._dns_host, self.port, timeout,
+                                   source_address=self.source_address,
+                                   socket_options=self.socket_options)
+            except socket.gaierror as e:
+                raise NameResolutionError(self.host, self, e) from e
+            except socket.timeout as e:
+                raise ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. (connect timeout={timeout})"
+                ) from e
+            except OSError as e:
+                raise NewConnectionError(
+                    self, f"Failed to establish a new connection: {e}") from e
+            self._tcp_seconds = time.perf_counter() - started
+            return sock
+
+        def connect(self):
+            self._tcp_seconds = 0.0
+            started = time.perf_counter()
+            super().connect()
+            total = time.perf_counter() - started
+            on_connected(self.host, self._tcp_seconds, total - self._tcp_seconds)
+    return _Connection
+
+
+class _CountingAdapter(HTTPAdapter):
+    """Adaptateur qui signale chaque ouverture de connexion au client, et la
+    durée de son établissement, et soumet les requêtes aux disjoncteurs."""
+
+    def __init__(self, on_new_connection, on_connected, socket_options, dns, guard,
+                 **kwargs):
+        # Avant super().__init__, qui appelle init_poolmanager.
+        self._on_new_connection = on_new_connection
+        self._on_connected = on_connected
+        self._socket_options = socket_options
+        self._dns = dns
+        self._guard = guard
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._socket_options:
+            kwargs['socket_options'] = self._socket_options
+        super().init_poolmanager(*args, **kwargs)
+        notify = self._on_new_connection
+        on_connected = self._on_connected
+        dns = self._dns
+
+        def counting(pool_class):
+            class _Pool(pool_class):
+                ConnectionCls = _timed(pool_class.ConnectionCls, on_connected, dns)
+
+                def _new_conn(self):
+                    notify(self.host)
+                    return super()._new_conn()
+            return _Pool
+
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: counting(pool_class)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def send(self, request, **kwargs):
+        # Les sondages (HEAD) échappent aux disjoncteurs : ils détectent le
+        # retour du serveur.
+        if request.method == 'HEAD':
+            return super().send(request, **kwargs)
+        self._guard.before_request(request.url)
+        try:
+            response = super().send(request, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            self._guard.after_error(request.url)
+            raise
+        except BaseException:
+            # Toute sortie doit conclure la requête : sinon un essai
+            # semi-ouvert resterait pris et la route refusée pour toujours.
+            self._guard.after_abort(request.url)
+            raise
+        self._guard.after_response(request.url, response.status_code,
+                                   response.headers.get('Retry-After'))
+        return response
+
+
+class HttpClient:
+    """Session HTTP partagée et ses métriques."""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                 keepalive=DEFAULT_KEEPALIVE, dns=None, guard=None):
+        self.dns = dns or DnsCache()
+        self.guard = guard or ServerGuard()
+        self._lock = threading.Lock()
+        self._opened = {}
+        self._handshakes = 0
+        self._last_handshake = None
+        retry = Retry(total=retries, connect=retries, read=0, status=0, other=0,
+                      redirect=False, backoff_factor=RETRY_BACKOFF_FACTOR,
+                      raise_on_status=False)
+        socket_options = None
+        if keepalive:
+            socket_options = HTTPConnection.default_socket_options + _keepalive_options(keepalive)
+        adapter = _CountingAdapter(self._note_connection, self._note_handshake,
+                                   socket_options, self.dns, self.guard,
+                                   pool_connections=1, pool_maxsize=pool_size,
+                                   max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(pool_size=settings.http_pool_size, retries=settings.http_retries,
+                   keepalive=settings.http_keepalive,
+                   dns=DnsCache(ttl=settings.dns_cache_ttl))
+
+    def _note_connection(self, host):
+        with self._lock:
+            self._opened[host] = self._opened.get(host, 0) + 1
+        logger.debug("Nouvelle connexion HTTP vers %s.", host)
+
+    def _note_handshake(self, host, tcp_seconds, tls_seconds):
+        with self._lock:
+            self._handshakes += 1
+            self._last_handshake = {
+                'host': host,
+                'tcp_ms': round(tcp_seconds * 1000, 1),
+                'tls_ms': round(tls_seconds * 1000, 1),
+            }
+        logger.debug("Connexion établie vers %s (DNS+TCP %.0f ms, TLS %.0f ms).",
+                     host, tcp_seconds * 1000, tls_seconds * 1000)
+
+    def stats(self):
+        """``{'connections_opened', 'by_host', 'handshakes', 'last_handshake',
+        'dns'}`` (``last_handshake`` : ``{'host', 'tcp_ms', 'tls_ms'}`` ou None ;
+        ``dns`` : cf. :meth:`DnsCache.stats`)."""
+        with self._lock:
+            stats = {'connections_opened': sum(self._opened.values()),
+                     'by_host': dict(self._opened),
+                     'handshakes': self._handshakes,
+                     'last_handshake': dict(self._last_handshake or {}) or None}
+        stats['dns'] = self.dns.stats()
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_http_client(settings=None):
+    """Client HTTP unique du processus, créé au premier appel (à partir de
+    ``settings`` si fournis, sinon avec les valeurs par défaut)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = HttpClient.from_settings(settings) if settings else HttpClient()
+        return _shared
@@ -0,0 +1,114 @@
+# idle_mode.py
+"""Mode veille de la fenêtre kiosque et mesure de son gain.
+
+La borne dessinait à pleine cadence toute la journée, y compris l'animation
+de l'écran « Borne hors ligne », ce qui occupe processeur et GPU sur un
+matériel refroidi passivement. Le script kiosque (cf. kiosk_bundle) passe
+la page en veille après ``idle_after_minutes`` sans contact : animations et
+transitions CSS suspendues, et, avec ``idle_screen``, un écran statique
+noir recouvre la page. Le premier contact réveille la page (avec l'écran
+statique, ce contact ne déclenche rien d'autre).
+
+:class:`IdleMeter` reçoit les passages en veille et réveils (pont
+JavaScript) et mesure, avec l'échantillonnage de la borne
+(:class:`renderer_watch.ProcessSampler`), le temps processeur consommé dans
+chaque état : la différence de charge moyenne est le gain de la veille.
+L'énergie est lue dans les compteurs RAPL (``/sys/class/powercap``, x86) si
+le système les expose ; sinon seul le gain processeur est rapporté.
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from renderer_watch import ProcessSampler
+
+logger = logging.getLogger("borne.idle")
+
+# Compteur d'énergie du paquet processeur (microjoules), x86 (Intel/AMD).
+RAPL_ENERGY_PATH = "/sys/class/powercap/intel-rapl:0/energy_uj"
+
+
+def _read_energy_uj(path):
+    try:
+        return int(Path(path).read_text().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class IdleMeter:
+    """Temps, temps processeur et énergie cumulés par état (actif/veille)."""
+
+    def __init__(self, sampler=None, clock=time.monotonic, energy_path=RAPL_ENERGY_PATH):
+        self._sampler = sampler or ProcessSampler()
+        self._clock = clock
+        self._energy_path = energy_path
+        self._lock = threading.Lock()
+        self._idle = False
+        self._entries = 0
+        self._totals = {state: {'seconds': 0.0, 'cpu': 0.0, 'energy_j': 0.0}
+                        for state in ('active', 'idle')}
+        self._energy_ok = os.access(energy_path, os.R_OK)
+        self._mark = self._sample()
+
+    def _sample(self):
+        return (self._clock(), self._sampler.sample()['cpu_seconds'],
+                _read_energy_uj(self._energy_path) if self._energy_ok else None)
+
+    def set_idle(self, idle):
+        """Passage en veille (True) ou réveil (False) de la page."""
+        idle = bool(idle)
+        with self._lock:
+            if idle == self._idle:
+                return
+            self._accumulate()
+            self._idle = idle
+            if idle:
+                self._entries += 1
+        if idle:
+            logger.info("Borne en veille (aucun contact).")
+        else:
+            stats = self.stats()
+            logger.info("Réveil de la borne (charge processeur : %s %% en veille, "
+                        "%s %% active).", stats['idle_cpu_percent'],
+                        stats['active_cpu_percent'])
+
+    def _accumulate(self):
+        now, cpu, energy = self._sample()
+        since, cpu_since, energy_since = self._mark
+        totals = self._totals['idle' if self._idle else 'active']
+        totals['seconds'] += now - since
+        if cpu is not None and cpu_since is not None:
+            totals['cpu'] += max(0.0, cpu - cpu_since)
+        if energy is not None and energy_since is not None and energy >= energy_since:
+            # Un compteur qui repasse à zéro fausse l'intervalle : ignoré.
+            totals['energy_j'] += (energy - energy_since) / 1e6
+        self._mark = (now, cpu, energy)
+
+    def stats(self):
+        """``{'idle', 'idle_entries', 'idle_seconds', 'active_seconds',
+        'idle_cpu_percent', 'active_cpu_percent', 'cpu_saved_percent',
+        'idle_watts', 'active_watts', 'power_saved_watts'}`` ; charges en %
+        d'un cœur, puissances None sans compteur d'énergie."""
+        with self._lock:
+            self._accumulate()
+            totals = {state: dict(values) for state, values in self._totals.items()}
+            stats = {'idle': self._idle, 'idle_entries': self._entries}
+        for state in ('idle', 'active'):
+            seconds = totals[state]['seconds']
+            stats[f'{state}_seconds'] = round(seconds, 1)
+            stats[f'{state}_cpu_percent'] = (round(100 * totals[state]['cpu'] / seconds, 1)
+                                            if seconds else None)
+            stats[f'{state}_watts'] = (round(totals[state]['energy_j'] / seconds, 2)
+                                       if seconds and self._energy_ok else None)
+        stats['cpu_saved_percent'] = _difference(stats['active_cpu_percent'],
+                                                 stats['idle_cpu_percent'])
+        stats['power_saved_watts'] = _difference(stats['active_watts'], stats['idle_watts'])
+        return stats
+
+
+def _difference(active, idle):
+    if active is None or idle is None:
+        return None
+    return round(active - idle, 2)
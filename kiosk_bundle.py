@@ -0,0 +1,254 @@
+# kiosk_bundle.py
+"""Script kiosque unique injecté dans les pages de la fenêtre.
+
+À chaque chargement de page, la fenêtre envoyait jusqu'à quatre scripts
+(protections tactiles et curseur, protections kiosque, touche F11,
+connexion automatique), chacun par un aller-retour synchrone
+``evaluate_js``, et l'écouteur ``keydown`` était ajouté à chaque chargement.
+:func:`build_kiosk_bundle` produit UN script pour les trois premiers,
+construit une fois par session avec les réglages intégrés ; il se protège
+lui-même contre une double exécution dans un même document
+(``window.__kioskBundle``).
+
+Contenu :
+
+- partout (écran hors ligne compris) : date du dernier contact
+  (``window.__kioskLastInput``, cf. renderer_watch) ; menu contextuel
+  bloqué ; pinch/zoom bloqué par preventDefault UNIQUEMENT si plusieurs
+  points de contact (un preventDefault sur chaque touchstart supprime, selon
+  le moteur, le clic synthétique et rend des boutons inopérants) ; curseur
+  masqué au toucher,
+  réaffiché dès qu'une souris bouge (maintenance), les faux ``mousemove``
+  émis juste après un toucher étant ignorés (``hide_cursor``) ;
+- partout : mode veille (cf. idle_mode) ;
+- pages du serveur : ``touch-action: manipulation`` (ni double-tap zoom ni
+  délai de clic, taps préservés) et ``user-select: none`` hors champs de
+  saisie ; F11 bascule le plein écran.
+
+Le script, exécuté dans tous les documents (pages étrangères comprises), ne
+contient AUCUN secret. La connexion automatique reste un script à part
+(:func:`build_login_script`), envoyé par la fenêtre uniquement après avoir
+vérifié côté Python que la page courante est la page de connexion du serveur
+(:func:`is_login_page`, comparaison d'origine).
+
+Avec Qt WebEngine, :func:`install_at_document_start` enregistre le script à
+la création de chaque document : les protections sont actives avant le
+premier rendu. Sinon, la fenêtre l'exécute au chargement (un seul appel).
+"""
+import json
+import logging
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("borne.bundle")
+
+_BUNDLE_TEMPLATE = """
+(function (config) {
+    if (window.__kioskBundle) { return; }
+    window.__kioskBundle = true;
+
+    function whenReady(fn) {
+        if (document.readyState === 'loading') {
+            document.addEventListener('DOMContentLoaded', fn);
+        } else {
+            fn();
+        }
+    }
+
+    function addStyle(css) {
+        var style = document.createElement('style');
+        style.textContent = css;
+        var parent = document.head || document.documentElement;
+        if (parent) {
+            parent.appendChild(style);
+        } else {
+            // Création du document : pas encore d'élément racine.
+            whenReady(function () {
+                (document.head || document.documentElement).appendChild(style);
+            });
+        }
+    }
+
+    // Dernier contact (pulsation de renderer_watch : inscription en cours).
+    window.__kioskLastInput = 0;
+    ['pointerdown', 'touchstart', 'keydown'].forEach(function (type) {
+        window.addEventListener(type, function () {
+            window.__kioskLastInput = Date.now();
+        }, {passive: true, capture: true});
+    });
+
+    // Veille (cf. idle_mode) : animations suspendues après idleAfterMs sans
+    // contact, écran statique en option ; le contact suivant réveille.
+    if (config.idleAfterMs > 0) {
+        var idle = false, overlay = null, idleTimer = null, idleSince = Date.now();
+        addStyle("html.kiosk-idle *, html.kiosk-idle *::before, html.kiosk-idle *::after " +
+                 "{ animation-play-state: paused !important; transition: none !important; }");
+        var reportIdle = function (state) {
+            var api = window.pywebview && window.pywebview.api;
+            if (api && api.window && api.window.set_idle) { api.window.set_idle(state); }
+        };
+        var armIdle = function () {
+            clearTimeout(idleTimer);
+            var last = Math.max(window.__kioskLastInput, idleSince);
+            var remaining = last + config.idleAfterMs - Date.now();
+            if (remaining > 0) {
+                idleTimer = setTimeout(armIdle, remaining);
+                return;
+            }
+            idle = true;
+            document.documentElement.classList.add('kiosk-idle');
+            if (config.idleScreen && document.body) {
+                overlay = document.createElement('div');
+                overlay.style.cssText = "position:fixed;top:0;left:0;right:0;bottom:0;" +
+                                        "z-index:2147483647;background:#000;";
+                document.body.appendChild(overlay);
+            }
+            reportIdle(true);
+        };
+        var wake = function () {
+            if (!idle) { return; }
+            idle = false;
+            document.documentElement.classList.remove('kiosk-idle');
+            if (overlay) {
+                // Retiré après le geste : le contact de réveil ne clique rien.
+                var wakeOverlay = overlay;
+                overlay = null;
+                setTimeout(function () { wakeOverlay.remove(); }, 500);
+            }
+            reportIdle(false);
+            armIdle();
+        };
+        ['pointerdown', 'touchstart', 'keydown'].forEach(function (type) {
+            window.addEventListener(type, wake, {passive: true, capture: true});
+        });
+        armIdle();
+    }
+
+    window.addEventListener('contextmenu', function (e) {
+        e.preventDefault();
+        return false;
+    }, true);
+
+    window.addEventListener('touchstart', function (e) {
+        if (e.touches.length > 1) {
+            e.preventDefault();
+        }
+    }, {passive: false, capture: true});
+
+    if (config.hideCursor) {
+        addStyle("html:not(.using-mouse) * { cursor: none !important; }");
+        var lastTouch = 0;
+        window.addEventListener('touchstart', function () {
+            lastTouch = Date.now();
+            document.documentElement.classList.remove('using-mouse');
+        }, true);
+        window.addEventListener('mousemove', function () {
+            if (Date.now() - lastTouch < 800) { return; }
+            document.documentElement.classList.add('using-mouse');
+        }, true);
+    }
+
+    // Simple présentation : aucun secret ne dépend de ce test.
+    if (location.href.indexOf(config.serverUrl) !== 0) { return; }
+
+    addStyle("html { touch-action: manipulation; } " +
+             "* { -webkit-user-select: none; user-select: none; -webkit-touch-callout: none; } " +
+             "input, textarea { -webkit-user-select: text; user-select: text; }");
+
+    document.addEventListener('keydown', function (event) {
+        if (event.key === 'F11') {
+            event.preventDefault();
+            window.pywebview.api.window.toggle_fullscreen();
+        }
+    });
+})(__CONFIG__);
+"""
+
+_LOGIN_TEMPLATE = """
+(function (credentials) {
+    function performLogin() {
+        var usernameInput = document.querySelector('input[name="username"]');
+        var passwordInput = document.querySelector('input[name="password"]');
+        var rememberCheckbox = document.querySelector('input[name="remember"]');
+        if (usernameInput) { usernameInput.value = credentials.username; }
+        if (passwordInput) { passwordInput.value = credentials.password; }
+        if (rememberCheckbox) { rememberCheckbox.checked = true; }
+        var form = usernameInput ? usernameInput.closest('form') : null;
+        if (form) {
+            console.log("Connexion automatique : formulaire soumis");
+            form.submit();
+        } else {
+            console.log("Connexion automatique : formulaire introuvable");
+        }
+    }
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', performLogin);
+    } else {
+        performLogin();
+    }
+})(__CREDENTIALS__);
+"""
+
+
+def build_kiosk_bundle(server_url, hide_cursor, idle_after_minutes=0, idle_screen=False):
+    """Script kiosque avec les réglages intégrés (sans identifiants).
+    ``server_url`` : origine des pages du serveur (celle du mandataire local
+    s'il est actif) ; ``idle_after_minutes`` : veille après N minutes sans
+    contact (0 : jamais, cf. idle_mode)."""
+    config = {'serverUrl': server_url, 'hideCursor': bool(hide_cursor),
+              'idleAfterMs': idle_after_minutes * 60 * 1000, 'idleScreen': bool(idle_screen)}
+    return _BUNDLE_TEMPLATE.replace('__CONFIG__', json.dumps(config))
+
+
+def build_login_script(username, password):
+    """Script de connexion automatique : remplit et soumet le formulaire.
+    À n'envoyer qu'à la page de connexion du serveur (cf. :func:`is_login_page`).
+
+    Les identifiants sont sérialisés par ``json.dumps`` : un guillemet, un
+    antislash ou un saut de ligne dans le mot de passe ne peut ni casser le
+    script ni injecter de code (``ensure_ascii`` encode aussi les caractères
+    non ASCII, dont U+2028/U+2029)."""
+    credentials = {'username': username, 'password': password}
+    return _LOGIN_TEMPLATE.replace('__CREDENTIALS__', json.dumps(credentials))
+
+
+def _origin(parts):
+    port = parts.port or {'http': 80, 'https': 443}.get(parts.scheme)
+    return parts.scheme, (parts.hostname or '').lower(), port
+
+
+def is_login_page(url, server_url):
+    """Vrai si ``url`` est une page de connexion du serveur ``server_url`` :
+    même origine (schéma, hôte, port), sous son chemin de base, et « login »
+    dans le chemin. Une page étrangère dont l'adresse commence comme celle du
+    serveur (``https://serveur.evil.example/login``…) est refusée."""
+    try:
+        page, server = urlsplit(url or ''), urlsplit(server_url)
+        if _origin(page) != _origin(server):
+            return False
+    except ValueError:
+        return False
+    base = server.path.rstrip('/')
+    if base and page.path != base and not page.path.startswith(base + '/'):
+        return False
+    return 'login' in page.path[len(base):]
+
+
+def install_at_document_start(window, bundle):
+    """Enregistre ``bundle`` à la création de chaque document de ``window``
+    (Qt WebEngine, à appeler avant l'affichage : évènement ``before_show``).
+    Renvoie False si le moteur ne le permet pas : l'appelant l'exécute
+    alors au chargement de chaque page."""
+    try:
+        from PySide6.QtWebEngineCore import QWebEngineScript
+        page = window.native.view.page()
+    except (ImportError, AttributeError) as e:
+        logger.debug("Injection au début du document indisponible : %s", e)
+        return False
+    script = QWebEngineScript()
+    script.setName("kiosk-bundle")
+    script.setSourceCode(bundle)
+    script.setInjectionPoint(QWebEngineScript.InjectionPoint.DocumentCreation)
+    script.setWorldId(QWebEngineScript.ScriptWorldId.MainWorld)
+    script.setRunsOnSubFrames(False)
+    page.scripts().insert(script)
+    return True
@@ -1,30 +1,38 @@
 import webview
 from config import Config
-import requests
-from requests.exceptions import RequestException
-import time
 import threading
 import json
 import html
 import logging
 import logging_config
-from printer import Printer, PrinterAPI, NETWORK_TIMEOUT
+from printer import Printer, PrinterAPI
+from network_core import NetworkCore
+from http_client import HttpClient, shared_http_client
+import secret_store
+from printer_worker import PrinterProcess
+from peer_link import PeerLink
+from status_outbox import OUTBOX_FILENAME
+from push_channel import PushChannel
+from asset_proxy import ASSET_CACHE_DIRNAME, AssetProxy
+from page_preload import PagePreloader
+from kiosk_bundle import (build_kiosk_bundle, build_login_script, install_at_document_start,
+                          is_login_page)
+from renderer_watch import RendererSupervisor
+from webengine_profile import apply_profile, describe
+from idle_mode import IdleMeter
+from ticket_lease import LEASE_FILENAME, TicketAPI, TicketLeaser, TicketLeaseStore
+import socket
+import weakref
 import os
 
 logger = logging.getLogger("borne.main")
 
-# Renouvellement du token avant son expiration (24 h côté serveur). Marge d'1 h
-# pour absorber d'éventuels échecs/réessais réseau.
-TOKEN_REFRESH_INTERVAL = 23 * 3600
-
-# Boucle d'initialisation persistante : au démarrage (et tant que la borne n'a
-# pas obtenu son token), on réessaie avec un backoff exponentiel borné au lieu
-# d'abandonner. Tant que la borne n'est pas opérationnelle, l'écran local
-# « Borne hors ligne » ci-dessous est affiché et la page /patient n'est PAS
-# chargée : aucune inscription (a fortiori nécessitant un ticket) ne peut donc
-# aboutir.
-INIT_BACKOFF_START = 5          # premier réessai après 5 s
-INIT_BACKOFF_MAX = 300          # plafond : 5 min entre deux tentatives
+# Boucle d'initialisation persistante (network_core) : au démarrage (et tant
+# que la borne n'a pas obtenu son token), on réessaie avec un backoff
+# exponentiel borné au lieu d'abandonner. Tant que la borne n'est pas
+# opérationnelle, l'écran local « Borne hors ligne » ci-dessous est affiché et
+# la page /patient n'est PAS chargée : aucune inscription (a fortiori
+# nécessitant un ticket) ne peut donc aboutir.
 
 # Écran affiché localement par l'application (donc visible même si le serveur
 # est injoignable) tant que la borne n'est pas opérationnelle. Il masque le
@@ -118,11 +126,22 @@ class WindowControlAPI:
     """API pour la gestion des contrôles de la fenêtre"""
     def __init__(self):
         self._fullscreen_callback = None
+        self._idle_callback = None
 
     def set_fullscreen_callback(self, callback):
         """Définit la fonction de callback pour le plein écran"""
         self._fullscreen_callback = callback
 
+    def set_idle_callback(self, callback):
+        """Définit la fonction de callback des passages en veille"""
+        self._idle_callback = callback
+
+    def set_idle(self, idle):
+        """Méthode exposée à JavaScript : la page entre en veille ou en sort
+        (cf. idle_mode)."""
+        if self._idle_callback:
+            self._idle_callback(bool(idle))
+
     def toggle_fullscreen(self):
         """Méthode exposée à JavaScript pour basculer le plein écran"""
         if self._fullscreen_callback:
@@ -142,8 +161,9 @@ class WindowControlAPI:
 class WebViewClient:
     def __init__(self):
         self.window = None
-        self.app_token = None
         self.printer = None
+        self.peer_link = None
+        self.tickets = None
         self.connected = False
         self.username = Config().settings.username
         self.password = Config().settings.password
@@ -159,6 +179,10 @@ class WebViewClient:
         # réécrite en douce (ce qui masquait les erreurs de configuration).
         self.base_url = Config().settings.normalized_base_url()
         self.is_fullscreen = Config().settings.fullscreen
+        # Origine des pages affichées : le serveur, ou le mandataire local
+        # quand il est activé (cf. start_asset_proxy).
+        self.page_url = self.base_url
+        self.asset_proxy = None
 
         # Ajout des configurations d'optimisation
         self.webview_settings = {
@@ -168,18 +192,37 @@ class WebViewClient:
         }
 
 
-        self._protection_injected = False
-
-        # Session HTTP persistante (keep-alive) pour les appels de la borne :
-        # évite de rouvrir une connexion TCP/TLS à chaque requête.
-        self.session = requests.Session()
-        self._next_refresh_delay = TOKEN_REFRESH_INTERVAL
-        self._token_refresh_stop = threading.Event()
-        self._token_refresh_thread = None
+        # Client HTTP unique (pool keep-alive réglable, cf. http_client) pour
+        # tous les appels de la borne : token, statuts, sondage.
+        self.http = shared_http_client(Config().settings)
+        self.session = self.http.session
+        # Cœur réseau : une boucle asyncio unique (token, supervision de
+        # l'initialisation, statuts imprimante, joignabilité du serveur).
+        self.network = NetworkCore(self.base_url, Config().settings.app_secret,
+                                   session=self.session, on_token=self._on_new_token,
+                                   refresh_percent=Config().settings.token_refresh_percent,
+                                   probe_interval=Config().settings.http_warm_interval,
+                                   guard=self.http.guard,
+                                   token_store=(secret_store if Config().settings.persist_app_token
+                                                else None))
+
+        # Canal de commandes persistant (optionnel, cf. push_channel) : créé
+        # dès maintenant pour que l'envoi des statuts l'emprunte, connecté une
+        # fois la borne opérationnelle (token obtenu).
+        self.push = None
+        self._push_started = False
+        if Config().settings.push_channel:
+            self.push = PushChannel(self.network,
+                                    Config().settings.borne_id or socket.gethostname(),
+                                    self._on_push_command,
+                                    ping_interval=Config().settings.push_ping_interval)
+            self.network.push = self.push
 
         # Création des APIs
         self.printer_api = PrinterAPI()
+        self.printer_api.set_event_sink(self._push_print_event)
         self.window_api = WindowControlAPI()
+        self.ticket_api = TicketAPI()
 
         # État opérationnel de la borne. Tant qu'il est faux, l'écran local
         # « Borne hors ligne » est affiché et /patient n'est pas chargée.
@@ -187,8 +230,17 @@ class WebViewClient:
         self._operational_lock = threading.Lock()
         self._window_ready = threading.Event()
         self._patient_page_shown = False
-        self._init_stop = threading.Event()
-        self._init_thread = None
+        # /patient chargée dans une fenêtre cachée puis substituée à l'écran
+        # hors ligne (cf. page_preload).
+        self.preloader = PagePreloader(self._open_hidden_window, self._swap_window,
+                                       preload=Config().settings.preload_patient_page)
+        # Surveillance du moteur de rendu (cf. renderer_watch), démarrée avec
+        # la fenêtre.
+        self.renderer_watch = None
+        # Mesure du gain de la veille (cf. idle_mode).
+        self.idle_meter = IdleMeter() if Config().settings.idle_after_minutes else None
+        if self.idle_meter:
+            self.window_api.set_idle_callback(self.idle_meter.set_idle)
 
         # Validation stricte de la configuration AVANT démarrage. Une borne mal
         # configurée (fichier illisible, URL invalide, http distant en prod,
@@ -232,18 +284,26 @@ class WebViewClient:
         # (récupération automatique après un démarrage hors ligne). On ne la
         # lance PAS si la configuration est refusée.
         if not self._config_error:
+            self.start_asset_proxy()
             self.start_initialization()
 
     def create_window(self):
         """Crée et configure la fenêtre WebView"""
         self.window_api.set_fullscreen_callback(self.toggle_fullscreen)
+        # Script kiosque unique, construit une fois pour la session (cf.
+        # kiosk_bundle) ; fenêtres où il est injecté au début du document.
+        self._bundle = build_kiosk_bundle(self.page_url, Config().settings.hide_cursor,
+                                          idle_after_minutes=Config().settings.idle_after_minutes,
+                                          idle_screen=Config().settings.idle_screen)
+        self._bundle_at_start = weakref.WeakSet()
 
         class CombinedAPI:
-            def __init__(self, printer_api, window_api):
+            def __init__(self, printer_api, window_api, ticket_api):
                 self.printer = printer_api
                 self.window = window_api
+                self.tickets = ticket_api
 
-        combined_api = CombinedAPI(self.printer_api, self.window_api)
+        self._js_api = CombinedAPI(self.printer_api, self.window_api, self.ticket_api)
 
         # Tant que la borne n'est pas opérationnelle, on affiche l'écran local
         # « Borne hors ligne » (indépendant du serveur) plutôt que /patient :
@@ -255,7 +315,7 @@ class WebViewClient:
             # borne reste non opérationnelle.
             content_kwargs = {'html': build_config_error_html(self._config_errors)}
         elif self.is_operational():
-            content_kwargs = {'url': f"{self.base_url}/patient"}
+            content_kwargs = {'url': f"{self.page_url}/patient"}
             self._patient_page_shown = True
         else:
             content_kwargs = {'html': OFFLINE_HTML}
@@ -263,160 +323,211 @@ class WebViewClient:
         self.window = webview.create_window(
             title="PharmaFile",
             fullscreen=Config().settings.fullscreen,
-            js_api=combined_api,
+            js_api=self._js_api,
             background_color='#FFFFFF',
             **content_kwargs,
             **self.webview_settings  # Applique les configurations d'optimisation
         )
 
-        # Ajout des gestionnaires d'événements
-        self.window.events.loaded += self.on_loaded
-        self.window.events.loaded += lambda: self.disable_context_menu_and_cursor()
+        self._attach_page_events(self.window)
         # La fenêtre est prête : on peut désormais naviguer vers /patient si la
         # borne est (ou devient) opérationnelle.
         self.window.events.shown += self._on_window_shown
 
-    # Injection de code JS pour désactiver le menu contextuel et gérer le curseur
-    def disable_context_menu_and_cursor(self):
-        """Désactive le menu contextuel, bloque le pinch-zoom (multitouch) et
-        gère le curseur.
-
-        Multitouch : preventDefault UNIQUEMENT si plusieurs points de contact
-        (pinch/zoom). Un tap simple laisse passer le clic synthétique, sinon des
-        boutons deviennent inopérants selon le moteur WebView.
-
-        Curseur : masqué par défaut (borne tactile en libre-service) MAIS
-        réapparaît dès qu'une souris est utilisée (maintenance) puis se remasque
-        au toucher suivant. Le réglage hide_cursor=False force l'affichage
-        permanent. Les faux 'mousemove' générés par le tactile sont ignorés."""
-        hide_cursor = "true" if Config().settings.hide_cursor else "false"
-        js_code = """
-        if (!window._contextMenuDisabled) {
-            // Désactive le menu contextuel
-            window.addEventListener('contextmenu', function(e) {
-                e.preventDefault();
-                return false;
-            }, true);
-
-            // Ne bloque QUE le multitouch (pinch/zoom) : les taps simples
-            // passent normalement (clic synthétique préservé).
-            window.addEventListener('touchstart', function(e) {
-                if (e.touches.length > 1) {
-                    e.preventDefault();
-                }
-            }, {passive: false, capture: true});
-
-            var hideCursor = %s;
-            if (hideCursor) {
-                // Curseur masqué tant que la classe 'using-mouse' est absente ;
-                // une souris qui bouge la pose, un toucher la retire.
-                var style = document.createElement('style');
-                style.textContent = "html:not(.using-mouse) * { cursor: none !important; }";
-                document.head.appendChild(style);
-
-                var lastTouch = 0;
-                window.addEventListener('touchstart', function() {
-                    lastTouch = Date.now();
-                    document.documentElement.classList.remove('using-mouse');
-                }, true);
-                window.addEventListener('mousemove', function() {
-                    // Ignore les 'mousemove' synthétiques émis juste après un toucher.
-                    if (Date.now() - lastTouch < 800) { return; }
-                    document.documentElement.classList.add('using-mouse');
-                }, true);
-            }
-
-            window._contextMenuDisabled = true;
-        }
-        """ % hide_cursor
-        self.window.evaluate_js(js_code)
+    def _attach_page_events(self, window):
+        """Gestionnaires de chargement de page d'une fenêtre (visible ou
+        cachée)."""
+        window.events.before_show += lambda: self._install_bundle(window)
+        window.events.loaded += lambda: self.on_loaded(window)
 
-    def get_app_token(self, max_retries=3, retry_delay=2):
-        """Obtient le token d'application avec système de retry"""
-        url = f'{self.base_url}/api/get_app_token'
-        data = {'app_secret': Config().settings.app_secret}
-        
-        for attempt in range(max_retries):
-            try:
-                # timeout : sans lui, une borne face à un serveur injoignable
-                # resterait bloquée indéfiniment sur cet appel.
-                response = self.session.post(url, data=data, timeout=NETWORK_TIMEOUT)
-                if response.status_code == 200:
-                    self.app_token = response.json()['token']
-                    # Enregistre le jeton pour qu'il soit masqué s'il apparaît
-                    # un jour dans un message de log (défense en profondeur).
-                    logging_config.register_secret(self.app_token)
-                    logger.info("Token d'application obtenu (connexion serveur OK).")
-                    return True
-                else:
-                    logger.warning("Échec de l'obtention du token (tentative %d/%d, HTTP %s).",
-                                   attempt + 1, max_retries, response.status_code)
-            except RequestException as e:
-                logger.warning("Erreur réseau à l'obtention du token (tentative %d/%d): %s",
-                               attempt + 1, max_retries, e)
-            
-            if attempt < max_retries - 1:  # Ne pas attendre après la dernière tentative
-                time.sleep(retry_delay)
-        
-        raise Exception("Impossible d'obtenir le token après plusieurs tentatives")
-
-    def start_token_refresh(self):
-        """Renouvelle le token avant son expiration (24 h côté serveur).
+    def _install_bundle(self, window):
+        """Script kiosque exécuté dès la création de chaque document de
+        ``window`` si le moteur le permet (cf. kiosk_bundle)."""
+        try:
+            if install_at_document_start(window, self._bundle):
+                self._bundle_at_start.add(window)
+        except Exception as e:
+            logger.warning("Injection au début du document impossible : %s", e)
 
-        Sur une borne qui tourne en continu, un token expiré ferait échouer en
-        401 toutes les requêtes authentifiées (notamment l'envoi du statut
-        imprimante). On le renouvelle donc de façon proactive et, en cas
-        d'échec réseau, on réessaie rapidement au lieu d'attendre l'intervalle
-        complet.
-        """
-        def _loop():
-            while not self._token_refresh_stop.wait(self._next_refresh_delay):
-                try:
-                    self.get_app_token()
-                    if self.printer:
-                        self.printer.update_token(self.app_token)
-                    self._next_refresh_delay = TOKEN_REFRESH_INTERVAL
-                    logger.info("Token d'application renouvelé.")
-                except Exception as e:
-                    self._next_refresh_delay = 300  # réessai dans 5 min
-                    logger.warning("Échec du renouvellement du token, réessai bientôt : %s", e)
-
-        self._token_refresh_thread = threading.Thread(target=_loop, daemon=True)
-        self._token_refresh_thread.start()
+    def _open_hidden_window(self, url):
+        """Fenêtre cachée chargeant ``url`` (préchargement, cf.
+        page_preload), mêmes réglages que la fenêtre principale."""
+        window = webview.create_window(
+            title="PharmaFile",
+            url=url,
+            hidden=True,
+            fullscreen=self.is_fullscreen,
+            js_api=self._js_api,
+            background_color='#FFFFFF',
+            **self.webview_settings
+        )
+        self._attach_page_events(window)
+        return window
+
+    def _swap_window(self, window):
+        """Affiche la fenêtre préchargée puis ferme l'ancienne : l'écran hors
+        ligne reste visible jusqu'à ce que la page prête le recouvre."""
+        previous = self.window
+        window.show()
+        self.window = window
+        if previous is not None and previous is not window:
+            previous.destroy()
+
+    def _push_print_event(self, event):
+        """Progression d'une impression asynchrone (cf.
+        PrinterAPI.print_ticket) relayée à la page : évènement DOM
+        ``kiosk-print`` dont ``detail`` est ``event``. Appelé par le fil
+        d'évènements de PrinterAPI : une page figée ne retarde aucun ticket."""
+        if self.window is None:
+            return
+        self.window.evaluate_js(
+            f"window.dispatchEvent(new CustomEvent('kiosk-print', {{detail: {json.dumps(event)}}}));")
 
     def start_initialization(self):
         """Boucle d'initialisation persistante (gère le démarrage hors ligne).
 
-        Réessaie l'obtention du token avec un backoff exponentiel borné. Dès
-        que le token est obtenu, initialise l'imprimante, démarre le
-        renouvellement périodique et bascule la borne en mode opérationnel — ce
-        qui déclenche le chargement de /patient à la place de l'écran « Borne
-        hors ligne ». Tourne dans un thread démon pour ne pas bloquer
-        l'ouverture de la fenêtre.
+        Confiée au cœur réseau : réessaie l'obtention du token avec un backoff
+        exponentiel borné. Dès que le token est obtenu, initialise
+        l'imprimante, démarre le renouvellement périodique et bascule la borne
+        en mode opérationnel — ce qui déclenche le chargement de /patient à la
+        place de l'écran « Borne hors ligne ». Ne bloque pas l'ouverture de la
+        fenêtre.
         """
-        def _supervise():
-            delay = INIT_BACKOFF_START
-            while not self._init_stop.is_set():
-                try:
-                    # Une seule tentative par itération : le backoff est géré
-                    # ici, get_app_token n'ajoute donc pas sa propre attente.
-                    self.get_app_token(max_retries=1)
-                    self.initialize_printer()
-                    self.start_token_refresh()
-                    self.connected = True
-                    self._set_operational(True)
-                    logger.info("Borne opérationnelle.")
-                    return
-                except Exception as e:
-                    self.connected = False
-                    logger.warning("Initialisation impossible, nouvel essai dans %ss : %s", delay, e)
-                    # Attente interruptible : réveil immédiat à la fermeture.
-                    if self._init_stop.wait(delay):
-                        return
-                    delay = min(delay * 2, INIT_BACKOFF_MAX)
-
-        self._init_thread = threading.Thread(target=_supervise, daemon=True)
-        self._init_thread.start()
+        self.network.start()
+        self.network.start_supervision(self.initialize_printer, self._on_operational,
+                                       self._on_offline)
+
+    def start_asset_proxy(self):
+        """Démarre le mandataire local avec cache disque (cf. asset_proxy) et
+        y fait pointer la fenêtre. En cas d'échec, la fenêtre charge le
+        serveur directement."""
+        settings = Config().settings
+        if not settings.asset_proxy:
+            return
+        # Client dédié (cookies non conservés), même cache DNS. Ses propres
+        # disjoncteurs et budget de réessais : le trafic de la page ne peut
+        # ni épuiser le budget ni ouvrir les disjoncteurs du token et des
+        # statuts.
+        client = HttpClient(pool_size=settings.http_pool_size, retries=settings.http_retries,
+                            keepalive=settings.http_keepalive, dns=self.http.dns)
+        try:
+            proxy = AssetProxy(self.base_url, Config().config_path / ASSET_CACHE_DIRNAME,
+                               client=client,
+                               max_bytes=settings.asset_cache_mb * 1024 * 1024)
+            proxy.start()
+        except OSError as e:
+            logger.error("Mandataire local indisponible, accès direct au serveur : %s", e)
+            client.close()
+            return
+        self.asset_proxy = proxy
+        self.page_url = proxy.url
+
+    def network_metrics(self):
+        """Métriques réseau jointes à la pulsation des statuts."""
+        metrics = {
+            'http': self.http.stats(),
+            'token': self.network.tokens.stats.snapshot(),
+            'startup': dict(self.network.timeline),
+            'circuit': self.http.guard.snapshot(),
+        }
+        if self.tickets:
+            metrics['tickets'] = self.tickets.stats()
+        if self.push:
+            metrics['push'] = self.push.stats()
+        if self.asset_proxy:
+            metrics['asset_proxy'] = self.asset_proxy.stats()
+        metrics['page'] = self.preloader.stats()
+        if self.renderer_watch:
+            metrics['renderer'] = self.renderer_watch.stats()
+        if self.idle_meter:
+            metrics['idle'] = self.idle_meter.stats()
+        return metrics
+
+    def _on_operational(self):
+        self.connected = True
+        if Config().settings.ticket_leasing and self.tickets is None:
+            self.start_ticket_leasing()
+        if self.push and not self._push_started:
+            self._push_started = True
+            self.push.start()
+        self._set_operational(True)
+        logger.info("Borne opérationnelle.")
+
+    def _on_push_command(self, command, args):
+        """Commande poussée par le serveur (cf. push_channel), exécutée hors de
+        la boucle réseau. Renvoie le résultat au format
+        ``{'success', 'code', 'message'}``."""
+        if command == 'reload':
+            if not (self.window and self.is_operational()):
+                return {'success': False, 'code': 'not_operational',
+                        'message': "Borne non opérationnelle."}
+            # Par le préchargement, comme renderer_watch : l'ancienne fenêtre
+            # reste affichée jusqu'à ce que la nouvelle page soit prête.
+            self.preloader.show(f"{self.page_url}/patient", self.window)
+            return {'success': True, 'code': 'reloaded', 'message': "Page rechargée."}
+        if command == 'print':
+            # Même contrôle strict de la charge que les impressions de la page.
+            return self.printer_api.print_ticket(args.get('data'))
+        if command == 'reconnect_printer':
+            if not self.printer:
+                return {'success': False, 'code': 'error_not_initialized',
+                        'message': "Système d'impression non initialisé"}
+            health = self.printer.reconnect()
+            if not health['printer_ok']:
+                return {'success': False, 'code': 'error_init',
+                        'message': "Imprimante toujours indisponible."}
+            return {'success': True, 'code': 'printer_ok',
+                    'message': "Imprimante reconnectée."}
+        if command == 'config':
+            errors = Config().apply_remote_changes(args.get('settings'))
+            if errors:
+                return {'success': False, 'code': 'invalid_config',
+                        'message': " ; ".join(errors)}
+            return {'success': True, 'code': 'config_saved',
+                    'message': "Configuration enregistrée (appliquée au prochain démarrage)."}
+        return {'success': False, 'code': 'unknown_command',
+                'message': f"Commande inconnue : {command}"}
+
+    def start_ticket_leasing(self):
+        """Active la délivrance locale des numéros de ticket (cf.
+        ticket_lease) : les blocs sont loués et les numéros remontés par la
+        boucle réseau. Un échec (stockage illisible...) laisse l'inscription
+        par le serveur seule."""
+        settings = Config().settings
+        try:
+            store = TicketLeaseStore(Config().config_path / LEASE_FILENAME)
+            leaser = TicketLeaser(self.network, store,
+                                  settings.borne_id or socket.gethostname(),
+                                  services=settings.ticket_lease_services,
+                                  block_size=settings.ticket_lease_block_size)
+            leaser.start()
+        except Exception as e:
+            logger.error("Délivrance locale des tickets indisponible : %s", e)
+            return
+        self.tickets = leaser
+        self.ticket_api.set_leaser(leaser)
+
+    def _on_offline(self):
+        """Token conservé refusé par le serveur et aucun nouveau token : retour
+        à l'écran « Borne hors ligne » jusqu'à l'obtention d'un token (la
+        supervision rappelle alors _on_operational)."""
+        self.connected = False
+        with self._operational_lock:
+            self.operational = False
+            self._patient_page_shown = False
+        logger.warning("Borne hors ligne.")
+        self.preloader.cancel()
+        if self.window:
+            try:
+                self.window.load_html(OFFLINE_HTML)
+            except Exception as e:
+                logger.error("Erreur lors de l'affichage de l'écran hors ligne : %s", e)
+
+    def _on_new_token(self, token):
+        """Nouveau token (obtention initiale ou renouvellement) : propagé à
+        l'imprimante pour garder ses en-têtes cohérents."""
+        if self.printer:
+            self.printer.update_token(token)
 
     def is_operational(self):
         with self._operational_lock:
@@ -441,76 +552,137 @@ class WebViewClient:
                 return
             self._patient_page_shown = True
         try:
-            self.window.load_url(f"{self.base_url}/patient")
+            self.preloader.show(f"{self.page_url}/patient", self.window)
         except Exception as e:
             with self._operational_lock:
                 self._patient_page_shown = False
             logger.error("Erreur lors du chargement de /patient : %s", e)
 
     def initialize_printer(self):
-        """Initialise l'imprimante une fois le token obtenu"""
-        if self.app_token:
-            self.printer = Printer(
-                Config().settings.printer_id_vendor,
-                Config().settings.printer_id_product,
-                Config().settings.printer_model,
-                self.base_url,
-                self.app_token,
-                token_refresh_callback=self._refresh_app_token_for_printer
-            )
-            # Une fois l'imprimante initialisée, on la passe à l'API
-            self.printer_api.set_print_callback(self.printer.print)
+        """Initialise l'imprimante dès le démarrage, sans attendre le token :
+        il est propagé ensuite (update_token) et démarre l'envoi des statuts."""
+        # Mode isolé : même interface, mais USB/statuts/santé tournent dans
+        # un processus enfant relancé automatiquement s'il plante.
+        # Sinon, les statuts sont envoyés par la boucle réseau (pas de
+        # thread dédié).
+        if Config().settings.printer_process_isolation:
+            printer_class, extra = PrinterProcess, {}
         else:
-            raise Exception("Tentative d'initialisation de l'imprimante sans token")
-
-    def _refresh_app_token_for_printer(self):
-        """Renouvelle le token à la demande du thread de statut imprimante (ex:
-        401 sur l'envoi d'un statut) et le renvoie, ou None en cas d'échec. On
-        propage aussi le nouveau token à l'imprimante pour garder les en-têtes
-        cohérents avec le reste des appels."""
+            printer_class = Printer
+            extra = {'status_delivery': self.network.status_delivery,
+                     'heartbeat_metrics': self.network_metrics}
+        self.printer = printer_class(
+            Config().settings.printer_id_vendor,
+            Config().settings.printer_id_product,
+            Config().settings.printer_model,
+            self.base_url,
+            self.network.app_token,
+            token_refresh_callback=self._refresh_app_token_for_printer,
+            outbox_path=(str(Config().config_path / OUTBOX_FILENAME)
+                         if Config().settings.status_outbox else None),
+            **extra
+        )
+        # Une fois l'imprimante initialisée, on la passe à l'API
+        self.printer_api.set_print_callback(self.printer.print)
+        if Config().settings.peer_forwarding:
+            self.start_peer_link()
+
+    def start_peer_link(self):
+        """Active le renvoi des tickets vers une borne voisine : l'impression
+        passe alors par PeerLink, qui imprime en local et ne sollicite une
+        voisine que si l'imprimante locale ne peut pas imprimer. Un échec de
+        démarrage (port occupé...) laisse l'impression locale seule."""
+        settings = Config().settings
         try:
-            self.get_app_token()
-            if self.printer:
-                self.printer.update_token(self.app_token)
-            return self.app_token
+            self.peer_link = PeerLink(
+                settings.borne_id or socket.gethostname(),
+                settings.app_secret,
+                self.printer.print,
+                self.printer.health,
+                settings.peer_port,
+                peers=settings.peers,
+                discovery=settings.peer_discovery,
+            )
+            self.peer_link.start()
         except Exception as e:
-            logger.warning("Échec du renouvellement du token (statut imprimante) : %s", e)
-            return None
+            self.peer_link = None
+            logger.error("Liaison entre bornes indisponible : %s", e)
+            return
+        self.printer_api.set_print_callback(self.peer_link.print)
+
+    def _refresh_app_token_for_printer(self):
+        """Renouvelle le token à la demande de l'envoi des statuts imprimante
+        (ex: 401 sur l'envoi d'un statut, processus imprimante isolé) et le
+        renvoie, ou None en cas d'échec. Le renouvellement passe par le cœur
+        réseau, qui propage aussi le nouveau token à l'imprimante."""
+        self.network.note_unauthorized()
+        return self.network.refresh_token_blocking()
 
 
     def _on_window_shown(self):
         """La fenêtre est affichée (boucle GUI démarrée) : on marque la fenêtre
         prête et on charge /patient si la borne est déjà opérationnelle."""
         self._window_ready.set()
+        if Config().settings.renderer_watch and self.renderer_watch is None:
+            self.start_renderer_watch()
         self._maybe_show_patient_page()
 
-    def on_loaded(self):
-        """Gestionnaire d'événement pour le chargement de la page"""
-        current_url = self.window.get_current_url()
+    def start_renderer_watch(self):
+        """Recharge /patient si le moteur de rendu grossit, se fige, ou dans
+        la fenêtre de recyclage (cf. renderer_watch). Le rechargement passe
+        par le préchargement : nouvelle fenêtre prête avant de remplacer
+        l'ancienne, dont les processus de rendu sont alors libérés."""
+        settings = Config().settings
+        self.renderer_watch = RendererSupervisor(
+            evaluate=lambda script: self.window.evaluate_js(script),
+            reload=lambda: self.preloader.show(f"{self.page_url}/patient", self.window),
+            is_printing=self.printer_api.busy,
+            active=self._renderer_watch_active,
+            memory_limit_mb=settings.renderer_memory_limit_mb,
+            heartbeat_interval=settings.renderer_heartbeat_interval,
+            heartbeat_timeout=settings.renderer_heartbeat_timeout,
+            quiet_window=settings.renderer_recycle_window)
+        self.renderer_watch.start()
+
+    def _renderer_watch_active(self):
+        with self._operational_lock:
+            shown = self._patient_page_shown and self.operational
+        return shown and not self.preloader.pending()
+
+    def on_loaded(self, window=None):
+        """Gestionnaire d'événement pour le chargement de la page (fenêtre
+        visible ou fenêtre cachée de préchargement)."""
+        window = window or self.window
+        current_url = window.get_current_url()
         logger.debug("Page chargée : %s", current_url)
-
-        # L'écran local « Borne hors ligne » (chargé via html=) gère lui-même sa
-        # présentation ; les injections kiosque ne concernent que les pages
-        # servies par le serveur. On les saute donc tant qu'on n'est pas sur une
-        # URL du serveur, ce qui évite aussi de consommer prématurément le
-        # verrou _protection_injected.
-        if not (current_url or '').startswith(self.base_url):
+        # Une page qui se charge démarre éveillée.
+        if self.idle_meter and window is self.window:
+            self.idle_meter.set_idle(False)
+
+        # Script kiosque en un seul appel s'il n'a pas été injecté au début
+        # du document (il ignore lui-même une seconde exécution ; sur l'écran
+        # local « Borne hors ligne », seules les protections tactiles et le
+        # curseur s'appliquent).
+        if window not in self._bundle_at_start:
+            window.evaluate_js(self._bundle)
+
+        if not (current_url or '').startswith(self.page_url):
             return
 
-        if not self._protection_injected:
-            self.inject_kiosk_protection()
-
-        # Injecte le gestionnaire de touches
-        self.inject_keyboard_handler()
-
-        if "login" in current_url:
-            self.inject_login_script()
-
         # Si l'utilisateur est redirigé vers la racine après authentification,
         # on recharge explicitement la page /patient
-        if current_url.rstrip('/') == self.base_url.rstrip('/'):
+        if current_url.rstrip('/') == self.page_url.rstrip('/'):
             logger.info("Redirection inattendue vers la racine détectée, chargement de /patient")
-            self.window.load_url(f"{self.base_url}/patient")
+            window.load_url(f"{self.page_url}/patient")
+            return
+
+        # Identifiants envoyés uniquement à la page de connexion du serveur,
+        # vérifiée ici (jamais dans le script kiosque partagé).
+        if is_login_page(current_url, self.page_url):
+            window.evaluate_js(build_login_script(self.username, self.password))
+
+        # Page prête et protégée : bascule si elle était préchargée.
+        self.preloader.page_ready(window, current_url)
 
     def toggle_fullscreen(self):
         """Gère le basculement du mode plein écran"""
@@ -528,129 +700,32 @@ class WebViewClient:
                 'message': f'Erreur lors du basculement du mode plein écran : {str(e)}'
             }
         
-    def inject_keyboard_handler(self):
-        """Injecte le gestionnaire de touches F11"""
-        script = """
-        document.addEventListener('keydown', function(event) {
-            if (event.key === 'F11') {
-                event.preventDefault();  // Empêche le comportement par défaut du navigateur
-                window.pywebview.api.window.toggle_fullscreen();
-            }
-        });
-        """
-        self.window.evaluate_js(script)
-
-    def inject_kiosk_protection(self):
-        """Injecte les protections kiosque sur les pages servies (clic droit,
-        zoom, sélection sur appui long).
-
-        On NE bloque PLUS tous les touchstart : appeler preventDefault() sur
-        chaque touchstart supprime, selon le moteur WebView, le clic synthétique
-        et rend des boutons tactiles inopérants. On privilégie CSS touch-action
-        (supprime le double-tap zoom et le délai de clic tactile SANS empêcher
-        les taps) + user-select (empêche la sélection de texte sur appui long).
-        Le pinch/zoom multitouch est neutralisé par
-        disable_context_menu_and_cursor() (preventDefault UNIQUEMENT si
-        plusieurs points de contact)."""
-        protection_script = """
-        if (!window._kioskProtected) {
-            // Bloque le menu contextuel (clic droit / appui long)
-            document.addEventListener('contextmenu', function(e) {
-                e.preventDefault();
-                return false;
-            }, false);
-
-            // Approche CSS (préférée à un preventDefault global) :
-            // - touch-action: manipulation -> désactive le double-tap zoom et le
-            //   délai de 300 ms, mais laisse passer les taps -> clics OK.
-            // - user-select/touch-callout: none -> pas de sélection ni de
-            //   menu sur appui long. Les champs de saisie restent sélectionnables.
-            var style = document.createElement('style');
-            style.textContent =
-                "html { touch-action: manipulation; } " +
-                "* { -webkit-user-select: none; user-select: none; -webkit-touch-callout: none; } " +
-                "input, textarea { -webkit-user-select: text; user-select: text; }";
-            document.head.appendChild(style);
-
-            window._kioskProtected = true;
-        }
-        """
-        self.window.evaluate_js(protection_script)
-        self._protection_injected = True
-
-
-    def inject_login_script(self):
-        """Injecte et exécute le script de connexion automatique.
-
-        Les identifiants sont sérialisés en JSON (json.dumps) AVANT insertion :
-        un guillemet, un antislash, un saut de ligne ou toute séquence spéciale
-        dans le mot de passe ne peut donc plus casser le script ni injecter de
-        code. json.dumps produit un littéral chaîne JavaScript sûr (échappe
-        guillemets/antislash/caractères de contrôle ; ensure_ascii encode les
-        non-ASCII en \\uXXXX). On insère le résultat SANS guillemets autour :
-        json.dumps les fournit déjà."""
-        username_js = json.dumps(self.username)
-        password_js = json.dumps(self.password)
-        script = f"""
-        function performLogin() {{
-            console.log("Injecting login script");
-            var usernameInput = document.querySelector('input[name="username"]');
-            var passwordInput = document.querySelector('input[name="password"]');
-            var rememberCheckbox = document.querySelector('input[name="remember"]');
-
-            if (usernameInput) {{
-                console.log("Found username input");
-                usernameInput.value = {username_js};
-            }} else {{
-                console.log("Username input not found");
-            }}
-
-            if (passwordInput) {{
-                console.log("Found password input");
-                passwordInput.value = {password_js};
-            }} else {{
-                console.log("Password input not found");
-            }}
-
-            if (rememberCheckbox) {{
-                console.log("Found remember me checkbox");
-                rememberCheckbox.checked = true;
-            }} else {{
-                console.log("Remember me checkbox not found");
-            }}
-
-            var form = usernameInput ? usernameInput.closest('form') : null;
-            if (form) {{
-                console.log("Found form, submitting");
-                form.submit();
-            }} else {{
-                console.log("Form not found");
-            }}
-        }}
-
-        // Vérifie si le DOM est déjà chargé
-        if (document.readyState === 'loading') {{
-            document.addEventListener('DOMContentLoaded', performLogin);
-        }} else {{
-            performLogin();
-        }}
-        """
-        self.window.evaluate_js(script)
-
     def run(self):
         """Lance l'application"""
         try:
-            os.environ['WEBKIT_DISABLE_COMPOSITING_MODE'] = '1'
-            os.environ['WEBKIT_FORCE_ACCELERATED_COMPOSITING'] = '1'
             os.environ["PYWEBVIEW_GUI"] = "qt"
+            # Drapeaux du moteur lus au démarrage de Qt (cf. webengine_profile).
+            settings = Config().settings
+            profile, start_kwargs = apply_profile(settings.webengine_profile,
+                                                  settings.webengine_overrides,
+                                                  Config().config_path)
+            logger.info("Profil Qt WebEngine %s.", describe(settings.webengine_profile, profile))
             self.create_window()
             logger.info("Fenêtre créée, démarrage de l'interface (fullscreen=%s).",
                         Config().settings.fullscreen)
-            webview.start(debug=Config().settings.debug)
+            webview.start(debug=Config().settings.debug, **start_kwargs)
         finally:
             logger.info("Arrêt de la borne.")
-            self._init_stop.set()
-            self._token_refresh_stop.set()
+            self.network.stop()
+            if self.renderer_watch:
+                self.renderer_watch.stop()
+            if self.asset_proxy:
+                self.asset_proxy.stop()
+            self.http.close()
+            if self.tickets:
+                self.tickets.close()
+            if self.peer_link:
+                self.peer_link.stop()
             if self.printer:
                 self.printer.cleanup()
 
@@ -0,0 +1,124 @@
+# net_watch.py
+"""Surveillance des changements réseau du système (Linux, netlink).
+
+Après une coupure (box redémarrée, câble rebranché, Wi-Fi retrouvé), la
+supervision de l'initialisation ne doit pas attendre la fin de son backoff
+(jusqu'à 5 min) pour réessayer. :class:`NetworkWatcher` s'abonne aux
+notifications ``NETLINK_ROUTE`` du noyau (interfaces, adresses IPv4/IPv6,
+routes) et appelle ``on_change(events)`` dès qu'un changement survient, depuis
+la boucle asyncio du cœur réseau (``loop.add_reader`` : aucun thread, aucun
+réveil en l'absence d'événement).
+
+Hors Linux (ou si le socket netlink ne peut pas être ouvert), la surveillance
+est désactivée : le cœur réseau se contente alors de sonder le serveur
+(cf. ``network_core.OFFLINE_PROBE_INTERVAL``).
+"""
+import errno
+import logging
+import socket
+import struct
+
+logger = logging.getLogger("borne.network")
+
+NETLINK_ROUTE = 0
+# Groupes de notification : interfaces, adresses et routes IPv4/IPv6.
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+NETLINK_GROUPS = (RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE
+                  | RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE)
+
+# En-tête nlmsghdr : longueur, type, drapeaux, séquence, pid.
+_NLMSG_HEADER = struct.Struct('=IHHII')
+# Types de message rtnetlink (linux/rtnetlink.h) -> catégorie journalisée.
+_RTM_EVENTS = {16: 'link', 17: 'link', 20: 'addr', 21: 'addr', 24: 'route', 25: 'route'}
+
+
+def parse_events(data):
+    """Catégories (``'link'``, ``'addr'``, ``'route'``) des messages netlink
+    contenus dans ``data`` ; les autres messages sont ignorés."""
+    events = []
+    offset = 0
+    while offset + _NLMSG_HEADER.size <= len(data):
+        length, msg_type, _, _, _ = _NLMSG_HEADER.unpack_from(data, offset)
+        if length < _NLMSG_HEADER.size:
+            break
+        if msg_type in _RTM_EVENTS:
+            events.append(_RTM_EVENTS[msg_type])
+        offset += (length + 3) & ~3  # messages alignés sur 4 octets
+    return events
+
+
+def _open_netlink():
+    if not hasattr(socket, 'AF_NETLINK'):
+        return None
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    except OSError as e:
+        logger.info("Surveillance réseau netlink indisponible : %s", e)
+        return None
+    try:
+        sock.bind((0, NETLINK_GROUPS))
+    except OSError as e:
+        sock.close()
+        logger.info("Surveillance réseau netlink indisponible : %s", e)
+        return None
+    return sock
+
+
+class NetworkWatcher:
+    """Notifie les changements réseau dans une boucle asyncio.
+
+    ``sock`` : socket à surveiller (par défaut, socket netlink ; un socket
+    datagramme quelconque pour les tests)."""
+
+    def __init__(self, on_change, sock=None):
+        self._on_change = on_change
+        self._sock = sock
+        self._loop = None
+        # Nombre d'événements reçus (diagnostic).
+        self.events = 0
+
+    def start(self, loop):
+        """Commence la surveillance (depuis le thread de ``loop``) ; renvoie
+        False si elle n'est pas disponible sur ce système."""
+        if self._sock is None:
+            self._sock = _open_netlink()
+        if self._sock is None:
+            return False
+        self._sock.setblocking(False)
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+        self._loop = loop
+        return True
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._loop = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _on_readable(self):
+        events = []
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                # ENOBUFS : file du noyau débordée, des événements sont perdus ;
+                # on les considère comme un changement.
+                if e.errno == errno.ENOBUFS:
+                    events.append('overflow')
+                    continue
+                logger.warning("Lecture netlink impossible : %s", e)
+                break
+            if not data:
+                break
+            events.extend(parse_events(data))
+        if events:
+            self.events += len(events)
+            self._on_change(events)
@@ -0,0 +1,621 @@
+# network_core.py
+"""Cœur réseau de la borne : une boucle asyncio unique, dans un seul thread,
+propriétaire de toutes les communications avec le serveur.
+
+Auparavant, le travail réseau était réparti sur plusieurs threads bloqués dans
+``requests`` : supervision de l'initialisation, renouvellement périodique du
+token, thread de statut imprimante, appels de renouvellement depuis le pont
+JavaScript. :class:`NetworkCore` les remplace par des tâches d'une même
+boucle :
+
+- obtention et renouvellement du token (:meth:`NetworkCore.get_app_token`,
+  boucle de renouvellement), conservé dans le magasin de secrets : au
+  redémarrage, le token encore valide est réutilisé sans attendre le serveur
+  et renouvelé en arrière-plan (démarrage à chaud) ;
+- supervision de l'initialisation : imprimante ouverte en parallèle de
+  l'obtention du token, durée de chaque étape mesurée ; backoff exponentiel
+  borné, écourté dès que le serveur redevient joignable (changement réseau
+  signalé par le noyau, cf. net_watch, ou sondage toutes les
+  ``OFFLINE_PROBE_INTERVAL`` secondes) ;
+- envoi des statuts imprimante (:class:`AsyncStatusDelivery`, même logique que
+  ``PrinterStatusThread``, réveillée uniquement quand un statut arrive) ;
+- préchauffage de la connexion au démarrage (résolution DNS, TCP, TLS) puis
+  sondages périodiques légers qui gardent la connexion du pool ouverte
+  (:attr:`NetworkCore.reachable`, :attr:`NetworkCore.timeline`).
+
+Client HTTP : la session ``requests`` partagée de la borne (cf. http_client,
+un seul pool de connexions keep-alive). Les appels bloquants
+s'exécutent sur un petit exécuteur borné (``NETWORK_WORKERS`` threads) et sont
+attendus via ``asyncio.wait_for`` : un délai dépassé ou un arrêt annule
+l'attente côté boucle immédiatement, et l'appel sous-jacent reste de toute
+façon borné par ``NETWORK_TIMEOUT``. :meth:`NetworkCore.stop` annule toutes
+les tâches puis joint le thread : l'arrêt est déterministe.
+"""
+import asyncio
+import functools
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from requests.exceptions import RequestException
+
+import logging_config
+from http_client import shared_http_client
+from net_watch import NetworkWatcher
+from token_manager import DEFAULT_REFRESH_PERCENT, TokenManager
+from printer import (
+    NETWORK_TIMEOUT,
+    STATUS_BACKOFF_MAX,
+    STATUS_BACKOFF_START,
+    StatusUploader,
+)
+
+logger = logging.getLogger("borne.network")
+
+# Durée de validité restante minimale d'un token conservé pour le réutiliser
+# au démarrage (secondes).
+RESTORED_MIN_REMAINING = 60
+
+# Délai entre deux tentatives d'une même demande de token (secondes).
+TOKEN_FETCH_RETRY_DELAY = 2
+
+# Réessai du renouvellement après un échec. L'échéance normale dépend de la
+# durée de vie annoncée par le serveur (cf. token_manager).
+TOKEN_RETRY_DELAY = 300
+
+# Boucle d'initialisation persistante : au démarrage (et tant que la borne n'a
+# pas obtenu son token), on réessaie avec un backoff exponentiel borné au lieu
+# d'abandonner.
+INIT_BACKOFF_START = 5          # premier réessai après 5 s
+INIT_BACKOFF_MAX = 300          # plafond : 5 min entre deux tentatives
+
+# Sondage de joignabilité du serveur (secondes) une fois la borne
+# opérationnelle. Inférieur aux délais keep-alive usuels côté serveur (60-75 s)
+# pour que la connexion du pool reste ouverte entre deux statuts.
+PROBE_INTERVAL = 45
+# Pendant le backoff de l'initialisation, serveur injoignable : sondage toutes
+# les N secondes. Borne le délai de reprise après le retour du réseau (sous
+# Linux, un changement réseau déclenche en plus un sondage immédiat).
+OFFLINE_PROBE_INTERVAL = 10
+
+# Threads de l'exécuteur réseau : un appel long (réessai de token) ne bloque
+# pas l'envoi d'un statut, sans multiplier les threads.
+NETWORK_WORKERS = 2
+# Délai global d'un appel bloquant attendu par la boucle : couvre la connexion
+# et la lecture de NETWORK_TIMEOUT, plus une marge.
+CALL_TIMEOUT = sum(NETWORK_TIMEOUT) + 5
+
+
+class TokenError(Exception):
+    """Le token d'application n'a pas pu être obtenu."""
+
+
+class NetworkCore:
+    """Boucle asyncio (un thread) possédant les échanges avec le serveur.
+
+    ``on_token(token)`` est appelé (hors du thread de la boucle) à chaque
+    nouveau token, pour le propager (imprimante, en-têtes...).
+    ``refresh_percent`` : renouvellement à ce pourcentage de la durée de vie
+    du token (cf. token_manager). ``token_store`` : magasin du token conservé
+    entre deux exécutions (module ``secret_store`` ou équivalent), None pour
+    ne rien conserver."""
+
+    def __init__(self, base_url, app_secret, session=None, on_token=None,
+                 refresh_percent=DEFAULT_REFRESH_PERCENT, rng=None,
+                 probe_interval=PROBE_INTERVAL, guard=None, token_store=None):
+        self.base_url = base_url
+        self._app_secret = app_secret
+        self.session = session or shared_http_client().session
+        # Disjoncteurs et budget de réessais communs (cf. circuit_breaker).
+        self.guard = guard or shared_http_client().guard
+        self._token_url = f'{base_url}/api/get_app_token'
+        self._on_token = on_token
+        # Token courant, obtenu en single-flight (cf. token_manager).
+        self.tokens = TokenManager(self._fetch_token, refresh_percent, rng,
+                                   on_token=self._set_token)
+        self._token_renewed = None
+        self._token_store = token_store
+        self._on_operational = None
+        self._on_offline = None
+        self._recovery = None
+        # Joignabilité du serveur : None tant qu'aucun sondage n'a eu lieu.
+        self.reachable = None
+        self._probe_interval = probe_interval
+        # Canal de commandes (cf. push_channel), renseigné par la borne s'il
+        # est activé : les statuts imprimante l'empruntent quand il est connecté.
+        self.push = None
+        # Chronologie du démarrage (millisecondes depuis start()) : DNS,
+        # préchauffage, imprimante, token, opérationnel. Jointe aux métriques
+        # de pulsation.
+        self.timeline = {}
+        self._started_at = None
+        self._network_changed = None
+        self._watcher = NetworkWatcher(self._on_network_change)
+
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=NETWORK_WORKERS,
+                                            thread_name_prefix="borne-net")
+        self._tasks = set()
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def start(self):
+        """Démarre la boucle dans son thread (retourne une fois prête)."""
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run_loop, name="borne-network",
+                                        daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.loop = loop
+        self._token_renewed = asyncio.Event()
+        self._network_changed = asyncio.Event()
+        self._watcher.start(loop)
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def stop(self, timeout=5):
+        """Annule toutes les tâches réseau, arrête la boucle et joint son
+        thread. Les appels HTTP en cours sont abandonnés (leurs threads se
+        terminent d'eux-mêmes au plus tard à NETWORK_TIMEOUT)."""
+        if self.loop is None or not self._thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def app_token(self):
+        return self.tokens.token
+
+    async def _shutdown(self):
+        self._watcher.stop()
+        self.tokens.cancel()
+        tasks = [t for t in self._tasks if not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop.stop()
+
+    def spawn(self, coro, name=None):
+        """Crée une tâche suivie (arrêtée par stop). Depuis le thread de la
+        boucle uniquement ; depuis un autre thread, utiliser :meth:`submit`."""
+        task = self.loop.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def submit(self, coro):
+        """Planifie ``coro`` depuis un autre thread ; renvoie un
+        ``concurrent.futures.Future``."""
+        async def _tracked():
+            return await self.spawn(coro)
+        return asyncio.run_coroutine_threadsafe(_tracked(), self.loop)
+
+    async def run_blocking(self, func, *args, call_timeout=CALL_TIMEOUT, **kwargs):
+        """Exécute un appel bloquant sur l'exécuteur réseau, attendu avec un
+        délai global ``call_timeout`` (annulable). Les autres arguments sont
+        passés à ``func`` (dont ``timeout`` pour un appel requests)."""
+        future = self.loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs))
+        return await asyncio.wait_for(future, call_timeout)
+
+    # ------------------------------------------------------------------
+    # Token d'application
+    # ------------------------------------------------------------------
+    async def get_app_token(self, max_retries=3, retry_delay=None, force=False):
+        """Token d'application : servi depuis la mémoire s'il est frais, sinon
+        obtenu (avec réessais) par une requête partagée entre les appelants
+        simultanés. ``force`` : après un 401 ou à l'échéance. Lève TokenError."""
+        if retry_delay is None:
+            retry_delay = TOKEN_FETCH_RETRY_DELAY
+        return await self.tokens.get(force=force, max_retries=max_retries,
+                                     retry_delay=retry_delay)
+
+    async def _fetch_token(self, max_retries, retry_delay):
+        """Requête d'authentification (avec réessais) ; renvoie le corps JSON."""
+        url = self._token_url
+        data = {'app_secret': self._app_secret}
+        for attempt in range(max_retries):
+            try:
+                response = await self.run_blocking(
+                    self.session.post, url, data=data, timeout=NETWORK_TIMEOUT)
+                if response.status_code == 200:
+                    body = response.json()
+                    if not isinstance(body, dict) or not body.get('token'):
+                        raise ValueError("réponse sans token")
+                    return body
+                logger.warning("Échec de l'obtention du token (tentative %d/%d, HTTP %s).",
+                               attempt + 1, max_retries, response.status_code)
+            except (RequestException, asyncio.TimeoutError, ValueError, KeyError) as e:
+                logger.warning("Erreur réseau à l'obtention du token (tentative %d/%d): %s",
+                               attempt + 1, max_retries, e)
+            if attempt < max_retries - 1:  # Ne pas attendre après la dernière tentative
+                # Route suspendue (Retry-After, disjoncteur) ou budget de
+                # réessais épuisé : on laisse l'appelant replanifier.
+                if self.guard.retry_in(url) > 0 or not self.guard.allow_retry():
+                    break
+                await asyncio.sleep(retry_delay)
+        raise TokenError("Impossible d'obtenir le token après plusieurs tentatives")
+
+    def _set_token(self, token, lifetime, source, delay):
+        # Enregistre le jeton pour qu'il soit masqué s'il apparaît un jour dans
+        # un message de log (défense en profondeur).
+        logging_config.register_secret(token)
+        self._token_renewed.set()
+        logger.info("Token d'application obtenu (durée de vie %.0fs [%s], "
+                    "renouvellement dans %.0fs).", lifetime, source, delay)
+        if self._on_token:
+            # Hors de la boucle : la propagation peut bloquer (appel IPC vers
+            # un processus imprimante isolé).
+            self.loop.run_in_executor(None, self._propagate_token, token)
+        if self._token_store is not None:
+            self.loop.run_in_executor(None, self._persist_token, token, lifetime)
+
+    def _persist_token(self, token, lifetime):
+        try:
+            self._token_store.store_app_token(self.base_url, token, time.time() + lifetime)
+        except Exception as e:
+            logger.warning("Conservation du token impossible : %s", e)
+
+    async def _restore_token(self):
+        """Token conservé d'une exécution précédente, installé s'il reste
+        valable au moins RESTORED_MIN_REMAINING secondes ; True si installé."""
+        if self._token_store is None:
+            return False
+        try:
+            stored = await self.loop.run_in_executor(
+                None, self._token_store.load_app_token, self.base_url)
+        except Exception as e:
+            logger.warning("Lecture du token conservé impossible : %s", e)
+            return False
+        if not stored or stored[1] < RESTORED_MIN_REMAINING:
+            return False
+        token, remaining = stored
+        logging_config.register_secret(token)
+        self.tokens.seed(token)
+        logger.info("Token conservé réutilisé (valable encore %.0fs) : démarrage "
+                    "sans attendre le serveur, renouvellement en arrière-plan.", remaining)
+        return True
+
+    def _propagate_token(self, token):
+        try:
+            self._on_token(token)
+        except Exception as e:
+            logger.error("Propagation du nouveau token impossible : %s", e)
+
+    def note_unauthorized(self):
+        """Un appel authentifié a reçu un 401 (compté, cf. token_manager).
+        Avec un token restauré, déclenche :meth:`_recover_rejected_token`."""
+        self.tokens.stats.note_unauthorized()
+        if self.tokens.restored:
+            self.loop.call_soon_threadsafe(self._start_recovery)
+
+    def _start_recovery(self):
+        if self._recovery is None or self._recovery.done():
+            self._recovery = self.spawn(self._recover_rejected_token(), "token-rejected")
+
+    async def _recover_rejected_token(self):
+        """Le serveur refuse le token restauré au démarrage : il est effacé du
+        magasin et remplacé. Si aucun nouveau token ne peut être obtenu, la
+        borne repasse hors ligne (``on_offline``) jusqu'à en obtenir un.
+        Les deux rappels (fenêtre) s'exécutent hors de la boucle."""
+        if not self.tokens.restored:
+            return
+        logger.warning("Token conservé refusé par le serveur : remplacement.")
+        await self.loop.run_in_executor(None, self._token_store.clear_app_token)
+        delay = INIT_BACKOFF_START
+        offline = False
+        while True:
+            try:
+                await self.get_app_token(force=True, max_retries=1)
+                break
+            except TokenError as e:
+                if not offline:
+                    offline = True
+                    logger.warning("Aucun token valide : borne hors ligne (%s).", e)
+                    if self._on_offline:
+                        await self.loop.run_in_executor(None, self._on_offline)
+                await self._wait_before_retry(delay)
+                delay = min(delay * 2, INIT_BACKOFF_MAX)
+        if offline and self._on_operational:
+            await self.loop.run_in_executor(None, self._on_operational)
+
+    def refresh_token_blocking(self, timeout=CALL_TIMEOUT * 3):
+        """Renouvelle le token après un 401, depuis un AUTRE thread (thread de
+        statut d'un processus imprimante...) ; renvoie le token ou None."""
+        try:
+            return self.submit(self.get_app_token(force=True)).result(timeout)
+        except Exception as e:
+            logger.warning("Échec du renouvellement du token : %s", e)
+            return None
+
+    async def _token_refresh_loop(self):
+        """Renouvelle le token à l'échéance planifiée ; un token obtenu entre-
+        temps (ex. après un 401) replanifie l'échéance. Après un échec, réessaie
+        rapidement au lieu d'attendre l'échéance normale."""
+        while True:
+            self._token_renewed.clear()
+            delay = max(0.0, self.tokens.refresh_at - time.monotonic())
+            try:
+                await asyncio.wait_for(self._token_renewed.wait(), delay)
+                continue  # nouveau token : nouvelle échéance
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.get_app_token(force=True)
+            except TokenError as e:
+                self.tokens.postpone(max(TOKEN_RETRY_DELAY,
+                                         self.guard.retry_in(self._token_url)))
+                logger.warning("Échec du renouvellement du token, réessai bientôt : %s", e)
+
+    # ------------------------------------------------------------------
+    # Supervision de l'initialisation
+    # ------------------------------------------------------------------
+    def start_supervision(self, initialize, on_operational, on_offline=None):
+        """Lance la boucle d'initialisation persistante (depuis n'importe quel
+        thread). ``initialize()`` (bloquant, ex. ouverture USB) est exécuté
+        hors de la boucle, EN PARALLÈLE de l'obtention du token (le token est
+        ensuite propagé par ``on_token``) ; ``on_operational()`` est
+        appelé quand la borne devient opérationnelle, ``on_offline()`` si elle
+        cesse de l'être (token restauré refusé, cf. note_unauthorized)."""
+        self._on_operational = on_operational
+        self._on_offline = on_offline
+        self.loop.call_soon_threadsafe(
+            self.spawn, self._supervise(initialize, on_operational), "init")
+
+    def _mark(self, name):
+        self.timeline[name] = round((time.monotonic() - self._started_at) * 1000, 1)
+
+    async def _supervise(self, initialize, on_operational):
+        # Imprimante et token en parallèle : l'ouverture USB n'attend pas le
+        # réseau. Opérationnelle quand les deux sont prêts.
+        printer = self.spawn(self._initialize_printer(initialize), "init-printer")
+        await self._acquire_token()
+        await printer
+        # Token attaché à l'imprimante, même s'il est arrivé (ou a été
+        # restauré) avant la création de celle-ci.
+        if self._on_token:
+            await self.loop.run_in_executor(None, self._propagate_token, self.tokens.token)
+        self.spawn(self._token_refresh_loop(), "token-refresh")
+        if self._probe_interval:
+            self.spawn(self._probe_loop(), "probe")
+        self._mark('operational_ms')
+        logger.info("Borne opérationnelle en %.0f ms (%s).",
+                    self.timeline['operational_ms'], self.timeline)
+        # Hors de la boucle : la fenêtre, le stockage local et le canal de
+        # commandes démarrent sans bloquer token, statuts ni sondage.
+        await self.loop.run_in_executor(None, on_operational)
+
+    async def _acquire_token(self):
+        """Token initial : restauré (démarrage à chaud) ou demandé au serveur,
+        avec un backoff exponentiel borné."""
+        if await self._restore_token():
+            # Démarrage à chaud : aucune attente réseau. Le token restauré
+            # sera renouvelé une fois opérationnel (boucle de renouvellement).
+            self.spawn(self.prewarm(), "prewarm")
+        else:
+            # Préchauffage : la demande de token réutilise ensuite la connexion.
+            await self.prewarm()
+            delay = INIT_BACKOFF_START
+            while True:
+                try:
+                    # Une seule tentative par itération : le backoff est géré ici.
+                    await self.get_app_token(max_retries=1)
+                    break
+                except Exception as e:
+                    logger.warning("Token indisponible, nouvel essai dans %ss : %s",
+                                   delay, e)
+                    await self._wait_before_retry(delay)
+                    delay = min(delay * 2, INIT_BACKOFF_MAX)
+        self._mark('token_ms')
+        logger.info("Token prêt à %.0f ms.", self.timeline['token_ms'])
+
+    async def _initialize_printer(self, initialize):
+        """``initialize()`` (bloquant : ouverture USB, contrôle papier) hors de
+        la boucle, réessayé avec backoff s'il lève une exception."""
+        delay = INIT_BACKOFF_START
+        while True:
+            try:
+                await self.loop.run_in_executor(None, initialize)
+                break
+            except Exception as e:
+                logger.warning("Initialisation de l'imprimante impossible, nouvel essai "
+                               "dans %ss : %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, INIT_BACKOFF_MAX)
+        self._mark('printer_ms')
+        logger.info("Imprimante prête à %.0f ms.", self.timeline['printer_ms'])
+
+    async def _wait_before_retry(self, delay):
+        """Attend ``delay`` secondes avant un nouvel essai d'initialisation, ou
+        moins si le serveur était injoignable et le redevient. Un serveur
+        joignable (échec d'une autre nature : secret refusé, USB...) ne
+        raccourcit pas l'attente, et un Retry-After du serveur l'allonge."""
+        delay = max(delay, self.guard.retry_in(self._token_url))
+        deadline = self.loop.time() + delay
+        self._network_changed.clear()
+        if await self.probe():
+            await asyncio.sleep(max(0.0, deadline - self.loop.time()))
+            return
+        while (remaining := deadline - self.loop.time()) > 0:
+            await self._wait_network_change(min(remaining, OFFLINE_PROBE_INTERVAL))
+            if await self.probe():
+                logger.info("Serveur de nouveau joignable : nouvel essai immédiat.")
+                return
+
+    # ------------------------------------------------------------------
+    # Joignabilité du serveur
+    # ------------------------------------------------------------------
+    def _on_network_change(self, events):
+        logger.info("Changement réseau détecté (%s).", ", ".join(sorted(set(events))))
+        self._network_changed.set()
+
+    def notify_network_change(self):
+        """Signale un changement réseau (depuis n'importe quel thread) :
+        déclenche un sondage immédiat du serveur."""
+        self.loop.call_soon_threadsafe(self._network_changed.set)
+
+    async def _wait_network_change(self, timeout):
+        """Attend un changement réseau au plus ``timeout`` secondes."""
+        try:
+            await asyncio.wait_for(self._network_changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._network_changed.clear()
+        return True
+
+    async def prewarm(self):
+        """Résout le nom du serveur et ouvre la connexion (TCP + TLS) du pool
+        avant le premier appel utile. Sans effet bloquant en cas d'échec : la
+        supervision de l'initialisation prend le relais."""
+        parsed = urlparse(self.base_url)
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        try:
+            await asyncio.wait_for(
+                self.loop.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM),
+                NETWORK_TIMEOUT[0])
+            self._mark('dns_ms')
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.warning("Résolution de %s impossible : %s", parsed.hostname, e)
+            self.reachable = False
+            return False
+        reachable = await self.probe()
+        self._mark('prewarm_ms')
+        return reachable
+
+    async def probe(self):
+        """Sonde le serveur (toute réponse HTTP = joignable) ; met à jour et
+        renvoie :attr:`reachable`. Les changements sont journalisés."""
+        try:
+            await self.run_blocking(self.session.head, self.base_url,
+                                    timeout=NETWORK_TIMEOUT, allow_redirects=False)
+            reachable = True
+        except (RequestException, asyncio.TimeoutError) as e:
+            logger.debug("Sondage du serveur en échec : %s", e)
+            reachable = False
+        if reachable != self.reachable:
+            logger.info("Serveur %s.", "joignable" if reachable else "injoignable")
+        self.reachable = reachable
+        return reachable
+
+    async def _probe_loop(self):
+        # Sondage léger (HEAD) sur la connexion du pool : la maintient ouverte
+        # et détecte une connexion fermée par le serveur avant un vrai envoi.
+        # Un changement réseau déclenche un sondage immédiat.
+        while True:
+            await self._wait_network_change(self._probe_interval)
+            await self.probe()
+
+    # ------------------------------------------------------------------
+    # Statuts imprimante
+    # ------------------------------------------------------------------
+    def status_delivery(self, *args, **kwargs):
+        """Fabrique compatible avec ``Printer(status_delivery=...)`` : les
+        statuts sont envoyés par la boucle réseau au lieu d'un thread dédié,
+        avec la session partagée (ou le canal de commandes)."""
+        kwargs.setdefault('session', self.session)
+        kwargs.setdefault('guard', self.guard)
+        kwargs.setdefault('channel', self.push)
+        return AsyncStatusDelivery(self, *args, **kwargs)
+
+
+class AsyncStatusDelivery(StatusUploader):
+    """Envoi des statuts imprimante par la boucle réseau. Même contrat que
+    ``PrinterStatusThread`` (start/stop/join/update_headers/notify) ; aucune
+    scrutation : la tâche ne se réveille qu'à l'arrivée d'un statut, à
+    l'échéance de la pulsation ou d'un backoff."""
+
+    def __init__(self, core, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._core = core
+        self._wake = asyncio.Event()
+        self._future = None
+
+    def start(self):
+        self._future = self._core.submit(self._run())
+
+    def notify(self):
+        self._core.loop.call_soon_threadsafe(self._wake.set)
+
+    def stop(self):
+        super().stop()
+        if self._future is not None:
+            self._future.cancel()
+
+    def join(self, timeout=None):
+        if self._future is None:
+            return
+        try:
+            self._future.result(timeout)
+        except BaseException:
+            pass
+
+    async def _renew_token_async(self):
+        self._core.note_unauthorized()
+        try:
+            token = await self._core.get_app_token(force=True)
+        except TokenError:
+            return False
+        self.update_headers({'X-App-Token': token, 'Content-Type': 'application/json'})
+        return True
+
+    async def _run(self):
+        loop = self._core.loop
+        pending = self._initial_pending()
+        backoff = STATUS_BACKOFF_START
+        token_retries = 0
+        last_sent = loop.time()
+        while True:
+            if pending is None:
+                pending = self._drain_latest()
+            if pending is None:
+                # Attente sans scrutation : réveil par notify() ou à
+                # l'échéance de la pulsation.
+                timeout = None
+                if self._heartbeat_callback is not None:
+                    timeout = max(0.0, last_sent + self._heartbeat_interval - loop.time())
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                    continue
+                except asyncio.TimeoutError:
+                    pending = self._next_heartbeat()
+            else:
+                newer = self._drain_latest()
+                if newer is not None:
+                    pending = newer
+
+            try:
+                result = await self._core.run_blocking(self._send_pending, pending)
+            except asyncio.TimeoutError:
+                result = 'fail'
+
+            if result == 'ok':
+                pending = None
+                last_sent = loop.time()
+                backoff = STATUS_BACKOFF_START
+                token_retries = 0
+                continue
+
+            if result == 'unauthorized' and token_retries < 1:
+                token_retries += 1
+                if await self._renew_token_async():
+                    continue
+
+            token_retries = 0
+            await asyncio.sleep(self._retry_delay(backoff))
+            backoff = min(backoff * 2, STATUS_BACKOFF_MAX)
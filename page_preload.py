@@ -0,0 +1,178 @@
+# page_preload.py
+"""Préchargement de /patient dans une fenêtre cachée.
+
+Quand la borne devenait opérationnelle, la fenêtre passait de l'écran
+« Borne hors ligne » à /patient par ``load_url`` : les patients voyaient une
+page blanche ou à moitié dessinée pendant le chargement.
+:class:`PagePreloader` charge la page dans une fenêtre cachée pendant que
+l'écran hors ligne reste affiché ; une fois la page chargée ET les
+injections kiosque faites (:meth:`PagePreloader.page_ready`), la fenêtre
+cachée est affichée à la place de l'ancienne d'un seul coup.
+
+Si la fenêtre cachée ne peut pas être créée, ou si la page n'est pas prête
+après ``timeout`` secondes, la page est chargée dans la fenêtre visible
+comme auparavant.
+
+Le temps de bascule visible est mesuré dans les deux modes (cf.
+:meth:`PagePreloader.stats`) : durée pendant laquelle la fenêtre visible ne
+montre ni l'écran hors ligne ni la page prête (chargement direct), ou durée
+de la substitution (préchargement).
+"""
+import logging
+import threading
+import time
+
+from scheduler import get_scheduler
+
+logger = logging.getLogger("borne.preload")
+
+# Délai max du préchargement avant repli sur un chargement direct (secondes).
+PRELOAD_TIMEOUT = 30
+
+
+class PagePreloader:
+    """``open_hidden(url)`` crée une fenêtre cachée chargeant ``url`` ;
+    ``swap(window)`` l'affiche à la place de la fenêtre visible (et ferme
+    celle-ci). Les deux sont fournis par la fenêtre kiosque (cf. main).
+    Le délai de repli est une temporisation de l'ordonnanceur partagé."""
+
+    def __init__(self, open_hidden, swap, preload=True, timeout=PRELOAD_TIMEOUT,
+                 scheduler=None, clock=time.monotonic):
+        self._open_hidden = open_hidden
+        self._swap = swap
+        self.preload = preload
+        self._timeout = timeout
+        self._scheduler = scheduler or get_scheduler()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._url = None
+        self._hidden = None
+        self._visible = None
+        self._started_at = None
+        self._timer = None
+        self._stats = {'mode': None, 'load_ms': None, 'switch_ms': None, 'fallbacks': 0}
+
+    def show(self, url, visible):
+        """Affiche ``url`` à la place du contenu de la fenêtre ``visible``."""
+        with self._lock:
+            self._cancel_locked()
+            self._url = url
+            self._visible = visible
+            self._started_at = self._clock()
+        if self.preload:
+            try:
+                hidden = self._open_hidden(url)
+            except Exception as e:
+                logger.warning("Préchargement impossible (%s), chargement direct.", e)
+            else:
+                with self._lock:
+                    if self._url != url:
+                        # Annulé pendant la création.
+                        _destroy(hidden)
+                        return
+                    self._hidden = hidden
+                    self._timer = self._scheduler.call_later(
+                        self._timeout, self._on_timeout, hidden)
+                return
+        self._load_direct(url, visible, fallback=False)
+
+    def page_ready(self, window, url):
+        """Page chargée et injections faites dans ``window`` (appelé par le
+        gestionnaire ``loaded``). Ignoré si ce n'est pas la page attendue
+        (page de connexion, redirection...)."""
+        with self._lock:
+            if self._url is None or not (url or '').startswith(self._url):
+                return
+            if window is self._hidden:
+                hidden, self._hidden = self._hidden, None
+                self._stop_timer_locked()
+                load_ms = self._elapsed_ms(self._started_at)
+                mode = 'preload'
+            elif window is self._visible and self._hidden is None:
+                hidden = None
+                load_ms = self._elapsed_ms(self._started_at)
+                mode = 'direct'
+            else:
+                return
+            self._url = None
+            visible = self._visible
+        if hidden is None:
+            # Chargement direct : la fenêtre visible était en transition
+            # depuis l'appel à load_url.
+            self._record(mode, load_ms, load_ms)
+            return
+        swap_started = self._clock()
+        try:
+            self._swap(hidden)
+        except Exception as e:
+            logger.error("Bascule vers la page préchargée impossible : %s", e)
+            _destroy(hidden)
+            with self._lock:
+                self._stats['fallbacks'] += 1
+            self._load_direct(url, visible, fallback=True)
+            return
+        self._record(mode, load_ms, self._elapsed_ms(swap_started))
+
+    def pending(self):
+        """Un affichage est en cours (page pas encore prête)."""
+        with self._lock:
+            return self._url is not None
+
+    def cancel(self):
+        """Abandonne l'affichage en cours (borne repassée hors ligne)."""
+        with self._lock:
+            self._cancel_locked()
+
+    def stats(self):
+        """``{'mode', 'load_ms', 'switch_ms', 'fallbacks'}`` du dernier
+        affichage (``mode`` : 'preload' ou 'direct')."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _load_direct(self, url, visible, fallback):
+        with self._lock:
+            self._url = url
+            self._visible = visible
+            if fallback:
+                self._started_at = self._clock()
+        visible.load_url(url)
+
+    def _on_timeout(self, hidden):
+        with self._lock:
+            if hidden is not self._hidden:
+                return
+            self._hidden = None
+            url, visible = self._url, self._visible
+            self._stats['fallbacks'] += 1
+        logger.warning("Page non prête après %s s en arrière-plan, chargement direct.",
+                       self._timeout)
+        _destroy(hidden)
+        self._load_direct(url, visible, fallback=True)
+
+    def _cancel_locked(self):
+        self._stop_timer_locked()
+        if self._hidden is not None:
+            _destroy(self._hidden)
+            self._hidden = None
+        self._url = None
+
+    def _stop_timer_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _elapsed_ms(self, since):
+        return round((self._clock() - since) * 1000, 1)
+
+    def _record(self, mode, load_ms, switch_ms):
+        with self._lock:
+            self._stats.update(mode=mode, load_ms=load_ms, switch_ms=switch_ms)
+        logger.info("Page affichée (%s) : chargée en %.0f ms, bascule visible %.0f ms.",
+                    mode, load_ms, switch_ms)
+
+
+def _destroy(window):
+    try:
+        window.destroy()
+    except Exception as e:
+        logger.debug("Fermeture de la fenêtre cachée : %s", e)
@@ -0,0 +1,508 @@
+# peer_link.py
+"""Renvoi des impressions vers l'imprimante d'une borne voisine (réseau local).
+
+Sur un site équipé de deux bornes, une borne dont l'imprimante n'a plus de
+papier (ou est en erreur USB) devenait inutilisable. Avec le réglage
+``peer_forwarding``, les bornes :
+
+- se découvrent (liste statique ``peers`` et/ou annonce UDP diffusée sur le
+  réseau local) et partagent l'état de leur imprimante ;
+- lorsque l'imprimante locale n'a rien pu imprimer (``no_paper``, imprimante
+  absente ou inaccessible), le ticket (revalidé localement) est transmis à
+  une voisine en bonne santé, et le message renvoyé à la page indique quelle
+  borne l'a imprimé. Jamais de doublon : une erreur survenue pendant
+  l'impression (ticket peut-être déjà sorti) n'est pas renvoyée, et une
+  voisine qui a reçu le ticket sans répondre à temps n'est pas relayée par une
+  autre (issue inconnue, ``error_peer_outcome``).
+
+Protocole local, volontairement minimal et borné :
+
+- TCP, une requête par connexion, trame = longueur (4 octets big-endian) +
+  JSON UTF-8, au plus ``MAX_PEER_FRAME`` octets ; délai ``PEER_TIMEOUT`` ;
+- chaque message est signé (HMAC-SHA256, clé dérivée du secret d'application
+  partagé par les bornes du site) et horodaté ; un nonce déjà vu ou un
+  horodatage hors fenêtre est refusé (rejeu) ;
+- nombre de connexions simultanées servies borné (``MAX_PEER_CONNECTIONS``) ;
+- la borne réceptrice REVALIDE la charge (``decode_and_validate_print_payload``)
+  et n'imprime qu'en local : un ticket transféré n'est jamais retransféré.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+
+from printer import decode_and_validate_print_payload
+from scheduler import get_scheduler
+
+logger = logging.getLogger("borne.peers")
+
+PROTOCOL_VERSION = 1
+# Taille max d'une trame TCP : une charge d'impression (MAX_ENCODED_LEN) plus
+# l'enveloppe JSON signée.
+MAX_PEER_FRAME = 64 * 1024
+# Taille max d'une annonce UDP.
+MAX_ANNOUNCE_BYTES = 2048
+# Délai (secondes) de connexion / lecture d'un échange entre bornes.
+PEER_TIMEOUT = 5.0
+# Délai (secondes) de la réponse à une demande d'impression : la voisine
+# imprime avant de répondre (cf. printer_worker.WORKER_CALL_TIMEOUT).
+PEER_PRINT_TIMEOUT = 35.0
+MAX_PEER_CONNECTIONS = 4
+# Fenêtre d'acceptation de l'horodatage d'un message (anti-rejeu).
+MAX_CLOCK_SKEW = 30.0
+_MAX_SEEN_NONCES = 1024
+# Intervalle (secondes) d'annonce / de sondage de santé des voisines ; une
+# voisine silencieuse depuis PEER_STALE_AFTER n'est plus candidate.
+PEER_HEALTH_INTERVAL = 15.0
+PEER_STALE_AFTER = 3 * PEER_HEALTH_INTERVAL
+
+# Codes de Printer.print pour lesquels on tente une voisine : l'imprimante a
+# refusé AVANT d'imprimer quoi que ce soit (la charge n'est pas en cause).
+# ``error_print`` et ``error_worker`` peuvent survenir ticket (en partie)
+# sorti : jamais renvoyés, sous peine de doublon.
+FORWARDABLE_CODES = frozenset({'no_paper', 'error_init', 'error_grant'})
+# Réponses d'une voisine qui n'a rien imprimé : la suivante peut être tentée.
+_PEER_DECLINED_CODES = FORWARDABLE_CODES | {'peer_unavailable'}
+
+_LENGTH = struct.Struct('>I')
+
+
+class PeerProtocolError(Exception):
+    """Message entre bornes invalide, non authentifié ou trop volumineux."""
+
+
+class PeerReplyLost(PeerProtocolError):
+    """Requête remise à la voisine, réponse absente ou invalide : on ne sait
+    pas si elle a été traitée."""
+
+
+def derive_peer_key(app_secret):
+    """Clé HMAC du protocole, dérivée du secret d'application (jamais envoyé)."""
+    return hmac.new(app_secret.encode('utf-8'), b"borne-peer-link-v1",
+                    hashlib.sha256).digest()
+
+
+def _canonical(message):
+    return json.dumps(message, sort_keys=True, separators=(',', ':'),
+                      ensure_ascii=True).encode('utf-8')
+
+
+class PeerCodec:
+    """Signature / vérification des messages entre bornes."""
+
+    def __init__(self, key, borne_id, clock=time.time):
+        self._key = key
+        self.borne_id = borne_id
+        self._clock = clock
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def seal(self, msg_type, body=None):
+        message = {
+            'v': PROTOCOL_VERSION,
+            'type': msg_type,
+            'from': self.borne_id,
+            'ts': self._clock(),
+            'nonce': uuid.uuid4().hex,
+            'body': body or {},
+        }
+        message['mac'] = hmac.new(self._key, _canonical(message),
+                                  hashlib.sha256).hexdigest()
+        return _canonical(message)
+
+    def open(self, raw):
+        """Vérifie et renvoie le message, ou lève PeerProtocolError."""
+        try:
+            message = json.loads(raw.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError):
+            raise PeerProtocolError("message illisible")
+        if not isinstance(message, dict) or message.get('v') != PROTOCOL_VERSION:
+            raise PeerProtocolError("version de protocole inconnue")
+        mac = message.pop('mac', None)
+        expected = hmac.new(self._key, _canonical(message), hashlib.sha256).hexdigest()
+        if not isinstance(mac, str) or not hmac.compare_digest(mac, expected):
+            raise PeerProtocolError("signature invalide")
+        ts = message.get('ts')
+        now = self._clock()
+        if not isinstance(ts, (int, float)) or abs(now - ts) > MAX_CLOCK_SKEW:
+            raise PeerProtocolError("horodatage hors fenêtre")
+        nonce = message.get('nonce')
+        with self._lock:
+            if nonce in self._seen:
+                raise PeerProtocolError("message rejoué")
+            self._seen[nonce] = ts
+            if len(self._seen) > _MAX_SEEN_NONCES:
+                cutoff = now - MAX_CLOCK_SKEW
+                self._seen = {n: t for n, t in self._seen.items() if t >= cutoff}
+                while len(self._seen) > _MAX_SEEN_NONCES:
+                    self._seen.pop(next(iter(self._seen)))
+        if not isinstance(message.get('body'), dict):
+            raise PeerProtocolError("corps de message invalide")
+        return message
+
+
+def _send_frame(sock, payload):
+    if len(payload) > MAX_PEER_FRAME:
+        raise PeerProtocolError("trame trop volumineuse")
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            raise PeerProtocolError("connexion fermée prématurément")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_frame(sock):
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    if size > MAX_PEER_FRAME:
+        raise PeerProtocolError("trame trop volumineuse")
+    return _recv_exact(sock, size)
+
+
+def parse_peer_address(value, default_port):
+    """« hôte[:port] » -> (hôte, port). Lève ValueError si invalide."""
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"adresse de borne voisine invalide : {value!r}")
+    host, sep, port = value.strip().rpartition(':')
+    if not sep:
+        return value.strip(), default_port
+    port = int(port)
+    if not host or not (0 < port < 65536):
+        raise ValueError(f"adresse de borne voisine invalide : {value!r}")
+    return host, port
+
+
+class _Peer:
+    __slots__ = ('host', 'port', 'borne_id', 'printer_ok', 'last_seen', 'static')
+
+    def __init__(self, host, port, static=False):
+        self.host = host
+        self.port = port
+        self.borne_id = None
+        self.printer_ok = False
+        self.last_seen = 0.0
+        self.static = static
+
+
+class PeerLink:
+    """Serveur + client du protocole entre bornes, et renvoi des impressions.
+
+    ``print_callback`` est l'impression locale (``Printer.print``) ;
+    ``health_callback`` renvoie ``{'printer_ok': bool, ...}`` (``Printer.health``).
+    :meth:`print` s'utilise à la place de l'impression locale dans
+    ``PrinterAPI``."""
+
+    def __init__(self, borne_id, app_secret, print_callback, health_callback,
+                 port, peers=(), discovery=True, bind_host='0.0.0.0',
+                 clock=time.time, scheduler=None):
+        self.borne_id = borne_id
+        self._codec = PeerCodec(derive_peer_key(app_secret), borne_id, clock)
+        self._print_local = print_callback
+        self._health = health_callback
+        self._clock = clock
+        self.port = port
+        self._bind_host = bind_host
+        self._discovery = discovery
+        self._peers = {}
+        self._peers_lock = threading.Lock()
+        for address in peers:
+            host, peer_port = parse_peer_address(address, port)
+            self._peers[(host, peer_port)] = _Peer(host, peer_port, static=True)
+        self._slots = threading.BoundedSemaphore(MAX_PEER_CONNECTIONS)
+        self._stop = threading.Event()
+        self._scheduler = scheduler or get_scheduler()
+        self._health_timer = None
+        self._server = None
+        self._udp = None
+        self._threads = []
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def start(self):
+        link = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                link._serve_connection(self.request, self.client_address)
+
+        class _Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = _Server((self._bind_host, self.port), _Handler)
+        # Port effectif (utile si 0 a été demandé, notamment en test).
+        self.port = self._server.server_address[1]
+        # Attente sans délai : aucun réveil au repos (voir stop()).
+        self._spawn(lambda: self._server.serve_forever(poll_interval=None))
+        if self._discovery:
+            self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._udp.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self._udp.bind((self._bind_host, self.port))
+            self._spawn(self._listen_announces)
+        self._health_timer = self._scheduler.call_every(
+            PEER_HEALTH_INTERVAL, self._health_tick, first_delay=0)
+        logger.info("Liaison entre bornes active (port %s, %d voisine(s) statique(s), "
+                    "découverte %s).", self.port, len(self._peers),
+                    "active" if self._discovery else "désactivée")
+
+    def _spawn(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        if self._health_timer is not None:
+            self._health_timer.cancel()
+        if self._server is not None:
+            # serve_forever attend une connexion sans délai : on le débloque
+            # par des connexions locales jusqu'à prise en compte de l'arrêt.
+            stopper = threading.Thread(target=self._server.shutdown, daemon=True)
+            stopper.start()
+            while stopper.is_alive():
+                self._wake_server()
+                stopper.join(0.05)
+            self._server.server_close()
+        if self._udp is not None:
+            self._udp.close()
+
+    # ------------------------------------------------------------------
+    # Côté serveur
+    # ------------------------------------------------------------------
+    def _wake_server(self):
+        host = '127.0.0.1' if self._bind_host in ('', '0.0.0.0') else self._bind_host
+        try:
+            socket.create_connection((host, self.port), timeout=1).close()
+        except OSError:
+            pass
+
+    def _serve_connection(self, sock, address):
+        if self._stop.is_set():
+            return  # connexion de réveil à l'arrêt
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Borne voisine %s refusée : trop de connexions.", address[0])
+            return
+        try:
+            sock.settimeout(PEER_TIMEOUT)
+            request = self._codec.open(_recv_frame(sock))
+            self._note_peer(address[0], None, request)
+            reply = self._dispatch(request)
+            _send_frame(sock, self._codec.seal('reply', reply))
+        except (PeerProtocolError, OSError) as e:
+            logger.warning("Échange refusé avec la borne %s : %s", address[0], e)
+        finally:
+            self._slots.release()
+
+    def _dispatch(self, request):
+        if request['type'] == 'health':
+            return self._local_health()
+        if request['type'] == 'print':
+            return self._print_for_peer(request)
+        return {'success': False, 'code': 'error_exception',
+                'message': "Requête inconnue."}
+
+    def _print_for_peer(self, request):
+        data = request['body'].get('data')
+        try:
+            decode_and_validate_print_payload(data)
+        except ValueError as e:
+            logger.warning("Ticket transféré par %s refusé : %s", request['from'], e)
+            return {'success': False, 'code': 'invalid_data',
+                    'message': "Données d'impression invalides."}
+        if not self._local_health().get('printer_ok'):
+            return {'success': False, 'code': 'peer_unavailable',
+                    'message': "Imprimante indisponible."}
+        logger.info("Impression d'un ticket transféré par la borne %s.", request['from'])
+        # Impression LOCALE uniquement : pas de retransfert en cascade.
+        return self._print_local(data)
+
+    def _local_health(self):
+        try:
+            health = dict(self._health())
+        except Exception as e:
+            logger.debug("État imprimante indisponible : %s", e)
+            health = {'printer_ok': False}
+        health['borne_id'] = self.borne_id
+        return health
+
+    # ------------------------------------------------------------------
+    # Découverte et santé des voisines
+    # ------------------------------------------------------------------
+    def _note_peer(self, host, port, message):
+        """Met à jour la table des voisines à partir d'un message authentifié
+        (annonce UDP ou requête entrante)."""
+        borne_id = message.get('from')
+        if borne_id == self.borne_id:
+            return
+        body = message.get('body', {})
+        with self._peers_lock:
+            peer = None
+            if port is not None:
+                peer = self._peers.get((host, port))
+            if peer is None:
+                peer = next((p for p in self._peers.values()
+                             if p.borne_id == borne_id), None)
+            if peer is None:
+                if port is None:
+                    return  # requête entrante d'une borne inconnue : rien à noter
+                peer = self._peers[(host, port)] = _Peer(host, port)
+            peer.borne_id = borne_id
+            if 'printer_ok' in body:
+                peer.printer_ok = bool(body['printer_ok'])
+            peer.last_seen = self._clock()
+
+    def _listen_announces(self):
+        while not self._stop.is_set():
+            try:
+                datagram, address = self._udp.recvfrom(MAX_ANNOUNCE_BYTES)
+            except OSError:
+                return
+            self.handle_announce(datagram, address)
+
+    def handle_announce(self, datagram, address):
+        try:
+            message = self._codec.open(datagram)
+        except PeerProtocolError as e:
+            logger.debug("Annonce ignorée de %s : %s", address[0], e)
+            return
+        if message['type'] != 'announce':
+            return
+        port = message['body'].get('port')
+        if not isinstance(port, int) or not (0 < port < 65536):
+            return
+        self._note_peer(address[0], port, message)
+
+    def _announce(self):
+        body = self._local_health()
+        body['port'] = self.port
+        payload = self._codec.seal('announce', body)
+        try:
+            self._udp.sendto(payload, ('<broadcast>', self.port))
+        except OSError as e:
+            logger.debug("Annonce UDP impossible : %s", e)
+
+    def _health_tick(self):
+        """Passage périodique (ordonnanceur partagé) : annonce UDP et santé
+        des voisines statiques."""
+        if self._stop.is_set():
+            return
+        if self._discovery and self._udp is not None:
+            self._announce()
+        for peer in self.peers(static_only=True):
+            self.poll_health(peer)
+
+    def poll_health(self, peer):
+        try:
+            reply = self._request(peer, 'health')
+        except (PeerProtocolError, OSError) as e:
+            logger.debug("Borne voisine %s:%s injoignable : %s", peer.host, peer.port, e)
+            with self._peers_lock:
+                peer.printer_ok = False
+            return
+        with self._peers_lock:
+            peer.borne_id = reply['from']
+            peer.printer_ok = bool(reply['body'].get('printer_ok'))
+            peer.last_seen = self._clock()
+
+    def peers(self, static_only=False):
+        with self._peers_lock:
+            return [p for p in self._peers.values() if p.static or not static_only]
+
+    def healthy_peers(self):
+        """Voisines candidates : imprimante OK et vues récemment."""
+        now = self._clock()
+        with self._peers_lock:
+            candidates = [p for p in self._peers.values()
+                          if p.printer_ok and now - p.last_seen <= PEER_STALE_AFTER]
+        return sorted(candidates, key=lambda p: p.last_seen, reverse=True)
+
+    # ------------------------------------------------------------------
+    # Côté client
+    # ------------------------------------------------------------------
+    def _request(self, peer, msg_type, body=None, reply_timeout=PEER_TIMEOUT):
+        """Échange une requête ; lève PeerReplyLost si la requête est partie
+        mais que la réponse manque (délai ``reply_timeout`` dépassé, connexion
+        coupée, réponse invalide)."""
+        with socket.create_connection((peer.host, peer.port), timeout=PEER_TIMEOUT) as sock:
+            sock.settimeout(PEER_TIMEOUT)
+            _send_frame(sock, self._codec.seal(msg_type, body))
+            sock.settimeout(reply_timeout)
+            try:
+                reply = self._codec.open(_recv_frame(sock))
+            except (PeerProtocolError, OSError) as e:
+                raise PeerReplyLost(str(e) or type(e).__name__) from e
+        if reply['type'] != 'reply':
+            raise PeerReplyLost("réponse inattendue")
+        return reply
+
+    def print(self, data):
+        """Impression locale, avec renvoi vers une voisine si l'imprimante
+        locale ne peut pas imprimer. Même contrat de retour que Printer.print ;
+        en cas de renvoi, ``code`` vaut ``print_forwarded`` et ``printed_by``
+        identifie la borne qui a imprimé."""
+        result = self._print_local(data)
+        if result.get('success') or result.get('code') not in FORWARDABLE_CODES:
+            return result
+        try:
+            decode_and_validate_print_payload(data)
+        except ValueError:
+            return result
+        for peer in self.healthy_peers():
+            try:
+                reply = self._request(peer, 'print', {'data': data},
+                                      reply_timeout=PEER_PRINT_TIMEOUT)
+            except PeerReplyLost as e:
+                # Le ticket a peut-être été imprimé : pas d'autre voisine.
+                logger.error("Renvoi vers la borne %s sans réponse, issue inconnue : %s",
+                             peer.borne_id, e)
+                with self._peers_lock:
+                    peer.printer_ok = False
+                return self._outcome_unknown(peer)
+            except (PeerProtocolError, OSError) as e:
+                logger.warning("Renvoi vers la borne %s impossible : %s", peer.borne_id, e)
+                with self._peers_lock:
+                    peer.printer_ok = False
+                continue
+            peer_result = reply['body']
+            if peer_result.get('success'):
+                printed_by = reply['from']
+                logger.info("Ticket imprimé par la borne voisine %s (local : %s).",
+                            printed_by, result.get('code'))
+                return {
+                    'success': True,
+                    'code': 'print_forwarded',
+                    'message': f"Ticket imprimé sur la borne « {printed_by} ».",
+                    'printed_by': printed_by,
+                }
+            with self._peers_lock:
+                peer.printer_ok = False
+            if peer_result.get('code') not in _PEER_DECLINED_CODES:
+                logger.error("Impression en erreur sur la borne %s (%s), issue inconnue.",
+                             reply['from'], peer_result.get('code'))
+                return self._outcome_unknown(peer)
+        return result
+
+    @staticmethod
+    def _outcome_unknown(peer):
+        name = peer.borne_id or peer.host
+        return {
+            'success': False,
+            'code': 'error_peer_outcome',
+            'message': (f"Impression sur la borne « {name} » incertaine : "
+                        "vérifiez si le ticket est sorti avant de recommencer."),
+        }
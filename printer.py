@@ -4,15 +4,18 @@ from escpos.constants import RT_STATUS_PAPER
 import base64
 import logging
 import threading
-import requests
 import queue
 import time
 import random
 import socket
 import uuid
+import zlib
 from datetime import datetime, timezone
 import usb.core  # pyusb : dépendance de python-escpos, fournit USBError
 from config import Config
+from status_outbox import StatusOutbox, encode_batch
+from scheduler import get_scheduler
+from http_client import shared_http_client
 from array import array
 
 logger = logging.getLogger("borne.printer")
@@ -47,23 +50,74 @@ def _default_device_factory(id_vendor, id_product, printer_model):
     return CustomUsb(id_vendor, id_product, profile=printer_model)
 
 
+# Impressions asynchrones (PrinterAPI.print_ticket avec {'async': true}) :
+# travaux en attente au plus ; au-delà, la demande est refusée aussitôt.
+MAX_PENDING_PRINT_JOBS = 5
+# Évènements de progression en attente de remise à la page ; au-delà (page
+# figée), les suivants sont abandonnés.
+MAX_PENDING_PRINT_EVENTS = 100
+
+
 class PrinterAPI:
     """API minimaliste pour PyWebView"""
     def __init__(self):
         self._print_callback = None
+        self._event_sink = None
+        self._jobs = None
+        self._jobs_lock = threading.Lock()
+        self._active = 0
+        # Travaux asynchrones acceptés et pas encore terminés (en attente ou
+        # en cours) : compté de l'acceptation à la fin de l'impression, sans
+        # trou entre la sortie de la file et l'impression (cf. busy).
+        self._pending = 0
+        # Progression remise à la page par un fil dédié : ni le pont ni
+        # l'impression n'attendent le moteur de rendu (cf. _emit).
+        self._events = queue.Queue(maxsize=MAX_PENDING_PRINT_EVENTS)
 
     def set_print_callback(self, callback):
         """Définit la fonction de callback pour l'impression"""
         self._print_callback = callback
 
-    def print_ticket(self, print_data):
+    def set_event_sink(self, sink):
+        """``sink(event)`` reçoit la progression des impressions asynchrones
+        (la fenêtre kiosque la relaie à la page, cf. main)."""
+        self._event_sink = sink
+
+    def print_ticket(self, print_data, options=None):
         """Méthode exposée à JavaScript pour l'impression.
 
         Retourne toujours un dictionnaire au format unique
         ``{'success': bool, 'code': str, 'message': str}``. Le callback
         (Printer.print) respecte déjà ce contrat ; on ne fait que
         garantir le même format pour les erreurs propres à l'API.
+
+        Avec ``options={'async': true}``, le pont n'attend pas l'impression
+        physique : la réponse immédiate dit si le travail est accepté
+        (``print_queued`` avec ``job_id``) ou refusé, puis la progression est
+        signalée par des évènements ``{'job_id', 'state'}`` (``queued``,
+        ``printing``, puis ``done`` ou ``error`` avec ``result``, au format
+        ci-dessus).
         """
+        if (options or {}).get('async'):
+            return self._submit(print_data)
+        return self._run(print_data)
+
+    def busy(self):
+        """Impression en cours ou en attente (cf. renderer_watch : pas de
+        rechargement de la page pendant une impression)."""
+        with self._jobs_lock:
+            return self._active > 0 or self._pending > 0
+
+    def _run(self, print_data):
+        with self._jobs_lock:
+            self._active += 1
+        try:
+            return self._call(print_data)
+        finally:
+            with self._jobs_lock:
+                self._active -= 1
+
+    def _call(self, print_data):
         if self._print_callback:
             try:
                 return self._print_callback(print_data)
@@ -79,15 +133,77 @@ class PrinterAPI:
             'message': 'Système d\'impression non initialisé'
         }
 
+    def _submit(self, print_data):
+        if not self._print_callback:
+            return self._run(print_data)
+        job_id = uuid.uuid4().hex[:8]
+        with self._jobs_lock:
+            if self._jobs is None:
+                self._jobs = queue.Queue(maxsize=MAX_PENDING_PRINT_JOBS)
+                threading.Thread(target=self._work, name="borne-print-jobs",
+                                 daemon=True).start()
+                threading.Thread(target=self._deliver_events, name="borne-print-events",
+                                 daemon=True).start()
+            try:
+                self._jobs.put_nowait((job_id, print_data))
+            except queue.Full:
+                return {
+                    'success': False,
+                    'code': 'print_queue_full',
+                    'message': "Trop d'impressions en attente, réessayez."
+                }
+            self._pending += 1
+            # Sous le verrou (dépôt sans attente) : « queued » précède
+            # toujours « printing » dans la file d'évènements.
+            self._emit({'job_id': job_id, 'state': 'queued'})
+        return {
+            'success': True,
+            'code': 'print_queued',
+            'message': "Impression en attente.",
+            'job_id': job_id
+        }
+
+    def _work(self):
+        # Un seul fil : les tickets sortent dans l'ordre des demandes.
+        while True:
+            job_id, print_data = self._jobs.get()
+            try:
+                self._emit({'job_id': job_id, 'state': 'printing'})
+                result = self._call(print_data)
+            finally:
+                with self._jobs_lock:
+                    self._pending -= 1
+            self._emit({'job_id': job_id, 'state': 'done' if result.get('success') else 'error',
+                        'result': result})
+
+    def _emit(self, event):
+        """Dépose ``event`` pour la page, sans jamais attendre."""
+        if self._event_sink is None:
+            return
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            logger.warning("Progression d'impression abandonnée (page qui ne répond pas) : %s",
+                           event)
+
+    def _deliver_events(self):
+        while True:
+            event = self._events.get()
+            try:
+                self._event_sink(event)
+            except Exception as e:
+                logger.warning("Progression d'impression non transmise à la page : %s", e)
+
 
 # Timeouts (connexion, lecture) en secondes pour les appels réseau de la borne.
 # Sans timeout, un serveur injoignable ou lent bloque le thread appelant
 # indéfiniment.
 NETWORK_TIMEOUT = (5, 10)
 
-# Intervalle (secondes) entre deux passages du gestionnaire de santé de
-# l'imprimante : tant qu'elle n'est pas connectée (absente au démarrage ou
-# débranchée en cours de route), il retente périodiquement l'ouverture USB.
+# Intervalle (secondes) entre deux tentatives de reconnexion de l'imprimante :
+# tant qu'elle n'est pas connectée (absente au démarrage ou débranchée en cours
+# de route), l'ouverture USB est retentée périodiquement. Une imprimante
+# connectée ne déclenche AUCUN réveil.
 HEALTH_CHECK_INTERVAL = 10
 
 # Backoff (secondes) pour les réessais d'envoi des statuts imprimante après un
@@ -96,6 +212,24 @@ HEALTH_CHECK_INTERVAL = 10
 STATUS_BACKOFF_START = 1.0
 STATUS_BACKOFF_MAX = 30.0
 
+# Pulsation (secondes) : en l'absence de transition d'état, un statut
+# « heartbeat » portant l'état courant et les compteurs est envoyé à cette
+# fréquence. Le serveur sait ainsi qu'une borne silencieuse au-delà de cet
+# intervalle est hors service, sans recevoir un statut à chaque contrôle.
+STATUS_HEARTBEAT_INTERVAL = 300
+
+# Codes qui signalent un INCIDENT ponctuel et non un état de l'imprimante : ils
+# ne modifient pas l'état courant et ne sont transmis qu'une fois par
+# intervalle de pulsation (une page qui enverrait des charges invalides en
+# boucle ne peut pas inonder le serveur). Tous sont comptés.
+_STATUS_EVENT_CODES = frozenset({'invalid_data'})
+
+# Marqueur de travail du thread de statut en mode boîte d'envoi : « vider la
+# boîte d'envoi » (les statuts eux-mêmes sont déjà persistés sur disque).
+_FLUSH_OUTBOX = object()
+# Marqueur d'arrêt déposé dans la file pour débloquer le thread de statut.
+_STOP_STATUS = object()
+
 
 # --- Contrôle des données d'impression ------------------------------------
 # La charge d'impression (base64) provient de la page servie, transmise via le
@@ -113,6 +247,21 @@ MAX_DECODED_BYTES = 12288    # taille max des octets décodés
 MAX_TICKET_CHARS = 6000      # longueur max du ticket (caractères)
 MAX_TICKET_LINES = 150       # nombre max de lignes du ticket
 
+# Enveloppe compressée (second format accepté par le pont JavaScript) :
+#   "DFL1:" + base64( longueur décompressée [4 octets, big-endian]
+#                     + flux deflate au format zlib )
+# Côté page : CompressionStream('deflate') produit exactement ce flux. Un ticket
+# (surtout avec du contenu répétitif / raster) compresse fortement : moins de
+# base64 à produire côté JS, moins de JSON à sérialiser sur le pont, moins à
+# décoder ici. La longueur préfixée est contrôlée AVANT décompression et la
+# décompression est elle-même bornée : une « bombe » deflate ne peut donc pas
+# dépasser MAX_DECODED_BYTES en mémoire.
+COMPRESSED_PAYLOAD_PREFIX = "DFL1:"
+# Taille max de l'enveloppe une fois le base64 décodé (préfixe de longueur
+# compris) : c'est ce que reçoit _inflate_envelope.
+MAX_COMPRESSED_BYTES = 8192
+_LENGTH_PREFIX_BYTES = 4
+
 # Séquences ESC/POS AUTORISÉES : exactement celles émises par le serveur
 # (Serveur/utils.py convert_markdown_to_escpos). Toute autre séquence de
 # contrôle débutant par ESC (0x1B) ou GS (0x1D) est refusée.
@@ -165,16 +314,51 @@ def _validate_decoded_ticket(text):
         i += 1
 
 
+def _inflate_envelope(envelope):
+    """Décompresse une enveloppe « DFL1 » (octets déjà décodés du base64).
+
+    Lève ValueError si l'enveloppe est tronquée, si la longueur annoncée dépasse
+    MAX_DECODED_BYTES, si le flux est corrompu / incomplet / suivi de données
+    parasites, ou si la taille obtenue diffère de la taille annoncée. La
+    décompression est bornée (max_length) : au plus MAX_DECODED_BYTES + 1
+    octets sont produits, quelle que soit la charge reçue."""
+    if len(envelope) <= _LENGTH_PREFIX_BYTES:
+        raise ValueError("enveloppe compressée tronquée")
+    if len(envelope) > MAX_COMPRESSED_BYTES:
+        raise ValueError(
+            f"charge compressée trop volumineuse "
+            f"({len(envelope)} > {MAX_COMPRESSED_BYTES} octets)")
+    declared = int.from_bytes(envelope[:_LENGTH_PREFIX_BYTES], 'big')
+    if declared > MAX_DECODED_BYTES:
+        raise ValueError(
+            f"charge décodée trop volumineuse "
+            f"({declared} > {MAX_DECODED_BYTES} octets)")
+    inflater = zlib.decompressobj()
+    try:
+        raw = inflater.decompress(envelope[_LENGTH_PREFIX_BYTES:], declared + 1)
+    except zlib.error:
+        raise ValueError("flux compressé invalide")
+    if (not inflater.eof or inflater.unconsumed_tail or inflater.unused_data
+            or len(raw) != declared):
+        raise ValueError("flux compressé incohérent avec la longueur annoncée")
+    return raw
+
+
 def decode_and_validate_print_payload(data, encoding='utf-8'):
-    """Décode et valide STRICTEMENT une charge d'impression base64.
+    """Décode et valide STRICTEMENT une charge d'impression.
 
-    Renvoie le texte décodé prêt à imprimer, ou lève ValueError avec un message
-    ne contenant JAMAIS le contenu du ticket (journaux sûrs). Contrôles
+    Deux formats sont acceptés : base64 du ticket brut, ou enveloppe compressée
+    préfixée par COMPRESSED_PAYLOAD_PREFIX (voir _inflate_envelope). Renvoie le
+    texte décodé prêt à imprimer, ou lève ValueError avec un message ne
+    contenant JAMAIS le contenu du ticket (journaux sûrs). Contrôles
     successifs : type / vacuité, taille encodée, base64 strict (validate=True),
-    taille décodée, décodage dans l'encodage attendu, puis validation du contenu
-    (_validate_decoded_ticket)."""
+    décompression bornée le cas échéant, taille décodée, décodage dans
+    l'encodage attendu, puis validation du contenu (_validate_decoded_ticket)."""
     if not isinstance(data, str):
         raise ValueError("charge d'impression non textuelle")
+    compressed = data.startswith(COMPRESSED_PAYLOAD_PREFIX)
+    if compressed:
+        data = data[len(COMPRESSED_PAYLOAD_PREFIX):]
     if not data:
         raise ValueError("charge d'impression vide")
     if len(data) > MAX_ENCODED_LEN:
@@ -186,6 +370,8 @@ def decode_and_validate_print_payload(data, encoding='utf-8'):
         raw = base64.b64decode(data, validate=True)
     except (ValueError, TypeError):
         raise ValueError("base64 invalide")
+    if compressed:
+        raw = _inflate_envelope(raw)
     if len(raw) > MAX_DECODED_BYTES:
         raise ValueError(
             f"charge décodée trop volumineuse "
@@ -198,22 +384,96 @@ def decode_and_validate_print_payload(data, encoding='utf-8'):
     return text
 
 
-class PrinterStatusThread(threading.Thread):
-    def __init__(self, url, headers, status_queue, session=None, token_refresh_callback=None):
-        super().__init__(daemon=True)
+class PrinterStatusStateMachine:
+    """Filtre placé devant la file des statuts : seules les TRANSITIONS d'état
+    de l'imprimante sont transmises (avant, chaque contrôle papier renvoyait
+    ``no_paper``/``low_paper`` même sans changement). Chaque statut observé est
+    néanmoins compté ; l'état courant et les compteurs sont portés par la
+    pulsation périodique (voir :meth:`heartbeat`)."""
+
+    def __init__(self, clock=time.monotonic,
+                 heartbeat_interval=STATUS_HEARTBEAT_INTERVAL):
+        self._clock = clock
+        self._heartbeat_interval = heartbeat_interval
+        self._lock = threading.Lock()
+        self.state = None
+        self._counters = {}
+        self._suppressed = 0
+        self._last_event_sent = {}
+
+    def observe(self, code):
+        """Enregistre un statut ; renvoie True s'il doit être transmis."""
+        with self._lock:
+            self._counters[code] = self._counters.get(code, 0) + 1
+            if code in _STATUS_EVENT_CODES:
+                now = self._clock()
+                last = self._last_event_sent.get(code)
+                if last is not None and now - last < self._heartbeat_interval:
+                    self._suppressed += 1
+                    return False
+                self._last_event_sent[code] = now
+                return True
+            if code == self.state:
+                self._suppressed += 1
+                return False
+            self.state = code
+            return True
+
+    def count(self, name):
+        """Incrémente un compteur qui n'est pas un statut (ex. impressions)."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+
+    def heartbeat(self):
+        """Instantané pour la pulsation : état courant, compteurs cumulés et
+        nombre de statuts non transmis (doublons)."""
+        with self._lock:
+            return {
+                'state': self.state,
+                'counters': dict(self._counters),
+                'suppressed': self._suppressed,
+            }
+
+
+class StatusUploader:
+    """Envoi des statuts imprimante au serveur (sans boucle propre).
+
+    Regroupe la logique d'envoi (statut unique, lots de la boîte d'envoi,
+    renouvellement du token sur 401, pulsation) ; la boucle qui l'anime est
+    soit un thread dédié (:class:`PrinterStatusThread`), soit la boucle réseau
+    asyncio de la borne (``network_core.AsyncStatusDelivery``)."""
+
+    def __init__(self, url, headers, status_queue, session=None, token_refresh_callback=None,
+                 heartbeat_callback=None, heartbeat_interval=STATUS_HEARTBEAT_INTERVAL,
+                 outbox=None, guard=None, channel=None):
         self.url = url
+        # Boîte d'envoi persistante (optionnelle, cf. status_outbox) : les
+        # statuts y sont écrits par Printer.send_printer_status et envoyés par
+        # lots compressés sur {url}/batch. Un serveur qui ne connaît pas cette
+        # route (404/405/501) reçoit les statuts un par un, dans l'ordre.
+        self._outbox = outbox
+        self._batch_url = f'{url}/batch'
+        self._batch_supported = True
         self._headers = dict(headers)
         self._headers_lock = threading.Lock()
         self.status_queue = status_queue
         self._stop_event = threading.Event()
-        # Session persistante : réutilise la connexion TCP/TLS (keep-alive)
-        # au lieu d'en rouvrir une à chaque envoi de statut.
-        self.session = session or requests.Session()
-        # On ne ferme la session à l'arrêt que si on l'a créée nous-mêmes.
-        self._owns_session = session is None
+        # Session partagée de la borne (cf. http_client) : réutilise la
+        # connexion TCP/TLS (keep-alive) des autres échanges avec le serveur.
+        self.session = session or shared_http_client().session
+        # Disjoncteurs et budget de réessais communs (cf. circuit_breaker).
+        self._guard = guard or shared_http_client().guard
+        # Canal de commandes (optionnel, cf. push_channel) : tant qu'il est
+        # connecté, statuts et lots y sont envoyés au lieu d'une requête HTTP
+        # chacun ; sans réponse, repli sur HTTP.
+        self._channel = channel
         # Callback (optionnel) invoqué sur 401 pour renouveler le token ;
         # renvoie le nouveau token (str) ou None en cas d'échec.
         self._token_refresh_callback = token_refresh_callback
+        # Callback (optionnel) produisant le statut de pulsation, envoyé quand
+        # aucun statut n'a été transmis depuis heartbeat_interval secondes.
+        self._heartbeat_callback = heartbeat_callback
+        self._heartbeat_interval = heartbeat_interval
 
     def update_headers(self, headers):
         """Met à jour les en-têtes (ex: nouveau token) de façon thread-safe."""
@@ -223,6 +483,54 @@ class PrinterStatusThread(threading.Thread):
     def stop(self):
         self._stop_event.set()
 
+    def notify(self):
+        """Signale qu'un statut vient d'être mis en file (voir
+        Printer.send_printer_status). Rien à faire pour le thread dédié, qui
+        attend directement sur la file."""
+
+    def _initial_pending(self):
+        """Travail à reprendre au démarrage : vider la boîte d'envoi si des
+        statuts y sont restés (arrêt précédent), sinon rien."""
+        if self._outbox is not None and self._outbox.count():
+            return _FLUSH_OUTBOX
+        return None
+
+    def _heartbeat_due(self, last_sent):
+        return (self._heartbeat_callback is not None
+                and time.monotonic() - last_sent >= self._heartbeat_interval)
+
+    def _next_heartbeat(self):
+        """Statut de pulsation, persisté dans la boîte d'envoi le cas échéant."""
+        item = self._heartbeat_callback()
+        if self._outbox is not None:
+            self._outbox.append(item)
+        return item
+
+    def _renew_token(self):
+        """Renouvelle le token après un 401 ; True si de nouveaux en-têtes sont
+        en place (réessai immédiat possible)."""
+        if not self._token_refresh_callback:
+            return False
+        new_token = self._token_refresh_callback()
+        if not new_token:
+            return False
+        self.update_headers({
+            'X-App-Token': new_token,
+            'Content-Type': 'application/json'
+        })
+        return True
+
+    def _retry_delay(self, backoff):
+        """Délai avant de réessayer un envoi : backoff avec jitter, porté au
+        maximum si le budget de réessais commun est épuisé, et jamais avant la
+        réouverture de la route (Retry-After, disjoncteur)."""
+        delay = min(backoff, STATUS_BACKOFF_MAX)
+        if not self._guard.allow_retry():
+            delay = STATUS_BACKOFF_MAX
+        delay += random.uniform(0, delay * 0.5)  # jitter
+        url = self._batch_url if self._outbox is not None and self._batch_supported else self.url
+        return max(delay, self._guard.retry_in(url))
+
     def _drain_latest(self):
         """Vide la file et renvoie le statut le plus récent (ou None). Un statut
         plus récent supersède celui en attente : le serveur n'a besoin que de
@@ -230,14 +538,22 @@ class PrinterStatusThread(threading.Thread):
         latest = None
         while True:
             try:
-                latest = self.status_queue.get_nowait()
+                item = self.status_queue.get_nowait()
             except queue.Empty:
                 break
+            if item is not _STOP_STATUS:
+                latest = item
         return latest
 
     def _try_send(self, status_data):
         """Tente un envoi. Renvoie 'ok' (2xx), 'unauthorized' (401) ou 'fail'
         (erreur réseau ou tout autre code non-2xx)."""
+        if self._channel is not None:
+            reply = self._channel.request({'type': 'status', 'status': status_data})
+            if isinstance(reply, dict) and reply.get('type') == 'ack':
+                status_logger.debug("Statut imprimante envoyé par le canal : %s",
+                                    status_data.get('error'))
+                return 'ok'
         with self._headers_lock:
             headers = dict(self._headers)
         try:
@@ -265,69 +581,174 @@ class PrinterStatusThread(threading.Thread):
                               response.status_code)
         return 'fail'
 
+    def _try_send_batch(self, events):
+        """Envoie un lot de la boîte d'envoi et applique le curseur acquitté.
+        Renvoie 'ok', 'unauthorized', 'fail' ou 'unsupported' (route absente
+        côté serveur)."""
+        if self._channel is not None:
+            reply = self._channel.request({
+                'type': 'status_batch', 'borne_id': events[0][1].get('borne_id'),
+                'events': [dict(item, seq=seq) for seq, item in events]})
+            if isinstance(reply, dict) and reply.get('type') == 'ack':
+                return self._apply_ack(events, reply, 'canal')
+        with self._headers_lock:
+            headers = dict(self._headers)
+        headers['Content-Type'] = 'application/json'
+        headers['Content-Encoding'] = 'gzip'
+        body = encode_batch(events[0][1].get('borne_id'), events)
+        try:
+            response = self.session.post(self._batch_url, data=body, headers=headers,
+                                         timeout=NETWORK_TIMEOUT)
+        except Exception as e:
+            status_logger.warning("Échec d'envoi du lot de statuts: %s", e)
+            return 'fail'
+        if response.status_code in (404, 405, 501):
+            return 'unsupported'
+        if response.status_code == 401:
+            status_logger.info("Lot de statuts: 401 (token expiré ?)")
+            return 'unauthorized'
+        if not 200 <= response.status_code < 300:
+            status_logger.warning("Lot de statuts rejeté par le serveur (HTTP %s)",
+                                  response.status_code)
+            return 'fail'
+        try:
+            reply = response.json()
+        except ValueError:
+            reply = None
+        return self._apply_ack(events, reply, f'{len(body)} octets')
+
+    def _apply_ack(self, events, reply, via):
+        """Applique le curseur acquitté d'un lot envoyé : par défaut tout le
+        lot ; le serveur peut n'en acquitter qu'une partie (champ 'ack' =
+        dernier numéro enregistré)."""
+        last_seq = events[-1][0]
+        ack = last_seq
+        if isinstance(reply, dict) and isinstance(reply.get('ack'), int):
+            ack = min(reply['ack'], last_seq)
+        self._outbox.ack(ack)
+        status_logger.debug("Lot de %d statut(s) envoyé (acquitté jusqu'à %s, %s).",
+                            len(events), ack, via)
+        # Aucun progrès : on laisse le backoff s'appliquer.
+        return 'ok' if ack >= events[0][0] else 'fail'
+
+    def _flush_outbox(self):
+        """Vide la boîte d'envoi (lots successifs). 'ok' une fois vide."""
+        while not self._stop_event.is_set():
+            events = self._outbox.pending()
+            if not events:
+                return 'ok'
+            result = 'unsupported'
+            if self._batch_supported:
+                result = self._try_send_batch(events)
+                if result == 'unsupported':
+                    status_logger.info("Envoi par lots non pris en charge par le "
+                                       "serveur : envoi statut par statut.")
+                    self._batch_supported = False
+            if result == 'unsupported':
+                for seq, item in events:
+                    result = self._try_send(item)
+                    if result != 'ok':
+                        return result
+                    self._outbox.ack(seq)
+            elif result != 'ok':
+                return result
+        return 'fail'
+
+    def _send_pending(self, pending):
+        if self._outbox is None:
+            return self._try_send(pending)
+        return self._flush_outbox()
+
+
+
+class PrinterStatusThread(StatusUploader, threading.Thread):
+    """Thread dédié à l'envoi des statuts (processus imprimante isolé, ou
+    sans boucle réseau). Au repos, il reste bloqué sur la file jusqu'au
+    prochain statut ou à l'échéance de la pulsation : aucun réveil inutile."""
+
+    def __init__(self, *args, **kwargs):
+        threading.Thread.__init__(self, daemon=True)
+        StatusUploader.__init__(self, *args, **kwargs)
+        # Nombre de sorties d'attente sans statut (pulsation ou arrêt).
+        self.wakeups = 0
+
+    def stop(self):
+        super().stop()
+        # Débloque l'attente sur la file.
+        self.status_queue.put(_STOP_STATUS)
+
+    def _wait_for_status(self, last_sent):
+        """Attente bloquante du prochain statut ; None à l'échéance de la
+        pulsation (ou sans objet si aucune pulsation n'est configurée)."""
+        timeout = None
+        if self._heartbeat_callback is not None:
+            timeout = max(0.0, last_sent + self._heartbeat_interval - time.monotonic())
+        try:
+            item = self.status_queue.get(timeout=timeout)
+        except queue.Empty:
+            self.wakeups += 1
+            return None
+        if item is _STOP_STATUS:
+            self.wakeups += 1
+            return None
+        return item
+
     def run(self):
         # Statut en cours d'envoi, CONSERVÉ tant qu'il n'est pas acquitté (2xx) :
-        # une erreur réseau ne le fait plus disparaître.
-        pending = None
+        # une erreur réseau ne le fait plus disparaître. En mode boîte d'envoi,
+        # des statuts restés sur disque (arrêt précédent) sont envoyés d'emblée.
+        pending = self._initial_pending()
         backoff = STATUS_BACKOFF_START
         token_retries = 0  # limite les renouvellements de token immédiats
-        try:
-            while not self._stop_event.is_set():
+        last_sent = time.monotonic()
+        while not self._stop_event.is_set():
+            if pending is None:
+                # Pas de statut en attente : on dort jusqu'au prochain
+                # (ou jusqu'à l'arrêt, qui débloque la file).
+                pending = self._wait_for_status(last_sent)
+                if self._stop_event.is_set():
+                    break
                 if pending is None:
-                    # Pas de statut en attente : on en récupère un (attente
-                    # bornée pour rester réactif à l'arrêt).
-                    try:
-                        pending = self.status_queue.get(timeout=0.5)
-                    except queue.Empty:
+                    # Aucune transition depuis longtemps : pulsation.
+                    if self._heartbeat_due(last_sent):
+                        pending = self._next_heartbeat()
+                    else:
                         continue
-                else:
-                    # On a un statut non acquitté : s'il en est arrivé un plus
-                    # récent entretemps, il le remplace.
-                    newer = self._drain_latest()
-                    if newer is not None:
-                        pending = newer
-
-                result = self._try_send(pending)
-
-                if result == 'ok':
-                    pending = None
-                    backoff = STATUS_BACKOFF_START
-                    token_retries = 0
-                    continue
-
-                if (result == 'unauthorized' and self._token_refresh_callback
-                        and token_retries < 1):
-                    # Renouvellement du token puis réessai immédiat (une fois).
-                    token_retries += 1
-                    new_token = self._token_refresh_callback()
-                    if new_token:
-                        self.update_headers({
-                            'X-App-Token': new_token,
-                            'Content-Type': 'application/json'
-                        })
-                        continue  # réessai sans attendre avec le nouveau token
-
-                # Échec (réseau, non-2xx, ou 401 non renouvelable) : on GARDE
-                # pending et on attend avant de réessayer (backoff + jitter),
-                # de façon interruptible à l'arrêt.
+            else:
+                # On a un statut non acquitté : s'il en est arrivé un plus
+                # récent entretemps, il le remplace.
+                newer = self._drain_latest()
+                if newer is not None:
+                    pending = newer
+
+            result = self._send_pending(pending)
+
+            if result == 'ok':
+                pending = None
+                last_sent = time.monotonic()
+                backoff = STATUS_BACKOFF_START
                 token_retries = 0
-                delay = min(backoff, STATUS_BACKOFF_MAX)
-                delay += random.uniform(0, delay * 0.5)  # jitter
-                if self._stop_event.wait(delay):
-                    break
-                backoff = min(backoff * 2, STATUS_BACKOFF_MAX)
-        finally:
-            # Fermeture de la session HTTP à l'arrêt (si on en est propriétaire).
-            if self._owns_session:
-                try:
-                    self.session.close()
-                except Exception:
-                    pass
+                continue
+
+            if result == 'unauthorized' and token_retries < 1:
+                # Renouvellement du token puis réessai immédiat (une fois).
+                token_retries += 1
+                if self._renew_token():
+                    continue  # réessai sans attendre avec le nouveau token
+
+            # Échec (réseau, non-2xx, ou 401 non renouvelable) : on GARDE
+            # pending et on attend avant de réessayer (backoff + jitter),
+            # de façon interruptible à l'arrêt.
+            token_retries = 0
+            if self._stop_event.wait(self._retry_delay(backoff)):
+                break
+            backoff = min(backoff * 2, STATUS_BACKOFF_MAX)
 
 
 class Printer:
     def __init__(self, idVendor, idProduct, printer_model, web_url, app_token,
-                 token_refresh_callback=None, device_factory=None):
+                 token_refresh_callback=None, device_factory=None, outbox_path=None,
+                 status_delivery=None, scheduler=None, heartbeat_metrics=None):
         self.idVendor = int(idVendor, 16)
         self.idProduct = int(idProduct, 16)
         self.printer_model = printer_model
@@ -348,29 +769,65 @@ class Printer:
         # File bornée : ne conserve que le dernier état (voir send_printer_status).
         self.status_queue = queue.Queue()
         self._status_lock = threading.Lock()
+        # Seules les transitions d'état sont mises en file (voir
+        # send_printer_status) ; la pulsation porte l'état courant.
+        self._status_machine = PrinterStatusStateMachine()
+        # Boîte d'envoi persistante (optionnelle) : tous les statuts y sont
+        # conservés jusqu'à acquittement par le serveur (cf. status_outbox).
+        self._outbox = None
+        if outbox_path:
+            try:
+                self._outbox = StatusOutbox(outbox_path)
+            except Exception as e:
+                logger.error("Boîte d'envoi des statuts indisponible (%s) : "
+                             "seul le dernier statut sera conservé.", e)
         self.is_paper_ok = True
+        # Dernier résultat du contrôle papier ('paper_ok', 'low_paper',
+        # 'no_paper'...) ; None tant qu'aucun contrôle n'a eu lieu.
+        self.last_paper_code = None
 
         # Verrou SÉRIALISANT tous les accès USB (ouverture, impression, contrôle
         # papier, fermeture). Réentrant car print() appelle check_paper_status()
-        # qui le reprend. Garantit qu'une impression JavaScript et une impression
-        # WebSocket ne peuvent pas s'exécuter en même temps sur le même handle.
+        # qui le reprend. Garantit qu'une impression JavaScript et une
+        # réimpression demandée par le serveur (canal de commandes, cf.
+        # push_channel) ne peuvent pas s'exécuter en même temps sur le même
+        # handle.
         self._usb_lock = threading.RLock()
-        # Signalé à la fermeture pour arrêter le thread de santé.
+        # Signalé à la fermeture : plus aucune reconnexion n'est planifiée.
         self._closing = threading.Event()
-        self._health_thread = None
-        
-        # Démarrage du thread de status
-        self.status_thread = PrinterStatusThread(
+        # Reconnexion planifiée sur l'ordonnanceur partagé (cf. scheduler)
+        # uniquement quand l'imprimante est déconnectée.
+        self._scheduler = scheduler or get_scheduler()
+        self._reconnect_timer = None
+        # Métriques (optionnelles) jointes à la pulsation, ex. réseau de la
+        # borne : callable renvoyant un dict.
+        self._heartbeat_metrics = heartbeat_metrics
+        self.status_thread = None
+        # L'imprimante peut être ouverte avant l'obtention du token (démarrage
+        # en parallèle, cf. network_core) : l'envoi des statuts ne démarre
+        # qu'avec un token (update_token), les statuts restent en file d'ici là.
+        self._status_started = False
+        self._start_lock = threading.Lock()
+
+        # Démarrage de l'envoi des statuts : thread dédié par défaut, ou
+        # fabrique fournie par l'appelant (ex. boucle réseau asyncio de la
+        # borne, cf. network_core.NetworkCore.status_delivery), même signature.
+        self.status_thread = (status_delivery or PrinterStatusThread)(
             f'{self.web_url}/api/printer/status',
             {
                 'X-App-Token': self.app_token,
                 'Content-Type': 'application/json'
             },
             self.status_queue,
-            token_refresh_callback=token_refresh_callback
+            token_refresh_callback=token_refresh_callback,
+            heartbeat_callback=self._heartbeat_status,
+            outbox=self._outbox
         )
-        self.status_thread.start()
-        
+        if self.app_token:
+            self._start_status_delivery()
+        else:
+            logger.info("Envoi des statuts imprimante en attente du token.")
+
         # Initialisation de l'imprimante
         try:
             self.initialize_printer()
@@ -391,15 +848,15 @@ class Printer:
             else:
                 self.send_printer_status('error_init', f"Erreur d'initialisation : {str(e)}")
 
-        # Gestionnaire de santé : surveille la connexion et rouvre l'USB dès que
-        # possible. Démarré même si l'initialisation ci-dessus a échoué (borne
-        # démarrée imprimante débranchée) pour permettre la reconnexion.
-        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
-        self._health_thread.start()
+        # Borne démarrée imprimante débranchée (ou initialisation en échec) :
+        # reconnexion automatique dès que possible.
+        with self._usb_lock:
+            if self.p is None:
+                self._schedule_reconnect()
 
     def initialize_printer(self):
         # Ouverture USB sérialisée : jamais concurrente d'une impression ou d'une
-        # tentative de reconnexion par le thread de santé.
+        # tentative de reconnexion planifiée.
         with self._usb_lock:
             # Repart d'un état propre : si un ancien handle traîne (reconnexion),
             # on le ferme avant d'en ouvrir un nouveau.
@@ -445,22 +902,46 @@ class Printer:
 
     def _reset_connection(self):
         """Après une erreur USB matérielle (débranchement, pipe cassé...), ferme
-        le handle et marque l'imprimante en erreur. Le thread de santé se
-        chargera de rouvrir la connexion au prochain passage."""
+        le handle, marque l'imprimante en erreur et planifie la reconnexion."""
         with self._usb_lock:
             self._close_printer()
             self.error = True
+            self._schedule_reconnect()
 
-    def _health_loop(self):
-        """Surveillance périodique : tant que l'imprimante n'est pas connectée,
-        retente l'ouverture USB. Permet à une borne démarrée sans imprimante, ou
-        dont l'imprimante a été débranchée puis rebranchée, de se rétablir seule
-        sans redémarrage de l'application."""
-        while not self._closing.wait(HEALTH_CHECK_INTERVAL):
+    def reconnect(self):
+        """Ferme puis rouvre immédiatement l'imprimante (commande du serveur,
+        cf. push_channel) ; si elle reste absente, la reconnexion planifiée
+        prend le relais. Renvoie l'état résumé (cf. health)."""
+        with self._usb_lock:
+            self._close_printer()
+            self._try_reconnect()
+            if self.p is None:
+                self._schedule_reconnect()
+        return self.health()
+
+    def _schedule_reconnect(self):
+        """Planifie une tentative de reconnexion (une seule à la fois). À
+        appeler en détenant self._usb_lock."""
+        if self._closing.is_set() or self._reconnect_timer is not None:
+            return
+        self._reconnect_timer = self._scheduler.call_later(
+            HEALTH_CHECK_INTERVAL, self._reconnect_tick)
+
+    def _reconnect_tick(self):
+        """Tentative de reconnexion : permet à une borne démarrée sans
+        imprimante, ou dont l'imprimante a été débranchée puis rebranchée, de
+        se rétablir seule sans redémarrage de l'application. Replanifiée tant
+        que l'imprimante reste absente."""
+        with self._usb_lock:
+            self._reconnect_timer = None
+            if self._closing.is_set():
+                return
             try:
                 self._try_reconnect()
             except Exception as e:
                 logger.debug("Surveillance imprimante: %s", e)
+            if self.p is None:
+                self._schedule_reconnect()
 
     def _try_reconnect(self):
         """Réessaie d'ouvrir l'imprimante si elle n'est pas connectée. Ne fait
@@ -542,6 +1023,7 @@ class Printer:
                 if self.error:
                     self.error = False
                     self.send_printer_status('print_ok', "Impression réussie.")
+                self._status_machine.count('jobs_ok')
                 log.info("Impression réussie.")
                 return {
                     'success': True,
@@ -552,7 +1034,7 @@ class Printer:
             except usb.core.USBError as e:
                 # Erreur USB matérielle (débranchement, pipe cassé, périphérique
                 # occupé...) : le handle est probablement mort. On le ferme pour
-                # que le thread de santé le rouvre proprement.
+                # que la reconnexion planifiée le rouvre proprement.
                 log.error("Erreur USB lors de l'impression : %s", e)
                 self._reset_connection()
                 self.send_printer_status('error_print', f"Erreur USB lors de l'impression : {e}")
@@ -593,6 +1075,11 @@ class Printer:
         
 
     def send_printer_status(self, error, error_message):
+        # Machine d'état : un statut identique à l'état courant (ex. no_paper à
+        # chaque contrôle papier) est compté mais PAS mis en file.
+        if not self._status_machine.observe(error):
+            status_logger.debug("Statut %s inchangé, non transmis.", error)
+            return
         # borne_id : pour distinguer les bornes côté serveur.
         # timestamp : instant de GÉNÉRATION du statut (et non d'envoi), pour
         # rester exploitable même si l'envoi n'aboutit qu'après des réessais.
@@ -602,6 +1089,13 @@ class Printer:
             'borne_id': self.borne_id,
             'timestamp': datetime.now(timezone.utc).isoformat(),
         }
+        # Boîte d'envoi : le statut est persisté AVANT d'être signalé au thread
+        # d'envoi ; aucune transition n'est donc perdue pendant une coupure.
+        if self._outbox is not None:
+            try:
+                self._outbox.append(item)
+            except Exception as e:
+                status_logger.warning("Écriture dans la boîte d'envoi impossible: %s", e)
         # File bornée qui ne conserve que le DERNIER état : si un statut est
         # encore en attente (réseau lent/bloqué), on le remplace au lieu
         # d'empiler un backlog de statuts périmés. Le serveur n'a besoin que de
@@ -613,28 +1107,73 @@ class Printer:
             except queue.Empty:
                 pass
             self.status_queue.put(item)
+        if self.status_thread is not None:
+            self.status_thread.notify()
+
+    def _heartbeat_status(self):
+        """Statut de pulsation : état courant (même code ``error`` que la
+        dernière transition) + compteurs depuis le démarrage."""
+        snapshot = self._status_machine.heartbeat()
+        item = {
+            'error': snapshot['state'] or 'unknown',
+            'message': "Pulsation",
+            'borne_id': self.borne_id,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'heartbeat': True,
+            'counters': snapshot['counters'],
+            'suppressed': snapshot['suppressed'],
+        }
+        if self._heartbeat_metrics is not None:
+            try:
+                item['metrics'] = self._heartbeat_metrics()
+            except Exception as e:
+                status_logger.debug("Métriques de pulsation indisponibles: %s", e)
+        return item
+
+    def health(self):
+        """État résumé de l'imprimante, partagé avec les bornes voisines
+        (peer_link) : ``printer_ok`` est vrai si le handle USB est ouvert, sans
+        erreur, et que le dernier contrôle papier n'a pas signalé de manque."""
+        printer_ok = (self.p is not None and not self.error
+                      and self.last_paper_code != 'no_paper')
+        return {'printer_ok': printer_ok, 'paper': self.last_paper_code}
 
     def update_token(self, new_token):
         """Met à jour le token utilisé pour l'envoi des statuts (renouvellement
-        avant l'expiration des 24 h côté serveur)."""
+        avant l'expiration des 24 h côté serveur) ; le premier token démarre
+        l'envoi des statuts."""
         self.app_token = new_token
         self.status_thread.update_headers({
             'X-App-Token': new_token,
             'Content-Type': 'application/json'
         })
+        if new_token:
+            self._start_status_delivery()
+
+    def _start_status_delivery(self):
+        with self._start_lock:
+            if self._status_started or self._closing.is_set():
+                return
+            self._status_started = True
+            self.status_thread.start()
 
     def cleanup(self):
         """À appeler lors de la fermeture de l'application"""
-        # Arrêt du gestionnaire de santé (réveil immédiat via l'événement).
+        # Plus de reconnexion : annulation de la tentative planifiée.
         self._closing.set()
-        if self._health_thread:
-            self._health_thread.join(timeout=2)
         # Fermeture propre du handle USB.
         with self._usb_lock:
+            if self._reconnect_timer is not None:
+                self._reconnect_timer.cancel()
+                self._reconnect_timer = None
             self._close_printer()
-        if self.status_thread:
+        with self._start_lock:
+            started = self._status_started
+        if self.status_thread and started:
             self.status_thread.stop()
             self.status_thread.join()
+        if self._outbox is not None:
+            self._outbox.close()
 
 
     def check_paper_status(self):
@@ -655,19 +1194,23 @@ class Printer:
                 if paper_status == 0:
                     self.send_printer_status("no_paper", "Plus de papier dans l'imprimante")
                     self.is_paper_ok = False
+                    self.last_paper_code = 'no_paper'
                     return 'no_paper'
                 elif paper_status == 1:
                     self.send_printer_status("low_paper", "Il ne reste pas beaucoup de papier dans l'imprimante")
                     self.is_paper_ok = False
+                    self.last_paper_code = 'low_paper'
                     return 'low_paper'
                 # on envoie un message si le papier est ok uniquement si ce n'était pas le cas avant
                 else:
                     if not self.is_paper_ok:
                         self.send_printer_status("paper_ok", "Papier remis dans l'imprimante")
                         self.is_paper_ok = True
+                    self.last_paper_code = 'paper_ok'
                     return 'paper_ok'
 
             except Exception as e:
                 logger.warning("Erreur lors de la vérification papier: %s", e)
                 self.send_printer_status("error_paper_check", f"Erreur lors de la vérification papier: {str(e)}")
+                self.last_paper_code = 'paper_check_error'
                 return 'paper_check_error'
@@ -0,0 +1,336 @@
+# printer_worker.py
+"""Exécution du sous-système imprimante dans un processus enfant (optionnel).
+
+Par défaut, ``Printer``, son thread de statut et sa reconnexion USB partagent
+le processus (et le GIL) de Qt WebEngine et de la boucle pywebview : un rendu
+lourd peut retarder les échanges USB, et un plantage de libusb emporte toute la
+borne. Avec le réglage ``printer_process_isolation``, ``main.py`` utilise à la
+place :class:`PrinterProcess`, qui expose la MÊME interface que ``Printer``
+(``print``, ``update_token``, ``cleanup``) mais délègue tout à un processus
+enfant via un ``multiprocessing.Pipe`` :
+
+- le processus enfant est relancé automatiquement s'il meurt (backoff borné) ;
+  un appel en cours au moment du plantage renvoie le code ``error_worker`` ;
+- un appel qui ne répond pas dans ``call_timeout`` (libusb bloqué) fait
+  terminer l'enfant, qui est alors relancé ;
+- le surcoût IPC de chaque appel (aller-retour moins temps d'exécution dans
+  l'enfant) est mesuré et exposé par :meth:`PrinterProcess.ipc_stats`.
+
+Le renouvellement du token sur 401 (thread de statut, dans l'enfant) est
+relayé au parent par un évènement ; le parent appelle
+``token_refresh_callback``, dont le nouveau token revient à l'enfant par la
+propagation habituelle des tokens (``update_token``, cf. network_core
+``on_token``), une seule fois.
+"""
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+
+logger = logging.getLogger("borne.printer_worker")
+
+# Délai max (secondes) d'un appel au processus imprimante. Une impression dure
+# quelques secondes au plus : au-delà, l'enfant est considéré bloqué.
+WORKER_CALL_TIMEOUT = 30.0
+
+# Backoff (secondes) entre deux relances du processus imprimante.
+WORKER_RESTART_BACKOFF_START = 1.0
+WORKER_RESTART_BACKOFF_MAX = 30.0
+# Un enfant resté vivant au moins ce temps remet le backoff à zéro.
+WORKER_STABLE_AFTER = 60.0
+
+
+def _worker_main(conn, printer_args, printer_kwargs):
+    """Point d'entrée du processus enfant : construit un ``Printer`` et sert
+    les commandes du parent jusqu'à ``stop`` ou fermeture du canal."""
+    # Import local : le parent n'a pas besoin d'ouvrir l'USB lui-même.
+    from printer import Printer
+
+    send_lock = threading.Lock()
+
+    def _send(message):
+        with send_lock:
+            conn.send(message)
+
+    def _request_token_refresh():
+        # Appelé par le thread de statut de l'enfant sur 401 : on délègue au
+        # parent, qui renverra le token par update_token. Le thread de statut
+        # réessaiera après son backoff avec les nouveaux en-têtes.
+        try:
+            _send(('event', None, 'token_refresh', 0.0))
+        except Exception:
+            pass
+        return None
+
+    printer = Printer(*printer_args, token_refresh_callback=_request_token_refresh,
+                      **printer_kwargs)
+    try:
+        while True:
+            try:
+                op, call_id, args = conn.recv()
+            except (EOFError, OSError):
+                break
+            if op == 'stop':
+                break
+            started = time.perf_counter()
+            try:
+                if op == 'print':
+                    result = printer.print(*args)
+                elif op == 'update_token':
+                    result = printer.update_token(*args)
+                elif op == 'health':
+                    result = printer.health()
+                elif op == 'reconnect':
+                    result = printer.reconnect()
+                elif op == 'ping':
+                    result = 'pong'
+                else:
+                    result = {
+                        'success': False,
+                        'code': 'error_exception',
+                        'message': f"Commande inconnue : {op}",
+                    }
+            except Exception as e:
+                result = {
+                    'success': False,
+                    'code': 'error_exception',
+                    'message': f"Erreur d'impression : {e}",
+                }
+            _send(('result', call_id, result, time.perf_counter() - started))
+    finally:
+        printer.cleanup()
+
+
+class PrinterProcess:
+    """Mandataire de ``Printer`` exécuté dans un processus enfant supervisé.
+
+    Les arguments sont ceux de ``Printer`` ; ``device_factory`` doit être
+    sérialisable (fonction de module) si le contexte multiprocessing est
+    ``spawn``. ``mp_context`` permet aux tests d'utiliser ``fork``."""
+
+    def __init__(self, idVendor, idProduct, printer_model, web_url, app_token,
+                 token_refresh_callback=None, device_factory=None,
+                 mp_context=None, call_timeout=WORKER_CALL_TIMEOUT, **printer_kwargs):
+        self.idVendor = idVendor
+        self.idProduct = idProduct
+        self.printer_model = printer_model
+        self.web_url = web_url
+        self.app_token = app_token
+        self._token_refresh_callback = token_refresh_callback
+        self._device_factory = device_factory
+        # Autres arguments de Printer (ex. outbox_path), transmis tels quels.
+        self._printer_kwargs = printer_kwargs
+        # spawn par défaut : un fork d'un processus Qt multi-thread est risqué.
+        self._ctx = mp_context or multiprocessing.get_context('spawn')
+        self._call_timeout = call_timeout
+
+        self._conn = None
+        self._process = None
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._call_ids = itertools.count(1)
+        self._closing = threading.Event()
+        self._connected = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self._calls = 0
+        self._overhead_total = 0.0
+        self._overhead_max = 0.0
+        self.restarts = 0
+
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+
+    # ------------------------------------------------------------------
+    # Cycle de vie du processus enfant
+    # ------------------------------------------------------------------
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        printer_args = (self.idVendor, self.idProduct, self.printer_model,
+                        self.web_url, self.app_token)
+        printer_kwargs = dict(self._printer_kwargs, device_factory=self._device_factory)
+        process = self._ctx.Process(
+            target=_worker_main, args=(child_conn, printer_args, printer_kwargs),
+            name="borne-printer", daemon=True)
+        process.start()
+        # On ferme notre copie de l'extrémité enfant : la mort de l'enfant se
+        # traduit alors par un EOF côté parent.
+        child_conn.close()
+        with self._pending_lock:
+            self._conn = parent_conn
+            self._process = process
+            self._connected.set()
+        logger.info("Processus imprimante démarré (pid=%s).", process.pid)
+
+    def _supervise(self):
+        """Démarre l'enfant, lit ses messages, et le relance s'il meurt."""
+        backoff = WORKER_RESTART_BACKOFF_START
+        while not self._closing.is_set():
+            started = time.monotonic()
+            try:
+                self._spawn()
+            except Exception as e:
+                logger.error("Démarrage du processus imprimante impossible : %s", e)
+            else:
+                self._read_until_eof()
+            self._fail_pending()
+            if self._closing.is_set():
+                break
+            if time.monotonic() - started >= WORKER_STABLE_AFTER:
+                backoff = WORKER_RESTART_BACKOFF_START
+            exitcode = self._process.exitcode if self._process else None
+            logger.error("Processus imprimante arrêté (code %s), relance dans %.0fs.",
+                         exitcode, backoff)
+            if self._closing.wait(backoff):
+                break
+            backoff = min(backoff * 2, WORKER_RESTART_BACKOFF_MAX)
+            self.restarts += 1
+
+    def _read_until_eof(self):
+        while True:
+            try:
+                kind, call_id, payload, child_elapsed = self._conn.recv()
+            except (EOFError, OSError):
+                return
+            if kind == 'event':
+                if payload == 'token_refresh':
+                    threading.Thread(target=self._refresh_token_for_child,
+                                     daemon=True).start()
+                continue
+            with self._pending_lock:
+                slot = self._pending.get(call_id)
+            if slot is not None:
+                slot['result'] = payload
+                slot['child_elapsed'] = child_elapsed
+                slot['done'].set()
+
+    def _fail_pending(self):
+        # Sous le même verrou que l'enregistrement des appels (_call) : un
+        # appel enregistré après ce point voit l'enfant déconnecté.
+        with self._pending_lock:
+            self._connected.clear()
+            slots = list(self._pending.values())
+        for slot in slots:
+            if not slot['done'].is_set():
+                slot['result'] = self._worker_error(
+                    "Le processus imprimante s'est arrêté pendant l'opération.")
+                slot['done'].set()
+
+    def _refresh_token_for_child(self):
+        # Le nouveau token revient par update_token (propagation on_token) :
+        # pas de second envoi ici.
+        if self._token_refresh_callback:
+            self._token_refresh_callback()
+
+    def _kill_child(self, process):
+        """Termine ``process`` s'il est toujours l'enfant courant (jamais un
+        enfant relancé entre-temps)."""
+        if process is not None and self._process is process and process.is_alive():
+            process.terminate()
+
+    # ------------------------------------------------------------------
+    # Appels
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _worker_error(message):
+        return {'success': False, 'code': 'error_worker', 'message': message}
+
+    def _call(self, op, *args):
+        call_id = next(self._call_ids)
+        slot = {'done': threading.Event(), 'result': None, 'child_elapsed': None}
+        deadline = time.monotonic() + self._call_timeout
+        # Appel rattaché à l'enfant auquel il est envoyé (canal et processus
+        # lus sous le verrou de _fail_pending).
+        while True:
+            if not self._connected.wait(max(0.0, deadline - time.monotonic())):
+                return self._worker_error("Processus imprimante indisponible.")
+            with self._pending_lock:
+                if self._connected.is_set():
+                    conn, process = self._conn, self._process
+                    self._pending[call_id] = slot
+                    break
+        started = time.perf_counter()
+        try:
+            try:
+                with self._send_lock:
+                    conn.send((op, call_id, args))
+            except (OSError, ValueError, AttributeError):
+                return self._worker_error("Processus imprimante indisponible.")
+            if not slot['done'].wait(self._call_timeout):
+                logger.error("Processus imprimante bloqué (%s > %.0fs) : arrêt forcé.",
+                             op, self._call_timeout)
+                self._kill_child(process)
+                return self._worker_error("Le processus imprimante ne répond pas.")
+            roundtrip = time.perf_counter() - started
+            if slot['child_elapsed'] is not None:
+                self._record_overhead(op, roundtrip - slot['child_elapsed'])
+            return slot['result']
+        finally:
+            with self._pending_lock:
+                self._pending.pop(call_id, None)
+
+    def _record_overhead(self, op, overhead):
+        overhead = max(overhead, 0.0)
+        with self._stats_lock:
+            self._calls += 1
+            self._overhead_total += overhead
+            self._overhead_max = max(self._overhead_max, overhead)
+        logger.debug("Appel IPC %s : surcoût %.2f ms.", op, overhead * 1000)
+
+    def ipc_stats(self):
+        """Surcoût IPC cumulé : nombre d'appels, moyenne et max (ms), relances."""
+        with self._stats_lock:
+            mean = self._overhead_total / self._calls if self._calls else 0.0
+            return {
+                'calls': self._calls,
+                'mean_overhead_ms': mean * 1000,
+                'max_overhead_ms': self._overhead_max * 1000,
+                'restarts': self.restarts,
+            }
+
+    # ------------------------------------------------------------------
+    # Interface de Printer
+    # ------------------------------------------------------------------
+    def print(self, data):
+        return self._call('print', data)
+
+    def health(self):
+        result = self._call('health')
+        if 'printer_ok' not in result:
+            # Enfant indisponible : résultat d'erreur de _call.
+            return {'printer_ok': False, 'paper': None}
+        return result
+
+    def reconnect(self):
+        result = self._call('reconnect')
+        if 'printer_ok' not in result:
+            return {'printer_ok': False, 'paper': None}
+        return result
+
+    def update_token(self, new_token):
+        # Conservé côté parent : un enfant relancé repart avec le bon token.
+        self.app_token = new_token
+        self._call('update_token', new_token)
+
+    def cleanup(self):
+        """Arrête le processus enfant (fermeture propre de l'USB côté enfant)."""
+        self._closing.set()
+        process = self._process
+        if process is not None and process.is_alive():
+            try:
+                with self._send_lock:
+                    self._conn.send(('stop', None, ()))
+            except (OSError, ValueError):
+                pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=2)
+        stats = self.ipc_stats()
+        logger.info("Processus imprimante arrêté (%d appels, surcoût IPC moyen "
+                    "%.2f ms, max %.2f ms, %d relance(s)).", stats['calls'],
+                    stats['mean_overhead_ms'], stats['max_overhead_ms'],
+                    stats['restarts'])
+        self._supervisor.join(timeout=2)
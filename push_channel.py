@@ -0,0 +1,411 @@
+# push_channel.py
+"""Canal de commandes persistant du serveur vers la borne (WebSocket).
+
+Jusqu'ici la borne ne faisait que sonder et poster : le serveur n'avait aucun
+moyen de la joindre. :class:`PushChannel` maintient UNE connexion WebSocket
+(RFC 6455, client minimal sans dépendance) authentifiée par le token
+d'application (en-tête ``X-App-Token``), portée par la boucle réseau de la
+borne (cf. network_core) :
+
+- descendant : le serveur pousse des commandes numérotées
+  ``{'type': 'command', 'seq', 'command', 'args'}`` (réimpression,
+  rechargement de la page, reconnexion de l'imprimante, changement de
+  configuration), exécutées par ``on_command(command, args)`` hors de la
+  boucle ; le résultat est renvoyé ``{'type': 'command_result', 'seq',
+  'result'}`` ;
+- montant : :meth:`PushChannel.request` envoie un message portant un ``id``
+  et attend la réponse du serveur de même ``id`` (statuts imprimante, cf.
+  ``printer.StatusUploader`` : un statut ne coûte plus une requête HTTP) ;
+- pulsation : un ping toutes les ``ping_interval`` secondes ; sans aucune
+  trame reçue pendant ``ping_interval + PUSH_PONG_TIMEOUT`` secondes, la
+  connexion est considérée morte ;
+- reprise automatique : reconnexion avec backoff exponentiel borné, en
+  indiquant le dernier numéro de commande reçu (``last_seq``) pour que le
+  serveur renvoie les commandes manquées. Une commande déjà reçue n'est pas
+  rejouée. Le serveur identifie sa session (en-tête ``X-Push-Session`` de
+  la poignée de main) : après son redémarrage, la session change et la
+  numérotation repart de zéro au lieu d'ignorer toutes les commandes.
+
+Un serveur qui ne connaît pas la route (404/405/501) désactive le canal :
+les statuts repartent alors par HTTP, comme si le canal était coupé.
+"""
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import ssl
+import struct
+import threading
+from urllib.parse import urlencode, urlsplit
+
+from circuit_breaker import parse_retry_after
+from network_core import TokenError
+from printer import NETWORK_TIMEOUT
+
+logger = logging.getLogger("borne.push")
+
+PUSH_PATH = '/api/kiosk/push'
+# Pulsation : ping toutes les N secondes, connexion déclarée morte sans trame
+# reçue pendant N + PUSH_PONG_TIMEOUT secondes.
+PUSH_PING_INTERVAL = 25
+PUSH_PONG_TIMEOUT = 10
+# Reconnexion : backoff exponentiel borné (secondes).
+PUSH_BACKOFF_START = 1
+PUSH_BACKOFF_MAX = 60
+# Délai d'attente de la réponse à une requête montante (secondes).
+PUSH_REQUEST_TIMEOUT = 10
+# Taille max d'un message reçu (garde-fou mémoire).
+MAX_MESSAGE_BYTES = 1 << 20
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class PushProtocolError(Exception):
+    """Échange WebSocket non conforme (poignée de main, trame)."""
+
+
+class PushUnavailable(Exception):
+    """Poignée de main refusée par le serveur (code HTTP, Retry-After)."""
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def accept_key(key):
+    """Valeur attendue de ``Sec-WebSocket-Accept`` pour ``key``."""
+    digest = hashlib.sha1((key + _WS_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def encode_frame(opcode, payload, mask=True):
+    """Trame finale ``opcode`` ; masquée (obligatoire côté client) si ``mask``."""
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', length)
+    if not mask:
+        return bytes(header) + payload
+    key = os.urandom(4)
+    masked = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return bytes(header) + key + masked
+
+
+async def read_frame(reader):
+    """Lit une trame : ``(fin, opcode, payload)``."""
+    first, second = await reader.readexactly(2)
+    fin, opcode = bool(first & 0x80), first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > MAX_MESSAGE_BYTES:
+        raise PushProtocolError(f"trame trop grande ({length} octets)")
+    key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if key:
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return fin, opcode, payload
+
+
+class PushChannel:
+    """Connexion WebSocket persistante au serveur, portée par la boucle
+    réseau ``core`` (``network_core.NetworkCore``).
+
+    ``on_command(command, args)`` (bloquant, hors de la boucle) renvoie le
+    résultat de la commande (dict au format ``{'success', 'code',
+    'message'}``)."""
+
+    def __init__(self, core, borne_id, on_command, ping_interval=PUSH_PING_INTERVAL,
+                 path=PUSH_PATH):
+        self._core = core
+        self._borne_id = borne_id
+        self._on_command = on_command
+        self._ping_interval = ping_interval
+        parts = urlsplit(core.base_url)
+        self._secure = parts.scheme == 'https'
+        self._host = parts.hostname
+        self._port = parts.port or (443 if self._secure else 80)
+        self._path = parts.path.rstrip('/') + path
+        self._writer = None
+        self._send_lock = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._connected = threading.Event()
+        self._future = None
+        # Dernier numéro de commande reçu : transmis à la reconnexion. Il
+        # n'a de sens que dans la session du serveur qui l'a attribué.
+        self.last_seq = 0
+        self.server_session = None
+        # Faux si le serveur ne gère pas le canal.
+        self.enabled = True
+        # Compteurs (diagnostic, joints aux métriques de pulsation).
+        self.connects = 0
+        self.commands = 0
+        self.requests = 0
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def start(self):
+        self._future = self._core.submit(self._run())
+
+    def stats(self):
+        return {'enabled': self.enabled, 'connected': self.connected,
+                'connects': self.connects, 'commands': self.commands,
+                'requests': self.requests, 'last_seq': self.last_seq,
+                'server_session': self.server_session}
+
+    # ------------------------------------------------------------------
+    # Requêtes montantes (n'importe quel thread sauf celui de la boucle)
+    # ------------------------------------------------------------------
+    def request(self, message, timeout=PUSH_REQUEST_TIMEOUT):
+        """Envoie ``message`` (dict) et renvoie la réponse du serveur (dict),
+        ou None si le canal n'est pas connecté ou ne répond pas à temps :
+        l'appelant se replie alors sur HTTP."""
+        if not self.connected or self._core.loop is None:
+            return None
+        future = asyncio.run_coroutine_threadsafe(self._request(message, timeout),
+                                                  self._core.loop)
+        try:
+            return future.result(timeout + 1)
+        except Exception as e:
+            logger.debug("Requête sur le canal sans réponse : %s", e)
+            future.cancel()
+            return None
+
+    async def _request(self, message, timeout):
+        request_id = next(self._ids)
+        reply = self._core.loop.create_future()
+        self._pending[request_id] = reply
+        try:
+            await self._send(dict(message, id=request_id))
+            self.requests += 1
+            return await asyncio.wait_for(reply, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    # ------------------------------------------------------------------
+    # Connexion (boucle réseau)
+    # ------------------------------------------------------------------
+    async def _run(self):
+        backoff = PUSH_BACKOFF_START
+        token_retries = 0
+        while True:
+            delay = None
+            try:
+                reader, writer = await self._connect()
+            except PushUnavailable as e:
+                if e.status in (404, 405, 501):
+                    self.enabled = False
+                    logger.info("Canal de commandes non pris en charge par le serveur : "
+                                "désactivé.")
+                    return
+                if e.status == 401 and token_retries < 1:
+                    token_retries += 1
+                    self._core.note_unauthorized()
+                    try:
+                        await self._core.get_app_token(force=True)
+                        continue
+                    except TokenError:
+                        pass
+                logger.warning("Canal de commandes refusé (HTTP %s).", e.status)
+                delay = e.retry_after
+            except (OSError, asyncio.TimeoutError, PushProtocolError,
+                    asyncio.IncompleteReadError) as e:
+                logger.warning("Canal de commandes injoignable : %s", e)
+            else:
+                token_retries = 0
+                backoff = PUSH_BACKOFF_START
+                await self._session(reader, writer)
+            delay = max(delay or 0, min(backoff, PUSH_BACKOFF_MAX))
+            delay += random.uniform(0, delay * 0.5)  # jitter
+            logger.info("Reconnexion du canal de commandes dans %.0fs.", delay)
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, PUSH_BACKOFF_MAX)
+
+    async def _connect(self):
+        """Ouvre la connexion et effectue la poignée de main WebSocket."""
+        context = ssl.create_default_context() if self._secure else None
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self._host, self._port, ssl=context),
+            NETWORK_TIMEOUT[0])
+        try:
+            key = base64.b64encode(os.urandom(16)).decode('ascii')
+            query = urlencode({'borne_id': self._borne_id, 'last_seq': self.last_seq})
+            host = self._host if self._port in (80, 443) else f'{self._host}:{self._port}'
+            request = (f'GET {self._path}?{query} HTTP/1.1\r\n'
+                       f'Host: {host}\r\n'
+                       'Upgrade: websocket\r\n'
+                       'Connection: Upgrade\r\n'
+                       f'Sec-WebSocket-Key: {key}\r\n'
+                       'Sec-WebSocket-Version: 13\r\n'
+                       f'X-App-Token: {self._core.app_token or ""}\r\n'
+                       '\r\n')
+            writer.write(request.encode('latin-1'))
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), NETWORK_TIMEOUT[1])
+            status, headers = _parse_response_head(head)
+            if status != 101:
+                raise PushUnavailable(status, parse_retry_after(headers.get('retry-after')))
+            if headers.get('sec-websocket-accept') != accept_key(key):
+                raise PushProtocolError("clé Sec-WebSocket-Accept invalide")
+            self._note_server_session(headers.get('x-push-session'))
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    def _note_server_session(self, session):
+        """Session du serveur annoncée à la poignée de main : si elle change
+        (serveur redémarré), sa numérotation des commandes repart de zéro."""
+        if not session:
+            return
+        if self.server_session is not None and session != self.server_session:
+            logger.info("Nouvelle session du serveur : numérotation des commandes "
+                        "reprise à zéro (dernière reçue : %d).", self.last_seq)
+            self.last_seq = 0
+        self.server_session = session
+
+    async def _session(self, reader, writer):
+        self._writer = writer
+        self._send_lock = asyncio.Lock()
+        self._connected.set()
+        self.connects += 1
+        logger.info("Canal de commandes connecté (reprise après la commande %d).",
+                    self.last_seq)
+        pinger = self._core.spawn(self._ping_loop(), "push-ping")
+        try:
+            await self._read_loop(reader)
+        except (OSError, asyncio.TimeoutError, PushProtocolError,
+                asyncio.IncompleteReadError) as e:
+            logger.warning("Canal de commandes interrompu : %s", e)
+        finally:
+            self._connected.clear()
+            pinger.cancel()
+            self._writer = None
+            for reply in self._pending.values():
+                if not reply.done():
+                    reply.set_exception(ConnectionError("canal de commandes interrompu"))
+            writer.close()
+
+    async def _ping_loop(self):
+        # Un ping impossible à écrire n'arrête que la pulsation : la lecture
+        # détecte la connexion morte (délai sans trame).
+        while True:
+            await asyncio.sleep(self._ping_interval)
+            try:
+                await self._send_frame(OP_PING, b'')
+            except OSError:
+                return
+
+    async def _read_loop(self, reader):
+        fragments = []
+        message_opcode = None
+        while True:
+            fin, opcode, payload = await asyncio.wait_for(
+                read_frame(reader), self._ping_interval + PUSH_PONG_TIMEOUT)
+            if opcode == OP_PING:
+                await self._send_frame(OP_PONG, payload)
+            elif opcode == OP_PONG:
+                pass
+            elif opcode == OP_CLOSE:
+                logger.info("Canal de commandes fermé par le serveur.")
+                try:
+                    await self._send_frame(OP_CLOSE, payload[:2])
+                except OSError:
+                    pass
+                return
+            elif opcode in (OP_TEXT, OP_BINARY, OP_CONTINUATION):
+                if opcode != OP_CONTINUATION:
+                    message_opcode = opcode
+                    fragments = []
+                fragments.append(payload)
+                if sum(map(len, fragments)) > MAX_MESSAGE_BYTES:
+                    raise PushProtocolError("message trop grand")
+                if fin and message_opcode == OP_TEXT:
+                    self._dispatch(b''.join(fragments))
+            else:
+                raise PushProtocolError(f"opcode inconnu {opcode}")
+
+    def _dispatch(self, raw):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            logger.warning("Message illisible sur le canal de commandes.")
+            return
+        if not isinstance(message, dict):
+            return
+        if message.get('type') == 'command':
+            seq = message.get('seq')
+            if not isinstance(seq, int) or seq <= self.last_seq:
+                return  # déjà reçue (reprise)
+            self.last_seq = seq
+            self._core.spawn(self._run_command(seq, message.get('command'),
+                                               message.get('args') or {}), "push-command")
+            return
+        reply = self._pending.get(message.get('id'))
+        if reply is not None and not reply.done():
+            reply.set_result(message)
+
+    async def _run_command(self, seq, command, args):
+        self.commands += 1
+        logger.info("Commande du serveur n°%d : %s.", seq, command)
+        try:
+            result = await self._core.loop.run_in_executor(None, self._on_command,
+                                                           command, args)
+        except Exception as e:
+            logger.error("Commande %s en échec : %s", command, e)
+            result = {'success': False, 'code': 'error_exception',
+                      'message': f"Erreur d'exécution de la commande : {e}"}
+        try:
+            await self._send({'type': 'command_result', 'seq': seq, 'result': result})
+        except (OSError, ConnectionError):
+            pass
+
+    async def _send(self, message):
+        raw = json.dumps(message, separators=(',', ':'), ensure_ascii=False)
+        await self._send_frame(OP_TEXT, raw.encode('utf-8'))
+
+    async def _send_frame(self, opcode, payload):
+        writer = self._writer
+        if writer is None:
+            raise ConnectionError("canal de commandes déconnecté")
+        async with self._send_lock:
+            writer.write(encode_frame(opcode, payload))
+            await writer.drain()
+
+
+def _parse_response_head(head):
+    """Code et en-têtes (noms en minuscules) d'une réponse HTTP/1.1."""
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        status = int(lines[0].split(' ', 2)[1])
+    except (IndexError, ValueError):
+        raise PushProtocolError(f"réponse invalide : {lines[0]!r}") from None
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return status, headers
@@ -0,0 +1,275 @@
+# renderer_watch.py
+"""Surveillance du moteur de rendu de la fenêtre kiosque.
+
+La borne tourne jour et nuit : au fil des jours, la mémoire des processus
+de rendu Qt WebEngine grossit et la page finit parfois par se figer ; seul
+un redémarrage manuel de la borne en venait à bout.
+:class:`RendererSupervisor` vérifie périodiquement (ordonnanceur unique,
+cf. scheduler) :
+
+- la mémoire des processus de rendu (:class:`ProcessSampler`, lue dans
+  ``/proc`` sous Linux) : au-delà de ``memory_limit_mb``, /patient est
+  rechargée ;
+- la réactivité de la page : un court script (pulsation) est exécuté par
+  ``evaluate_js`` ; sans réponse après ``heartbeat_timeout`` secondes, la
+  page est considérée figée et rechargée ;
+- la fenêtre de recyclage (``quiet_window``, ex. « 03:00-04:00 ») : la page
+  y est rechargée une fois par jour, même en bonne santé.
+
+Un rechargement n'a JAMAIS lieu pendant une impression, ni pendant une
+inscription : la pulsation renvoie le temps écoulé depuis le dernier contact
+(cf. kiosk_bundle) et le drapeau ``window.kioskBusy`` que la page peut
+poser. Le rechargement est alors reporté à la vérification suivante.
+
+:class:`ProcessSampler` sert aussi à mesurer la consommation processeur de
+la borne (cf. idle_mode).
+"""
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from scheduler import get_scheduler
+
+logger = logging.getLogger("borne.renderer")
+
+# Nom (tronqué à 15 caractères par le noyau) des processus de rendu Qt WebEngine.
+RENDERER_PROCESS_NAME = "QtWebEngineProc"
+# Inscription considérée en cours si la page a été touchée il y a moins de
+# N secondes.
+REGISTRATION_GRACE = 90
+
+# Pulsation : renvoie l'inactivité de la page (ms) et son drapeau « occupée ».
+HEARTBEAT_SCRIPT = ("({idle_ms: Date.now() - (window.__kioskLastInput || 0), "
+                    "busy: !!window.kioskBusy})")
+
+_WINDOW_RE = re.compile(r'^(\d{2}):(\d{2})-(\d{2}):(\d{2})$')
+
+
+def parse_quiet_window(value):
+    """« HH:MM-HH:MM » -> ``(début, fin)`` en minutes depuis minuit (la
+    fenêtre peut passer minuit) ; ``''`` -> None. Lève ValueError si le
+    format est invalide."""
+    if not value:
+        return None
+    match = _WINDOW_RE.match(value)
+    if not match:
+        raise ValueError(f"format attendu HH:MM-HH:MM : {value!r}")
+    h1, m1, h2, m2 = (int(group) for group in match.groups())
+    if h1 > 23 or h2 > 23 or m1 > 59 or m2 > 59 or (h1, m1) == (h2, m2):
+        raise ValueError(f"heures invalides : {value!r}")
+    return h1 * 60 + m1, h2 * 60 + m2
+
+
+class ProcessSampler:
+    """Processus de la borne et ses descendants (processus de rendu, GPU...)
+    lus dans ``/proc`` (Linux ; ailleurs, :meth:`sample` renvoie des
+    valeurs None)."""
+
+    def __init__(self, root_pid=None, proc='/proc'):
+        self._root = root_pid or os.getpid()
+        self._proc = Path(proc)
+        self._tick = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def _stats(self):
+        """``{pid: (ppid, nom, secondes CPU, pages résidentes)}``."""
+        processes = {}
+        for entry in self._proc.iterdir():
+            if not entry.name.isdigit():
+                continue
+            try:
+                stat = (entry / 'stat').read_text()
+                statm = (entry / 'statm').read_text().split()
+            except OSError:
+                continue  # processus terminé entre-temps
+            # Le nom (entre parenthèses) peut contenir des espaces.
+            name = stat[stat.index('(') + 1:stat.rindex(')')]
+            fields = stat[stat.rindex(')') + 2:].split()
+            processes[int(entry.name)] = (int(fields[1]), name,
+                                          (int(fields[11]) + int(fields[12])) / self._tick,
+                                          int(statm[1]))
+        return processes
+
+    def sample(self):
+        """``{'renderer_rss_mb', 'renderers', 'cpu_seconds'}`` : mémoire
+        résidente des processus de rendu, leur nombre, et temps CPU cumulé
+        de la borne et de ses descendants."""
+        try:
+            processes = self._stats()
+        except OSError:
+            return {'renderer_rss_mb': None, 'renderers': 0, 'cpu_seconds': None}
+        children = {}
+        for pid, (ppid, _, _, _) in processes.items():
+            children.setdefault(ppid, []).append(pid)
+        family, stack = [], [self._root]
+        while stack:
+            pid = stack.pop()
+            if pid in processes:
+                family.append(pid)
+            stack.extend(children.get(pid, ()))
+        renderers = [pid for pid in family
+                     if processes[pid][1].startswith(RENDERER_PROCESS_NAME)]
+        rss = sum(processes[pid][3] for pid in renderers) * self._page_size
+        return {'renderer_rss_mb': round(rss / (1024 * 1024), 1) if renderers else None,
+                'renderers': len(renderers),
+                'cpu_seconds': round(sum(processes[pid][2] for pid in family), 2)
+                if family else None}
+
+
+class RendererSupervisor:
+    """``evaluate(script)`` exécute la pulsation dans la page (bloquant) ;
+    ``reload()`` recharge /patient ; ``is_printing()`` indique une impression
+    en cours ; ``active()`` : la page du serveur est affichée (sinon rien
+    n'est surveillé)."""
+
+    def __init__(self, evaluate, reload, is_printing, active, sampler=None,
+                 memory_limit_mb=0, heartbeat_interval=60, heartbeat_timeout=20,
+                 quiet_window='', scheduler=None, clock=time.monotonic, now=datetime.now):
+        self._evaluate = evaluate
+        self._reload = reload
+        self._is_printing = is_printing
+        self._active = active
+        self._sampler = sampler or ProcessSampler()
+        self._memory_limit_mb = memory_limit_mb
+        self._interval = heartbeat_interval
+        self._timeout = heartbeat_timeout
+        self._quiet_window = parse_quiet_window(quiet_window)
+        self._scheduler = scheduler or get_scheduler()
+        self._clock = clock
+        self._now = now
+        self._lock = threading.Lock()
+        self._timer = None
+        self._heartbeat = None
+        self._generation = 0
+        self._pending_since = None
+        self._recycled_on = None
+        self._stats = {'reloads': {'memory': 0, 'heartbeat_timeout': 0, 'quiet_window': 0},
+                       'deferred': 0, 'renderer_rss_mb': None, 'heartbeat_ms': None}
+
+    def start(self):
+        if self._timer is None:
+            self._timer = self._scheduler.call_every(self._interval, self._tick)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['reloads'] = dict(self._stats['reloads'])
+        return stats
+
+    def _tick(self):
+        if not self._active():
+            with self._lock:
+                self._generation += 1
+                self._pending_since = None
+            return
+        with self._lock:
+            pending = self._pending_since
+        if pending is not None:
+            if self._clock() - pending < self._timeout:
+                return
+            # Page figée : son état d'inscription est inconnu (et sans objet).
+            if self._is_printing():
+                self._defer('heartbeat_timeout', "impression en cours")
+            else:
+                self._recycle('heartbeat_timeout')
+            return
+        # La décision est prise à la réponse de la pulsation : l'état
+        # d'inscription de la page est alors à jour.
+        self._start_heartbeat(self._check_memory() or self._check_quiet_window())
+
+    def _start_heartbeat(self, reason):
+        # Une page figée bloque evaluate_js : on n'empile pas un thread de
+        # pulsation par intervalle derrière celui qui attend encore.
+        if self._heartbeat is not None and self._heartbeat.is_alive():
+            logger.warning("Pulsation précédente toujours sans réponse : "
+                           "nouvelle pulsation ignorée.")
+            return
+        with self._lock:
+            generation = self._generation
+            started = self._pending_since = self._clock()
+
+        def _run():
+            try:
+                reply = self._evaluate(HEARTBEAT_SCRIPT)
+            except Exception as e:
+                logger.debug("Pulsation de la page en échec : %s", e)
+                reply = None
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._stats['heartbeat_ms'] = round((self._clock() - started) * 1000, 1)
+            if reason is not None:
+                self._decide(reason, reply if isinstance(reply, dict) else {})
+            with self._lock:
+                if generation == self._generation:
+                    self._pending_since = None
+
+        self._heartbeat = threading.Thread(target=_run, name="borne-renderer-heartbeat",
+                                           daemon=True)
+        self._heartbeat.start()
+
+    def _decide(self, reason, reply):
+        if self._is_printing():
+            self._defer(reason, "impression en cours")
+        elif reply.get('busy') or reply.get('idle_ms', REGISTRATION_GRACE * 1000) < REGISTRATION_GRACE * 1000:
+            self._defer(reason, "inscription en cours")
+        else:
+            self._recycle(reason)
+
+    def _check_memory(self):
+        rss = self._sampler.sample()['renderer_rss_mb']
+        with self._lock:
+            self._stats['renderer_rss_mb'] = rss
+        if self._memory_limit_mb and rss is not None and rss > self._memory_limit_mb:
+            return 'memory'
+        return None
+
+    def _window_day(self):
+        """Jour de la fenêtre de recyclage en cours (une fenêtre qui passe
+        minuit appartient au jour où elle commence), ou None hors fenêtre."""
+        if self._quiet_window is None:
+            return None
+        now = self._now()
+        minutes = now.hour * 60 + now.minute
+        start, end = self._quiet_window
+        if start < end:
+            inside = start <= minutes < end
+        else:
+            inside = minutes >= start or minutes < end
+        if not inside:
+            return None
+        return now.date() if minutes >= start else now.date() - timedelta(days=1)
+
+    def _check_quiet_window(self):
+        day = self._window_day()
+        if day is None or self._recycled_on == day:
+            return None
+        return 'quiet_window'
+
+    def _defer(self, reason, why):
+        with self._lock:
+            self._stats['deferred'] += 1
+        logger.info("Rechargement de la page (%s) reporté : %s.", reason, why)
+
+    def _recycle(self, reason):
+        with self._lock:
+            self._generation += 1
+            self._pending_since = None
+            self._stats['reloads'][reason] += 1
+            rss = self._stats['renderer_rss_mb']
+        # Tout rechargement dans la fenêtre vaut recyclage du jour.
+        self._recycled_on = self._window_day() or self._recycled_on
+        logger.warning("Rechargement de /patient (%s, mémoire de rendu %s Mo).", reason, rss)
+        try:
+            self._reload()
+        except Exception as e:
+            logger.error("Rechargement de /patient impossible : %s", e)
@@ -0,0 +1,148 @@
+# scheduler.py
+"""Ordonnanceur de temporisations unique (un seul thread) pour les tâches
+périodiques de la borne.
+
+Sur une borne au repos, chaque boucle « attendre N secondes puis vérifier »
+réveille le processeur même quand il n'y a rien à faire ; sur un Raspberry Pi
+sans ventilateur, ces réveils se paient en consommation et en chauffe.
+:class:`TimerScheduler` regroupe les temporisations des threads de la borne
+(reconnexion de l'imprimante, santé des voisines, pulsation du moteur de
+rendu, repli du préchargement de page) dans un tas trié par échéance : son
+thread dort jusqu'à la PROCHAINE échéance (ou indéfiniment s'il n'y en a
+aucune) et ne se réveille que pour exécuter du travail. Les tâches
+périodiques de la boucle asyncio de network_core (sondage du serveur,
+pulsation du canal de commandes, renouvellement du token) restent des
+temporisations de cette boucle, qui dort de la même façon jusqu'à sa
+prochaine échéance.
+
+Les callbacks s'exécutent dans le thread de l'ordonnanceur : ils doivent
+rester courts (une opération USB, une requête bornée par un timeout).
+Le compteur :attr:`TimerScheduler.wakeups` permet de suivre le nombre de
+réveils (voir tests/test_scheduler.py).
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger("borne.scheduler")
+
+
+class Timer:
+    """Temporisation planifiée ; :meth:`cancel` l'annule."""
+
+    __slots__ = ('when', 'interval', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, interval, callback, args):
+        self.when = when
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        # Suppression paresseuse : l'entrée reste dans le tas et sera ignorée.
+        self.cancelled = True
+
+
+class TimerScheduler:
+    """Thread unique exécutant les temporisations, démarré au premier besoin."""
+
+    def __init__(self, name="borne-timers", clock=time.monotonic):
+        self._name = name
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._thread = None
+        self._stopped = False
+        # Nombre de sorties d'attente du thread (échéances + replanifications).
+        self.wakeups = 0
+
+    def call_later(self, delay, callback, *args):
+        """Exécute ``callback(*args)`` une fois, dans ``delay`` secondes."""
+        return self._schedule(Timer(self._clock() + delay, None, callback, args))
+
+    def call_every(self, interval, callback, *args, first_delay=None):
+        """Exécute ``callback(*args)`` toutes les ``interval`` secondes (premier
+        passage après ``first_delay``, par défaut ``interval``)."""
+        delay = interval if first_delay is None else first_delay
+        return self._schedule(Timer(self._clock() + delay, interval, callback, args))
+
+    def _schedule(self, timer):
+        with self._cond:
+            if self._stopped:
+                return timer
+            earliest = self._heap[0][0] if self._heap else None
+            heapq.heappush(self._heap, (timer.when, next(self._seq), timer))
+            self._ensure_started()
+            # On ne réveille le thread que si l'échéance la plus proche change.
+            if earliest is None or timer.when < earliest:
+                self._cond.notify()
+        return timer
+
+    def _ensure_started(self):
+        # is_alive() : après un fork, le thread du parent n'existe plus.
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self._name,
+                                            daemon=True)
+            self._thread.start()
+
+    def pending(self):
+        """Nombre de temporisations actives."""
+        with self._cond:
+            return sum(1 for _, _, t in self._heap if not t.cancelled)
+
+    def stop(self, timeout=2):
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                now = self._clock()
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, timer = heapq.heappop(self._heap)
+                    self._cond.release()
+                    try:
+                        self._fire(timer)
+                    finally:
+                        self._cond.acquire()
+                    if timer.interval is not None and not timer.cancelled and not self._stopped:
+                        # Cadence fixe ; les échéances manquées ne sont pas
+                        # rattrapées en rafale.
+                        timer.when = max(timer.when + timer.interval, self._clock())
+                        heapq.heappush(self._heap, (timer.when, next(self._seq), timer))
+                    continue
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+                self.wakeups += 1
+
+    @staticmethod
+    def _fire(timer):
+        try:
+            timer.callback(*timer.args)
+        except Exception:
+            logger.exception("Erreur dans une tâche planifiée (%s).",
+                             getattr(timer.callback, '__qualname__', timer.callback))
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Ordonnanceur partagé du processus (créé au premier appel)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = TimerScheduler()
+        return _default
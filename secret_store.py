@@ -15,10 +15,19 @@ indisponible ; l'appelant (``config.Config.save_settings``) décide alors selon
 mode : **refus** en production (exception), **avertissement + clair** en
 développement.
 
+Token d'application
+-------------------
+Le token courant et son échéance y sont aussi conservés
+(:func:`store_app_token`) : après un redémarrage, la borne le réutilise sans
+attendre le serveur (démarrage à chaud, cf. ``network_core``). Même politique :
+sans magasin sécurisé, il n'est tout simplement pas conservé.
+
 Aucune valeur secrète n'est jamais journalisée : seuls les noms de champ le sont.
 """
 
+import json
 import logging
+import time
 
 logger = logging.getLogger("borne.secret_store")
 
@@ -28,6 +37,9 @@ SERVICE_NAME = "GestionFile-Borne"
 # Champs de ``Settings`` traités comme secrets (jamais écrits en clair).
 SECRET_FIELDS = ("password", "app_secret")
 
+# Entrée du token d'application conservé (JSON : serveur, token, échéance).
+APP_TOKEN_ENTRY = "app_token"
+
 
 class SecretStoreUnavailableError(Exception):
     """Le magasin de secrets du système est indisponible et l'écriture en clair
@@ -106,3 +118,37 @@ def store_secrets(values) -> bool:
             if not set_secret(name, values[name]):
                 ok = False
     return ok
+
+
+def store_app_token(server, token, expires_at) -> bool:
+    """Conserve le token d'application de ``server`` et son échéance (epoch).
+    Jamais en clair : renvoie ``False`` sans rien écrire si le magasin sécurisé
+    est indisponible."""
+    if not available():
+        return False
+    return set_secret(APP_TOKEN_ENTRY, json.dumps(
+        {"server": server, "token": token, "expires_at": expires_at}))
+
+
+def load_app_token(server, now=time.time):
+    """Token conservé pour ``server`` : ``(token, secondes restantes)``, ou
+    ``None`` (absent, illisible, autre serveur ou expiré)."""
+    raw = get_secret(APP_TOKEN_ENTRY)
+    if not raw:
+        return None
+    try:
+        data = json.loads(raw)
+        token = data["token"]
+        remaining = float(data["expires_at"]) - now()
+        same_server = data["server"] == server
+    except (ValueError, TypeError, KeyError):
+        logger.warning("Token conservé illisible : ignoré.")
+        return None
+    if not same_server or not isinstance(token, str) or not token or remaining <= 0:
+        return None
+    return token, remaining
+
+
+def clear_app_token() -> bool:
+    """Efface le token conservé (refusé par le serveur)."""
+    return set_secret(APP_TOKEN_ENTRY, "")
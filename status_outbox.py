@@ -0,0 +1,107 @@
+# status_outbox.py
+"""Boîte d'envoi persistante des statuts imprimante (SQLite).
+
+``PrinterStatusThread`` ne conservait que le DERNIER statut : pendant une
+coupure réseau, toutes les transitions intermédiaires étaient perdues, et
+chaque statut coûtait une requête HTTP. Avec la boîte d'envoi :
+
+- chaque statut (transition ou pulsation) est d'abord écrit sur disque, dans
+  l'ordre, avec un numéro de séquence croissant ;
+- dès que le serveur est joignable, les statuts sont envoyés par lots
+  compressés (gzip) ; le serveur acquitte le dernier numéro reçu (curseur
+  ``ack``) et seuls les statuts acquittés sont supprimés ;
+- l'occupation disque est bornée : au-delà de ``MAX_OUTBOX_EVENTS`` statuts en
+  attente, les plus anciens sont abandonnés (et comptés).
+
+SQLite (bibliothèque standard) garantit l'atomicité des écritures même en cas
+de coupure de courant de la borne.
+"""
+import gzip
+import json
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger("borne.status")
+
+# Nombre max de statuts conservés en attente d'envoi (~quelques centaines de
+# Ko sur disque). Les transitions étant rares, cela couvre des jours de coupure.
+MAX_OUTBOX_EVENTS = 5000
+# Nombre max de statuts par lot envoyé.
+OUTBOX_BATCH_SIZE = 200
+
+OUTBOX_FILENAME = "status_outbox.sqlite3"
+
+
+def encode_batch(borne_id, events):
+    """Corps d'un lot : JSON ``{'borne_id', 'events': [{'seq', ...}]}``
+    compressé en gzip. ``events`` est une liste de ``(seq, statut)``."""
+    body = {
+        'borne_id': borne_id,
+        'events': [dict(item, seq=seq) for seq, item in events],
+    }
+    raw = json.dumps(body, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return gzip.compress(raw)
+
+
+class StatusOutbox:
+    """File de statuts persistante, sûre entre threads."""
+
+    def __init__(self, path, max_events=MAX_OUTBOX_EVENTS):
+        self.path = str(path)
+        self._max_events = max_events
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self._db = sqlite3.connect(self.path, check_same_thread=False,
+                                   isolation_level=None)
+        # auto_vacuum incrémental : l'espace libéré par les acquittements est
+        # rendu au système (doit précéder la création des tables).
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL)")
+
+    def append(self, item):
+        """Ajoute un statut ; renvoie son numéro de séquence."""
+        payload = json.dumps(item, separators=(',', ':'), ensure_ascii=False)
+        with self._lock:
+            cursor = self._db.execute("INSERT INTO outbox (payload) VALUES (?)",
+                                      (payload,))
+            seq = cursor.lastrowid
+            overflow = self._count() - self._max_events
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM outbox WHERE seq IN "
+                    "(SELECT seq FROM outbox ORDER BY seq LIMIT ?)", (overflow,))
+                self.dropped += overflow
+                logger.warning("Boîte d'envoi des statuts pleine : %d statut(s) "
+                               "le(s) plus ancien(s) abandonné(s).", overflow)
+            return seq
+
+    def _count(self):
+        return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def count(self):
+        with self._lock:
+            return self._count()
+
+    def pending(self, limit=OUTBOX_BATCH_SIZE):
+        """Les plus anciens statuts non acquittés : liste de ``(seq, statut)``."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, payload FROM outbox ORDER BY seq LIMIT ?",
+                (limit,)).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def ack(self, up_to_seq):
+        """Supprime les statuts acquittés (numéro <= ``up_to_seq``)."""
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE seq <= ?", (up_to_seq,))
+            self._db.execute("PRAGMA incremental_vacuum")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
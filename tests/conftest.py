@@ -0,0 +1,50 @@
+"""Fixtures partagées des tests de la boucle réseau (network_core).
+
+``core`` est un ``NetworkCore`` démarré pour le test puis arrêté. Le
+module de test fournit le serveur factice par la fixture ``core_session`` ;
+les tokens propagés sont relevés dans ``received_tokens``. Les autres
+arguments viennent de fixtures surchargeables, par module (``core_base_url``)
+ou par test (``pytest.mark.parametrize`` sur ``probe_interval`` ou
+``token_store``).
+"""
+import pytest
+
+from circuit_breaker import ServerGuard
+from network_core import NetworkCore
+
+
+@pytest.fixture
+def core_base_url():
+    return 'http://localhost'
+
+
+@pytest.fixture
+def guard():
+    return ServerGuard()
+
+
+@pytest.fixture
+def probe_interval():
+    """Sondages de joignabilité désactivés par défaut."""
+    return 0
+
+
+@pytest.fixture
+def token_store():
+    """Aucun token conservé entre deux exécutions."""
+    return None
+
+
+@pytest.fixture
+def received_tokens():
+    return []
+
+
+@pytest.fixture
+def core(core_base_url, core_session, guard, probe_interval, token_store, received_tokens):
+    core = NetworkCore(core_base_url, 'secret', session=core_session,
+                       on_token=received_tokens.append, guard=guard,
+                       probe_interval=probe_interval, token_store=token_store)
+    core.start()
+    yield core
+    core.stop()
@@ -0,0 +1,229 @@
+"""Tests du mandataire local avec cache disque (asset_proxy).
+
+Un petit serveur HTTP local tient lieu de serveur. Couvre :
+- ressource fraîche servie depuis le cache sans appel au serveur ;
+- ressource périmée servie aussitôt puis revalidée par requête
+  conditionnelle ;
+- page d'accueil servie depuis sa dernière version si le serveur ne répond
+  plus ;
+- cookies et redirections réécrits pour l'origine locale, POST relayés ;
+- taille du cache bornée.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from asset_proxy import AssetCache, AssetProxy
+from config import Settings
+
+
+class _Origin:
+    """Serveur factice ; ``hits`` : chemins demandés, ``failing`` : répond
+    503 à tout."""
+
+    def __init__(self):
+        self.hits = []
+        self.conditional = []
+        self.failing = False
+        self.posted = []
+        outer = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                outer.hits.append(self.path)
+                if outer.failing:
+                    return self._reply(503, b'', 'text/plain')
+                if self.path == '/patient':
+                    return self._reply(200, b'<html>accueil</html>', 'text/html')
+                if self.path.startswith('/static/app.js'):
+                    if self.headers.get('If-None-Match') == '"v1"':
+                        outer.conditional.append(self.path)
+                        return self._reply(304, None, None, [('ETag', '"v1"')])
+                    return self._reply(200, b'console.log(1)', 'application/javascript',
+                                       [('ETag', '"v1"'), ('Cache-Control', 'max-age=60')])
+                if self.path == '/private.css':
+                    return self._reply(200, b'body{}', 'text/css',
+                                       [('Cache-Control', 'no-store')])
+                if self.path == '/':
+                    return self._reply(302, b'', 'text/plain',
+                                       [('Location', f'http://127.0.0.1:{outer.port}/patient')])
+                self._reply(404, b'', 'text/plain')
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                outer.posted.append((self.path, body, self.headers.get('Cookie')))
+                self._reply(200, b'{}', 'application/json',
+                            [('Set-Cookie', 'session=abc; Domain=example.org; Secure; '
+                                            'HttpOnly; SameSite=None; Path=/')])
+
+            def _reply(self, status, body, content_type, headers=()):
+                self.send_response(status)
+                if content_type:
+                    self.send_header('Content-Type', content_type)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body or b'')))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.port = self._server.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def proxied(tmp_path):
+    origin = _Origin()
+    clock = _Clock()
+    proxy = AssetProxy(origin.url, tmp_path / 'cache', clock=clock)
+    proxy.start()
+    yield origin, proxy, clock
+    proxy.stop()
+    origin.close()
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_fresh_asset_served_from_cache(proxied):
+    origin, proxy, _ = proxied
+
+    first = requests.get(f'{proxy.url}/static/app.js')
+    second = requests.get(f'{proxy.url}/static/app.js')
+    assert first.content == second.content == b'console.log(1)'
+    assert second.headers['Content-Type'] == 'application/javascript'
+    assert origin.hits == ['/static/app.js']
+    assert proxy.stats()['hits'] == 1
+
+    # Le moteur web a déjà la bonne version : 304 sans corps.
+    revalidated = requests.get(f'{proxy.url}/static/app.js', headers={'If-None-Match': '"v1"'})
+    assert revalidated.status_code == 304
+
+    # no-store : jamais conservée.
+    requests.get(f'{proxy.url}/private.css')
+    requests.get(f'{proxy.url}/private.css')
+    assert origin.hits.count('/private.css') == 2
+
+
+def test_stale_asset_served_then_revalidated(proxied):
+    origin, proxy, clock = proxied
+    requests.get(f'{proxy.url}/static/app.js')
+
+    clock.now += 120
+    stale = requests.get(f'{proxy.url}/static/app.js')
+    assert stale.content == b'console.log(1)'
+    assert _wait(lambda: origin.conditional == ['/static/app.js'])
+    assert _wait(lambda: proxy.stats()['revalidated'] == 1)
+
+    # 304 : de nouveau fraîche.
+    requests.get(f'{proxy.url}/static/app.js')
+    assert origin.hits == ['/static/app.js'] * 2
+
+
+def test_shell_served_from_cache_when_server_fails(proxied):
+    origin, proxy, _ = proxied
+    assert requests.get(f'{proxy.url}/patient').content == b'<html>accueil</html>'
+
+    origin.failing = True
+    fallback = requests.get(f'{proxy.url}/patient')
+    assert fallback.status_code == 200
+    assert fallback.content == b'<html>accueil</html>'
+    assert proxy.stats()['shell_fallbacks'] == 1
+
+    origin.close()
+    assert requests.get(f'{proxy.url}/patient').content == b'<html>accueil</html>'
+
+
+def test_shell_without_copy_reports_bad_gateway(tmp_path):
+    proxy = AssetProxy('http://127.0.0.1:9', tmp_path / 'cache')
+    proxy.start()
+    try:
+        assert requests.get(f'{proxy.url}/patient').status_code == 502
+    finally:
+        proxy.stop()
+
+
+def test_cookies_and_redirects_rewritten(proxied):
+    origin, proxy, _ = proxied
+
+    redirect = requests.get(f'{proxy.url}/', allow_redirects=False)
+    assert redirect.headers['Location'] == f'{proxy.url}/patient'
+
+    response = requests.post(f'{proxy.url}/api/register', data=b'x=1',
+                             headers={'Cookie': 'session=old'})
+    assert origin.posted == [('/api/register', b'x=1', 'session=old')]
+    assert response.headers['Set-Cookie'] == 'session=abc; HttpOnly; SameSite=Lax; Path=/'
+    # Le mandataire ne garde aucun cookie pour lui.
+    assert not proxy.session.cookies
+
+
+def test_cache_size_bounded(tmp_path):
+    clock = _Clock()
+    cache = AssetCache(tmp_path, max_bytes=250, clock=clock)
+    for index in range(4):
+        cache.put(f'/a{index}', 200, {'content-type': 'text/css'}, b'x' * 100, 60)
+    assert cache.size() <= 250
+    assert cache.evicted == 2
+    assert cache.get('/a3')[1] == b'x' * 100
+    assert AssetCache(tmp_path, max_bytes=250).size() == cache.size()
+
+
+def test_cache_entry_replaced_as_a_pair(tmp_path):
+    clock = _Clock()
+    cache = AssetCache(tmp_path, clock=clock)
+    cache.put('/app.js', 200, {'etag': '"v1"'}, b'ancien', 60)
+    held_meta, _ = cache.get('/app.js')
+
+    cache.put('/app.js', 200, {'etag': '"v2"'}, b'nouveau corps', 60)
+    meta, body = cache.get('/app.js')
+    assert (meta['headers']['etag'], body) == ('"v2"', b'nouveau corps')
+    assert len(list(tmp_path.glob('*.body'))) == 1
+    # Un lecteur qui tenait les anciennes métadonnées ne lit pas le nouveau corps.
+    assert not (tmp_path / held_meta['body']).exists()
+
+    # Revalidation : métadonnées seules, corps intact.
+    body_file = tmp_path / meta['body']
+    stamp = body_file.stat().st_mtime_ns
+    clock.now += 120
+    cache.touch('/app.js', {'etag': '"v3"'}, 300)
+    meta, body = cache.get('/app.js')
+    assert meta['headers']['etag'] == '"v3"' and meta['max_age'] == 300
+    assert cache.is_fresh(meta) and body == b'nouveau corps'
+    assert body_file.stat().st_mtime_ns == stamp
+
+    # Arrêt brutal entre corps et métadonnées : entrée incohérente écartée.
+    body_file.unlink()
+    (tmp_path / 'orphelin.tmp').write_bytes(b'x')
+    reloaded = AssetCache(tmp_path)
+    assert reloaded.get('/app.js') is None and reloaded.size() == 0
+    assert not list(tmp_path.iterdir())
+
+
+def test_settings_validation():
+    assert not [e for e in Settings().validate() if 'asset_' in e]
+    errors = Settings(asset_proxy='oui', asset_cache_mb=1).validate()
+    assert len([e for e in errors if 'asset_' in e]) == 2
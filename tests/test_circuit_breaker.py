@@ -0,0 +1,177 @@
+"""Tests des disjoncteurs et du budget de réessais (circuit_breaker).
+
+Horloge simulée pour les transitions ; un serveur HTTP local pour
+l'intégration au client partagé. Couvre :
+- fermé -> ouvert après N échecs -> semi-ouvert (une requête d'essai) ;
+- Retry-After (secondes ou date HTTP) ouvrant aussitôt la route ;
+- budget de réessais commun ;
+- requêtes refusées localement par le client HTTP, sondages HEAD exemptés ;
+- erreur locale pendant l'essai semi-ouvert : essai libéré, route non bloquée ;
+- table des disjoncteurs bornée (les moins récemment utilisés oubliés).
+"""
+import email.utils
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    MAX_BREAKERS,
+    ServerGuard,
+    parse_retry_after,
+)
+from http_client import HttpClient
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold_then_half_opens():
+    clock = _Clock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.retry_in() == 30
+
+    clock.now = 30
+    assert breaker.allow()            # requête d'essai
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()        # une seule à la fois
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.opened == 2
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+
+def test_retry_after_opens_immediately():
+    clock = _Clock()
+    breaker = CircuitBreaker(clock=clock)
+
+    breaker.record_failure(retry_after=120)
+
+    assert breaker.state == OPEN
+    assert breaker.retry_in() == 120
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    date = email.utils.formatdate(1_000_090, usegmt=True)
+    assert parse_retry_after(date, now=lambda: 1_000_000) == 90
+    assert parse_retry_after('demain') is None
+    assert parse_retry_after(None) is None
+
+
+def test_retry_budget_is_shared_and_proportional():
+    clock = _Clock()
+    budget = RetryBudget(ratio=0.5, minimum=1, window=60, clock=clock)
+    for _ in range(4):
+        budget.note_request()
+
+    assert [budget.allow_retry() for _ in range(4)] == [True, True, True, False]
+    assert budget.snapshot()['denied'] == 1
+
+    clock.now = 61  # fenêtre écoulée
+    assert budget.allow_retry()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self):
+        self.server.hits.append(self.command)
+        self.send_response(503)
+        self.send_header('Retry-After', '300')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_POST = do_HEAD = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.hits = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_client_honours_retry_after_and_exempts_probes(server):
+    guard = ServerGuard()
+    client = HttpClient(guard=guard)
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+
+    assert client.session.post(f'{base}/api/printer/status', timeout=5).status_code == 503
+    with pytest.raises(CircuitOpenError) as excinfo:
+        client.session.post(f'{base}/api/printer/status', timeout=5)
+    # Vue des appelants : une erreur réseau ordinaire.
+    assert isinstance(excinfo.value, requests.exceptions.ConnectionError)
+    assert 290 < excinfo.value.retry_in <= 300
+
+    # Autre route : non affectée ; sondage HEAD : jamais bloqué.
+    client.session.post(f'{base}/api/get_app_token', timeout=5)
+    client.session.head(base, timeout=5)
+    client.session.head(base, timeout=5)
+    assert server.hits == ['POST', 'POST', 'HEAD', 'HEAD']
+
+    snapshot = guard.snapshot()
+    assert snapshot['breakers']['127.0.0.1/api/printer/status']['state'] == OPEN
+    assert snapshot['retry_budget']['requests'] == 2
+    client.close()
+
+
+def test_local_error_during_half_open_trial_releases_it(server, monkeypatch):
+    clock = _Clock()
+    guard = ServerGuard(clock=clock)
+    client = HttpClient(guard=guard)
+    url = f'http://127.0.0.1:{server.server_address[1]}/api/printer/status'
+    guard.breaker(url).record_failure(retry_after=30)
+    clock.now = 30
+
+    def broken_send(self, request, **kwargs):
+        raise ValueError("en-tête invalide")
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, 'send', broken_send)
+    with pytest.raises(ValueError):
+        client.session.post(url, timeout=5)
+    monkeypatch.undo()
+
+    # L'essai n'est pas resté pris : la requête suivante part.
+    assert guard.breaker(url).failures == 1
+    assert client.session.post(url, timeout=5).status_code == 503
+    assert server.hits == ['POST']
+    client.close()
+
+
+def test_breaker_table_is_bounded():
+    guard = ServerGuard()
+    token = guard.breaker('http://srv/api/get_app_token')
+    for n in range(MAX_BREAKERS * 3):
+        guard.breaker(f'http://srv/patient/{n}')
+        guard.breaker('http://srv/api/get_app_token')  # route active conservée
+    assert len(guard.snapshot()['breakers']) == MAX_BREAKERS
+    assert guard.breaker('http://srv/api/get_app_token') is token
@@ -105,3 +105,25 @@ def test_written_content_is_valid_and_complete(store):
     # Secrets jamais en clair (magasin disponible).
     assert data["password"] == ""
     assert data["app_secret"] == ""
+
+
+def test_remote_changes_limited_to_tunable_fields(store):
+    tmp_path = store["_path"]
+    cfg = Config()
+    cfg.save_settings(_new_settings())
+
+    assert cfg.apply_remote_changes({"check_paper": False, "http_warm_interval": 60}) == []
+    assert _read_json(tmp_path)["check_paper"] is False
+    assert cfg.settings.http_warm_interval == 60
+
+    assert cfg.apply_remote_changes({"base_url": "https://evil.example"})
+    for protected in ({"debug": True}, {"peers": ["10.0.0.9"]}, {"peer_port": 1},
+                      {"persist_app_token": False}, {"webengine_profile": "x86"},
+                      {"webengine_overrides": {"gpu": True}}):
+        assert cfg.apply_remote_changes(protected)
+    assert cfg.apply_remote_changes({"debug": True}) == [
+        "Réglage non modifiable à distance : debug."]
+    assert cfg.apply_remote_changes({"inconnu": 1})
+    assert cfg.apply_remote_changes({"http_warm_interval": -1})
+    assert cfg.settings.base_url == "http://127.0.0.1:5000"
+    assert _read_json(tmp_path)["http_warm_interval"] == 60
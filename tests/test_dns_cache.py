@@ -0,0 +1,178 @@
+"""Tests du cache DNS et de la connexion concurrente (dns_cache).
+
+Le résolveur est simulé (aucune requête DNS réelle), les connexions visent des
+sockets locaux. Couvre :
+- réponse servie depuis le cache pendant le TTL, nouvelle résolution ensuite ;
+- réponse expirée servie si le résolveur échoue ou reste bloqué ;
+- échec sans réponse en cache ;
+- une adresse qui ne répond pas n'empêche pas la connexion à la suivante ;
+- intégration au client HTTP partagé.
+"""
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import dns_cache
+from dns_cache import DnsCache, _interleave
+from http_client import HttpClient
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _info(port, host='127.0.0.1', family=socket.AF_INET):
+    return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (host, port))
+
+
+class _Resolver:
+    """Résolveur factice : une réponse de ``answers`` par appel, la dernière
+    étant répétée (une exception est levée, un appelable est appelé)."""
+
+    def __init__(self, *answers, ttl=None):
+        self.answers = list(answers)
+        self.ttl = ttl
+        self.calls = 0
+
+    def __call__(self, host, port):
+        self.calls += 1
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if isinstance(answer, BaseException):
+            raise answer
+        if callable(answer):
+            answer = answer()
+        return answer, self.ttl
+
+
+@pytest.fixture
+def listener():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+    yield server
+    server.close()
+
+
+def test_answer_cached_for_its_ttl():
+    clock = _Clock()
+    resolver = _Resolver([_info(80)], ttl=30)
+    cache = DnsCache(resolver, ttl=300, clock=clock)
+
+    assert cache.resolve('srv', 80, timeout=1) == [_info(80)]
+    assert cache.resolve('srv', 80, timeout=1) == [_info(80)]
+    assert resolver.calls == 1
+
+    clock.now = 31  # TTL du résolveur (et non le TTL par défaut)
+    cache.resolve('srv', 80, timeout=1)
+    assert resolver.calls == 2
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_stale_answer_served_when_resolver_fails():
+    clock = _Clock()
+    resolver = _Resolver([_info(80)], socket.gaierror("SERVFAIL"))
+    cache = DnsCache(resolver, ttl=10, clock=clock)
+    cache.resolve('srv', 80, timeout=1)
+
+    clock.now = 11
+    assert cache.resolve('srv', 80, timeout=1) == [_info(80)]
+    assert cache.stats()['stale'] == 1 and cache.stats()['failures'] == 1
+
+
+def test_stale_answer_served_when_resolver_hangs(monkeypatch):
+    monkeypatch.setattr(dns_cache, 'STALE_GRACE', 0.1)
+    clock = _Clock()
+    release = threading.Event()
+    resolver = _Resolver([_info(80)], lambda: release.wait(5) and [_info(81)])
+    cache = DnsCache(resolver, ttl=10, clock=clock)
+    cache.resolve('srv', 80, timeout=1)
+
+    clock.now = 11
+    started = time.monotonic()
+    assert cache.resolve('srv', 80, timeout=5) == [_info(80)]
+    assert time.monotonic() - started < 1
+
+    # La résolution lente met le cache à jour quand elle aboutit.
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache.resolve('srv', 80, timeout=1) != [_info(81)] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.resolve('srv', 80, timeout=1) == [_info(81)]
+
+
+def test_failure_without_cached_answer_raises():
+    cache = DnsCache(_Resolver(socket.gaierror("NXDOMAIN")))
+
+    with pytest.raises(socket.gaierror):
+        cache.resolve('srv', 80, timeout=1)
+
+
+def test_families_are_interleaved():
+    v6 = [_info(1, '::1', socket.AF_INET6), _info(2, '::1', socket.AF_INET6)]
+    v4 = [_info(3), _info(4)]
+
+    assert _interleave(v6 + v4) == [v6[0], v4[0], v6[1], v4[1]]
+
+
+def test_unresponsive_address_does_not_block_connection(listener):
+    # File d'attente pleine : les connexions suivantes restent sans réponse.
+    blackhole = socket.socket()
+    blackhole.bind(('127.0.0.1', 0))
+    blackhole.listen(0)
+    filler = socket.create_connection(blackhole.getsockname())
+    port = listener.getsockname()[1]
+    cache = DnsCache(_Resolver([_info(blackhole.getsockname()[1]), _info(port)]),
+                     attempt_delay=0.05)
+    try:
+        started = time.monotonic()
+        sock = cache.connect('srv', 80, timeout=5)
+        elapsed = time.monotonic() - started
+        assert sock.getpeername()[1] == port
+        assert sock.gettimeout() == 5
+        assert elapsed < 1
+        assert cache.stats()['won_by'] == {'ipv4': 1}
+        sock.close()
+    finally:
+        filler.close()
+        blackhole.close()
+
+
+def test_refused_addresses_fail_over_then_raise(listener):
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    closed_port = closed.getsockname()[1]
+    closed.close()
+    port = listener.getsockname()[1]
+
+    sock = DnsCache(_Resolver([_info(closed_port), _info(port)])).connect('srv', 80, 2)
+    assert sock.getpeername()[1] == port
+    sock.close()
+
+    with pytest.raises(ConnectionRefusedError):
+        DnsCache(_Resolver([_info(closed_port)])).connect('srv', 80, 2)
+
+
+def test_http_client_uses_the_cache():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), BaseHTTPRequestHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    resolver = _Resolver([_info(port)])
+    client = HttpClient(keepalive=0, dns=DnsCache(resolver))
+    try:
+        for _ in range(2):
+            # Méthode non gérée par le serveur de test : 501, connexion fermée.
+            response = client.session.head(f'http://kiosk-server:{port}/', timeout=(1, 1))
+            assert response.status_code == 501
+        assert resolver.calls == 1
+        assert client.stats()['dns']['hits'] == 1
+    finally:
+        client.close()
+        httpd.shutdown()
+        httpd.server_close()
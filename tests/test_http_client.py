@@ -0,0 +1,102 @@
+"""Tests du client HTTP partagé (http_client).
+
+Un petit serveur HTTP local (thread) sert de cible. Couvre :
+- réutilisation d'une seule connexion keep-alive pour des requêtes successives,
+  mesurée par la métrique ``connections_opened``, et durée de la poignée de
+  main ;
+- taille de pool respectée pour des requêtes simultanées ;
+- réessai d'une connexion refusée, jamais d'une réponse d'erreur ;
+- validation des réglages ``http_*``.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from config import Settings
+from http_client import HttpClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.server.posts += 1
+        status = 503 if self.path == '/down' else 200
+        body = b'{}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.posts = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path='/api/printer/status'):
+    return f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+
+def test_sequential_requests_reuse_one_connection(server):
+    client = HttpClient()
+    for _ in range(5):
+        assert client.session.post(_url(server), json={'a': 1}, timeout=5).status_code == 200
+
+    assert client.stats()['connections_opened'] == 1
+    assert client.stats()['by_host'] == {'127.0.0.1': 1}
+    stats = client.stats()
+    assert stats['handshakes'] == 1
+    assert stats['last_handshake']['host'] == '127.0.0.1'
+    assert stats['last_handshake']['tcp_ms'] >= 0 and stats['last_handshake']['tls_ms'] >= 0
+    client.close()
+
+
+def test_concurrent_requests_stay_within_pool(server):
+    client = HttpClient(pool_size=2)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        for _ in range(3):
+            list(pool.map(lambda _: client.session.post(_url(server), timeout=5), range(6)))
+
+    # Au-delà du pool, des connexions supplémentaires sont ouvertes puis
+    # fermées ; la plupart des requêtes réutilisent les connexions du pool.
+    assert client.stats()['connections_opened'] < 18
+    client.close()
+
+
+def test_refused_connection_is_retried_but_error_response_is_not(server):
+    client = HttpClient(retries=2, keepalive=0)
+    # Port fermé : connexion refusée, réessayée puis abandonnée.
+    closed = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    port = closed.server_address[1]
+    closed.server_close()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.session.post(f'http://127.0.0.1:{port}/x', timeout=2)
+    assert client.stats()['connections_opened'] == 3
+
+    assert client.session.post(_url(server, '/down'), timeout=5).status_code == 503
+    assert server.posts == 1
+    client.close()
+
+
+def test_settings_http_validation():
+    assert not [e for e in Settings().validate() if 'http_' in e]
+    assert len([e for e in Settings(http_pool_size=0, http_retries=-1,
+                                    http_keepalive="60",
+                                    http_warm_interval=-5).validate() if 'http_' in e]) == 4
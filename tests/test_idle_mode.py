@@ -0,0 +1,74 @@
+"""Tests de la mesure du mode veille (idle_mode).
+
+Un faux échantillonneur, une fausse horloge et un faux compteur RAPL
+remplacent la borne. Couvre :
+- charge processeur et puissance par état, gain de la veille ;
+- sans compteur d'énergie : puissances absentes ;
+- passages répétés dans le même état ignorés ;
+- validation des réglages.
+"""
+from config import Settings
+from idle_mode import IdleMeter
+
+
+class _Sampler:
+    def __init__(self):
+        self.cpu = 0.0
+
+    def sample(self):
+        return {'renderer_rss_mb': 100.0, 'renderers': 1, 'cpu_seconds': self.cpu}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cpu_and_power_saved(tmp_path):
+    energy = tmp_path / 'energy_uj'
+    energy.write_text('0')
+    sampler, clock = _Sampler(), _Clock()
+    meter = IdleMeter(sampler, clock, energy_path=energy)
+
+    # 100 s actifs : 40 s de CPU, 800 J.
+    clock.now, sampler.cpu = 100, 40.0
+    energy.write_text('800000000')
+    meter.set_idle(True)
+    # 200 s en veille : 10 s de CPU, 400 J.
+    clock.now, sampler.cpu = 300, 50.0
+    energy.write_text('1200000000')
+    meter.set_idle(False)
+
+    stats = meter.stats()
+    assert stats['idle'] is False and stats['idle_entries'] == 1
+    assert (stats['active_seconds'], stats['idle_seconds']) == (100.0, 200.0)
+    assert (stats['active_cpu_percent'], stats['idle_cpu_percent']) == (40.0, 5.0)
+    assert stats['cpu_saved_percent'] == 35.0
+    assert (stats['active_watts'], stats['idle_watts']) == (8.0, 2.0)
+    assert stats['power_saved_watts'] == 6.0
+
+
+def test_without_energy_counter(tmp_path):
+    sampler, clock = _Sampler(), _Clock()
+    meter = IdleMeter(sampler, clock, energy_path=tmp_path / 'absent')
+    clock.now, sampler.cpu = 10, 1.0
+    stats = meter.stats()
+    assert stats['active_cpu_percent'] == 10.0 and stats['idle_cpu_percent'] is None
+    assert stats['active_watts'] is None and stats['power_saved_watts'] is None
+
+
+def test_repeated_state_ignored(tmp_path):
+    meter = IdleMeter(_Sampler(), _Clock(), energy_path=tmp_path / 'absent')
+    meter.set_idle(False)
+    meter.set_idle(True)
+    meter.set_idle(True)
+    assert meter.stats()['idle_entries'] == 1 and meter.stats()['idle'] is True
+
+
+def test_settings_validation():
+    assert not [e for e in Settings().validate() if 'idle_' in e]
+    errors = Settings(idle_after_minutes=-1, idle_screen='oui').validate()
+    assert len([e for e in errors if 'idle_' in e]) == 2
@@ -0,0 +1,64 @@
+"""Tests du script kiosque unique (kiosk_bundle).
+
+Couvre :
+- réglages intégrés au script (origine du serveur, curseur, veille) ;
+- aucun identifiant dans le script partagé ; script de connexion à part,
+  identifiants sérialisés en littéraux JavaScript sûrs ;
+- page de connexion reconnue par origine, pas par préfixe d'adresse ;
+- garde contre une double exécution dans un même document ;
+- repli sans Qt WebEngine : pas d'injection au début du document.
+"""
+import json
+
+from kiosk_bundle import (build_kiosk_bundle, build_login_script, install_at_document_start,
+                          is_login_page)
+
+
+def _config(bundle):
+    start = bundle.rindex('})(') + 3
+    return json.loads(bundle[start:bundle.rindex(');')])
+
+
+def test_settings_baked_in():
+    bundle = build_kiosk_bundle('http://127.0.0.1:8123', False)
+    assert _config(bundle) == {'serverUrl': 'http://127.0.0.1:8123', 'hideCursor': False,
+                               'idleAfterMs': 0, 'idleScreen': False}
+    assert 'password' not in bundle
+    assert '__CONFIG__' not in bundle
+    idle = build_kiosk_bundle('http://srv', True, idle_after_minutes=5, idle_screen=True)
+    assert _config(idle)['idleAfterMs'] == 300000 and _config(idle)['idleScreen'] is True
+
+
+def test_credentials_cannot_break_the_script():
+    password = 'a"b\\c\n\u2028</script> "); alert(1); ("'
+    script = build_login_script("o'neil", password)
+    assert _config(script)['password'] == password
+    assert _config(script)['username'] == "o'neil"
+    assert '\u2028' not in script and '\n</script>' not in script
+
+
+def test_login_page_matched_by_origin():
+    assert is_login_page('https://serveur/login?next=/patient', 'https://serveur')
+    assert is_login_page('https://serveur:443/auth/login', 'https://serveur')
+    assert is_login_page('http://127.0.0.1:8123/login', 'http://127.0.0.1:8123')
+    assert is_login_page('https://serveur/app/login', 'https://serveur/app')
+    assert not is_login_page('https://serveur/patient', 'https://serveur')
+    assert not is_login_page('https://serveur.evil.example/login', 'https://serveur')
+    assert not is_login_page('https://serveur@evil.example/login', 'https://serveur')
+    assert not is_login_page('http://serveur/login', 'https://serveur')
+    assert not is_login_page('https://serveur/application/login', 'https://serveur/app')
+    assert not is_login_page('https://evil.example/?https://serveur/login', 'https://serveur')
+    assert not is_login_page(None, 'https://serveur')
+
+
+def test_guarded_against_double_execution():
+    bundle = build_kiosk_bundle('https://serveur', True)
+    assert bundle.index('if (window.__kioskBundle) { return; }') < bundle.index(
+        'addEventListener')
+
+
+def test_document_start_unavailable_without_qt():
+    class _Window:
+        native = None
+
+    assert install_at_document_start(_Window(), 'void 0;') is False
@@ -0,0 +1,47 @@
+"""Tests de la surveillance des changements réseau (net_watch).
+
+Les messages netlink sont simulés sur une paire de sockets locale. Couvre :
+- décodage des notifications (interfaces, adresses, routes) ;
+- appel de ``on_change`` depuis la boucle asyncio à la réception.
+"""
+import asyncio
+import socket
+import struct
+
+from net_watch import NetworkWatcher, parse_events
+
+
+def _message(msg_type, payload=b'\0' * 3):
+    # Longueur non multiple de 4 : le message suivant est aligné.
+    header = struct.pack('=IHHII', 16 + len(payload), msg_type, 0, 0, 0)
+    return header + payload + b'\0' * (-len(payload) % 4)
+
+
+def test_parse_events_keeps_link_addr_route():
+    data = _message(16) + _message(3) + _message(20) + _message(25)
+
+    assert parse_events(data) == ['link', 'addr', 'route']
+    assert parse_events(b'\x01\x00') == []
+
+
+def test_watcher_reports_changes_from_the_loop():
+    reader, writer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    received = []
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        watcher = NetworkWatcher(lambda events: (received.append(events), changed.set()),
+                                 sock=reader)
+        assert watcher.start(loop)
+        writer.send(_message(20))
+        writer.send(_message(24))
+        await asyncio.wait_for(changed.wait(), 2)
+        watcher.stop()
+        return watcher.events
+
+    try:
+        assert asyncio.run(scenario()) == 2
+        assert sum(received, []) == ['addr', 'route']
+    finally:
+        writer.close()
@@ -0,0 +1,387 @@
+"""Tests du cœur réseau asyncio (network_core).
+
+Le serveur est simulé par une session factice (pas de réseau). Couvre :
+- obtention du token (enregistrement, propagation, échec) ;
+- requête unique partagée par les demandes simultanées (single-flight) ;
+- supervision de l'initialisation avec backoff jusqu'au mode opérationnel,
+  écourté quand le réseau revient ;
+- préchauffage de la connexion et chronologie du démarrage ;
+- démarrage à chaud avec le token conservé, et retour hors ligne s'il est
+  refusé ;
+- arrêt déterministe (tâches annulées, thread de boucle joint) ;
+- envoi des statuts par la boucle, y compris renouvellement du token sur 401.
+"""
+import queue
+import threading
+import time
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+import network_core
+from network_core import TokenError
+
+
+class _Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class _Session:
+    """Serveur factice : ``handler(url, kwargs) -> _Response`` (ou exception)."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+        self.heads = []
+        # Serveur injoignable pour les sondages (HEAD) tant que True.
+        self.offline = False
+
+    def post(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        return self.handler(url, kwargs)
+
+    def head(self, url, **kwargs):
+        self.heads.append(url)
+        if self.offline:
+            raise RequestsConnectionError("offline")
+        return _Response(200)
+
+    def close(self):
+        pass
+
+
+class _TokenStore:
+    """Magasin de token en mémoire (interface de secret_store)."""
+
+    def __init__(self, token=None, remaining=3600):
+        self.saved = None
+        self.cleared = 0
+        if token:
+            self.saved = ('http://localhost', token, time.time() + remaining)
+
+    def store_app_token(self, server, token, expires_at):
+        self.saved = (server, token, expires_at)
+        return True
+
+    def load_app_token(self, server):
+        if not self.saved or self.saved[0] != server:
+            return None
+        return self.saved[1], self.saved[2] - time.time()
+
+    def clear_app_token(self):
+        self.cleared += 1
+        self.saved = None
+        return True
+
+
+def _token_server(tokens, expires_in=None):
+    """Répond aux demandes de token avec les valeurs de ``tokens`` (une
+    exception dans la liste simule une erreur réseau)."""
+    tokens = iter(tokens)
+
+    def handler(url, kwargs):
+        value = next(tokens)
+        if isinstance(value, Exception):
+            raise value
+        if value is None:
+            return _Response(503)
+        body = {'token': value}
+        if expires_in is not None:
+            body['expires_in'] = expires_in
+        return _Response(200, body)
+    return handler
+
+
+@pytest.fixture
+def core_session():
+    """Session de la fixture ``core`` (cf. tests/conftest.py) ; chaque test fixe
+    son ``handler``."""
+    return _Session(None)
+
+
+@pytest.fixture
+def token_store(request):
+    """Token conservé (valeur paramétrée par le test), aucun par défaut."""
+    token = getattr(request, 'param', None)
+    return _TokenStore(token) if token else None
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_get_app_token_sets_and_propagates_token(core, core_session, received_tokens):
+    core_session.handler = _token_server(['tok-1'])
+
+    assert core.submit(core.get_app_token()).result(5) == 'tok-1'
+    assert core.app_token == 'tok-1'
+    assert _wait(lambda: received_tokens == ['tok-1'])
+    [(url, kwargs)] = core.session.calls
+    assert url == 'http://localhost/api/get_app_token'
+    assert kwargs['data'] == {'app_secret': 'secret'}
+
+
+def test_get_app_token_failure_raises(core, core_session):
+    core_session.handler = _token_server([None, RequestsConnectionError("down")])
+
+    with pytest.raises(TokenError):
+        core.submit(core.get_app_token(max_retries=2, retry_delay=0)).result(5)
+    assert core.app_token is None
+
+
+def test_open_circuit_stops_token_retries(core, core_session, guard):
+    core_session.handler = _token_server([None, 'tok'])
+    guard.after_response('http://localhost/api/get_app_token', 503, '120')
+
+    with pytest.raises(TokenError):
+        core.submit(core.get_app_token(max_retries=3, retry_delay=0)).result(5)
+    # Une seule tentative : pas de réessai pendant le Retry-After.
+    assert len(core.session.calls) == 1
+
+
+def test_refresh_token_blocking_from_another_thread(core, core_session):
+    core_session.handler = _token_server(['tok-1', 'tok-2'])
+
+    assert core.refresh_token_blocking() == 'tok-1'
+    # Token tout juste obtenu : pas de nouvelle requête (intervalle minimal).
+    assert core.refresh_token_blocking() == 'tok-1'
+    assert len(core.session.calls) == 1
+
+
+def test_concurrent_refreshes_share_one_request(core, core_session):
+    release = threading.Event()
+    tokens = iter(['tok-1', 'tok-2'])
+
+    def slow_server(url, kwargs):
+        release.wait(5)
+        return _Response(200, {'token': next(tokens)})
+
+    core_session.handler = slow_server
+
+    async def burst():
+        return await network_core.asyncio.gather(
+            *(core.get_app_token(force=True) for _ in range(10)))
+
+    future = core.submit(burst())
+    time.sleep(0.1)
+    release.set()
+
+    assert future.result(5) == ['tok-1'] * 10
+    assert len(core.session.calls) == 1
+    stats = core.tokens.stats.snapshot()
+    assert stats['requests'] == 1 and stats['coalesced'] == 9
+
+    # Rafale de 401 juste après : servie depuis la mémoire.
+    assert core.submit(burst()).result(5) == ['tok-1'] * 10
+    assert len(core.session.calls) == 1
+
+
+def test_supervision_retries_until_operational(core, core_session, received_tokens,
+                                               monkeypatch):
+    monkeypatch.setattr(network_core, 'INIT_BACKOFF_START', 0.01)
+    core_session.handler = _token_server([None, None, 'tok'])
+    initialized = []
+    operational = threading.Event()
+
+    core.start_supervision(lambda: initialized.append(1), operational.set)
+
+    assert operational.wait(5)
+    assert initialized == [1]
+    assert _wait(lambda: received_tokens[-1:] == ['tok'])
+    assert len(core.session.calls) == 3
+    assert _wait(lambda: core.reachable is True)
+
+
+def test_printer_opens_in_parallel_with_token(core, core_session, received_tokens):
+    init_started = threading.Event()
+
+    def server(url, kwargs):
+        # Le token n'arrive qu'une fois l'ouverture de l'imprimante commencée.
+        init_started.wait(2)
+        return _Response(200, {'token': 'tok' if init_started.is_set() else 'late'})
+
+    core_session.handler = server
+    operational = threading.Event()
+
+    core.start_supervision(init_started.set, operational.set)
+
+    assert operational.wait(5)
+    assert _wait(lambda: received_tokens[-1:] == ['tok'])
+    assert {'printer_ms', 'token_ms', 'operational_ms'} <= set(core.timeline)
+    assert core.timeline['operational_ms'] >= max(core.timeline['printer_ms'],
+                                                  core.timeline['token_ms'])
+
+
+def test_network_change_cuts_backoff_short(core, core_session, monkeypatch):
+    monkeypatch.setattr(network_core, 'INIT_BACKOFF_START', 60)
+    core_session.handler = _token_server([RequestsConnectionError("down"), 'tok'])
+    core.session.offline = True
+    operational = threading.Event()
+
+    core.start_supervision(lambda: None, operational.set)
+    assert _wait(lambda: len(core.session.calls) == 1 and len(core.session.heads) >= 2)
+    assert not operational.is_set()
+
+    # Retour du réseau : nouvel essai immédiat, sans attendre les 60 s.
+    core.session.offline = False
+    core.notify_network_change()
+    assert operational.wait(2)
+    assert core.app_token == 'tok'
+
+
+def test_offline_probes_bound_recovery_time(core, core_session, monkeypatch):
+    monkeypatch.setattr(network_core, 'INIT_BACKOFF_START', 60)
+    monkeypatch.setattr(network_core, 'OFFLINE_PROBE_INTERVAL', 0.05)
+    core_session.handler = _token_server([RequestsConnectionError("down"), 'tok'])
+    core.session.offline = True
+    operational = threading.Event()
+
+    core.start_supervision(lambda: None, operational.set)
+    assert _wait(lambda: len(core.session.heads) >= 4)
+    core.session.offline = False
+
+    assert operational.wait(2)
+
+
+def test_reachable_server_keeps_the_backoff(core, core_session, monkeypatch):
+    monkeypatch.setattr(network_core, 'INIT_BACKOFF_START', 60)
+    monkeypatch.setattr(network_core, 'OFFLINE_PROBE_INTERVAL', 0.01)
+    # Secret refusé : le serveur répond, inutile de réessayer plus tôt.
+    core_session.handler = _token_server([None, 'tok'])
+    operational = threading.Event()
+
+    core.start_supervision(lambda: None, operational.set)
+    assert _wait(lambda: len(core.session.calls) == 1)
+    core.notify_network_change()
+
+    assert not operational.wait(0.3)
+    assert len(core.session.calls) == 1
+
+
+@pytest.mark.parametrize('token_store', ['kept'], indirect=True)
+def test_warm_start_with_persisted_token(core, core_session, token_store, received_tokens):
+    release = threading.Event()
+
+    def slow_server(url, kwargs):
+        release.wait(5)
+        return _Response(200, {'token': 'fresh', 'expires_in': 3600})
+
+    core_session.handler = slow_server
+    operational = threading.Event()
+
+    core.start_supervision(lambda: None, operational.set)
+
+    # Opérationnelle sans attendre le serveur, avec le token conservé...
+    assert operational.wait(2)
+    assert _wait(lambda: received_tokens == ['kept'])
+    # ... puis renouvellement en arrière-plan, conservé à son tour.
+    release.set()
+    assert _wait(lambda: core.app_token == 'fresh')
+    assert _wait(lambda: token_store.saved and token_store.saved[1] == 'fresh')
+    assert 3500 < token_store.saved[2] - time.time() <= 3600
+
+
+@pytest.mark.parametrize('token_store', ['revoked'], indirect=True)
+def test_rejected_persisted_token_goes_offline_until_renewed(core, core_session, token_store,
+                                                             monkeypatch):
+    monkeypatch.setattr(network_core, 'INIT_BACKOFF_START', 0.05)
+    monkeypatch.setattr(network_core, 'OFFLINE_PROBE_INTERVAL', 0.01)
+    monkeypatch.setattr(network_core, 'TOKEN_FETCH_RETRY_DELAY', 0.01)
+    core_session.handler = _token_server([RequestsConnectionError("down")] * 3 + ['tok'])
+    events = []
+    operational = threading.Event()
+
+    def on_operational():
+        events.append('operational')
+        operational.set()
+
+    core.start_supervision(lambda: None, on_operational, lambda: events.append('offline'))
+    assert operational.wait(2)
+    operational.clear()
+
+    core.note_unauthorized()  # 401 avec le token conservé
+
+    assert _wait(lambda: events == ['operational', 'offline', 'operational'])
+    assert core.app_token == 'tok'
+    assert token_store.cleared == 1
+
+
+def test_prewarm_before_token_and_startup_timeline(core, core_session):
+    core_session.handler = _token_server(['tok'])
+    operational = threading.Event()
+
+    core.start_supervision(lambda: None, operational.set)
+
+    assert operational.wait(5)
+    # Connexion ouverte (HEAD) avant la première demande de token.
+    assert core.session.heads == ['http://localhost']
+    timeline = core.timeline
+    assert set(timeline) == {'dns_ms', 'prewarm_ms', 'printer_ms', 'token_ms',
+                             'operational_ms'}
+    assert timeline['dns_ms'] <= timeline['prewarm_ms'] <= timeline['token_ms'] \
+        <= timeline['operational_ms']
+
+
+@pytest.mark.parametrize('probe_interval', [0.05])
+def test_warm_probes_keep_polling(core, core_session):
+    core_session.handler = _token_server(['tok'])
+
+    core.start_supervision(lambda: None, lambda: None)
+
+    assert _wait(lambda: len(core.session.heads) >= 3)
+
+
+def test_refresh_follows_server_lifetime(core, core_session, received_tokens):
+    tokens = [f'tok-{i}' for i in range(1, 50)]
+    core_session.handler = _token_server(tokens, expires_in=0.4)
+
+    core.start_supervision(lambda: None, lambda: None)
+
+    # Renouvellement avant expiration (et non au bout de 23 h).
+    # (Le premier token est propagé deux fois : à l'obtention, puis à
+    # l'imprimante une fois celle-ci prête.)
+    assert _wait(lambda: list(dict.fromkeys(received_tokens))[:2] == ['tok-1', 'tok-2'])
+    stats = core.tokens.stats.snapshot()
+    assert stats['lifetime_source'] == 'expires_in'
+    assert 0 < stats['refresh_delay'] < 0.4
+
+
+def test_stop_is_deterministic(core):
+    sleeping = core.submit(network_core.asyncio.sleep(3600))
+
+    started = time.monotonic()
+    core.stop()
+
+    assert time.monotonic() - started < 2
+    assert not core._thread.is_alive()
+    assert sleeping.cancelled()
+
+
+def test_status_delivery_sends_on_notify_and_renews_token(core, core_session):
+    replies = iter([_Response(401), _Response(200, {'token': 'tok-2'}), _Response(200)])
+    core_session.handler = lambda url, kwargs: next(replies)
+    status_queue = queue.Queue()
+    delivery = core.status_delivery('http://localhost/api/printer/status',
+                                    {'X-App-Token': 'tok-1'}, status_queue)
+    delivery.start()
+
+    status_queue.put({'error': 'no_paper', 'message': 'x', 'borne_id': 'b1'})
+    delivery.notify()
+
+    assert _wait(lambda: len(core.session.calls) == 3)
+    first, renew, retry = core.session.calls
+    assert first[1]['headers']['X-App-Token'] == 'tok-1'
+    assert renew[0] == 'http://localhost/api/get_app_token'
+    assert retry[1]['headers']['X-App-Token'] == 'tok-2'
+    assert retry[1]['json']['error'] == 'no_paper'
+
+    delivery.stop()
+    delivery.join(2)
@@ -0,0 +1,172 @@
+"""Tests du préchargement de /patient (page_preload).
+
+Fenêtres factices (aucune interface graphique). Couvre :
+- page chargée dans une fenêtre cachée, substituée une fois prête, temps de
+  bascule mesuré ;
+- pages intermédiaires (connexion) ignorées ;
+- repli sur un chargement direct (création impossible, délai dépassé) ;
+- annulation quand la borne repasse hors ligne (délai de repli annulé) ;
+- mode direct (préchargement désactivé) mesuré lui aussi.
+"""
+from config import Settings
+from page_preload import PagePreloader
+
+
+class _Window:
+    def __init__(self, url=None):
+        self.url = url
+        self.loads = []
+        self.destroyed = False
+
+    def load_url(self, url):
+        self.loads.append(url)
+
+    def destroy(self):
+        self.destroyed = True
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Scheduler:
+    """Ordonnanceur factice : les temporisations sont déclenchées à la main."""
+
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback, *args):
+        timer = _Timer(delay, callback, args)
+        self.timers.append(timer)
+        return timer
+
+
+class _Timer:
+    def __init__(self, delay, callback, args):
+        self.delay = delay
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        if not self.cancelled:
+            self.callback(*self.args)
+
+
+class _Kiosk:
+    """Fenêtre kiosque factice : crée les fenêtres cachées et les affiche."""
+
+    def __init__(self, fail_open=False):
+        self.visible = _Window('offline')
+        self.hidden = []
+        self.fail_open = fail_open
+
+    def open_hidden(self, url):
+        if self.fail_open:
+            raise RuntimeError("pas de fenêtre cachée")
+        window = _Window(url)
+        self.hidden.append(window)
+        return window
+
+    def swap(self, window):
+        self.visible.destroy()
+        self.visible = window
+
+
+URL = 'http://127.0.0.1:5000/patient'
+
+
+def test_preloaded_page_swapped_when_ready():
+    kiosk, clock = _Kiosk(), _Clock()
+    preloader = PagePreloader(kiosk.open_hidden, kiosk.swap, scheduler=_Scheduler(),
+                              clock=clock)
+    offline = kiosk.visible
+
+    preloader.show(URL, offline)
+    assert offline.loads == [] and len(kiosk.hidden) == 1
+    hidden = kiosk.hidden[0]
+
+    # Page de connexion intermédiaire : pas encore de bascule.
+    clock.now = 0.4
+    preloader.page_ready(hidden, 'http://127.0.0.1:5000/login')
+    assert kiosk.visible is offline
+
+    clock.now = 1.2
+    preloader.page_ready(hidden, URL)
+    assert kiosk.visible is hidden and offline.destroyed
+    stats = preloader.stats()
+    assert stats['mode'] == 'preload'
+    assert stats['load_ms'] == 1200.0 and stats['switch_ms'] == 0.0
+
+    # Chargements suivants de la même fenêtre : rien à faire.
+    preloader.page_ready(hidden, URL)
+    assert preloader.stats() == stats
+
+
+def test_direct_load_when_hidden_window_unavailable():
+    kiosk, clock = _Kiosk(fail_open=True), _Clock()
+    preloader = PagePreloader(kiosk.open_hidden, kiosk.swap, clock=clock)
+    offline = kiosk.visible
+
+    preloader.show(URL, offline)
+    assert offline.loads == [URL]
+    clock.now = 2.5
+    preloader.page_ready(offline, URL)
+    stats = preloader.stats()
+    assert stats['mode'] == 'direct' and stats['switch_ms'] == 2500.0
+
+
+def test_direct_load_after_timeout():
+    kiosk, scheduler = _Kiosk(), _Scheduler()
+    preloader = PagePreloader(kiosk.open_hidden, kiosk.swap, timeout=30,
+                              scheduler=scheduler)
+    offline = kiosk.visible
+
+    preloader.show(URL, offline)
+    [timer] = scheduler.timers
+    assert timer.delay == 30 and offline.loads == []
+    timer.fire()
+    assert offline.loads == [URL]
+    assert kiosk.hidden[0].destroyed
+    assert preloader.stats()['fallbacks'] == 1
+    # La fenêtre cachée abandonnée ne bascule plus.
+    preloader.page_ready(kiosk.hidden[0], URL)
+    assert kiosk.visible is offline
+
+
+def test_cancel_when_going_offline():
+    kiosk, scheduler = _Kiosk(), _Scheduler()
+    preloader = PagePreloader(kiosk.open_hidden, kiosk.swap, scheduler=scheduler)
+    offline = kiosk.visible
+
+    preloader.show(URL, offline)
+    preloader.cancel()
+    assert kiosk.hidden[0].destroyed
+    assert scheduler.timers[0].cancelled
+    preloader.page_ready(kiosk.hidden[0], URL)
+    assert kiosk.visible is offline
+
+
+def test_preload_disabled_measures_direct_switch():
+    kiosk, clock = _Kiosk(), _Clock()
+    preloader = PagePreloader(kiosk.open_hidden, kiosk.swap, preload=False, clock=clock)
+    offline = kiosk.visible
+
+    preloader.show(URL, offline)
+    assert kiosk.hidden == [] and offline.loads == [URL]
+    clock.now = 0.8
+    preloader.page_ready(offline, URL)
+    assert preloader.stats()['switch_ms'] == 800.0
+
+
+def test_settings_validation():
+    assert Settings().preload_patient_page is True
+    errors = Settings(preload_patient_page='oui').validate()
+    assert any('preload_patient_page' in e for e in errors)
@@ -0,0 +1,288 @@
+"""Tests du renvoi des impressions vers une borne voisine (peer_link).
+
+Deux bornes tournent sur la même machine (127.0.0.1, ports éphémères) : dans
+le même processus pour la plupart des cas, et dans deux processus distincts
+pour le scénario de bout en bout. Couvre :
+- signature / anti-rejeu / fenêtre d'horodatage du protocole ;
+- renvoi d'un ticket quand l'imprimante locale n'a plus de papier, avec le
+  nom de la borne qui a imprimé ;
+- pas de renvoi pour une charge invalide ni vers une voisine non authentifiée ;
+- pas de doublon : erreur en cours d'impression non renvoyée, voisine muette
+  ou en erreur d'impression non relayée par une autre (issue inconnue) ;
+- validation des réglages ``peer_port`` / ``peers``.
+"""
+import base64
+import multiprocessing
+import sys
+import threading
+import time
+
+import pytest
+
+import peer_link
+from config import Settings
+from peer_link import (
+    PeerCodec,
+    PeerLink,
+    PeerProtocolError,
+    MAX_CLOCK_SKEW,
+    derive_peer_key,
+)
+
+
+def _b64(text):
+    return base64.b64encode(text.encode('utf-8')).decode('ascii')
+
+
+OK = {'success': True, 'code': 'print_ok', 'message': "Ticket imprimé."}
+NO_PAPER = {'success': False, 'code': 'no_paper', 'message': "Plus de papier dans l'imprimante."}
+PRINT_ERROR = {'success': False, 'code': 'error_print', 'message': "Erreur d'impression."}
+
+
+class _LocalPrinter:
+    def __init__(self, result, printer_ok):
+        self.result = result
+        self.printer_ok = printer_ok
+        self.calls = []
+
+    def print(self, data):
+        self.calls.append(data)
+        return self.result
+
+    def health(self):
+        return {'printer_ok': self.printer_ok}
+
+
+def _link(borne_id, local, peers=(), secret="secret-site"):
+    link = PeerLink(borne_id, secret, local.print, local.health, 0,
+                    peers=peers, discovery=False, bind_host='127.0.0.1')
+    link.start()
+    return link
+
+
+# Les imprimantes des bornes se paramètrent par test (indirect) avec une
+# fabrique : ``pytest.mark.parametrize('local', [lambda: ...], indirect=True)``.
+
+@pytest.fixture
+def local(request):
+    """Imprimante de borne-a : plus de papier par défaut."""
+    return getattr(request, 'param', lambda: _LocalPrinter(NO_PAPER, printer_ok=False))()
+
+
+@pytest.fixture
+def remote(request):
+    """Imprimante de borne-b : en état d'imprimer par défaut."""
+    return getattr(request, 'param', lambda: _LocalPrinter(OK, printer_ok=True))()
+
+
+@pytest.fixture
+def spare():
+    """Imprimante de borne-c."""
+    return _LocalPrinter(OK, printer_ok=True)
+
+
+@pytest.fixture
+def peer_b(remote):
+    link = _link("borne-b", remote)
+    yield link
+    link.stop()
+
+
+@pytest.fixture
+def peer_c(spare):
+    link = _link("borne-c", spare)
+    yield link
+    link.stop()
+
+
+@pytest.fixture
+def foreign_peer():
+    """Borne d'un autre site (autre secret)."""
+    link = _link("borne-c", _LocalPrinter(OK, printer_ok=True), secret="autre-site")
+    yield link
+    link.stop()
+
+
+@pytest.fixture
+def peers(request):
+    """Voisines statiques de borne-a (paramètre : noms de fixtures), borne-b
+    par défaut."""
+    return [request.getfixturevalue(name) for name in getattr(request, 'param', ['peer_b'])]
+
+
+@pytest.fixture
+def borne_a(local, peers):
+    link = _link("borne-a", local, peers=[f"127.0.0.1:{peer.port}" for peer in peers])
+    yield link
+    link.stop()
+
+
+# --- Protocole -------------------------------------------------------------
+
+def test_codec_roundtrip_and_tamper_detection():
+    codec = PeerCodec(derive_peer_key("s"), "a")
+    message = codec.open(codec.seal('health'))
+    assert message['from'] == "a" and message['type'] == 'health'
+
+    tampered = codec.seal('print', {'data': 'x'}).replace(b'"x"', b'"y"')
+    with pytest.raises(PeerProtocolError):
+        codec.open(tampered)
+
+
+def test_codec_rejects_other_key_replay_and_skew():
+    sender = PeerCodec(derive_peer_key("s"), "a")
+    receiver = PeerCodec(derive_peer_key("s"), "b")
+    intruder = PeerCodec(derive_peer_key("autre"), "x")
+
+    with pytest.raises(PeerProtocolError):
+        receiver.open(intruder.seal('health'))
+
+    sealed = sender.seal('health')
+    receiver.open(sealed)
+    with pytest.raises(PeerProtocolError):
+        receiver.open(sealed)  # rejeu
+
+    stale = PeerCodec(derive_peer_key("s"), "a", clock=lambda: 1000.0)
+    late = PeerCodec(derive_peer_key("s"), "b",
+                     clock=lambda: 1000.0 + MAX_CLOCK_SKEW + 1)
+    with pytest.raises(PeerProtocolError):
+        late.open(stale.seal('health'))
+
+
+# --- Renvoi ----------------------------------------------------------------
+
+def test_no_paper_forwards_to_healthy_peer(borne_a, remote):
+    a = borne_a
+    a.poll_health(a.peers()[0])
+
+    result = a.print(_b64("Ticket A12"))
+
+    assert result['success'] is True
+    assert result['code'] == 'print_forwarded'
+    assert result['printed_by'] == "borne-b"
+    assert "borne-b" in result['message']
+    assert remote.calls == [_b64("Ticket A12")]
+
+
+@pytest.mark.parametrize('local', [lambda: _LocalPrinter(OK, printer_ok=True)],
+                         indirect=True)
+def test_local_success_is_not_forwarded(borne_a, remote):
+    a = borne_a
+    a.poll_health(a.peers()[0])
+
+    assert a.print(_b64("x")) == OK
+    assert remote.calls == []
+
+
+def test_invalid_payload_is_never_forwarded(borne_a, remote):
+    a = borne_a
+    a.poll_health(a.peers()[0])
+
+    assert a.print(_b64("X\x1b\x70\x00Y")) == NO_PAPER
+    assert remote.calls == []
+
+
+@pytest.mark.parametrize('remote', [lambda: _LocalPrinter(NO_PAPER, printer_ok=False)],
+                         indirect=True)
+@pytest.mark.parametrize('peers', [['peer_b', 'foreign_peer']], indirect=True)
+def test_unhealthy_or_foreign_peer_is_not_used(borne_a, remote):
+    a = borne_a
+    for peer in a.peers():
+        a.poll_health(peer)
+
+    assert a.healthy_peers() == []
+    assert a.print(_b64("x")) == NO_PAPER
+
+
+@pytest.mark.parametrize('local', [lambda: _LocalPrinter(PRINT_ERROR, printer_ok=False)],
+                         indirect=True)
+def test_error_during_printing_is_not_forwarded(borne_a, remote):
+    a = borne_a
+    a.poll_health(a.peers()[0])
+
+    assert a.print(_b64("x")) == PRINT_ERROR
+    assert remote.calls == []
+
+
+class _SlowPrinter(_LocalPrinter):
+    def __init__(self, result):
+        super().__init__(result, printer_ok=True)
+        self.release = threading.Event()
+
+    def print(self, data):
+        self.calls.append(data)
+        self.release.wait(5)
+        return self.result
+
+
+@pytest.mark.parametrize('remote', [lambda: _SlowPrinter(OK),
+                                    lambda: _LocalPrinter(PRINT_ERROR, printer_ok=True)],
+                         ids=['silent', 'failing'], indirect=True)
+@pytest.mark.parametrize('peers', [['peer_c', 'peer_b']], indirect=True)
+def test_unknown_peer_outcome_is_not_retried_elsewhere(borne_a, remote, spare, monkeypatch):
+    monkeypatch.setattr(peer_link, 'PEER_PRINT_TIMEOUT', 0.3)
+    a = borne_a
+    for peer in a.peers():  # borne-b vue en dernier : tentée en premier
+        a.poll_health(peer)
+        time.sleep(0.01)
+
+    result = a.print(_b64("x"))
+    if isinstance(remote, _SlowPrinter):
+        remote.release.set()
+
+    assert result['success'] is False and result['code'] == 'error_peer_outcome'
+    assert "borne-b" in result['message']
+    assert len(remote.calls) == 1 and spare.calls == []
+
+
+@pytest.mark.parametrize('peers', [[]], indirect=True)
+def test_announce_registers_peer(borne_a):
+    a = borne_a
+    b_codec = PeerCodec(derive_peer_key("secret-site"), "borne-b")
+
+    a.handle_announce(b_codec.seal('announce', {'port': 47801, 'printer_ok': True}),
+                      ('127.0.0.1', 47801))
+
+    [peer] = a.healthy_peers()
+    assert (peer.borne_id, peer.host, peer.port) == ("borne-b", '127.0.0.1', 47801)
+
+
+def _serve_peer(port_queue, stop_event):
+    link = _link("borne-b", _LocalPrinter(OK, printer_ok=True))
+    port_queue.put(link.port)
+    stop_event.wait(30)
+    link.stop()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="contexte fork requis")
+def test_forwarding_between_two_processes():
+    ctx = multiprocessing.get_context('fork')
+    port_queue = ctx.Queue()
+    stop_event = ctx.Event()
+    child = ctx.Process(target=_serve_peer, args=(port_queue, stop_event), daemon=True)
+    child.start()
+    a = None
+    try:
+        port = port_queue.get(timeout=10)
+        a = _link("borne-a", _LocalPrinter(NO_PAPER, printer_ok=False),
+                  peers=[f"127.0.0.1:{port}"])
+        a.poll_health(a.peers()[0])
+
+        result = a.print(_b64("Ticket B07"))
+
+        assert result['code'] == 'print_forwarded'
+        assert result['printed_by'] == "borne-b"
+    finally:
+        if a is not None:
+            a.stop()
+        stop_event.set()
+        child.join(timeout=5)
+
+
+# --- Réglages --------------------------------------------------------------
+
+def test_settings_peer_validation():
+    assert Settings(peers=["192.168.1.20", "borne2.local:47801"]).peer_errors() == []
+    errors = Settings(peer_port=70000, peers=["hôte:abc", 12]).peer_errors()
+    assert len(errors) == 3
+    assert Settings(peers="192.168.1.20").peer_errors()
@@ -11,7 +11,10 @@ invalides, exception USB — plus les erreurs propres à l'API.
 """
 import base64
 import queue
+import random
 import threading
+import time
+import zlib
 
 import pytest
 
@@ -20,17 +23,28 @@ from printer import (
     Printer,
     PrinterAPI,
     decode_and_validate_print_payload,
+    COMPRESSED_PAYLOAD_PREFIX,
+    MAX_COMPRESSED_BYTES,
     MAX_ENCODED_LEN,
     MAX_DECODED_BYTES,
     MAX_TICKET_CHARS,
     MAX_TICKET_LINES,
 )
+from scheduler import Timer
 
 
 def _b64(text):
     return base64.b64encode(text.encode('utf-8')).decode('ascii')
 
 
+def _dfl(raw, declared=None):
+    """Enveloppe compressée « DFL1 » : longueur annoncée + flux zlib."""
+    if declared is None:
+        declared = len(raw)
+    envelope = declared.to_bytes(4, 'big') + zlib.compress(raw)
+    return COMPRESSED_PAYLOAD_PREFIX + base64.b64encode(envelope).decode('ascii')
+
+
 # --- Doubles de test -------------------------------------------------------
 
 class FakeDevice:
@@ -57,6 +71,24 @@ class FakeDevice:
         pass
 
 
+class _ManualScheduler:
+    """Ordonnanceur factice : enregistre les temporisations sans les exécuter."""
+
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(delay, None, callback, args)
+        self.timers.append(timer)
+        return timer
+
+    def run_pending(self):
+        timers, self.timers = self.timers, []
+        for timer in timers:
+            if not timer.cancelled:
+                timer.callback(*timer.args)
+
+
 def make_printer(device=None, error=False, check_paper=False, monkeypatch=None,
                  device_factory=None):
     """Construit un Printer sans passer par __init__ (pas de matériel/thread).
@@ -69,11 +101,23 @@ def make_printer(device=None, error=False, check_paper=False, monkeypatch=None,
     p.error = error
     p.encoding = 'utf-8'
     p.is_paper_ok = True
+    p.last_paper_code = None
     p.status_queue = queue.Queue()
     p._status_lock = threading.Lock()
+    p._status_machine = printer_module.PrinterStatusStateMachine()
+    p._outbox = None
+    p.status_thread = None
     # Verrou USB sérialisant les accès (ajouté avec la reconnexion USB) :
     # Printer.print l'acquiert, le helper doit donc le fournir.
     p._usb_lock = threading.RLock()
+    # Reconnexion planifiée (ordonnanceur factice : rien ne s'exécute seul).
+    p._closing = threading.Event()
+    p._scheduler = _ManualScheduler()
+    p._reconnect_timer = None
+    p._heartbeat_metrics = None
+    # Envoi des statuts démarré au premier token (update_token).
+    p._status_started = False
+    p._start_lock = threading.Lock()
     # Identifiant de borne joint aux statuts (send_printer_status).
     p.borne_id = 'test-borne'
     # Métadonnées matériel + fabrique de périphérique injectée (découplage).
@@ -228,6 +272,96 @@ def test_api_callback_raises():
     assert 'boom' in result['message']
 
 
+def _wait_events(events, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(events) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return events
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_api_async_print_reports_progress():
+    api = PrinterAPI()
+    events = []
+    api.set_event_sink(events.append)
+    release = threading.Event()
+    expected = {'success': True, 'code': 'print_ok', 'message': 'Ticket imprimé.'}
+
+    def slow_print(data):
+        release.wait(5)
+        return expected
+
+    api.set_print_callback(slow_print)
+    accepted = api.print_ticket("payload", {'async': True})
+    assert accepted['success'] is True and accepted['code'] == 'print_queued'
+    job_id = accepted['job_id']
+
+    # Le pont a rendu la main avant l'impression physique.
+    _wait_events(events, 2)
+    assert events == [{'job_id': job_id, 'state': 'queued'},
+                      {'job_id': job_id, 'state': 'printing'}]
+    release.set()
+    _wait_events(events, 3)
+    assert events[2] == {'job_id': job_id, 'state': 'done', 'result': expected}
+
+
+def test_api_blocked_event_sink_does_not_stall_printing():
+    api = PrinterAPI()
+    unblock, events, printed = threading.Event(), [], []
+
+    def frozen_page(event):
+        unblock.wait(5)  # evaluate_js bloqué sur une page figée
+        events.append(event)
+
+    ok = {'success': True, 'code': 'print_ok', 'message': 'Ticket imprimé.'}
+    api.set_print_callback(lambda data: printed.append(data) or ok)
+    api.set_event_sink(frozen_page)
+
+    # Le pont rend la main et les tickets sortent sans attendre la page.
+    started = time.monotonic()
+    jobs = [api.print_ticket(f"payload-{n}", {'async': True})['job_id'] for n in range(2)]
+    assert time.monotonic() - started < 1
+    _wait_events(printed, 2)
+    assert printed == ["payload-0", "payload-1"]
+    assert _wait_for(lambda: not api.busy())
+    assert api.print_ticket("payload") == ok
+    assert events == []
+
+    unblock.set()
+    _wait_events(events, 6)
+    for job_id in jobs:
+        assert [e['state'] for e in events if e['job_id'] == job_id] == [
+            'queued', 'printing', 'done']
+
+
+def test_api_async_print_error_and_refusals():
+    api = PrinterAPI()
+    assert api.print_ticket("payload", {'async': True})['code'] == 'error_not_initialized'
+
+    events = []
+    api.set_event_sink(events.append)
+    failure = {'success': False, 'code': 'no_paper', 'message': "Plus de papier."}
+    release = threading.Event()
+    api.set_print_callback(lambda data: release.wait(5) and failure)
+
+    results = [api.print_ticket("payload", {'async': True})
+               for _ in range(printer_module.MAX_PENDING_PRINT_JOBS + 2)]
+    # Un travail en cours d'impression, MAX_PENDING_PRINT_JOBS en attente.
+    assert results[-1]['success'] is False and results[-1]['code'] == 'print_queue_full'
+    release.set()
+    accepted = [r['job_id'] for r in results if r['success']]
+    _wait_events(events, 3 * len(accepted))
+    finals = [e for e in events if e['state'] in ('done', 'error')]
+    assert [e['job_id'] for e in finals] == accepted
+    assert all(e['state'] == 'error' and e['result'] == failure for e in finals)
+
+
 # --- Tests validation stricte des données d'impression ---------------------
 
 # Ticket légitime : texte + toutes les séquences ESC/POS émises par le serveur
@@ -317,6 +451,77 @@ def test_payload_error_never_leaks_content():
         assert "SECRET-TOKEN" not in str(e)
 
 
+# --- Tests enveloppe compressée (DFL1) --------------------------------------
+
+def test_compressed_payload_roundtrip():
+    assert decode_and_validate_print_payload(
+        _dfl(_LEGIT_TICKET.encode('utf-8'))) == _LEGIT_TICKET
+
+
+def test_compressed_payload_is_smaller_than_base64_for_repetitive_ticket():
+    ticket = ("-" * 42 + "\n") * 100
+    assert len(_dfl(ticket.encode('utf-8'))) < len(_b64(ticket)) // 10
+    assert decode_and_validate_print_payload(_dfl(ticket.encode('utf-8'))) == ticket
+
+
+def test_compressed_payload_rejects_declared_size_over_cap():
+    with pytest.raises(ValueError):
+        decode_and_validate_print_payload(
+            _dfl(b"x", declared=MAX_DECODED_BYTES + 1))
+
+
+def test_compressed_payload_rejects_deflate_bomb():
+    # Flux très compressible dont la taille réelle dépasse le plafond, avec une
+    # longueur annoncée mensongère : la décompression bornée doit refuser.
+    bomb = b"\x00" * (MAX_DECODED_BYTES * 50)
+    with pytest.raises(ValueError):
+        decode_and_validate_print_payload(_dfl(bomb, declared=MAX_DECODED_BYTES))
+
+
+@pytest.mark.parametrize("declared_delta", [-1, 1])
+def test_compressed_payload_rejects_length_mismatch(declared_delta):
+    raw = b"Bonjour"
+    with pytest.raises(ValueError):
+        decode_and_validate_print_payload(
+            _dfl(raw, declared=len(raw) + declared_delta))
+
+
+def test_compressed_payload_rejects_trailing_garbage_and_corruption():
+    envelope = (7).to_bytes(4, 'big') + zlib.compress(b"Bonjour")
+    trailing = COMPRESSED_PAYLOAD_PREFIX + base64.b64encode(
+        envelope + b"xx").decode('ascii')
+    corrupt = COMPRESSED_PAYLOAD_PREFIX + base64.b64encode(
+        envelope[:-3] + b"\x00\x00\x00").decode('ascii')
+    for payload in (trailing, corrupt, COMPRESSED_PAYLOAD_PREFIX,
+                    COMPRESSED_PAYLOAD_PREFIX + base64.b64encode(b"\x00\x00").decode()):
+        with pytest.raises(ValueError):
+            decode_and_validate_print_payload(payload)
+
+
+def test_compressed_payload_rejects_oversized_compressed_stream():
+    raw = random.Random(0).randbytes(MAX_COMPRESSED_BYTES + 512)  # incompressible
+    envelope = (len(raw)).to_bytes(4, 'big') + zlib.compress(raw)
+    assert len(envelope) > MAX_COMPRESSED_BYTES
+    payload = COMPRESSED_PAYLOAD_PREFIX + base64.b64encode(envelope).decode('ascii')
+    with pytest.raises(ValueError):
+        decode_and_validate_print_payload(payload)
+
+
+def test_compressed_payload_content_is_still_validated():
+    with pytest.raises(ValueError):
+        decode_and_validate_print_payload(_dfl(b"X\x1b\x70\x00Y"))
+
+
+def test_print_accepts_compressed_payload(monkeypatch):
+    device = FakeDevice()
+    p = make_printer(device=device, check_paper=False, monkeypatch=monkeypatch)
+
+    result = p.print(_dfl("Bonjour".encode('utf-8')))
+
+    assert result['success'] is True
+    assert device.text_calls == ["Bonjour"]
+
+
 def test_print_rejects_dangerous_payload_without_printing(monkeypatch):
     # Une charge avec commande non autorisée => invalid_data, rien n'est imprimé.
     device = FakeDevice()
@@ -368,6 +573,54 @@ def test_initialize_printer_factory_failure_sets_error(monkeypatch):
     assert p.error is True
 
 
+def test_usb_failure_schedules_reconnect_until_printer_is_back(monkeypatch):
+    """Après une erreur USB, une reconnexion est planifiée (une seule) et
+    replanifiée tant que l'imprimante reste absente ; plus aucune ensuite."""
+    fresh = FakeDevice()
+    devices = iter([RuntimeError("absente"), fresh])
+
+    def factory(id_vendor, id_product, model):
+        device = next(devices)
+        if isinstance(device, Exception):
+            raise device
+        return device
+
+    p = make_printer(device=FakeDevice(text_exc=ValueError("no langid")),
+                     monkeypatch=monkeypatch, device_factory=factory)
+
+    p.print(VALID_PAYLOAD)
+    p.print(VALID_PAYLOAD)  # imprimante absente : pas de seconde planification
+    assert len(p._scheduler.timers) == 1
+
+    p._scheduler.run_pending()  # toujours absente : replanifiée
+    assert p.p is None and len(p._scheduler.timers) == 1
+
+    p._scheduler.run_pending()
+    assert p.p is fresh
+    assert p._scheduler.timers == []
+
+
+def test_reconnect_reopens_printer_on_demand(monkeypatch):
+    """Reconnexion demandée par le serveur : le handle est rouvert aussitôt ;
+    si l'imprimante reste absente, la reconnexion planifiée prend le relais."""
+    fresh = FakeDevice()
+    devices = iter([fresh, RuntimeError("absente")])
+
+    def factory(id_vendor, id_product, model):
+        device = next(devices)
+        if isinstance(device, Exception):
+            raise device
+        return device
+
+    p = make_printer(device=FakeDevice(), monkeypatch=monkeypatch, device_factory=factory)
+
+    assert p.reconnect()['printer_ok'] is True
+    assert p.p is fresh and p._scheduler.timers == []
+
+    assert p.reconnect()['printer_ok'] is False
+    assert p.p is None and len(p._scheduler.timers) == 1
+
+
 def test_print_end_to_end_with_fake_printer(monkeypatch):
     """Impression complète (init via fabrique + print) avec une fausse
     imprimante : démontre l'exécution des tests sans dépendance matérielle."""
@@ -381,3 +634,149 @@ def test_print_end_to_end_with_fake_printer(monkeypatch):
     assert result['success'] is True
     assert fake.text_calls == ["Bonjour"]
     assert fake.cut_calls == 1
+
+
+# --- Tests statuts : transitions uniquement + pulsation -----------------------
+
+def _queued(p):
+    items = []
+    while not p.status_queue.empty():
+        items.append(p.status_queue.get_nowait())
+    return items
+
+
+def test_repeated_paper_status_is_sent_once(monkeypatch):
+    device = FakeDevice(paper_status_value=0)
+    p = make_printer(device=device, check_paper=True, monkeypatch=monkeypatch)
+
+    for _ in range(5):
+        p.check_paper_status()
+    sent = _queued(p)
+
+    assert [item['error'] for item in sent] == ['no_paper']
+    heartbeat = p._heartbeat_status()
+    assert heartbeat['error'] == 'no_paper'
+    assert heartbeat['counters']['no_paper'] == 5
+    assert heartbeat['suppressed'] == 4
+
+
+def test_heartbeat_carries_metrics(monkeypatch):
+    p = make_printer(device=FakeDevice(), monkeypatch=monkeypatch)
+    p._heartbeat_metrics = lambda: {'http': {'connections_opened': 1}}
+
+    assert p._heartbeat_status()['metrics'] == {'http': {'connections_opened': 1}}
+
+
+class _RecordingDelivery:
+    """Envoi des statuts factice : enregistre démarrage et en-têtes."""
+
+    def __init__(self, url, headers, status_queue, **kwargs):
+        self.headers = headers
+        self.started = 0
+
+    def start(self):
+        self.started += 1
+
+    def notify(self):
+        pass
+
+    def update_headers(self, headers):
+        self.headers = headers
+
+    def stop(self):
+        pass
+
+    def join(self, timeout=None):
+        pass
+
+
+def test_status_delivery_waits_for_first_token(monkeypatch):
+    """Imprimante ouverte avant l'obtention du token : les statuts restent en
+    file, l'envoi démarre avec le premier token (une seule fois)."""
+    class _Config:
+        class settings:
+            check_paper = False
+            borne_id = 'test-borne'
+
+    monkeypatch.setattr(printer_module, 'Config', _Config)
+    p = Printer('0x04b8', '0x0202', 'TM-T88II', 'http://srv', None,
+                device_factory=lambda *a: FakeDevice(), status_delivery=_RecordingDelivery,
+                scheduler=_ManualScheduler())
+
+    assert p.p is not None
+    assert p.status_thread.started == 0
+    assert [item['error'] for item in _queued(p)] == ['init_ok']
+
+    p.update_token('tok')
+    p.update_token('tok-2')
+    assert p.status_thread.started == 1
+    assert p.status_thread.headers['X-App-Token'] == 'tok-2'
+    p.cleanup()
+
+
+def test_state_change_is_sent(monkeypatch):
+    device = FakeDevice(paper_status_value=0)
+    p = make_printer(device=device, check_paper=True, monkeypatch=monkeypatch)
+
+    # La file ne garde que le dernier statut : on la vide après chaque contrôle.
+    sent = []
+    for value in (0, 2, 2, 1):
+        device.paper_status_value = value
+        p.check_paper_status()
+        sent.extend(item['error'] for item in _queued(p))
+
+    assert sent == ['no_paper', 'paper_ok', 'low_paper']
+
+
+def test_incident_codes_are_rate_limited_without_changing_state():
+    now = [0.0]
+    machine = printer_module.PrinterStatusStateMachine(
+        clock=lambda: now[0], heartbeat_interval=300)
+
+    assert machine.observe('no_paper') is True
+    assert machine.observe('invalid_data') is True
+    assert machine.observe('invalid_data') is False
+    now[0] = 301.0
+    assert machine.observe('invalid_data') is True
+    # L'incident n'a pas modifié l'état : no_paper reste dédoublonné.
+    assert machine.observe('no_paper') is False
+    assert machine.heartbeat()['state'] == 'no_paper'
+    assert machine.heartbeat()['counters']['invalid_data'] == 3
+
+
+class _RecordingSession:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.posts.append(json)
+
+        class _Response:
+            status_code = 200
+        return _Response()
+
+    def close(self):
+        pass
+
+
+def test_status_thread_sends_heartbeat_when_idle():
+    session = _RecordingSession()
+    beats = []
+
+    def heartbeat():
+        beats.append(1)
+        return {'error': 'paper_ok', 'heartbeat': True}
+
+    thread = printer_module.PrinterStatusThread(
+        'http://srv/api/printer/status', {}, queue.Queue(), session=session,
+        heartbeat_callback=heartbeat, heartbeat_interval=0.2)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not session.posts and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        thread.stop()
+        thread.join(timeout=2)
+
+    assert session.posts and session.posts[0]['heartbeat'] is True
@@ -0,0 +1,163 @@
+"""Tests du mode « imprimante dans un processus enfant » (printer_worker).
+
+Le processus enfant est créé avec le contexte ``fork`` : il hérite ainsi des
+stubs escpos/pyusb de conftest.py et de la configuration factice, et la fausse
+imprimante n'a pas besoin d'être sérialisable. Couvre :
+- une impression traverse le pipe et renvoie le contrat habituel ;
+- le surcoût IPC est mesuré ;
+- l'enfant tué est relancé automatiquement ;
+- un appel bloqué fait terminer puis relancer l'enfant (code ``error_worker``).
+
+Un test utilise ``spawn``, le contexte de production : il vérifie que la cible
+de l'enfant, la fabrique de périphérique et les arguments de ``Printer`` sont
+sérialisables. L'enfant lit la vraie configuration, sous un HOME temporaire.
+"""
+import base64
+import multiprocessing
+import os
+import runpy
+import signal
+import sys
+import time
+
+import pytest
+
+# Un enfant spawn ré-importe ce module (pour _factory) hors de pytest : les
+# stubs escpos/pyusb du conftest.py racine y sont installés avant ``printer``.
+runpy.run_path(os.path.join(os.path.dirname(__file__), os.pardir, 'conftest.py'))
+
+import printer as printer_module  # noqa: E402
+import printer_worker
+from printer_worker import PrinterProcess
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32",
+                                reason="contexte fork requis")
+
+
+def _b64(text):
+    return base64.b64encode(text.encode('utf-8')).decode('ascii')
+
+
+class _Device:
+    def text(self, data):
+        if data == "LENT":
+            time.sleep(30)
+
+    def cut(self):
+        pass
+
+    def paper_status(self):
+        return 2
+
+    def close(self):
+        pass
+
+
+def _factory(id_vendor, id_product, model):
+    return _Device()
+
+
+@pytest.fixture
+def mp_context():
+    return multiprocessing.get_context('fork')
+
+
+@pytest.fixture
+def call_timeout():
+    return printer_worker.WORKER_CALL_TIMEOUT
+
+
+@pytest.fixture
+def proc(mp_context, call_timeout, monkeypatch, tmp_path):
+    class _Settings:
+        check_paper = False
+        borne_id = 'test-borne'
+
+    class _Config:
+        settings = _Settings()
+
+    monkeypatch.setattr(printer_module, 'Config', _Config)
+    # Hérité par un enfant spawn, qui lit la vraie configuration : sous tmp_path.
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr(printer_worker, 'WORKER_RESTART_BACKOFF_START', 0.05)
+    proc = PrinterProcess(
+        '0x04b8', '0x0202', 'TM-T88II', 'http://127.0.0.1:9', 'tok',
+        device_factory=_factory, mp_context=mp_context, call_timeout=call_timeout)
+    yield proc
+    proc.cleanup()
+
+
+def _wait_restart(proc, previous_pid, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        process = proc._process
+        if (process is not None and process.pid != previous_pid
+                and proc._connected.is_set()):
+            return
+        time.sleep(0.05)
+    raise AssertionError("processus imprimante non relancé")
+
+
+def test_print_through_worker_process(proc):
+
+    result = proc.print(_b64("Bonjour"))
+
+    assert result == {'success': True, 'code': 'print_ok', 'message': "Ticket imprimé."}
+    assert proc._process.pid != os.getpid()
+    stats = proc.ipc_stats()
+    assert stats['calls'] == 1
+    assert stats['mean_overhead_ms'] >= 0
+    assert stats['restarts'] == 0
+
+
+def test_invalid_payload_is_rejected_in_child(proc):
+
+    result = proc.print("pas du base64 !!!")
+
+    assert result['success'] is False
+    assert result['code'] == 'invalid_data'
+
+
+def test_crashed_worker_is_restarted(proc):
+    assert proc.print(_b64("avant"))['success'] is True
+    pid = proc._process.pid
+
+    os.kill(pid, signal.SIGKILL)
+    _wait_restart(proc, pid)
+
+    assert proc.print(_b64("après"))['success'] is True
+    assert proc.ipc_stats()['restarts'] == 1
+
+
+@pytest.mark.parametrize('call_timeout', [1.0])
+def test_hung_call_times_out_and_restarts(proc):
+    assert proc.print(_b64("ok"))['success'] is True
+    pid = proc._process.pid
+
+    result = proc.print(_b64("LENT"))
+
+    assert result['success'] is False
+    assert result['code'] == 'error_worker'
+    _wait_restart(proc, pid)
+    assert proc.print(_b64("ok"))['success'] is True
+
+
+def test_timeout_never_kills_a_respawned_child(proc):
+    assert proc.print(_b64("avant"))['success'] is True
+    old = proc._process
+    os.kill(old.pid, signal.SIGKILL)
+    _wait_restart(proc, old.pid)
+    new = proc._process
+
+    # Délai expiré d'un appel envoyé à l'ancien enfant.
+    proc._kill_child(old)
+
+    assert new.is_alive()
+    assert proc.print(_b64("ok"))['success'] is True
+
+
+@pytest.mark.parametrize('mp_context', [multiprocessing.get_context('spawn')])
+def test_print_through_spawned_worker(proc):
+    result = proc.print(_b64("Bonjour"))
+
+    assert result == {'success': True, 'code': 'print_ok', 'message': "Ticket imprimé."}
@@ -0,0 +1,280 @@
+"""Tests du canal de commandes WebSocket (push_channel).
+
+Un serveur WebSocket minimal local tient lieu de serveur. Couvre :
+- trames (masquage, longueurs) et clé de poignée de main (RFC 6455) ;
+- poignée de main authentifiée, commande poussée exécutée et son résultat
+  renvoyé ;
+- statuts imprimante envoyés par le canal au lieu d'une requête HTTP ;
+- reprise après coupure avec le dernier numéro de commande, sans rejouer une
+  commande déjà reçue ; numérotation reprise à zéro si la session du
+  serveur change ;
+- connexion silencieuse détectée par la pulsation, puis reconnexion ;
+- serveur sans canal : désactivé.
+"""
+import asyncio
+import json
+import queue
+import select
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import push_channel
+from circuit_breaker import ServerGuard
+from printer import StatusUploader
+from push_channel import (OP_PING, OP_PONG, OP_TEXT, PushChannel, accept_key,
+                          encode_frame, read_frame)
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("fermé")
+        data += chunk
+    return data
+
+
+def _recv_frame(sock):
+    first, second = _recv_exact(sock, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', _recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', _recv_exact(sock, 8))[0]
+    key = _recv_exact(sock, 4) if second & 0x80 else b'\0\0\0\0'
+    payload = bytes(b ^ key[i % 4] for i, b in enumerate(_recv_exact(sock, length)))
+    return first & 0x0F, payload, bool(second & 0x80)
+
+
+class _WsServer:
+    """Serveur WebSocket factice : une connexion à la fois. ``outgoing`` :
+    messages à pousser ; ``received`` : messages reçus de la borne. Les
+    statuts sont acquittés ; ``silent`` : ne répond pas aux pings."""
+
+    def __init__(self, status=101):
+        self.status = status
+        self.silent = False
+        self.session = None
+        self.requests = []
+        self.received = []
+        self.pings = 0
+        self.outgoing = queue.Queue()
+        self.drop = threading.Event()
+        outer = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                outer._serve(self.request)
+
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def push(self, message):
+        self.outgoing.put(message)
+
+    def _serve(self, sock):
+        head = b''
+        while b'\r\n\r\n' not in head:
+            head += sock.recv(4096)
+        lines = head.decode('latin-1').split('\r\n')
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        self.requests.append((lines[0].split(' ')[1], headers))
+        if self.status != 101:
+            sock.sendall(f'HTTP/1.1 {self.status} Refus\r\nContent-Length: 0\r\n\r\n'.encode())
+            return
+        sock.sendall(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                      'Connection: Upgrade\r\nSec-WebSocket-Accept: '
+                      f'{accept_key(headers["sec-websocket-key"])}\r\n'
+                      + (f'X-Push-Session: {self.session}\r\n' if self.session else '')
+                      + '\r\n').encode())
+        self.drop.clear()
+        while not self.drop.is_set():
+            try:
+                message = self.outgoing.get_nowait()
+                sock.sendall(encode_frame(OP_TEXT, json.dumps(message).encode(), mask=False))
+            except queue.Empty:
+                pass
+            if not select.select([sock], [], [], 0.02)[0]:
+                continue
+            try:
+                opcode, payload, masked = _recv_frame(sock)
+            except (ConnectionError, OSError):
+                return
+            assert masked
+            if opcode == OP_PING:
+                self.pings += 1
+                if not self.silent:
+                    sock.sendall(encode_frame(OP_PONG, payload, mask=False))
+            elif opcode == OP_TEXT:
+                message = json.loads(payload)
+                self.received.append(message)
+                if message.get('type') in ('status', 'status_batch'):
+                    ack = {'type': 'ack', 'id': message['id']}
+                    if message['type'] == 'status_batch':
+                        ack['ack'] = message['events'][-1]['seq']
+                    sock.sendall(encode_frame(OP_TEXT, json.dumps(ack).encode(), mask=False))
+        sock.close()
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class _NoHttp:
+    def post(self, url, **kwargs):
+        raise AssertionError("requête HTTP inattendue")
+
+    def head(self, url, **kwargs):
+        raise AssertionError("requête HTTP inattendue")
+
+
+@pytest.fixture
+def server():
+    server = _WsServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def core_base_url(server):
+    return f'http://127.0.0.1:{server.port}'
+
+
+@pytest.fixture
+def core_session():
+    return _NoHttp()
+
+
+@pytest.fixture
+def ping_interval():
+    return push_channel.PUSH_PING_INTERVAL
+
+
+@pytest.fixture
+def commands():
+    """Commandes exécutées par la borne : ``(command, args)``."""
+    return []
+
+
+@pytest.fixture
+def channel(core, commands, ping_interval, monkeypatch):
+    monkeypatch.setattr(push_channel, 'PUSH_BACKOFF_START', 0.05)
+    core.tokens.seed('tok')
+
+    def on_command(command, args):
+        commands.append((command, args))
+        return {'success': True, 'code': 'done', 'message': "ok"}
+
+    return PushChannel(core, 'b1', on_command, ping_interval=ping_interval)
+
+
+def test_frames_and_handshake_key():
+    # Exemple de la RFC 6455 (§ 1.3).
+    assert accept_key('dGhlIHNhbXBsZSBub25jZQ==') == 's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+    async def _roundtrip(frame):
+        reader = asyncio.StreamReader()
+        reader.feed_data(frame)
+        return await read_frame(reader)
+
+    for size in (5, 300, 70000):
+        payload = bytes(range(256)) * (size // 256) + b'x' * (size % 256)
+        frame = encode_frame(OP_TEXT, payload)
+        assert asyncio.run(_roundtrip(frame)) == (True, OP_TEXT, payload)
+
+
+def test_pushed_command_runs_and_result_returned(channel, server, commands):
+    channel.start()
+    assert _wait(lambda: channel.connected)
+    path, headers = server.requests[0]
+    assert headers['x-app-token'] == 'tok'
+    assert urlsplit(path).path == '/api/kiosk/push'
+    assert parse_qs(urlsplit(path).query) == {'borne_id': ['b1'], 'last_seq': ['0']}
+
+    server.push({'type': 'command', 'seq': 1, 'command': 'reload', 'args': {}})
+    assert _wait(lambda: server.received)
+    assert commands == [('reload', {})]
+    assert server.received[0] == {'type': 'command_result', 'seq': 1,
+                                  'result': {'success': True, 'code': 'done',
+                                             'message': "ok"}}
+
+
+def test_statuses_sent_over_the_channel(channel, server):
+    channel.start()
+    assert _wait(lambda: channel.connected)
+    uploader = StatusUploader('http://unused/api/printer/status', {}, queue.Queue(),
+                              session=_NoHttp(), guard=ServerGuard(), channel=channel)
+
+    assert uploader._try_send({'error': 'no_paper'}) == 'ok'
+    assert server.received[0]['type'] == 'status'
+    assert server.received[0]['status'] == {'error': 'no_paper'}
+
+
+def test_resume_after_drop_without_replaying(channel, server, commands):
+    channel.start()
+    assert _wait(lambda: channel.connected)
+    server.push({'type': 'command', 'seq': 4, 'command': 'reconnect_printer'})
+    assert _wait(lambda: channel.last_seq == 4)
+
+    server.drop.set()
+    assert _wait(lambda: len(server.requests) == 2 and channel.connected)
+    assert parse_qs(urlsplit(server.requests[1][0]).query)['last_seq'] == ['4']
+    # Le serveur renvoie la commande 4 (déjà reçue) puis la 5.
+    server.push({'type': 'command', 'seq': 4, 'command': 'reconnect_printer'})
+    server.push({'type': 'command', 'seq': 5, 'command': 'reload'})
+    assert _wait(lambda: channel.last_seq == 5)
+    assert _wait(lambda: [c for c, _ in commands] == ['reconnect_printer', 'reload'])
+    assert channel.stats()['connects'] == 2
+
+
+def test_new_server_session_restarts_numbering(channel, server, commands):
+    server.session = 'a'
+    channel.start()
+    assert _wait(lambda: channel.connected)
+    server.push({'type': 'command', 'seq': 7, 'command': 'reload'})
+    assert _wait(lambda: channel.last_seq == 7)
+
+    # Serveur redémarré : nouvelle session, numérotation repartie à 1.
+    server.session = 'b'
+    server.drop.set()
+    assert _wait(lambda: len(server.requests) == 2 and channel.connected)
+    server.push({'type': 'command', 'seq': 1, 'command': 'reconnect_printer'})
+    assert _wait(lambda: [c for c, _ in commands] == ['reload', 'reconnect_printer'])
+    assert channel.stats()['last_seq'] == 1 and channel.server_session == 'b'
+
+
+@pytest.mark.parametrize('ping_interval', [0.1])
+def test_silent_connection_detected_by_heartbeat(channel, server, monkeypatch):
+    monkeypatch.setattr(push_channel, 'PUSH_PONG_TIMEOUT', 0.2)
+    server.silent = True
+    channel.start()
+
+    assert _wait(lambda: len(server.requests) >= 2)
+    assert server.pings >= 1
+
+
+def test_server_without_channel_disables_it(channel, server):
+    server.status = 404
+    channel.start()
+
+    assert _wait(lambda: not channel.enabled)
+    assert channel.request({'type': 'status'}) is None
+
@@ -0,0 +1,264 @@
+"""Tests de la surveillance du moteur de rendu (renderer_watch).
+
+Un faux ``/proc`` et une fausse page (pulsation) remplacent Qt WebEngine.
+Couvre :
+- mémoire et temps CPU des processus de rendu descendants de la borne ;
+- rechargement au-delà de la limite mémoire, reporté pendant une impression
+  ou une inscription ;
+- page figée (pulsation sans réponse) rechargée ;
+- recyclage une fois par jour dans la fenêtre configurée (passant minuit) ;
+- validation des réglages.
+"""
+import threading
+from datetime import datetime
+
+import pytest
+
+from config import Settings
+from renderer_watch import ProcessSampler, RendererSupervisor, parse_quiet_window
+
+
+def _write_process(proc, pid, ppid, name, ticks, pages):
+    directory = proc / str(pid)
+    directory.mkdir()
+    fields = ['S', str(ppid)] + ['0'] * 9 + [str(ticks), '0'] + ['0'] * 10
+    (directory / 'stat').write_text(f"{pid} ({name}) " + ' '.join(fields))
+    (directory / 'statm').write_text(f"1000 {pages} 0 0 0 0 0")
+
+
+def test_sampler_reads_renderer_family(tmp_path):
+    _write_process(tmp_path, 100, 1, 'python3', 300, 10)
+    _write_process(tmp_path, 101, 100, 'QtWebEngineProc', 200, 256)
+    _write_process(tmp_path, 102, 101, 'QtWebEngineProc', 100, 256)
+    _write_process(tmp_path, 200, 1, 'QtWebEngineProc', 999, 999999)  # autre appli
+    (tmp_path / 'self').mkdir()
+
+    sampler = ProcessSampler(root_pid=100, proc=tmp_path)
+    sampler._tick, sampler._page_size = 100, 4096
+    assert sampler.sample() == {'renderer_rss_mb': 2.0, 'renderers': 2, 'cpu_seconds': 6.0}
+
+
+def test_sampler_without_renderer(tmp_path):
+    _write_process(tmp_path, 100, 1, 'python3', 100, 10)
+    sample = ProcessSampler(root_pid=100, proc=tmp_path).sample()
+    assert sample['renderer_rss_mb'] is None and sample['renderers'] == 0
+
+
+def test_quiet_window_parsing():
+    assert parse_quiet_window('') is None
+    assert parse_quiet_window('03:00-04:30') == (180, 270)
+    assert parse_quiet_window('23:30-01:00') == (1410, 60)
+    for value in ('3:00-4:00', '25:00-01:00', '03:00-03:00', 'nuit'):
+        with pytest.raises(ValueError):
+            parse_quiet_window(value)
+
+
+class _Sampler:
+    def __init__(self):
+        self.rss = 100.0
+
+    def sample(self):
+        return {'renderer_rss_mb': self.rss, 'renderers': 1, 'cpu_seconds': 0}
+
+
+class _Page:
+    """Fausse page : répond à la pulsation (``hang`` : ne répond pas)."""
+
+    def __init__(self):
+        self.idle_ms = 10 * 60 * 1000
+        self.busy = False
+        self.hang = threading.Event()
+        self.release = threading.Event()
+        self.heartbeats = 0
+
+    def evaluate(self, script):
+        self.heartbeats += 1
+        if self.hang.is_set():
+            self.release.wait(5)
+        return {'idle_ms': self.idle_ms, 'busy': self.busy}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def page():
+    page = _Page()
+    yield page
+    page.release.set()
+
+
+@pytest.fixture
+def sampler():
+    return _Sampler()
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def reloads():
+    return []
+
+
+@pytest.fixture
+def state():
+    """Impression en cours, page du serveur affichée."""
+    return {'printing': False, 'active': True}
+
+
+@pytest.fixture
+def now():
+    """Heure locale (``now['value']``) vue par la fenêtre de recyclage."""
+    return {'value': datetime(2026, 3, 2, 12, 0)}
+
+
+# Réglages du superviseur, paramétrés par test (pytest.mark.parametrize).
+@pytest.fixture
+def memory_limit_mb():
+    return 0
+
+
+@pytest.fixture
+def heartbeat_timeout():
+    return 20
+
+
+@pytest.fixture
+def quiet_window():
+    return ''
+
+
+@pytest.fixture
+def supervisor(page, sampler, clock, reloads, state, now, memory_limit_mb,
+               heartbeat_timeout, quiet_window):
+    return RendererSupervisor(
+        page.evaluate, lambda: reloads.append(True), lambda: state['printing'],
+        lambda: state['active'], sampler=sampler, scheduler=object(), clock=clock,
+        now=lambda: now['value'], memory_limit_mb=memory_limit_mb,
+        heartbeat_timeout=heartbeat_timeout, quiet_window=quiet_window)
+
+
+def _settle(supervisor):
+    if supervisor._heartbeat is not None:
+        supervisor._heartbeat.join(5)
+
+
+@pytest.mark.parametrize('memory_limit_mb', [500])
+def test_memory_limit_reloads_when_idle(supervisor, page, sampler, reloads, state):
+
+    supervisor._tick()
+    _settle(supervisor)
+    assert reloads == [] and page.heartbeats == 1
+
+    sampler.rss = 800.0
+    state['printing'] = True
+    supervisor._tick()
+    _settle(supervisor)
+    assert reloads == []
+
+    state['printing'] = False
+    page.idle_ms = 20 * 1000  # touchée il y a 20 s : inscription en cours
+    supervisor._tick()
+    _settle(supervisor)
+    assert reloads == []
+    assert supervisor.stats()['deferred'] == 2
+
+    page.idle_ms = 5 * 60 * 1000
+    supervisor._tick()
+    _settle(supervisor)
+    assert reloads == [True]
+    assert supervisor.stats()['reloads']['memory'] == 1
+    assert supervisor.stats()['renderer_rss_mb'] == 800.0
+
+
+def test_frozen_page_reloaded(supervisor, page, clock, reloads, state):
+    page.hang.set()
+
+    supervisor._tick()
+    clock.now = 10
+    supervisor._tick()
+    assert reloads == []
+
+    clock.now = 30
+    state['printing'] = True
+    supervisor._tick()
+    assert reloads == []
+    state['printing'] = False
+    supervisor._tick()
+    assert reloads == [True]
+    assert supervisor.stats()['reloads']['heartbeat_timeout'] == 1
+
+    # La réponse tardive de l'ancienne pulsation est ignorée.
+    page.hang.clear()
+    page.release.set()
+    supervisor._tick()
+    _settle(supervisor)
+    assert reloads == [True]
+
+
+def test_hung_heartbeat_not_stacked(supervisor, page, clock, reloads):
+    page.hang.set()
+
+    supervisor._tick()
+    clock.now = 30
+    supervisor._tick()
+    assert reloads == [True]
+    hung = supervisor._heartbeat
+
+    # Page rechargée mais toujours figée : pas de second thread en attente.
+    for _ in range(3):
+        supervisor._tick()
+    assert supervisor._heartbeat is hung
+    assert page.heartbeats == 1
+
+    page.release.set()
+    _settle(supervisor)
+    supervisor._tick()
+    assert supervisor._heartbeat is not hung
+    _settle(supervisor)
+    assert page.heartbeats == 2
+
+@pytest.mark.parametrize('quiet_window', ['23:30-01:00'])
+def test_quiet_window_recycles_once_per_night(supervisor, reloads, now):
+
+    supervisor._tick()
+    _settle(supervisor)
+    assert reloads == []
+
+    now['value'] = datetime(2026, 3, 2, 23, 45)
+    supervisor._tick()
+    _settle(supervisor)
+    now['value'] = datetime(2026, 3, 3, 0, 30)
+    supervisor._tick()
+    _settle(supervisor)
+    assert reloads == [True]
+
+    now['value'] = datetime(2026, 3, 3, 23, 40)
+    supervisor._tick()
+    _settle(supervisor)
+    assert reloads == [True, True]
+
+
+@pytest.mark.parametrize('memory_limit_mb', [500])
+def test_nothing_watched_while_page_not_shown(supervisor, page, sampler, reloads, state):
+    sampler.rss = 900.0
+    state['active'] = False
+
+    supervisor._tick()
+    assert page.heartbeats == 0 and reloads == []
+
+
+def test_settings_validation():
+    assert not [e for e in Settings().validate() if 'renderer_' in e]
+    errors = Settings(renderer_watch='oui', renderer_memory_limit_mb=-1,
+                      renderer_heartbeat_interval=1, renderer_heartbeat_timeout=0,
+                      renderer_recycle_window='minuit').validate()
+    assert len([e for e in errors if 'renderer_' in e]) == 5
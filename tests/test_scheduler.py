@@ -0,0 +1,203 @@
+"""Tests de l'ordonnanceur unique (scheduler) et des réveils d'une borne au repos.
+
+Couvre :
+- exécution différée / périodique et annulation des temporisations ;
+- aucun réveil sans temporisation, un réveil par échéance ;
+- borne au repos (imprimante connectée, page affichée, liaison entre bornes
+  active) : réveils de l'ordonnanceur partagé sur une fenêtre de 10 minutes
+  simulée par une fausse horloge, et aucun réveil du thread de statut de
+  l'imprimante. Le sondage réseau et la pulsation du canal de commandes sont
+  des temporisations de la boucle asyncio de network_core : non comptés ici.
+"""
+import threading
+import time
+
+import printer as printer_module
+from peer_link import PEER_HEALTH_INTERVAL, PeerLink
+from printer import Printer
+from renderer_watch import RendererSupervisor
+from scheduler import TimerScheduler
+
+# Budget de réveils par minute de l'ordonnanceur partagé, borne au repos : la
+# santé des voisines (toutes les 15 s), avec laquelle la pulsation du moteur
+# de rendu (toutes les 60 s) coïncide. L'imprimante connectée n'a aucune
+# temporisation.
+MAX_IDLE_WAKEUPS_PER_MINUTE = 60 / PEER_HEALTH_INTERVAL
+IDLE_WINDOW = 600  # secondes simulées
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_call_later_runs_in_deadline_order():
+    scheduler = TimerScheduler()
+    fired = []
+    done = threading.Event()
+    scheduler.call_later(0.10, fired.append, 'b')
+    scheduler.call_later(0.05, fired.append, 'a')
+    scheduler.call_later(0.15, done.set)
+    try:
+        assert done.wait(2)
+        assert fired == ['a', 'b']
+        assert scheduler.pending() == 0
+    finally:
+        scheduler.stop()
+
+
+def test_call_every_repeats_until_cancelled():
+    scheduler = TimerScheduler()
+    ticks = []
+    timer = scheduler.call_every(0.02, ticks.append, 1, first_delay=0)
+    try:
+        assert _wait(lambda: len(ticks) >= 3)
+        timer.cancel()
+        count = len(ticks)
+        time.sleep(0.1)
+        assert len(ticks) <= count + 1
+    finally:
+        scheduler.stop()
+
+
+def test_no_timer_means_no_wakeup():
+    scheduler = TimerScheduler()
+    fired = threading.Event()
+    scheduler.call_later(0.01, fired.set)
+    try:
+        assert fired.wait(2)
+        before = scheduler.wakeups
+        time.sleep(0.3)
+        assert scheduler.wakeups == before
+    finally:
+        scheduler.stop()
+
+
+class _Device:
+    def text(self, data):
+        pass
+
+    def cut(self):
+        pass
+
+    def paper_status(self):
+        return 2
+
+    def close(self):
+        pass
+
+
+class _Session:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, json=None, **kwargs):
+        self.posts.append(json)
+
+        class _Response:
+            status_code = 200
+        return _Response()
+
+    def close(self):
+        pass
+
+
+class _WindowOver(Exception):
+    pass
+
+
+class _SimClock:
+    def __init__(self):
+        self.now = 0.0
+        self.end = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _SimCondition(threading.Condition):
+    """Attente simulée : une attente bornée avance la fausse horloge au lieu
+    de dormir ; au-delà de la fenêtre (ou sans échéance), la mesure s'arrête."""
+
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def wait(self, timeout=None):
+        if timeout is None or self._clock.now + timeout > self._clock.end:
+            raise _WindowOver
+        self._clock.now += timeout
+        return False
+
+
+def _simulated_scheduler():
+    clock = _SimClock()
+    scheduler = TimerScheduler(clock=clock)
+    scheduler._cond = _SimCondition(clock)
+    # Pas de thread : _drive exécute la boucle dans le thread du test.
+    scheduler._thread = threading.current_thread()
+    return scheduler, clock
+
+
+def _drive(scheduler, clock, window):
+    """Exécute l'ordonnanceur sur ``window`` secondes simulées ; renvoie le
+    nombre de réveils."""
+    clock.end = clock.now + window
+    before = scheduler.wakeups
+    try:
+        scheduler._run()
+    except _WindowOver:
+        pass
+    return scheduler.wakeups - before
+
+
+class _Sampler:
+    def sample(self):
+        return {'renderer_rss_mb': 100.0, 'renderers': 1, 'cpu_seconds': 0}
+
+
+def test_idle_kiosk_wakeups_per_minute(monkeypatch):
+    class _Settings:
+        check_paper = False
+        borne_id = 'test-borne'
+
+    class _Config:
+        settings = _Settings()
+
+    monkeypatch.setattr(printer_module, 'Config', _Config)
+    session = _Session()
+    scheduler, clock = _simulated_scheduler()
+
+    def status_delivery(*args, **kwargs):
+        return printer_module.PrinterStatusThread(*args, session=session, **kwargs)
+
+    p = Printer('0x04b8', '0x0202', 'TM-T88II', 'http://srv', 'tok',
+                device_factory=lambda *a: _Device(), status_delivery=status_delivery,
+                scheduler=scheduler)
+    link = PeerLink('test-borne', 'secret', p.print, p.health, 0, discovery=False,
+                    bind_host='127.0.0.1', scheduler=scheduler)
+    page = RendererSupervisor(lambda script: {'idle_ms': 10 * 60 * 1000, 'busy': False},
+                              lambda: None, lambda: False, lambda: True,
+                              sampler=_Sampler(), scheduler=scheduler)
+    link.start()
+    page.start()
+    try:
+        # Statut d'initialisation envoyé, puis plus rien : borne au repos.
+        assert _wait(lambda: session.posts)
+        # Imprimante connectée : aucune temporisation de reconnexion.
+        assert scheduler.pending() == 2
+
+        wakeups = _drive(scheduler, clock, IDLE_WINDOW)
+
+        # Le thread de statut attend la pulsation (5 min) sans se réveiller.
+        assert p.status_thread.wakeups == 0
+    finally:
+        page.stop()
+        link.stop()
+        p.cleanup()
+
+    assert clock.now == IDLE_WINDOW
+    assert 0 < wakeups <= MAX_IDLE_WAKEUPS_PER_MINUTE * IDLE_WINDOW / 60
+    assert len(session.posts) == 1
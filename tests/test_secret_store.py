@@ -4,7 +4,9 @@ Vérifie, sans toucher au vrai gestionnaire d'identifiants du système :
 - ``store_secrets`` renvoie ``False`` (sans rien écrire) quand aucun magasin
   sécurisé n'est disponible — pas de repli silencieux ;
 - aller-retour store/load lorsque le magasin est disponible ;
-- ``load_secrets`` omet les valeurs vides.
+- ``load_secrets`` omet les valeurs vides ;
+- token d'application conservé : aller-retour, serveur différent ou token
+  expiré ignorés, rien d'écrit sans magasin sécurisé.
 
 On monkeypatche la couche interne (available/get_secret/set_secret) pour ne
 jamais dépendre d'un backend réel.
@@ -79,3 +81,26 @@ def test_store_secrets_ignores_unknown_fields(fake_store):
     store_secrets({"password": "pw", "not_a_secret": "x"})
     assert "not_a_secret" not in fake_store
     assert fake_store.get("password") == "pw"
+
+
+def test_app_token_roundtrip_and_clear(fake_store):
+    assert secret_store.store_app_token("https://srv", "tok", 1_000_600) is True
+    assert "tok" in fake_store[secret_store.APP_TOKEN_ENTRY]
+
+    assert secret_store.load_app_token("https://srv", now=lambda: 1_000_000) == ("tok", 600)
+    secret_store.clear_app_token()
+    assert secret_store.load_app_token("https://srv") is None
+
+
+def test_app_token_ignored_for_other_server_expired_or_corrupt(fake_store):
+    secret_store.store_app_token("https://srv", "tok", 1_000_600)
+
+    assert secret_store.load_app_token("https://autre", now=lambda: 1_000_000) is None
+    assert secret_store.load_app_token("https://srv", now=lambda: 1_000_601) is None
+    fake_store[secret_store.APP_TOKEN_ENTRY] = "{pas du json"
+    assert secret_store.load_app_token("https://srv") is None
+
+
+def test_app_token_not_stored_without_secure_store(unavailable):
+    assert secret_store.store_app_token("https://srv", "tok", 1_000_600) is False
+    assert unavailable["set"] == 0
@@ -0,0 +1,150 @@
+"""Tests de la boîte d'envoi persistante des statuts (status_outbox).
+
+Couvre :
+- persistance et ordre des statuts (y compris après réouverture du fichier) ;
+- occupation bornée (les plus anciens sont abandonnés et comptés) ;
+- envoi par lots gzip par le thread de statut, avec curseur acquitté ;
+- statuts conservés si le serveur est injoignable ;
+- repli statut par statut si le serveur ne connaît pas la route /batch.
+"""
+import gzip
+import json
+import queue
+import time
+
+from printer import PrinterStatusThread
+from status_outbox import StatusOutbox, encode_batch
+
+
+def _status(code):
+    return {'error': code, 'message': code, 'borne_id': 'b1'}
+
+
+def test_append_pending_ack_roundtrip_and_persistence(tmp_path):
+    path = tmp_path / "outbox.sqlite3"
+    outbox = StatusOutbox(path)
+    seqs = [outbox.append(_status(code)) for code in ('no_paper', 'paper_ok', 'low_paper')]
+    outbox.ack(seqs[0])
+    outbox.close()
+
+    reopened = StatusOutbox(path)
+    pending = reopened.pending()
+    assert [item['error'] for _, item in pending] == ['paper_ok', 'low_paper']
+    assert [seq for seq, _ in pending] == seqs[1:]
+    reopened.close()
+
+
+def test_outbox_is_bounded(tmp_path):
+    outbox = StatusOutbox(tmp_path / "o.sqlite3", max_events=3)
+    for i in range(5):
+        outbox.append(_status(f"s{i}"))
+
+    assert outbox.count() == 3
+    assert outbox.dropped == 2
+    assert [item['error'] for _, item in outbox.pending()] == ['s2', 's3', 's4']
+
+
+def test_encode_batch_is_gzip_json():
+    body = encode_batch('b1', [(7, _status('no_paper'))])
+    decoded = json.loads(gzip.decompress(body))
+    assert decoded == {'borne_id': 'b1',
+                       'events': [dict(_status('no_paper'), seq=7)]}
+
+
+class _Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("pas de JSON")
+        return self._body
+
+
+class _Session:
+    """Serveur factice : ``handler(url, kwargs) -> _Response``."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+
+    def post(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        return self.handler(url, kwargs)
+
+    def close(self):
+        pass
+
+
+def _run_until(thread, predicate, timeout=5):
+    thread.start()
+    try:
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        thread.stop()
+        thread.join(timeout=2)
+
+
+def _thread(outbox, session, status_queue=None):
+    return PrinterStatusThread('http://srv/api/printer/status', {'X-App-Token': 't'},
+                               status_queue or queue.Queue(), session=session,
+                               outbox=outbox)
+
+
+def test_backlog_is_uploaded_as_one_compressed_batch(tmp_path):
+    outbox = StatusOutbox(tmp_path / "o.sqlite3")
+    for code in ('no_paper', 'paper_ok', 'low_paper'):
+        outbox.append(_status(code))
+    session = _Session(lambda url, kw: _Response(200, {'ack': 3}))
+
+    _run_until(_thread(outbox, session), lambda: outbox.count() == 0)
+
+    assert outbox.count() == 0
+    [(url, kwargs)] = session.calls
+    assert url == 'http://srv/api/printer/status/batch'
+    assert kwargs['headers']['Content-Encoding'] == 'gzip'
+    events = json.loads(gzip.decompress(kwargs['data']))['events']
+    assert [e['error'] for e in events] == ['no_paper', 'paper_ok', 'low_paper']
+
+
+def test_partial_ack_keeps_unacknowledged_events(tmp_path):
+    outbox = StatusOutbox(tmp_path / "o.sqlite3")
+    for code in ('a', 'b', 'c'):
+        outbox.append(_status(code))
+    acks = iter([{'ack': 1}, {'ack': 3}])
+    session = _Session(lambda url, kw: _Response(200, next(acks)))
+
+    _run_until(_thread(outbox, session), lambda: outbox.count() == 0)
+
+    assert len(session.calls) == 2
+    second = json.loads(gzip.decompress(session.calls[1][1]['data']))['events']
+    assert [e['error'] for e in second] == ['b', 'c']
+
+
+def test_server_down_keeps_every_event(tmp_path):
+    outbox = StatusOutbox(tmp_path / "o.sqlite3")
+    for code in ('no_paper', 'paper_ok'):
+        outbox.append(_status(code))
+    session = _Session(lambda url, kw: _Response(503))
+
+    _run_until(_thread(outbox, session), lambda: len(session.calls) >= 1)
+
+    assert outbox.count() == 2
+
+
+def test_falls_back_to_single_posts_without_batch_route(tmp_path):
+    outbox = StatusOutbox(tmp_path / "o.sqlite3")
+    for code in ('no_paper', 'paper_ok'):
+        outbox.append(_status(code))
+
+    def handler(url, kwargs):
+        return _Response(404) if url.endswith('/batch') else _Response(200)
+
+    session = _Session(handler)
+    _run_until(_thread(outbox, session), lambda: outbox.count() == 0)
+
+    singles = [kw['json']['error'] for url, kw in session.calls if not url.endswith('/batch')]
+    assert singles == ['no_paper', 'paper_ok']
@@ -0,0 +1,213 @@
+"""Tests de la délivrance locale des numéros de ticket (ticket_lease).
+
+Le serveur est simulé par une session factice. Couvre :
+- délivrance dans l'ordre du bloc, persistance après réouverture du fichier ;
+- blocs expirés (ou dans la marge d'expiration) ignorés puis purgés ;
+- location d'un bloc au démarrage, délivrance sans appel réseau, remontées
+  regroupées et acquittées, renouvellement du bloc quand il s'épuise ;
+- nombre de services suivis borné ;
+- délivrance poursuivie pendant une coupure, remontée au retour du serveur ;
+- serveur sans location de blocs : délivrance locale désactivée.
+"""
+import threading
+import time
+
+import pytest
+
+import ticket_lease
+from config import Settings
+from ticket_lease import TicketAPI, TicketLeaser, TicketLeaseStore
+
+
+class _Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("pas de JSON")
+        return self._body
+
+
+class _Server:
+    """Serveur de tickets factice : loue des blocs consécutifs et enregistre
+    les numéros remontés."""
+
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.next_number = 100
+        self.leases = []
+        self.reports = []
+        self.down = False
+        self.status = None
+        self.lock = threading.Lock()
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        with self.lock:
+            if self.down:
+                raise ConnectionError("down")
+            if self.status:
+                return _Response(self.status)
+            if url.endswith('/api/tickets/lease'):
+                first = self.next_number
+                self.next_number += json['count']
+                self.leases.append(json)
+                return _Response(200, {'lease_id': f'L{len(self.leases)}', 'first': first,
+                                       'last': self.next_number - 1,
+                                       'expires_in': self.expires_in})
+            if url.endswith('/api/tickets/issued'):
+                self.reports.append(json)
+                return _Response(200, {'ack': json['tickets'][-1]['seq']})
+            return _Response(404)
+
+    def head(self, url, **kwargs):
+        return _Response(200)
+
+    def reported(self):
+        return [t['number'] for report in self.reports for t in report['tickets']]
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def server():
+    return _Server()
+
+
+@pytest.fixture
+def core_session(server):
+    return server
+
+
+@pytest.fixture
+def services():
+    """Services loués dès le démarrage."""
+    return ['A']
+
+
+@pytest.fixture
+def leaser(core, services, tmp_path, monkeypatch):
+    monkeypatch.setattr(ticket_lease, 'REPORT_DELAY', 0.05)
+    core.tokens.seed('tok')
+    store = TicketLeaseStore(tmp_path / "lease.sqlite3")
+    leaser = TicketLeaser(core, store, 'b1', services=services, block_size=8)
+    yield leaser
+    # Boucle réseau arrêtée avant la fermeture du stockage.
+    core.stop()
+    leaser.close()
+
+
+def test_store_issues_in_order_and_persists(tmp_path):
+    path = tmp_path / "lease.sqlite3"
+    store = TicketLeaseStore(path)
+    store.add_block('A', 'L1', 10, 12, expires_at=1000)
+
+    assert store.take('A', 0, 0)[0]['number'] == 10
+    ticket, remaining = store.take('A', 0, 0)
+    assert ticket == {'service': 'A', 'number': 11, 'lease_id': 'L1', 'issued_at': 0}
+    assert remaining == 1
+    store.close()
+
+    reopened = TicketLeaseStore(path)
+    assert reopened.take('A', 0, 0)[0]['number'] == 12
+    assert reopened.take('A', 0, 0) is None
+    assert reopened.take('B', 0, 0) is None
+    assert [t['number'] for _, t in reopened.pending()] == [10, 11, 12]
+    reopened.close()
+
+
+def test_store_skips_expiring_blocks_and_purges_expired(tmp_path):
+    store = TicketLeaseStore(tmp_path / "lease.sqlite3")
+    store.add_block('A', 'old', 1, 5, expires_at=100)
+    store.add_block('A', 'new', 6, 10, expires_at=500)
+
+    # Bloc « old » dans la marge d'expiration : on passe au suivant.
+    assert store.take('A', valid_after=120, issued_at=90)[0]['lease_id'] == 'new'
+    assert store.remaining('A', 0) == 9
+
+    assert store.purge(now=200) == 5
+    assert store.remaining('A', 0) == 4
+    store.close()
+
+
+def test_tickets_issued_locally_and_reported_in_batches(leaser, server):
+    leaser.start()
+    assert _wait(lambda: len(server.leases) == 1)
+    assert server.leases[0] == {'borne_id': 'b1', 'service': 'A', 'count': 8}
+
+    numbers = [leaser.issue('A')['number'] for _ in range(3)]
+    assert numbers == [100, 101, 102]
+    assert _wait(lambda: server.reported() == numbers)
+    # Numéros délivrés en rafale : une seule remontée.
+    assert len(server.reports) == 1
+    assert server.reports[0]['borne_id'] == 'b1'
+    assert _wait(lambda: leaser.stats()['pending_reports'] == 0)
+
+    # Sous le seuil (8 // 4 = 2 restants) : un nouveau bloc est loué.
+    for _ in range(4):
+        leaser.issue('A')
+    assert _wait(lambda: len(server.leases) == 2)
+    assert [leaser.issue('A')['number'] for _ in range(3)] == [107, 108, 109]
+
+
+@pytest.mark.parametrize('services', [[]])
+def test_unknown_service_leased_on_first_request(leaser, server):
+    leaser.start()
+    api = TicketAPI()
+    api.set_leaser(leaser)
+
+    first = api.issue_ticket(7)
+    assert first['success'] is False and first['code'] == 'no_ticket_block'
+    assert _wait(lambda: [lease['service'] for lease in server.leases] == ['7'])
+    issued = api.issue_ticket(7)
+    assert issued['success'] is True and issued['code'] == 'ticket_issued'
+    assert issued['service'] == '7' and issued['number'] == 100
+
+
+def test_tracked_services_are_capped(leaser, monkeypatch):
+    monkeypatch.setattr(ticket_lease, 'MAX_TRACKED_SERVICES', 2)
+
+    leaser.issue('B')
+    result = leaser.issue('C')
+
+    assert result['code'] == 'no_ticket_block'
+    assert leaser._services == {'A', 'B'}
+    assert leaser.stats()['misses'] == 2
+
+
+def test_issuing_continues_during_outage(leaser, server):
+    leaser.start()
+    assert _wait(lambda: len(server.leases) == 1)
+
+    server.down = True
+    assert [leaser.issue('A')['success'] for _ in range(3)] == [True] * 3
+    time.sleep(0.2)
+    assert leaser.stats()['pending_reports'] == 3
+
+    server.down = False
+    assert _wait(lambda: server.reported() == [100, 101, 102], timeout=10)
+
+
+def test_server_without_leasing_disables_it(leaser, server):
+    server.status = 404
+    leaser.start()
+
+    assert _wait(lambda: not leaser.enabled)
+    assert leaser.issue('A')['code'] == 'no_ticket_block'
+
+
+def test_api_without_leaser():
+    assert TicketAPI().issue_ticket('A')['code'] == 'error_not_initialized'
+
+
+def test_settings_validation():
+    assert not [e for e in Settings().validate() if 'ticket_' in e]
+    errors = Settings(ticket_leasing='oui', ticket_lease_services='A',
+                      ticket_lease_block_size=0).validate()
+    assert len([e for e in errors if 'ticket_' in e]) == 3
@@ -0,0 +1,105 @@
+"""Tests de la durée de vie du token et de la planification de son
+renouvellement (token_manager).
+
+Couvre :
+- lecture de ``expires_in`` puis de ``exp`` (JWT), repli sur 24 h ;
+- échéance à la fraction configurée, avancée d'un décalage aléatoire qui
+  étale les renouvellements de bornes démarrées ensemble ;
+- comptage des 401 (avant / après l'échéance planifiée) ;
+- validation du réglage ``token_refresh_percent``.
+"""
+import asyncio
+import base64
+import json
+import random
+
+from config import Settings
+from token_manager import (
+    DEFAULT_TOKEN_LIFETIME,
+    TOKEN_REFRESH_JITTER,
+    TokenManager,
+    TokenStats,
+    refresh_delay,
+    token_lifetime,
+)
+
+
+def _jwt(claims):
+    def segment(data):
+        raw = json.dumps(data).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+    return f"{segment({'alg': 'HS256'})}.{segment(claims)}.signature"
+
+
+def test_lifetime_from_expires_in_first():
+    body = {'token': _jwt({'exp': 2000}), 'expires_in': 3600}
+    assert token_lifetime(body, body['token'], now=lambda: 1000) == (3600, 'expires_in')
+
+
+def test_lifetime_from_jwt_exp():
+    token = _jwt({'exp': 1000 + 7200})
+    assert token_lifetime({'token': token}, token, now=lambda: 1000) == (7200, 'jwt')
+
+
+def test_lifetime_defaults_for_opaque_or_expired_token():
+    assert token_lifetime({'token': 'opaque'}, 'opaque') == (DEFAULT_TOKEN_LIFETIME, 'default')
+    expired = _jwt({'exp': 10})
+    assert token_lifetime({}, expired, now=lambda: 1000) == (DEFAULT_TOKEN_LIFETIME, 'default')
+    for bad in (0, -5, True, "abc", None):
+        assert token_lifetime({'expires_in': bad}, 'opaque')[1] == 'default'
+
+
+def test_refresh_delay_is_a_jittered_fraction_of_lifetime():
+    rng = random.Random(1)
+    lifetime = 10000
+    delays = [refresh_delay(lifetime, 80, rng) for _ in range(200)]
+
+    assert all(lifetime * (0.8 - TOKEN_REFRESH_JITTER) <= d <= lifetime * 0.8 for d in delays)
+    # Des bornes démarrées ensemble ne renouvellent pas au même instant.
+    assert max(delays) - min(delays) > lifetime * TOKEN_REFRESH_JITTER / 2
+
+
+def test_refresh_delay_stays_before_expiry_for_short_tokens():
+    assert 0 < refresh_delay(30, 95, random.Random(0)) < 30
+
+
+def test_stats_count_early_and_late_401():
+    now = [0.0]
+    stats = TokenStats(clock=lambda: now[0])
+    stats.token_obtained(1000, 'expires_in', 800)
+
+    now[0] = 100
+    stats.note_unauthorized()  # avant l'échéance : token expiré trop tôt
+    now[0] = 900
+    stats.note_unauthorized()
+
+    snapshot = stats.snapshot()
+    assert snapshot['unauthorized'] == 2
+    assert snapshot['unauthorized_early'] == 1
+    assert snapshot['last_401_token_age'] == 900
+    assert snapshot['lifetime_source'] == 'expires_in'
+
+
+def test_seeded_token_is_used_then_replaced_by_a_fetch():
+    fetched = []
+
+    async def fetch():
+        fetched.append(1)
+        return {'token': 'fresh'}
+
+    manager = TokenManager(fetch)
+    manager.seed('kept')
+    assert manager.token == 'kept' and manager.restored
+    assert not manager.is_fresh()
+
+    # Un 401 juste après le démarrage : nouvelle requête malgré l'intervalle minimal.
+    assert asyncio.run(manager.get(force=True)) == 'fresh'
+    assert fetched == [1]
+    assert not manager.restored and manager.is_fresh()
+
+
+def test_settings_token_refresh_percent_validation():
+    assert not [e for e in Settings().validate() if 'token_refresh_percent' in e]
+    for bad in (5, 99, "80", True):
+        assert [e for e in Settings(token_refresh_percent=bad).validate()
+                if 'token_refresh_percent' in e]
@@ -0,0 +1,62 @@
+"""Tests du profil de performance du moteur web (webengine_profile).
+
+Couvre :
+- préréglages et surcharges -> drapeaux Chromium ;
+- drapeaux ajoutés à ceux déjà présents dans l'environnement ;
+- cache disque (jamais par préréglage) : session non privée et répertoire de stockage ;
+- préréglage « default » sans effet ;
+- validation des réglages.
+"""
+from config import Settings
+from webengine_profile import (PRESETS, apply_profile, chromium_flags, describe,
+                               resolve_profile)
+
+
+def test_presets_translate_to_chromium_flags():
+    pi = chromium_flags(resolve_profile('raspberry_pi', {}))
+    assert '--disable-gpu' in pi and '--num-raster-threads=2' in pi
+    assert '--process-per-site' in pi and '--touch-events=enabled' in pi
+    x86 = chromium_flags(resolve_profile('x86', {'raster_threads': 3, 'touch': False}))
+    assert '--enable-gpu-rasterization' in x86 and '--num-raster-threads=3' in x86
+    assert '--touch-events=disabled' in x86 and '--disable-gpu' not in x86
+    # Pas de cache disque (session non privée) sans demande explicite.
+    assert not [flag for flag in pi + x86 if flag.startswith('--disk-cache-size')]
+    cached = chromium_flags(resolve_profile('x86', {'disk_cache_mb': 256}))
+    assert f'--disk-cache-size={256 * 1024 * 1024}' in cached
+
+
+def test_default_profile_changes_nothing(tmp_path):
+    environ = {}
+    profile, start_kwargs = apply_profile('default', {}, tmp_path, environ)
+    assert profile == {} and start_kwargs == {} and environ == {}
+    assert 'default' in describe('default', profile)
+
+
+def test_apply_profile_sets_environment_and_cache(tmp_path):
+    environ = {'QTWEBENGINE_CHROMIUM_FLAGS': '--enable-logging --disable-gpu'}
+    profile, start_kwargs = apply_profile('raspberry_pi',
+                                          {'disk_cache_mb': 64, 'cache_dir': str(tmp_path / 'c')},
+                                          tmp_path, environ)
+    flags = environ['QTWEBENGINE_CHROMIUM_FLAGS'].split()
+    assert flags[:2] == ['--enable-logging', '--disable-gpu']
+    assert flags.count('--disable-gpu') == 1
+    assert start_kwargs == {'private_mode': False, 'storage_path': str(tmp_path / 'c')}
+    assert (tmp_path / 'c').is_dir()
+    assert 'GPU désactivé' in describe('raspberry_pi', profile)
+
+    _, in_memory = apply_profile('x86', {}, tmp_path, {})
+    assert in_memory == {}
+
+
+def test_settings_validation():
+    assert not [e for e in Settings().validate() if 'profil' in e]
+    for name in PRESETS:
+        assert not [e for e in Settings(webengine_profile=name).validate() if 'profil' in e]
+    errors = Settings(webengine_profile='pi',
+                      webengine_overrides={'gpu': 'oui', 'raster_threads': 8,
+                                           'process_model': 'un', 'zoom': 2}).validate()
+    assert len([e for e in errors if 'profil' in e]) == 5
+    assert [e for e in Settings(webengine_overrides={'process_model': 'single-process'})
+            .validate() if 'profil' in e]
+    assert any('webengine_overrides' in e
+               for e in Settings(webengine_overrides=[]).validate())
@@ -0,0 +1,463 @@
+# ticket_lease.py
+"""Numéros de ticket délivrés localement, par blocs loués au serveur.
+
+Sans ce module, chaque inscription attend un aller-retour avec le serveur
+avant l'impression, et une borne qui ne le joint plus ne délivre plus rien.
+:class:`TicketLeaser` loue à l'avance, pour chaque service, un petit bloc de
+numéros consécutifs (``POST {base_url}/api/tickets/lease``) :
+
+- un numéro est pris localement dans le bloc courant (:meth:`TicketLeaser.issue`,
+  exposé à la page par :class:`TicketAPI`), sans appel réseau ;
+- les numéros délivrés sont remontés par lots (``POST
+  {base_url}/api/tickets/issued``) ; le serveur acquitte le dernier numéro de
+  séquence enregistré (même curseur ``ack`` que la boîte d'envoi des statuts) ;
+- un bloc est renouvelé en arrière-plan dès qu'il en reste moins de
+  ``low_watermark`` numéros, ou qu'il approche de l'expiration du bail.
+
+Un bail expiré est abandonné (le serveur récupère ses numéros inutilisés) :
+aucun numéro n'est délivré moins de ``LEASE_EXPIRY_MARGIN`` secondes avant
+l'expiration. Blocs et numéros non acquittés sont conservés sur disque
+(SQLite) : un redémarrage ne délivre jamais deux fois le même numéro et ne
+perd aucune remontée. Une borne coupée du serveur continue de délivrer tant
+que ses blocs restent valables ; sans numéro disponible, la page se replie
+sur l'inscription par le serveur.
+
+Un serveur qui ne connaît pas ces routes (404/405/501) désactive la
+délivrance locale.
+"""
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from network_core import TokenError
+from printer import NETWORK_TIMEOUT, STATUS_BACKOFF_MAX, STATUS_BACKOFF_START
+
+logger = logging.getLogger("borne.tickets")
+
+LEASE_FILENAME = "ticket_lease.sqlite3"
+
+# Numéros demandés par bloc.
+LEASE_BLOCK_SIZE = 20
+# Aucun numéro n'est délivré moins de N secondes avant l'expiration du bail :
+# le numéro doit être remonté avant que le serveur ne le réattribue.
+LEASE_EXPIRY_MARGIN = 30
+# Regroupement des remontées : un numéro délivré est remonté au plus tard
+# après N secondes, avec ceux délivrés entre-temps.
+REPORT_DELAY = 2
+# Nombre max de numéros par remontée.
+REPORT_BATCH_SIZE = 200
+# Contrôle périodique des baux (expiration) en l'absence d'activité.
+LEASE_CHECK_INTERVAL = 60
+# Services suivis au plus (configurés + demandés par la page) : au-delà, un
+# nouveau service passe par l'inscription serveur, sans bloc loué.
+MAX_TRACKED_SERVICES = 32
+
+
+class TicketLeaseStore:
+    """Blocs loués et numéros délivrés non acquittés (SQLite, sûr entre
+    threads)."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS blocks ("
+            " lease_id TEXT PRIMARY KEY,"
+            " service TEXT NOT NULL,"
+            " next INTEGER NOT NULL,"
+            " last INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS issued ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL)")
+
+    def add_block(self, service, lease_id, first, last, expires_at):
+        """Enregistre un bloc loué (un bail déjà connu est ignoré)."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO blocks (lease_id, service, next, last, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)", (lease_id, service, first, last, expires_at))
+
+    def take(self, service, valid_after, issued_at):
+        """Délivre le prochain numéro de ``service`` depuis le bloc valable
+        (expiration postérieure à ``valid_after``) qui expire le premier, et
+        l'inscrit dans les numéros à remonter, en une transaction. Renvoie
+        ``(ticket, restants)`` ou None si aucun numéro n'est disponible."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT lease_id, next FROM blocks"
+                    " WHERE service = ? AND next <= last AND expires_at > ?"
+                    " ORDER BY expires_at, lease_id LIMIT 1",
+                    (service, valid_after)).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                lease_id, number = row
+                self._db.execute("UPDATE blocks SET next = next + 1 WHERE lease_id = ?",
+                                 (lease_id,))
+                ticket = {'service': service, 'number': number, 'lease_id': lease_id,
+                          'issued_at': issued_at}
+                self._db.execute("INSERT INTO issued (payload) VALUES (?)",
+                                 (json.dumps(ticket, separators=(',', ':'),
+                                             ensure_ascii=False),))
+                remaining = self._remaining(service, valid_after)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return ticket, remaining
+
+    def _remaining(self, service, valid_after):
+        return self._db.execute(
+            "SELECT COALESCE(SUM(last - next + 1), 0) FROM blocks"
+            " WHERE service = ? AND next <= last AND expires_at > ?",
+            (service, valid_after)).fetchone()[0]
+
+    def remaining(self, service, valid_after):
+        """Numéros encore disponibles pour ``service``."""
+        with self._lock:
+            return self._remaining(service, valid_after)
+
+    def next_expiry(self):
+        """Expiration la plus proche d'un bloc non épuisé, ou None."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT MIN(expires_at) FROM blocks WHERE next <= last").fetchone()[0]
+
+    def purge(self, now):
+        """Supprime les blocs épuisés ou expirés ; renvoie le nombre de
+        numéros perdus (inutilisés dans un bloc expiré)."""
+        with self._lock:
+            lost = self._db.execute(
+                "SELECT COALESCE(SUM(last - next + 1), 0) FROM blocks"
+                " WHERE next <= last AND expires_at <= ?", (now,)).fetchone()[0]
+            self._db.execute("DELETE FROM blocks WHERE next > last OR expires_at <= ?",
+                             (now,))
+        return lost
+
+    def pending(self, limit=REPORT_BATCH_SIZE):
+        """Les plus anciens numéros non acquittés : liste de ``(seq, ticket)``."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, payload FROM issued ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def count_pending(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM issued").fetchone()[0]
+
+    def ack(self, up_to_seq):
+        """Supprime les numéros acquittés (séquence <= ``up_to_seq``)."""
+        with self._lock:
+            self._db.execute("DELETE FROM issued WHERE seq <= ?", (up_to_seq,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class TicketLeaser:
+    """Délivrance locale des numéros de ticket ; location des blocs et
+    remontées par la boucle réseau (``core`` : ``network_core.NetworkCore``).
+
+    ``services`` : services dont un bloc est loué dès le démarrage ; un
+    service demandé à :meth:`issue` est ajouté aux services suivis (au plus
+    ``MAX_TRACKED_SERVICES``)."""
+
+    def __init__(self, core, store, borne_id, services=(), block_size=LEASE_BLOCK_SIZE,
+                 clock=time.time):
+        self._core = core
+        self._store = store
+        self._borne_id = borne_id
+        self._block_size = block_size
+        self._low_watermark = max(1, block_size // 4)
+        self._clock = clock
+        self._lease_url = f'{core.base_url}/api/tickets/lease'
+        self._report_url = f'{core.base_url}/api/tickets/issued'
+        self._services = {str(service) for service in services}
+        self._services_lock = threading.Lock()
+        self._wake = asyncio.Event()
+        self._report_handle = None
+        self._future = None
+        # Faux si le serveur ne gère pas la location de blocs.
+        self.enabled = True
+        # Compteurs (diagnostic, joints aux métriques de pulsation), mis à
+        # jour depuis le pont JavaScript et la boucle réseau.
+        self._stats_lock = threading.Lock()
+        self.issued = 0
+        self.misses = 0
+        self.leased = 0
+        self.lost = 0
+
+    def start(self):
+        self._future = self._core.submit(self._run())
+
+    def close(self):
+        """Ferme le stockage (après l'arrêt de la boucle réseau)."""
+        self._store.close()
+
+    # ------------------------------------------------------------------
+    # Délivrance (pont JavaScript, n'importe quel thread)
+    # ------------------------------------------------------------------
+    def issue(self, service):
+        """Délivre localement le prochain numéro de ``service``. Renvoie
+        ``{'success', 'code', 'message'}`` complété, en cas de succès, de
+        ``service``, ``number`` et ``lease_id``."""
+        service = str(service)
+        if not self.enabled:
+            return self._miss()
+        with self._services_lock:
+            tracked = service in self._services
+            if not tracked and len(self._services) < MAX_TRACKED_SERVICES:
+                self._services.add(service)
+                tracked = True
+        if not tracked:
+            logger.warning("Service %s non suivi (%d services au plus) : inscription "
+                           "par le serveur.", service, MAX_TRACKED_SERVICES)
+            with self._stats_lock:
+                self.misses += 1
+            return self._miss()
+        now = self._clock()
+        taken = self._store.take(service, now + LEASE_EXPIRY_MARGIN, now)
+        if taken is None:
+            with self._stats_lock:
+                self.misses += 1
+            logger.info("Aucun numéro disponible localement pour le service %s.", service)
+            self._core.loop.call_soon_threadsafe(self._wake.set)
+            return self._miss()
+        ticket, remaining = taken
+        with self._stats_lock:
+            self.issued += 1
+        logger.info("Numéro %s délivré localement (service %s, %d restant(s)).",
+                    ticket['number'], service, remaining)
+        if remaining < self._low_watermark:
+            self._core.loop.call_soon_threadsafe(self._wake.set)
+        else:
+            self._core.loop.call_soon_threadsafe(self._schedule_report)
+        return {
+            'success': True,
+            'code': 'ticket_issued',
+            'message': "Numéro de ticket délivré.",
+            'service': service,
+            'number': ticket['number'],
+            'lease_id': ticket['lease_id'],
+        }
+
+    @staticmethod
+    def _miss():
+        return {
+            'success': False,
+            'code': 'no_ticket_block',
+            'message': "Aucun numéro disponible localement : inscription par le serveur.",
+        }
+
+    def _schedule_report(self):
+        # Remontée regroupée : un seul réveil pour les numéros délivrés
+        # pendant REPORT_DELAY secondes.
+        if self._report_handle is None or self._report_handle.cancelled():
+            self._report_handle = self._core.loop.call_later(REPORT_DELAY, self._wake.set)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {'enabled': self.enabled, 'issued': self.issued, 'misses': self.misses,
+                     'leased': self.leased, 'lost': self.lost}
+        stats['pending_reports'] = self._store.count_pending()
+        return stats
+
+    # ------------------------------------------------------------------
+    # Location et remontées (boucle réseau)
+    # ------------------------------------------------------------------
+    async def _run(self):
+        backoff = STATUS_BACKOFF_START
+        token_retries = 0
+        while True:
+            if self._report_handle is not None:
+                self._report_handle.cancel()
+                self._report_handle = None
+            self._wake.clear()
+            try:
+                result = await self._core.run_blocking(self._sync)
+            except asyncio.TimeoutError:
+                result = 'fail'
+
+            if result == 'unsupported':
+                self.enabled = False
+                logger.info("Location de blocs de tickets non prise en charge par le "
+                            "serveur : délivrance locale désactivée.")
+                return
+            if result == 'ok':
+                backoff = STATUS_BACKOFF_START
+                token_retries = 0
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self._next_check())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if result == 'unauthorized' and token_retries < 1:
+                token_retries += 1
+                self._core.note_unauthorized()
+                try:
+                    await self._core.get_app_token(force=True)
+                    continue
+                except TokenError:
+                    pass
+
+            token_retries = 0
+            await asyncio.sleep(self._retry_delay(backoff))
+            backoff = min(backoff * 2, STATUS_BACKOFF_MAX)
+
+    def _next_check(self):
+        """Délai avant le prochain contrôle : au plus tard quand le premier
+        bloc entre dans la marge d'expiration."""
+        expiry = self._store.next_expiry()
+        if expiry is None:
+            return LEASE_CHECK_INTERVAL
+        delay = expiry - LEASE_EXPIRY_MARGIN - self._clock()
+        return min(max(delay, 1.0), LEASE_CHECK_INTERVAL)
+
+    def _retry_delay(self, backoff):
+        """Backoff avec jitter, porté au maximum si le budget de réessais
+        commun est épuisé, et jamais avant la réouverture des routes."""
+        guard = self._core.guard
+        delay = min(backoff, STATUS_BACKOFF_MAX)
+        if not guard.allow_retry():
+            delay = STATUS_BACKOFF_MAX
+        delay += random.uniform(0, delay * 0.5)  # jitter
+        return max(delay, guard.retry_in(self._report_url), guard.retry_in(self._lease_url))
+
+    def _sync(self):
+        """Remonte les numéros délivrés puis complète les blocs des services
+        suivis (bloquant, exécuté hors de la boucle). Renvoie 'ok',
+        'unauthorized', 'fail' ou 'unsupported'."""
+        now = self._clock()
+        lost = self._store.purge(now)
+        if lost:
+            with self._stats_lock:
+                self.lost += lost
+            logger.warning("Bail expiré : %d numéro(s) inutilisé(s) rendu(s) au serveur.",
+                           lost)
+        result = self._flush_reports()
+        if result != 'ok':
+            return result
+        with self._services_lock:
+            services = sorted(self._services)
+        for service in services:
+            if self._store.remaining(service, now + LEASE_EXPIRY_MARGIN) < self._low_watermark:
+                result = self._lease(service)
+                if result != 'ok':
+                    return result
+        return 'ok'
+
+    def _post(self, url, payload, what):
+        """POST authentifié ; renvoie ``(résultat, corps JSON ou None)``."""
+        headers = {'X-App-Token': self._core.app_token or '',
+                   'Content-Type': 'application/json'}
+        try:
+            response = self._core.session.post(url, json=payload, headers=headers,
+                                               timeout=NETWORK_TIMEOUT)
+        except Exception as e:
+            logger.warning("Échec %s : %s", what, e)
+            return 'fail', None
+        if response.status_code in (404, 405, 501):
+            return 'unsupported', None
+        if response.status_code == 401:
+            logger.info("%s : 401 (token expiré ?)", what.capitalize())
+            return 'unauthorized', None
+        if not 200 <= response.status_code < 300:
+            logger.warning("Échec %s (HTTP %s).", what, response.status_code)
+            return 'fail', None
+        try:
+            return 'ok', response.json()
+        except ValueError:
+            return 'ok', None
+
+    def _lease(self, service):
+        result, body = self._post(self._lease_url, {
+            'borne_id': self._borne_id, 'service': service, 'count': self._block_size,
+        }, "de la location d'un bloc de tickets")
+        if result != 'ok':
+            return result
+        try:
+            lease_id = str(body['lease_id'])
+            first, last = int(body['first']), int(body['last'])
+            expires_in = float(body['expires_in'])
+        except (TypeError, KeyError, ValueError):
+            logger.warning("Réponse de location de bloc invalide pour le service %s.", service)
+            return 'fail'
+        if last < first or expires_in <= LEASE_EXPIRY_MARGIN:
+            logger.warning("Bloc de tickets inutilisable pour le service %s.", service)
+            return 'fail'
+        self._store.add_block(service, lease_id, first, last, self._clock() + expires_in)
+        with self._stats_lock:
+            self.leased += 1
+        logger.info("Bloc de tickets loué : service %s, numéros %d à %d (bail %.0fs).",
+                    service, first, last, expires_in)
+        return 'ok'
+
+    def _flush_reports(self):
+        """Remonte les numéros délivrés (lots successifs). 'ok' une fois tout
+        acquitté."""
+        while True:
+            tickets = self._store.pending()
+            if not tickets:
+                return 'ok'
+            result, reply = self._post(self._report_url, {
+                'borne_id': self._borne_id,
+                'tickets': [dict(ticket, seq=seq) for seq, ticket in tickets],
+            }, "de la remontée des tickets délivrés")
+            if result != 'ok':
+                return result
+            # Curseur acquitté : par défaut tout le lot ; le serveur peut n'en
+            # acquitter qu'une partie (champ 'ack').
+            last_seq = tickets[-1][0]
+            ack = last_seq
+            if isinstance(reply, dict) and isinstance(reply.get('ack'), int):
+                ack = min(reply['ack'], last_seq)
+            self._store.ack(ack)
+            logger.debug("%d ticket(s) délivré(s) remonté(s) (acquitté jusqu'à %s).",
+                         len(tickets), ack)
+            if ack < tickets[0][0]:
+                return 'fail'
+
+
+class TicketAPI:
+    """API PyWebView de délivrance locale des numéros de ticket."""
+
+    def __init__(self):
+        self._leaser = None
+
+    def set_leaser(self, leaser):
+        self._leaser = leaser
+
+    def issue_ticket(self, service):
+        """Méthode exposée à JavaScript : numéro de ticket pour ``service``.
+
+        Même format de résultat que ``PrinterAPI.print_ticket`` ; en cas
+        d'échec, la page s'inscrit auprès du serveur comme auparavant."""
+        if self._leaser is None:
+            return {
+                'success': False,
+                'code': 'error_not_initialized',
+                'message': "Délivrance locale des tickets non activée.",
+            }
+        try:
+            return self._leaser.issue(service)
+        except Exception as e:
+            logger.error("Délivrance locale d'un ticket impossible : %s", e)
+            return {
+                'success': False,
+                'code': 'error_exception',
+                'message': f"Erreur de délivrance du ticket : {e}",
+            }
@@ -0,0 +1,246 @@
+# token_manager.py
+"""Token d'application : durée de vie, planification du renouvellement et
+obtention « single-flight ».
+
+Le serveur indique la durée de vie du token : champ ``expires_in`` (secondes)
+de la réponse de ``/api/get_app_token`` ou, à défaut, revendication ``exp``
+du token s'il s'agit d'un JWT. Le renouvellement est planifié à une fraction
+configurable de cette durée (réglage ``token_refresh_percent``), avancée d'un
+décalage aléatoire propre à chaque borne : des bornes démarrées en même temps
+ne renouvellent pas leur token au même instant.
+
+:class:`TokenManager` détient le token courant. Les demandes simultanées
+(boucle de renouvellement, 401 de l'envoi des statuts, supervision de
+l'initialisation) attendent UNE seule requête en cours et en partagent le
+résultat ; un token encore frais est servi depuis la mémoire, et un
+renouvellement forcé (401) n'est pas refait moins de
+``MIN_TOKEN_REFRESH_INTERVAL`` secondes après le précédent : une rafale de 401
+ne produit qu'une requête d'authentification. Un token conservé d'une
+exécution précédente (:meth:`TokenManager.seed`) est utilisé aussitôt et
+renouvelé dès que possible.
+
+:class:`TokenStats` compte les 401 reçus pour mesurer la qualité de la
+planification : un 401 avant l'échéance prévue signale un token expiré plus tôt
+que prévu (horloge, révocation, durée mal annoncée).
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger("borne.network")
+
+# Durée de vie supposée quand le serveur ne l'indique pas (24 h côté serveur).
+DEFAULT_TOKEN_LIFETIME = 24 * 3600
+# Renouvellement à 80 % de la durée de vie par défaut (cf. Settings).
+DEFAULT_REFRESH_PERCENT = 80
+# Décalage aléatoire (avance) : jusqu'à 10 % de la durée de vie.
+TOKEN_REFRESH_JITTER = 0.1
+# Délai minimal entre l'obtention d'un token et son renouvellement planifié.
+MIN_REFRESH_DELAY = 60
+# Intervalle minimal entre deux renouvellements forcés (401) d'un token frais.
+MIN_TOKEN_REFRESH_INTERVAL = 30
+
+
+def _positive_number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+
+def _jwt_expiry(token):
+    """Revendication ``exp`` (epoch, secondes) d'un JWT, ou None. La signature
+    n'est pas vérifiée : seul le serveur l'exploite, on ne lit que l'échéance."""
+    parts = token.split('.') if isinstance(token, str) else []
+    if len(parts) != 3:
+        return None
+    segment = parts[1]
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(claims, dict):
+        return None
+    return _positive_number(claims.get('exp'))
+
+
+def token_lifetime(body, token, now=time.time):
+    """Durée de vie restante du token (secondes) et sa provenance :
+    ``'expires_in'``, ``'jwt'`` ou ``'default'``."""
+    expires_in = _positive_number(body.get('expires_in')) if isinstance(body, dict) else None
+    if expires_in is not None:
+        return expires_in, 'expires_in'
+    exp = _jwt_expiry(token)
+    if exp is not None:
+        remaining = exp - now()
+        if remaining > 0:
+            return remaining, 'jwt'
+        logger.warning("Token reçu déjà expiré (exp JWT dépassé de %.0fs) : "
+                       "durée de vie par défaut utilisée.", -remaining)
+    return DEFAULT_TOKEN_LIFETIME, 'default'
+
+
+def refresh_delay(lifetime, percent=DEFAULT_REFRESH_PERCENT, rng=random):
+    """Délai avant renouvellement : ``percent`` % de la durée de vie, avancé
+    d'un décalage aléatoire (jusqu'à ``TOKEN_REFRESH_JITTER`` de la durée)."""
+    jitter = rng.uniform(0, lifetime * TOKEN_REFRESH_JITTER)
+    return max(min(MIN_REFRESH_DELAY, lifetime / 2), lifetime * percent / 100 - jitter)
+
+
+class TokenStats:
+    """Compteurs de renouvellement du token et des 401 (sûr entre threads)."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        # Requêtes d'authentification lancées / demandes servies sans requête
+        # (jointes à une requête en cours, ou token frais en mémoire).
+        self.requests = 0
+        self.coalesced = 0
+        self.from_memory = 0
+        self.unauthorized = 0
+        # 401 reçus AVANT l'échéance de renouvellement planifiée.
+        self.unauthorized_early = 0
+        self.lifetime = None
+        self.lifetime_source = None
+        self._obtained_at = None
+        self._refresh_delay = None
+        self._last_401_age = None
+
+    def token_obtained(self, lifetime, source, delay):
+        with self._lock:
+            self.refreshes += 1
+            self.lifetime = lifetime
+            self.lifetime_source = source
+            self._obtained_at = self._clock()
+            self._refresh_delay = delay
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def note_unauthorized(self):
+        """Un appel authentifié a reçu un 401 avec le token courant."""
+        with self._lock:
+            self.unauthorized += 1
+            if self._obtained_at is None:
+                return
+            age = self._clock() - self._obtained_at
+            self._last_401_age = age
+            planned = self._refresh_delay
+            early = age < planned
+            if early:
+                self.unauthorized_early += 1
+            lifetime = self.lifetime
+        if early:
+            logger.warning("401 avec un token de %.0fs (durée de vie annoncée %.0fs, "
+                           "renouvellement prévu à %.0fs).", age, lifetime, planned)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'refreshes': self.refreshes,
+                'requests': self.requests,
+                'coalesced': self.coalesced,
+                'from_memory': self.from_memory,
+                'unauthorized': self.unauthorized,
+                'unauthorized_early': self.unauthorized_early,
+                'lifetime': self.lifetime,
+                'lifetime_source': self.lifetime_source,
+                'refresh_delay': self._refresh_delay,
+                'last_401_token_age': self._last_401_age,
+            }
+
+
+class TokenManager:
+    """Token courant et renouvellement single-flight (boucle asyncio).
+
+    ``fetch(**kwargs)`` est une coroutine renvoyant le corps JSON de la réponse
+    d'authentification (``{'token', 'expires_in'?}``) ou levant une exception.
+    ``on_token(token, lifetime, source, delay)`` est appelé à chaque nouveau
+    token, dans la boucle."""
+
+    def __init__(self, fetch, refresh_percent=DEFAULT_REFRESH_PERCENT, rng=None,
+                 on_token=None, clock=time.monotonic,
+                 min_interval=MIN_TOKEN_REFRESH_INTERVAL):
+        self._fetch = fetch
+        self._refresh_percent = refresh_percent
+        self._rng = rng or random.Random()
+        self._on_token = on_token
+        self._clock = clock
+        self._min_interval = min_interval
+        self.token = None
+        # Token restauré (exécution précédente), pas encore confirmé par le serveur.
+        self.restored = False
+        # Échéance (horloge monotone) du prochain renouvellement planifié.
+        self.refresh_at = None
+        self._obtained_at = None
+        self._flight = None
+        self.stats = TokenStats(clock)
+
+    def is_fresh(self):
+        return self.token is not None and self._clock() < self.refresh_at
+
+    def seed(self, token):
+        """Installe un token conservé d'une exécution précédente : utilisable
+        aussitôt, mais jamais « frais » (renouvellement immédiat, et un 401
+        déclenche toujours une nouvelle requête)."""
+        self.token = token
+        self.restored = True
+        self._obtained_at = None
+        self.refresh_at = self._clock()
+
+    def postpone(self, delay):
+        """Reporte l'échéance de renouvellement (après un échec)."""
+        self.refresh_at = self._clock() + delay
+
+    async def get(self, force=False, **fetch_kwargs):
+        """Token valide. ``force`` (ex. après un 401) demande un nouveau token,
+        sauf si le token courant a moins de ``min_interval`` secondes. Les
+        appels simultanés partagent la même requête."""
+        if self._flight is not None:
+            self.stats.count('coalesced')
+            return await asyncio.shield(self._flight)
+        if self.is_fresh() and (not force or (
+                self._obtained_at is not None  # token restauré : jamais récent
+                and self._clock() - self._obtained_at < self._min_interval)):
+            self.stats.count('from_memory')
+            return self.token
+        self.stats.count('requests')
+        self._flight = asyncio.ensure_future(self._refresh(fetch_kwargs))
+        self._flight.add_done_callback(self._flight_done)
+        return await asyncio.shield(self._flight)
+
+    async def _refresh(self, fetch_kwargs):
+        body = await self._fetch(**fetch_kwargs)
+        token = body['token']
+        lifetime, source = token_lifetime(body, token)
+        delay = refresh_delay(lifetime, self._refresh_percent, self._rng)
+        self.token = token
+        self.restored = False
+        self._obtained_at = self._clock()
+        self.refresh_at = self._obtained_at + delay
+        self.stats.token_obtained(lifetime, source, delay)
+        if self._on_token:
+            self._on_token(token, lifetime, source, delay)
+        return token
+
+    def _flight_done(self, task):
+        if self._flight is task:
+            self._flight = None
+        # Marque l'exception comme lue même si plus personne n'attend.
+        if not task.cancelled():
+            task.exception()
+
+    def cancel(self):
+        if self._flight is not None:
+            self._flight.cancel()
@@ -0,0 +1,143 @@
+# webengine_profile.py
+"""Profil de performance du moteur web (Qt WebEngine / Chromium).
+
+``run()`` positionnait des variables d'environnement WebKit sans effet sur
+le backend Qt, et rien ne permettait d'adapter le moteur au matériel. Le
+profil (``Settings.webengine_profile``) part d'un préréglage
+(:data:`PRESETS`) dont chaque option peut être surchargée
+(``Settings.webengine_overrides``) :
+
+- ``gpu`` : accélération matérielle (False : rendu logiciel, plus stable sur
+  les pilotes GPU fragiles) ;
+- ``raster_threads`` : fils de rastérisation (1 à 4) ;
+- ``disk_cache_mb`` : cache HTTP sur disque (0 : cache en mémoire, session
+  privée) ; ``cache_dir`` : son emplacement (défaut : ``webengine/`` à côté
+  du fichier de configuration). Jamais activé par un préréglage : un cache
+  disque impose une session NON privée, la borne conserve alors cookies et
+  stockage local de la page d'un redémarrage à l'autre ;
+- ``process_model`` : modèle de processus de Chromium (``single-process``,
+  non pris en charge par Qt WebEngine et incompatible avec le recyclage du
+  moteur de rendu, cf. renderer_watch, est refusé) ;
+- ``touch`` : évènements tactiles.
+
+Les options deviennent des drapeaux Chromium (``QTWEBENGINE_CHROMIUM_FLAGS``,
+lus au démarrage de Qt) et des paramètres de ``webview.start`` (cf.
+:func:`apply_profile`). Le préréglage ``default`` ne change rien au moteur.
+"""
+import os
+from pathlib import Path
+
+DEFAULT_PROFILE = "default"
+PROCESS_MODELS = ("process-per-site-instance", "process-per-site")
+# Répertoire du cache disque, sous le dossier de configuration de la borne.
+WEBENGINE_DIRNAME = "webengine"
+
+PRESETS = {
+    # Réglages d'origine de Qt WebEngine, aucun drapeau.
+    "default": {},
+    # Raspberry Pi (4/5) : rendu logiciel (pilotes GPU instables sous Qt 6),
+    # peu de processus et de fils.
+    "raspberry_pi": {"gpu": False, "raster_threads": 2, "disk_cache_mb": 0,
+                     "process_model": "process-per-site", "touch": True},
+    # Mini-PC x86 : GPU, plus de fils de rastérisation.
+    "x86": {"gpu": True, "raster_threads": 4, "disk_cache_mb": 0,
+            "process_model": "process-per-site-instance", "touch": True},
+}
+
+# Option -> (type, bornes ou valeurs admises).
+_OPTIONS = {
+    "gpu": (bool, None),
+    "raster_threads": (int, (1, 4)),
+    "disk_cache_mb": (int, (0, 4096)),
+    "cache_dir": (str, None),
+    "process_model": (str, PROCESS_MODELS),
+    "touch": (bool, None),
+}
+
+
+def profile_errors(name, overrides):
+    """Erreurs de configuration du profil (liste vide si valide)."""
+    errors = []
+    if name not in PRESETS:
+        errors.append(f"Le champ « webengine_profile » doit valoir "
+                      f"{', '.join(PRESETS)}.")
+    if not isinstance(overrides, dict):
+        return errors + ["Le champ « webengine_overrides » doit être un objet."]
+    for key, value in overrides.items():
+        if key not in _OPTIONS:
+            errors.append(f"Option de profil inconnue : « {key} » "
+                          f"(attendu : {', '.join(_OPTIONS)}).")
+            continue
+        kind, allowed = _OPTIONS[key]
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            errors.append(f"L'option de profil « {key} » doit être de type {kind.__name__}.")
+        elif kind is int and not (allowed[0] <= value <= allowed[1]):
+            errors.append(f"L'option de profil « {key} » doit être entre "
+                          f"{allowed[0]} et {allowed[1]}.")
+        elif isinstance(allowed, tuple) and kind is str and value not in allowed:
+            errors.append(f"L'option de profil « {key} » doit valoir {', '.join(allowed)}.")
+    return errors
+
+
+def resolve_profile(name, overrides):
+    """Options effectives : préréglage ``name`` puis surcharges."""
+    profile = dict(PRESETS.get(name, {}))
+    profile.update(overrides or {})
+    return profile
+
+
+def chromium_flags(profile):
+    flags = []
+    if profile.get("gpu") is False:
+        flags += ["--disable-gpu", "--disable-gpu-compositing"]
+    elif profile.get("gpu") is True:
+        flags += ["--ignore-gpu-blocklist", "--enable-gpu-rasterization"]
+    if "raster_threads" in profile:
+        flags.append(f"--num-raster-threads={profile['raster_threads']}")
+    if profile.get("disk_cache_mb"):
+        flags.append(f"--disk-cache-size={profile['disk_cache_mb'] * 1024 * 1024}")
+    if profile.get("process_model") == "process-per-site":
+        flags.append("--process-per-site")
+    if "touch" in profile:
+        flags.append(f"--touch-events={'enabled' if profile['touch'] else 'disabled'}")
+    return flags
+
+
+def describe(name, profile):
+    """Résumé lisible du profil (journal de démarrage)."""
+    if not profile:
+        return f"« {name} » (réglages de Qt WebEngine)"
+    parts = []
+    if "gpu" in profile:
+        parts.append("GPU activé" if profile["gpu"] else "GPU désactivé")
+    if "raster_threads" in profile:
+        parts.append(f"{profile['raster_threads']} fil(s) de rastérisation")
+    if "disk_cache_mb" in profile:
+        parts.append(f"cache disque {profile['disk_cache_mb']} Mo"
+                     if profile["disk_cache_mb"] else "cache en mémoire")
+    if "process_model" in profile:
+        parts.append(f"modèle {profile['process_model']}")
+    if "touch" in profile:
+        parts.append("tactile activé" if profile["touch"] else "tactile désactivé")
+    return f"« {name} » : {', '.join(parts)}"
+
+
+def apply_profile(name, overrides, config_dir, environ=None):
+    """Ajoute les drapeaux Chromium du profil à ``QTWEBENGINE_CHROMIUM_FLAGS``
+    (à appeler AVANT le démarrage de Qt) et renvoie ``(profil, paramètres de
+    webview.start)``. Un cache disque impose une session non privée : les
+    cookies et le stockage local de la page sont alors conservés dans le
+    même répertoire."""
+    environ = os.environ if environ is None else environ
+    profile = resolve_profile(name, overrides)
+    flags = chromium_flags(profile)
+    if flags:
+        existing = environ.get("QTWEBENGINE_CHROMIUM_FLAGS", "").split()
+        environ["QTWEBENGINE_CHROMIUM_FLAGS"] = " ".join(
+            existing + [flag for flag in flags if flag not in existing])
+    start_kwargs = {}
+    if profile.get("disk_cache_mb"):
+        cache_dir = Path(profile.get("cache_dir") or Path(config_dir) / WEBENGINE_DIRNAME)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        start_kwargs = {"private_mode": False, "storage_path": str(cache_dir)}
+    return profile, start_kwargs